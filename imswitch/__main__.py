@@ -96,6 +96,12 @@ def main(is_headless:bool=None, default_config:str=None, http_port:int=None, soc
                 parser.add_argument('--with-kernel', dest='with_kernel', default=False, action='store_true',
                                     help='start with embedded Jupyter kernel for external notebook connections')
 
+                parser.add_argument('--eager-managers', dest='lazy_managers', default=True, action='store_false',
+                                    help='construct all managers at startup instead of on first use')
+
+                parser.add_argument('--sequential-init', dest='parallel_init', default=True, action='store_false',
+                                    help='initialize the hardware devices one after another')
+
                 # Add Jupyter/Colab specific arguments to prevent errors
                 parser.add_argument('-f', '--connection-file', dest='connection_file', type=str, default=None,
                                     help='Jupyter connection file (ignored)')
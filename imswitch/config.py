@@ -5,7 +5,7 @@ This module provides a centralized way to manage ImSwitch configuration,
 replacing the global variables with a proper configuration object.
 """
 import os
-from typing import Optional
+from typing import Dict, Optional
 from dataclasses import dataclass, field
 
 
@@ -21,6 +21,18 @@ class ImSwitchConfig:
     socket_port: int = 8002
     ssl: bool = True
     
+    # Execution of synchronous API endpoints (thread pool off the event loop)
+    api_max_workers: int = 16
+    api_max_concurrent_per_controller: int = 1  # 0: only limited by the pool
+    api_controller_limits: Dict[str, int] = field(default_factory=dict)
+    api_job_history: int = 200
+    
+    # Startup: construct widget-specific managers on first use
+    lazy_managers: bool = True
+    # Startup: initialize independent devices concurrently (headless only)
+    parallel_init: bool = True
+    device_init_timeout: float = 60.0  # seconds, 0: no limit
+    
     # File paths
     default_config: Optional[str] = None
     config_folder: Optional[str] = None
@@ -76,7 +88,9 @@ class ImSwitchConfig:
             'data_folder': 'data_folder',
             'scan_ext_data_folder': 'scan_ext_data_folder',
             'ext_drive_mount': 'ext_drive_mount',
-            'with_kernel': 'with_kernel'
+            'with_kernel': 'with_kernel',
+            'lazy_managers': 'lazy_managers',
+            'parallel_init': 'parallel_init'
         }
         
         for arg_name, config_attr in arg_mapping.items():
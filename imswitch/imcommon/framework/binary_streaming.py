@@ -6,9 +6,10 @@ with lossless compression and configurable subsampling.
 """
 
 import struct
+import threading
 import time
 import numpy as np
-from typing import Optional, Tuple, Union
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 import logging
 
 try:
@@ -37,10 +38,64 @@ COMPRESSION_NONE = "none"
 COMPRESSION_LZ4 = "lz4"
 COMPRESSION_ZSTD = "zstd"
 
+HDR_SIZE = struct.calcsize(HDR_FMT)
+SIZE_FMT = "<I"
+SIZE_SIZE = struct.calcsize(SIZE_FMT)
+
+# Protocol versions
+UC2F_VERSION = 1  # whole frame: [header][u32 compressed_size][compressed_bytes]
+UC2F_VERSION_TILED = 2  # viewport tiles: [header][tile ext][n x ([tile hdr][compressed_bytes])]
+
+# Version 2 extension: full_w, full_h, roi_x, roi_y, roi_w, roi_h, level, flags, tile_size, n_tiles
+TILE_EXT_FMT = "<IIIIIIBBHI"
+TILE_EXT_SIZE = struct.calcsize(TILE_EXT_FMT)
+# Per tile: tile column, tile row, compressed size
+TILE_HDR_FMT = "<HHI"
+TILE_HDR_SIZE = struct.calcsize(TILE_HDR_FMT)
+TILE_FLAG_KEYFRAME = 0x01
+DEFAULT_TILE_SIZE = 256
+
 class CompressionError(Exception):
     """Exception raised when compression fails."""
     pass
 
+
+class FrameBufferPool:
+    """Round-robin pool of reusable packet buffers.
+
+    Packets are assembled in place inside one of ``pool_size`` bytearrays, so
+    the live path does not allocate a fresh header+payload object per frame.
+    A buffer is only (re)allocated when a frame no longer fits into it. The
+    pool size bounds how many packets can be in flight before a buffer is
+    reused, so consumers that hold on to a returned view longer than
+    ``pool_size`` frames must copy it.
+    """
+
+    def __init__(self, pool_size: int = 3):
+        self.pool_size = max(1, int(pool_size))
+        self._buffers = [bytearray(0) for _ in range(self.pool_size)]
+        self._index = 0
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def acquire(self, nbytes: int) -> bytearray:
+        """Return the next buffer in the ring, grown to at least nbytes."""
+        self._index = (self._index + 1) % self.pool_size
+        buf = self._buffers[self._index]
+        if len(buf) < nbytes:
+            # Over-allocate a little so small frame-size jitter (compressed
+            # payloads) does not trigger a reallocation every frame
+            capacity = int(nbytes * 1.25)
+            buf = bytearray(capacity)
+            self._buffers[self._index] = buf
+            self.allocations += 1
+            self.allocated_bytes += capacity
+        return buf
+
+    def capacity(self) -> int:
+        """Total number of bytes currently held by the pool."""
+        return sum(len(b) for b in self._buffers)
+
 class BinaryFrameEncoder:
     """Encoder for binary image frames with compression and subsampling."""
     
@@ -50,7 +105,8 @@ class BinaryFrameEncoder:
                  subsampling_factor: int = 1,
                  subsampling_auto_max_dim: int = 0,
                  bitdepth: int = 12,
-                 pixfmt: str = "GRAY16"):
+                 pixfmt: str = "GRAY16",
+                 pool_size: int = 3):
         """
         Initialize the binary frame encoder.
         
@@ -61,6 +117,7 @@ class BinaryFrameEncoder:
             subsampling_auto_max_dim: Auto max dimension (0=off, else max width/height target)
             bitdepth: Bit depth of input data (e.g., 12)
             pixfmt: Pixel format ("GRAY16", "BAYER_RG16", "RGB48")
+            pool_size: Number of reusable packet buffers kept by the encoder
         """
         self.compression_algorithm = compression_algorithm
         self.compression_level = compression_level
@@ -76,6 +133,64 @@ class BinaryFrameEncoder:
         elif compression_algorithm == COMPRESSION_ZSTD and not HAS_ZSTD:
             logger.warning("Zstandard not available, falling back to 'none'")
             self.compression_algorithm = COMPRESSION_NONE
+
+        # Long-lived state reused across frames
+        self._zstd_cctx = None
+        self._zstd_cctx_level = None
+        self._scratch: Dict[str, np.ndarray] = {}
+        self._buffer_pool = FrameBufferPool(pool_size)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the encoder statistics."""
+        self._stats = {
+            "frames_encoded": 0,
+            "scratch_allocations": 0,
+            "total_encode_time_ms": 0.0,
+            "last_encode_time_ms": 0.0,
+            "max_encode_time_ms": 0.0,
+            "total_raw_bytes": 0,
+            "total_packet_bytes": 0,
+            "reconfigurations": 0,
+        }
+
+    def get_stats(self) -> dict:
+        """
+        Return allocation and timing statistics of this encoder.
+
+        Returns:
+            Dictionary with frame count, buffer/scratch allocation counts,
+            encode times and byte totals
+        """
+        stats = dict(self._stats)
+        n = stats["frames_encoded"]
+        stats["avg_encode_time_ms"] = stats["total_encode_time_ms"] / n if n else 0.0
+        stats["buffer_allocations"] = self._buffer_pool.allocations
+        stats["buffer_pool_size"] = self._buffer_pool.pool_size
+        stats["buffer_pool_bytes"] = self._buffer_pool.capacity()
+        stats["scratch_bytes"] = sum(a.nbytes for a in self._scratch.values())
+        stats["compression_algorithm"] = self.compression_algorithm
+        stats["compression_level"] = self.compression_level
+        stats["subsampling_factor"] = self.subsampling_factor
+        stats["subsampling_auto_max_dim"] = self.subsampling_auto_max_dim
+        return stats
+
+    def _get_scratch(self, key: str, shape: tuple, dtype) -> np.ndarray:
+        """Return a cached scratch array, reallocating only on shape/dtype change."""
+        arr = self._scratch.get(key)
+        if arr is None or arr.shape != shape or arr.dtype != dtype:
+            arr = np.empty(shape, dtype=dtype)
+            self._scratch[key] = arr
+            self._stats["scratch_allocations"] += 1
+        return arr
+
+    def _get_zstd_compressor(self, level: int):
+        """Return the cached zstd compressor context for the given level."""
+        if self._zstd_cctx is None or self._zstd_cctx_level != level:
+            self._zstd_cctx = zstd.ZstdCompressor(level=level)
+            self._zstd_cctx_level = level
+        return self._zstd_cctx
     
     def _get_pixfmt_code(self, pixfmt: str) -> int:
         """Convert pixel format string to code."""
@@ -92,6 +207,12 @@ class BinaryFrameEncoder:
                      subsampling_factor: Optional[int] = None,
                      subsampling_auto_max_dim: Optional[int] = None):
         """Update encoder configuration at runtime."""
+        with self._lock:  # not while a frame is being encoded
+            self._update_config(compression_algorithm, compression_level,
+                                subsampling_factor, subsampling_auto_max_dim)
+
+    def _update_config(self, compression_algorithm, compression_level,
+                       subsampling_factor, subsampling_auto_max_dim):
         if compression_algorithm is not None:
             # Validate availability
             if compression_algorithm == COMPRESSION_LZ4 and not HAS_LZ4:
@@ -110,6 +231,7 @@ class BinaryFrameEncoder:
             self.subsampling_factor = max(1, subsampling_factor)
         if subsampling_auto_max_dim is not None:
             self.subsampling_auto_max_dim = max(0, subsampling_auto_max_dim)
+        self._stats["reconfigurations"] += 1
     
     def subsample(self, img: np.ndarray) -> Tuple[np.ndarray, int]:
         """
@@ -137,9 +259,11 @@ class BinaryFrameEncoder:
         if effective_factor <= 1:
             return np.ascontiguousarray(img), 1
             
-        # Use nearest-neighbor stride slicing
+        # Use nearest-neighbor stride slicing into a reused contiguous buffer
         subsampled = img[::effective_factor, ::effective_factor]
-        return np.ascontiguousarray(subsampled), effective_factor
+        out = self._get_scratch("subsampled", subsampled.shape, subsampled.dtype)
+        np.copyto(out, subsampled)
+        return out, effective_factor
     
     def compress_block(self, buf: memoryview) -> bytes:
         """
@@ -166,36 +290,51 @@ class BinaryFrameEncoder:
                 if not HAS_ZSTD:
                     raise CompressionError("Zstandard not available")
                 level = max(1, min(self.compression_level, 22))
-                cctx = zstd.ZstdCompressor(level=level)
-                return cctx.compress(buf)
+                return self._get_zstd_compressor(level).compress(buf)
             else:
                 raise CompressionError(f"Unsupported compression algorithm: {self.compression_algorithm}")
         except Exception as e:
             raise CompressionError(f"Compression failed: {e}")
     
-    def encode_frame(self, img: np.ndarray) -> Tuple[bytes, dict]:
+    def _to_uint16(self, img: np.ndarray) -> np.ndarray:
+        """Convert the input frame to uint16 using a reused scratch buffer."""
+        if img.dtype == np.uint16:
+            return img
+        out = self._get_scratch("u16", img.shape, np.uint16)
+        if img.dtype == np.uint8:
+            np.copyto(out, img, casting="unsafe")
+            np.left_shift(out, 8, out=out)  # Scale 8-bit to 16-bit range
+        elif img.dtype == np.uint32:
+            np.right_shift(img, 4, out=out, casting="unsafe")  # Assume 16-bit data in upper bits
+        else:
+            # For 12-bit data packed in uint16, shift to use full 16-bit range
+            np.copyto(out, img, casting="unsafe")
+            np.left_shift(out, 16 - self.bitdepth, out=out)
+        return out
+
+    def encode_frame_into(self, img: np.ndarray) -> Tuple[memoryview, dict]:
         """
-        Encode a frame into binary format.
+        Encode a frame into a pooled packet buffer.
+
+        The returned view points into one of the encoder's reusable buffers and
+        stays valid until ``pool_size`` further frames have been encoded.
         
         Args:
             img: Input image array
             
         Returns:
-            Tuple of (binary_packet, metadata_dict)
+            Tuple of (packet_view, metadata_dict)
         """
-        start_time = time.time()
+        with self._lock:
+            return self._encode(img, pooled=True)
+
+    def _encode(self, img: np.ndarray, pooled: bool) -> Tuple[object, dict]:
+        # pooled: assemble the packet in a pool buffer and return a view,
+        # otherwise directly in a new bytes object (one copy of the payload)
+        start_time = time.perf_counter()
         
         # Convert to uint16 if needed
-        if img.dtype != np.uint16:
-            if img.dtype == np.uint8:
-                u16_img = img.astype(np.uint16) << 8  # Scale 8-bit to 16-bit range
-            elif img.dtype == np.uint32:
-                u16_img = (img >> 4).astype(np.uint16)  # Assume 16-bit data in upper bits
-            else:
-                # For 12-bit data packed in uint16, shift to use full 16-bit range
-                u16_img = (img << (16 - self.bitdepth)).astype(np.uint16)
-        else:
-            u16_img = img
+        u16_img = self._to_uint16(img)
             
         # Apply subsampling
         subsampled_img, effective_factor = self.subsample(u16_img)
@@ -207,26 +346,49 @@ class BinaryFrameEncoder:
         h, w = subsampled_img.shape[:2]
         channels = 1 if len(subsampled_img.shape) == 2 else subsampled_img.shape[2]
         stride = w * 2 * channels  # 2 bytes per pixel for uint16
-        
-        # Build header
         timestamp_ns = int(time.time_ns())
-        header = struct.pack(HDR_FMT, UC2_MAGIC, 1, w, h, stride, 
-                           self.bitdepth, channels, self.pixfmt, timestamp_ns)
         
         # Compress data
         raw_size = subsampled_img.nbytes
-        try:
-            compressed = self.compress_block(memoryview(subsampled_img))
-            compression_success = True
-        except CompressionError as e:
-            logger.warning(f"Compression failed, falling back to uncompressed: {e}")
-            compressed = bytes(memoryview(subsampled_img))
-            compression_success = False
+        payload_offset = HDR_SIZE + SIZE_SIZE
+        compression_success = True
+        compressed = None
+        if self.compression_algorithm != COMPRESSION_NONE:
+            try:
+                compressed = self.compress_block(memoryview(subsampled_img).cast("B"))
+            except CompressionError as e:
+                logger.warning(f"Compression failed, falling back to uncompressed: {e}")
+                compression_success = False
+        payload_size = raw_size if compressed is None else len(compressed)
         
         # Build packet: [header][u32 compressed_size][compressed_bytes]
-        packet = header + struct.pack("<I", len(compressed)) + compressed
+        packet_size = payload_offset + payload_size
+        if pooled:
+            buf = self._buffer_pool.acquire(packet_size)
+            struct.pack_into(HDR_FMT, buf, 0, UC2_MAGIC, 1, w, h, stride,
+                             self.bitdepth, channels, self.pixfmt, timestamp_ns)
+            struct.pack_into(SIZE_FMT, buf, HDR_SIZE, payload_size)
+            packet = memoryview(buf)[:packet_size]
+            if compressed is None:
+                np.copyto(np.frombuffer(buf, dtype=np.uint16, count=raw_size // 2,
+                                        offset=payload_offset).reshape(subsampled_img.shape),
+                          subsampled_img)
+            else:
+                packet[payload_offset:] = compressed
+        else:
+            header = struct.pack(HDR_FMT, UC2_MAGIC, 1, w, h, stride, self.bitdepth,
+                                 channels, self.pixfmt, timestamp_ns)
+            payload = memoryview(subsampled_img).cast("B") if compressed is None else compressed
+            packet = b"".join((header, struct.pack(SIZE_FMT, payload_size), payload))
         
-        encode_time_ms = (time.time() - start_time) * 1000
+        encode_time_ms = (time.perf_counter() - start_time) * 1000
+
+        self._stats["frames_encoded"] += 1
+        self._stats["last_encode_time_ms"] = encode_time_ms
+        self._stats["total_encode_time_ms"] += encode_time_ms
+        self._stats["max_encode_time_ms"] = max(self._stats["max_encode_time_ms"], encode_time_ms)
+        self._stats["total_raw_bytes"] += raw_size
+        self._stats["total_packet_bytes"] += packet_size
         
         # Build metadata
         metadata = {
@@ -238,15 +400,31 @@ class BinaryFrameEncoder:
             "compression_algorithm": self.compression_algorithm if compression_success else "none",
             "compression_level": self.compression_level if compression_success else 0,
             "raw_bytes": raw_size,
-            "compressed_bytes": len(compressed),
-            "packet_bytes": len(packet),
-            "compression_ratio": raw_size / len(compressed) if len(compressed) > 0 else 1.0,
+            "compressed_bytes": payload_size,
+            "packet_bytes": packet_size,
+            "compression_ratio": raw_size / payload_size if payload_size > 0 else 1.0,
             "encode_time_ms": encode_time_ms,
             "timestamp_ns": timestamp_ns
         }
         
         return packet, metadata
 
+    def encode_frame(self, img: np.ndarray) -> Tuple[bytes, dict]:
+        """
+        Encode a frame into binary format.
+
+        The packet is assembled once into its own bytes object, which the
+        caller owns (e.g. to hand it to an asynchronous transport).
+        
+        Args:
+            img: Input image array
+            
+        Returns:
+            Tuple of (binary_packet, metadata_dict)
+        """
+        with self._lock:
+            return self._encode(img, pooled=False)
+
 
     def decode_frame_header(self, data: bytes) -> dict:
         """
@@ -261,10 +439,10 @@ class BinaryFrameEncoder:
         Raises:
             ValueError: If header is invalid
         """
-        if len(data) < struct.calcsize(HDR_FMT):
+        if len(data) < HDR_SIZE:
             raise ValueError("Data too short for header")
         
-        header_size = struct.calcsize(HDR_FMT)
+        header_size = HDR_SIZE
         header_data = data[:header_size]
         
         fields = struct.unpack(HDR_FMT, header_data)
@@ -273,7 +451,10 @@ class BinaryFrameEncoder:
         if magic != UC2_MAGIC:
             raise ValueError(f"Invalid magic bytes: {magic}")
         
-        if ver != 1:
+        if ver == UC2F_VERSION_TILED:
+            return self._decode_tiled_header(data, fields)
+        
+        if ver != UC2F_VERSION:
             raise ValueError(f"Unsupported version: {ver}")
         
         # Extract compressed size
@@ -313,6 +494,8 @@ class BinaryFrameEncoder:
         """
         # First decode the header
         header = self.decode_frame_header(data)
+        if header["version"] != UC2F_VERSION:
+            raise ValueError("Tiled frames must be decoded with decode_tiled_frame()")
         
         # Validate we have enough data
         if len(data) < header["total_expected_size"]:
@@ -362,6 +545,89 @@ class BinaryFrameEncoder:
         
         return image, metadata
 
+    def _decode_tiled_header(self, data: bytes, fields: tuple) -> dict:
+        """Decode the version 2 header extension and walk the tile table."""
+        magic, ver, w, h, stride, bitdepth, channels, pixfmt, timestamp_ns = fields
+        if len(data) < HDR_SIZE + TILE_EXT_SIZE:
+            raise ValueError("Data too short for tile header")
+        (full_w, full_h, roi_x, roi_y, roi_w, roi_h,
+         level, flags, tile_size, n_tiles) = struct.unpack_from(TILE_EXT_FMT, data, HDR_SIZE)
+
+        tiles = []
+        offset = HDR_SIZE + TILE_EXT_SIZE
+        for _ in range(n_tiles):
+            if len(data) < offset + TILE_HDR_SIZE:
+                raise ValueError("Data too short for tile table")
+            tx, ty, size = struct.unpack_from(TILE_HDR_FMT, data, offset)
+            offset += TILE_HDR_SIZE
+            tiles.append((tx, ty, offset, size))
+            offset += size
+
+        return {
+            "magic": magic,
+            "version": ver,
+            "width": w,
+            "height": h,
+            "stride": stride,
+            "bitdepth": bitdepth,
+            "channels": channels,
+            "pixfmt": pixfmt,
+            "timestamp_ns": timestamp_ns,
+            "header_size": HDR_SIZE + TILE_EXT_SIZE,
+            "full_width": full_w,
+            "full_height": full_h,
+            "roi": (roi_x, roi_y, roi_w, roi_h),
+            "level": level,
+            "keyframe": bool(flags & TILE_FLAG_KEYFRAME),
+            "tile_size": tile_size,
+            "tiles": tiles,
+            "total_expected_size": offset
+        }
+
+    def decode_tiled_frame(self, data: bytes,
+                           previous: Optional[np.ndarray] = None) -> Tuple[np.ndarray, dict]:
+        """
+        Decode a version 2 (viewport tile) packet.
+
+        Tiles missing from a delta packet are taken from ``previous``, the
+        image decoded from the preceding packet of the same viewport.
+
+        Args:
+            data: Complete binary packet from TiledFrameEncoder.encode_viewport()
+            previous: Previously decoded image of the same viewport
+
+        Returns:
+            Tuple of (decoded_image_array, metadata_dict)
+        """
+        header = self.decode_frame_header(data)
+        if header["version"] != UC2F_VERSION_TILED:
+            raise ValueError(f"Not a tiled frame (version {header['version']})")
+        if len(data) < header["total_expected_size"]:
+            raise ValueError("Incomplete tiled frame")
+
+        h, w, channels = header["height"], header["width"], header["channels"]
+        shape = (h, w) if channels == 1 else (h, w, channels)
+        if header["keyframe"] or previous is None or previous.shape != shape:
+            if not header["keyframe"]:
+                logger.warning("Delta frame without matching previous image, missing tiles stay empty")
+            image = np.zeros(shape, dtype=np.uint16)
+        else:
+            image = previous.copy()
+
+        ts = header["tile_size"]
+        for tx, ty, offset, size in header["tiles"]:
+            y0, x0 = ty * ts, tx * ts
+            y1, x1 = min(y0 + ts, h), min(x0 + ts, w)
+            raw = self._decompress_block(data[offset:offset + size])
+            tile_shape = (y1 - y0, x1 - x0) + shape[2:]
+            image[y0:y1, x0:x1] = np.frombuffer(raw, dtype=np.uint16).reshape(tile_shape)
+
+        metadata = {key: header[key] for key in
+                    ("width", "height", "channels", "bitdepth", "pixfmt", "timestamp_ns",
+                     "full_width", "full_height", "roi", "level", "keyframe", "tile_size")}
+        metadata["tiles_received"] = len(header["tiles"])
+        return image, metadata
+
     def _decompress_block(self, compressed_data: bytes) -> bytes:
         """
         Decompress a compressed data block.
@@ -390,4 +656,261 @@ class BinaryFrameEncoder:
             else:
                 raise CompressionError(f"Unsupported compression algorithm: {self.compression_algorithm}")
         except Exception as e:
-            raise CompressionError(f"Decompression failed: {e}")
\ No newline at end of file
+            raise CompressionError(f"Decompression failed: {e}")
+
+
+class Viewport(NamedTuple):
+    """Region of a detector frame requested by a client.
+
+    x/y/width/height are in full-resolution sensor pixels (width/height 0
+    means up to the frame edge); the region is box-filtered by 2**level.
+    """
+    x: int = 0
+    y: int = 0
+    width: int = 0
+    height: int = 0
+    level: int = 0
+
+    @property
+    def factor(self) -> int:
+        return 2 ** self.level
+
+    def clamp(self, frame_width: int, frame_height: int) -> "Viewport":
+        """Clip the viewport to the frame and align it to the downsampling factor."""
+        level = max(0, min(int(self.level), 15))
+        x = max(0, min(int(self.x), frame_width - 1))
+        y = max(0, min(int(self.y), frame_height - 1))
+        width = int(self.width) if self.width > 0 else frame_width
+        height = int(self.height) if self.height > 0 else frame_height
+        width = min(width, frame_width - x)
+        height = min(height, frame_height - y)
+        # Reduce the level until at least one output pixel remains
+        while level > 0 and (width < 2 ** level or height < 2 ** level):
+            level -= 1
+        factor = 2 ** level
+        return Viewport(x, y, width - width % factor, height - height % factor, level)
+
+
+def box_downsample(img: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Downsample by mean pooling over factor x factor blocks.
+
+    Unlike stride slicing this does not alias. Trailing rows/columns that do
+    not fill a whole block are dropped.
+
+    Args:
+        img: uint16 image (H x W or H x W x C)
+        factor: Block size
+
+    Returns:
+        Downsampled image with the input dtype
+    """
+    if factor <= 1:
+        return img
+    h, w = img.shape[0] // factor, img.shape[1] // factor
+    blocks = img[:h * factor, :w * factor].reshape((h, factor, w, factor) + img.shape[2:])
+    # uint64: factor * factor * 65535 overflows uint32 from factor 512 on (level 9)
+    summed = blocks.sum(axis=(1, 3), dtype=np.uint64)
+    summed += (factor * factor) // 2  # round to nearest
+    summed //= factor * factor
+    return summed.astype(img.dtype)
+
+
+class TiledFrameEncoder(BinaryFrameEncoder):
+    """
+    Encoder for version 2 UC2F packets carrying a viewport as tiles.
+
+    The requested region is cut from the full-resolution frame (or a
+    box-filtered overview of it), split into ``tile_size`` tiles and every
+    tile is compressed separately. Tiles that did not change since the last
+    packet of this encoder are skipped, so a static scene only costs the
+    header. One encoder serves one (detector, viewport) stream.
+    """
+
+    def __init__(self, tile_size: int = DEFAULT_TILE_SIZE, delta_threshold: int = 0, **kwargs):
+        """
+        Initialize the tiled frame encoder.
+
+        Args:
+            tile_size: Edge length of the square tiles in output pixels
+            delta_threshold: Maximum absolute pixel difference for a tile to
+                count as unchanged (0 = exact)
+            **kwargs: Passed to BinaryFrameEncoder
+        """
+        super().__init__(**kwargs)
+        self.tile_size = max(16, min(int(tile_size), 4096))
+        self.delta_threshold = max(0, int(delta_threshold))
+        self._previous_key = None
+
+    def reset_stats(self):
+        super().reset_stats()
+        self._stats["tiles_sent"] = 0
+        self._stats["tiles_skipped"] = 0
+
+    def reset_delta(self):
+        """Force the next packet to be a keyframe."""
+        self._previous_key = None
+
+    def _tile_unchanged(self, tile: np.ndarray, previous: np.ndarray) -> bool:
+        if self.delta_threshold == 0:
+            return np.array_equal(tile, previous)
+        diff = np.abs(tile.astype(np.int32) - previous)
+        return int(diff.max()) <= self.delta_threshold
+
+    def encode_viewport(self, img: np.ndarray, viewport: Viewport = Viewport(),
+                        keyframe: bool = False) -> Tuple[bytes, dict]:
+        """
+        Encode the viewport of a frame as a tiled packet.
+
+        Args:
+            img: Full-resolution input image
+            viewport: Requested region and zoom level
+            keyframe: Send all tiles regardless of the delta state
+
+        Returns:
+            Tuple of (binary_packet, metadata_dict)
+        """
+        with self._lock:
+            return self._encode_viewport(img, viewport, keyframe)
+
+    def _encode_viewport(self, img: np.ndarray, viewport: Viewport,
+                         keyframe: bool) -> Tuple[bytes, dict]:
+        start_time = time.perf_counter()
+        full_h, full_w = img.shape[:2]
+        vp = viewport.clamp(full_w, full_h)
+
+        u16_img = self._to_uint16(img)
+        region = u16_img[vp.y:vp.y + vp.height, vp.x:vp.x + vp.width]
+        out = box_downsample(region, vp.factor)
+
+        h, w = out.shape[:2]
+        channels = 1 if out.ndim == 2 else out.shape[2]
+        key = (vp, out.shape)
+        keyframe = keyframe or key != self._previous_key
+        previous = self._get_scratch("previous", out.shape, out.dtype)
+
+        ts = self.tile_size
+        parts = []
+        n_tiles = skipped = 0
+        raw_size = 0
+        for ty, y0 in enumerate(range(0, h, ts)):
+            for tx, x0 in enumerate(range(0, w, ts)):
+                tile = out[y0:y0 + ts, x0:x0 + ts]
+                prev_tile = previous[y0:y0 + ts, x0:x0 + ts]
+                if not keyframe and self._tile_unchanged(tile, prev_tile):
+                    skipped += 1
+                    continue
+                # Keep what the client has, so sub-threshold changes cannot accumulate
+                np.copyto(prev_tile, tile)
+                tile_buf = memoryview(np.ascontiguousarray(tile)).cast("B")
+                raw_size += tile_buf.nbytes
+                compressed = self.compress_block(tile_buf)
+                parts.append(struct.pack(TILE_HDR_FMT, tx, ty, len(compressed)))
+                parts.append(compressed)
+                n_tiles += 1
+        self._previous_key = key
+
+        timestamp_ns = int(time.time_ns())
+        flags = TILE_FLAG_KEYFRAME if keyframe else 0
+        header = struct.pack(HDR_FMT, UC2_MAGIC, UC2F_VERSION_TILED, w, h, w * 2 * channels,
+                             self.bitdepth, channels, self.pixfmt, timestamp_ns)
+        ext = struct.pack(TILE_EXT_FMT, full_w, full_h, vp.x, vp.y, vp.width, vp.height,
+                          vp.level, flags, ts, n_tiles)
+        packet = b"".join([header, ext] + parts)
+
+        encode_time_ms = (time.perf_counter() - start_time) * 1000
+        self._stats["frames_encoded"] += 1
+        self._stats["last_encode_time_ms"] = encode_time_ms
+        self._stats["total_encode_time_ms"] += encode_time_ms
+        self._stats["max_encode_time_ms"] = max(self._stats["max_encode_time_ms"], encode_time_ms)
+        self._stats["total_raw_bytes"] += raw_size
+        self._stats["total_packet_bytes"] += len(packet)
+        self._stats["tiles_sent"] += n_tiles
+        self._stats["tiles_skipped"] += skipped
+
+        metadata = {
+            "width": w,
+            "height": h,
+            "original_width": full_w,
+            "original_height": full_h,
+            "roi": [vp.x, vp.y, vp.width, vp.height],
+            "level": vp.level,
+            "keyframe": keyframe,
+            "tile_size": ts,
+            "tiles_sent": n_tiles,
+            "tiles_skipped": skipped,
+            "compression_algorithm": self.compression_algorithm,
+            "raw_bytes": raw_size,
+            "packet_bytes": len(packet),
+            "encode_time_ms": encode_time_ms,
+            "timestamp_ns": timestamp_ns
+        }
+        return packet, metadata
+
+
+# Stream parameters in globalDetectorParams that configure the live encoder
+STREAM_PARAM_DEFAULTS = {
+    "stream_compression_algorithm": COMPRESSION_LZ4,
+    "stream_compression_level": 0,
+    "stream_subsampling_factor": 1,
+    "stream_subsampling_auto_max_dim": 0,
+}
+
+_detector_encoders: Dict[str, BinaryFrameEncoder] = {}
+_detector_encoder_keys: Dict[str, tuple] = {}
+_detector_encoders_lock = threading.Lock()
+
+
+def get_detector_encoder(detector_name: str, global_params: dict) -> BinaryFrameEncoder:
+    """
+    Return the long-lived encoder of a detector, reconfigured if needed.
+
+    The encoder (with its compressor contexts and packet buffers) is created
+    once per detector and only reconfigured when one of the ``stream_*``
+    parameters in the global detector parameters actually changed.
+
+    Args:
+        detector_name: Name of the detector the frame belongs to
+        global_params: The global detector parameters dict
+
+    Returns:
+        The detector's BinaryFrameEncoder
+    """
+    key = tuple(global_params.get(name, default) for name, default in STREAM_PARAM_DEFAULTS.items())
+    with _detector_encoders_lock:
+        encoder = _detector_encoders.get(detector_name)
+        if encoder is None:
+            from imswitch.config import get_config
+            config = get_config()
+            encoder = BinaryFrameEncoder(
+                compression_algorithm=key[0],
+                compression_level=key[1],
+                subsampling_factor=key[2],
+                subsampling_auto_max_dim=key[3],
+                bitdepth=config.stream_binary_bitdepth_in,
+                pixfmt=config.stream_binary_pixfmt
+            )
+            _detector_encoders[detector_name] = encoder
+            _detector_encoder_keys[detector_name] = key
+        elif _detector_encoder_keys[detector_name] != key:
+            encoder.update_config(
+                compression_algorithm=key[0],
+                compression_level=key[1],
+                subsampling_factor=key[2],
+                subsampling_auto_max_dim=key[3]
+            )
+            _detector_encoder_keys[detector_name] = key
+    return encoder
+
+
+def get_detector_encoder_stats() -> dict:
+    """Return the statistics of all per-detector live encoders."""
+    with _detector_encoders_lock:
+        return {name: encoder.get_stats() for name, encoder in _detector_encoders.items()}
+
+
+def reset_detector_encoder_stats() -> None:
+    """Reset the statistics of all per-detector live encoders."""
+    with _detector_encoders_lock:
+        for encoder in _detector_encoders.values():
+            encoder.reset_stats()
@@ -0,0 +1,376 @@
+"""
+Live frame streaming stage for ImSwitch.
+
+Image signals are handed to a FrameStreamer, which keeps one latest-frame-wins
+slot per detector and encodes/emits frames on its own thread. Each frame is
+encoded at most once per format and only for the formats that connected
+Socket.IO clients subscribed to; frames that are superseded before the
+streaming thread gets to them are dropped instead of queued. Clients of the
+"tiles" format receive only their viewport (UC2F version 2), encoded once per
+distinct (detector, viewport) and sent as deltas of changed tiles.
+"""
+
+import base64
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from imswitch.config import get_config
+from imswitch.imcommon.framework.binary_streaming import (
+    DEFAULT_TILE_SIZE, TiledFrameEncoder, Viewport, get_detector_encoder
+)
+
+logger = logging.getLogger(__name__)
+
+# Stream formats a client can subscribe to
+FORMAT_BINARY = "binary"  # UC2F packets on the "frame" event
+FORMAT_JPEG = "jpeg"  # raw JPEG bytes as binary attachment on the "frame_jpeg" event
+FORMAT_JPEG_BASE64 = "jpeg_base64"  # legacy base64 JPEG inside the JSON "signal" event
+FORMAT_TILES = "tiles"  # UC2F version 2 viewport tiles on the "frame_tiles" event
+STREAM_FORMATS = (FORMAT_BINARY, FORMAT_JPEG, FORMAT_JPEG_BASE64, FORMAT_TILES)
+
+# Clients that never send a subscription get the legacy behaviour
+DEFAULT_FORMATS = (FORMAT_BINARY, FORMAT_JPEG_BASE64)
+
+DEFAULT_JPEG_QUALITY = 80
+
+# Send a full tile set every N packets so clients can recover from losses
+TILES_KEYFRAME_INTERVAL = 100
+
+
+def stream_room(fmt: str) -> str:
+    """Socket.IO room of the clients subscribed to a stream format."""
+    return f"stream_{fmt}"
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = DEFAULT_JPEG_QUALITY) -> bytes:
+    """
+    Encode a frame as preview JPEG (legacy subsampling and 16->8 bit scaling).
+
+    Args:
+        frame: Input image array
+        quality: JPEG quality (0-100)
+
+    Returns:
+        JPEG bytes
+    """
+    # Apply legacy subsampling logic
+    if frame.shape[0] > 640 or frame.shape[1] > 480:
+        everyNthsPixel = np.min((np.min([frame.shape[0] // 240, frame.shape[1] // 320]), 3))
+    else:
+        everyNthsPixel = 1
+    everyNthsPixel = max(1, int(everyNthsPixel))
+    output_frame = frame[::everyNthsPixel, ::everyNthsPixel]
+
+    # convert 16 bit to 8 bit for visualization
+    if output_frame.dtype == np.uint16:
+        output_frame = np.uint8(output_frame // 128)
+
+    flag, compressed = cv2.imencode(".jpg", output_frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not flag:
+        raise ValueError("JPEG encoding failed")
+    return compressed.tobytes()
+
+
+class _FrameSlot:
+    """Latest pending frame of one detector."""
+    __slots__ = ("signal_name", "detector_name", "frame", "pixel_size", "params", "submit_time")
+
+    def __init__(self, signal_name, detector_name, frame, pixel_size, params):
+        self.signal_name = signal_name
+        self.detector_name = detector_name
+        self.frame = frame
+        self.pixel_size = pixel_size
+        self.params = params
+        self.submit_time = time.perf_counter()
+
+
+class FrameStreamer:
+    """
+    Streams live frames to Socket.IO clients from a dedicated thread.
+
+    The producer side (``submit``) only swaps a reference into the detector's
+    slot, so no encoding work happens on the thread that emitted the camera
+    signal. The transport is injected as ``emit_func(event, data, room)``.
+    """
+
+    def __init__(self, emit_func: Callable[[str, object, Optional[str]], None]):
+        self._emit = emit_func
+        self._cond = threading.Condition()
+        self._slots: Dict[str, _FrameSlot] = {}
+        self._subscribers: Dict[str, Set[str]] = {}
+        self._last_binary_emit_time: Dict[str, float] = {}
+        self._last_tiles_emit_time: Dict[str, float] = {}
+        self._viewports: Dict[str, Tuple[Optional[str], Viewport]] = {}
+        self._tile_encoders: Dict[Tuple[str, Viewport], TiledFrameEncoder] = {}
+        self._tile_packets: Dict[Tuple[str, Viewport], int] = {}
+        self._tile_settings: Dict[Tuple[str, Viewport], tuple] = {}
+        self._keyframe_requests: Set[str] = set()
+        self._thread = None
+        self._running = False
+        self.reset_stats()
+
+    # Subscriptions
+
+    def add_client(self, sid: str, formats: Iterable[str] = DEFAULT_FORMATS) -> Set[str]:
+        """Register a connected client with its initial stream formats."""
+        return self.set_client_formats(sid, formats)
+
+    def remove_client(self, sid: str) -> None:
+        """Forget a disconnected client."""
+        with self._cond:
+            self._subscribers.pop(sid, None)
+            self._viewports.pop(sid, None)
+            self._keyframe_requests.discard(sid)
+
+    def set_client_formats(self, sid: str, formats: Iterable[str]) -> Set[str]:
+        """
+        Set the stream formats a client is subscribed to.
+
+        Args:
+            sid: Socket.IO session id
+            formats: Requested formats; unknown formats are ignored
+
+        Returns:
+            The accepted set of formats
+        """
+        accepted = {fmt for fmt in formats if fmt in STREAM_FORMATS}
+        with self._cond:
+            if FORMAT_TILES in accepted and FORMAT_TILES not in self._subscribers.get(sid, ()):
+                self._keyframe_requests.add(sid)
+            self._subscribers[sid] = accepted
+        return accepted
+
+    def set_client_viewport(self, sid: str, viewport: Viewport,
+                            detector_name: Optional[str] = None, keyframe: bool = True) -> Viewport:
+        """
+        Set the viewport a "tiles" client wants to see.
+
+        Args:
+            sid: Socket.IO session id
+            viewport: Requested region and zoom level in sensor pixels
+            detector_name: Restrict the viewport to one detector (None = all)
+            keyframe: Send all tiles with the next packet
+
+        Returns:
+            The stored viewport
+        """
+        viewport = Viewport(*(max(0, int(v)) for v in viewport))
+        with self._cond:
+            self._viewports[sid] = (detector_name, viewport)
+            if keyframe:
+                self._keyframe_requests.add(sid)
+        return viewport
+
+    def get_client_formats(self, sid: str) -> Set[str]:
+        with self._cond:
+            return set(self._subscribers.get(sid, ()))
+
+    def active_formats(self) -> Set[str]:
+        """Union of the formats subscribed by all connected clients."""
+        with self._cond:
+            active = set()
+            for formats in self._subscribers.values():
+                active |= formats
+            return active
+
+    # Producer side
+
+    def submit(self, signal_name: str, detector_name: str, frame: np.ndarray,
+               pixel_size: float = 1, params: Optional[dict] = None) -> bool:
+        """
+        Hand a frame to the streaming stage.
+
+        Returns immediately. If the detector's previous frame has not been
+        streamed yet it is replaced (and counted as dropped).
+
+        Returns:
+            False if no client is subscribed to any format, True otherwise
+        """
+        if not self.active_formats():
+            return False
+        slot = _FrameSlot(signal_name, detector_name, frame, pixel_size, params or {})
+        with self._cond:
+            if detector_name in self._slots:
+                self._stats["frames_dropped"] += 1
+            self._slots[detector_name] = slot
+            self._stats["frames_submitted"] += 1
+            self._cond.notify()
+        self.start()
+        return True
+
+    # Streaming thread
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="FrameStreamer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._slots:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                slots = list(self._slots.values())
+                self._slots.clear()
+            for slot in slots:
+                try:
+                    self.stream_slot(slot)
+                except Exception as e:
+                    logger.error(f"Error streaming frame of {slot.detector_name}: {e}")
+
+    def stream_slot(self, slot: _FrameSlot) -> None:
+        """Encode a pending frame in every subscribed format and emit it."""
+        formats = self.active_formats()
+        frame = np.ascontiguousarray(slot.frame)
+        pixel_size = int(slot.pixel_size)  # must not be int64
+        params = slot.params
+
+        if FORMAT_BINARY in formats and params.get("stream_compression_algorithm") is not None:
+            self._stream_binary(slot, frame, pixel_size)
+
+        if FORMAT_JPEG in formats or FORMAT_JPEG_BASE64 in formats:
+            start = time.perf_counter()
+            jpeg = encode_jpeg(frame, params.get("compressionlevel", DEFAULT_JPEG_QUALITY))
+            self._stats["jpeg_encoded"] += 1
+            self._stats["jpeg_encode_time_ms"] += (time.perf_counter() - start) * 1000
+            message = {
+                "name": slot.signal_name,
+                "detectorname": slot.detector_name,
+                "pixelsize": pixel_size,
+                "format": "jpeg",
+            }
+            if FORMAT_JPEG in formats:
+                self._emit("frame_jpeg", dict(message, image=jpeg), stream_room(FORMAT_JPEG))
+            if FORMAT_JPEG_BASE64 in formats:
+                message["image"] = base64.b64encode(jpeg).decode("utf-8")
+                self._emit("signal", json.dumps(message), stream_room(FORMAT_JPEG_BASE64))
+
+        if FORMAT_TILES in formats:
+            self._stream_tiles(slot, frame)
+
+        self._stats["frames_streamed"] += 1
+        self._stats["last_latency_ms"] = (time.perf_counter() - slot.submit_time) * 1000
+
+    def _stream_binary(self, slot: _FrameSlot, frame: np.ndarray, pixel_size: int) -> None:
+        throttle_s = slot.params.get("stream_throttle_ms", 200) / 1000.0
+        now = time.time()
+        if now - self._last_binary_emit_time.get(slot.detector_name, 0) < throttle_s:
+            return  # Throttle binary emissions
+        encoder = get_detector_encoder(slot.detector_name, slot.params)
+        # Socket.IO only sends bytes as binary attachments and emits
+        # asynchronously, so the packet is assembled once into its own bytes
+        packet, metadata = encoder.encode_frame(frame)
+        self._emit("frame", packet, stream_room(FORMAT_BINARY))
+        meta_message = {
+            "name": "frame_meta",
+            "detectorname": slot.detector_name,
+            "pixelsize": pixel_size,
+            "format": "binary",
+            "metadata": metadata
+        }
+        self._emit("signal", json.dumps(meta_message), stream_room(FORMAT_BINARY))
+        self._last_binary_emit_time[slot.detector_name] = now
+        self._stats["binary_encoded"] += 1
+
+    def _stream_tiles(self, slot: _FrameSlot, frame: np.ndarray) -> None:
+        throttle_s = slot.params.get("stream_throttle_ms", 200) / 1000.0
+        now = time.time()
+        if now - self._last_tiles_emit_time.get(slot.detector_name, 0) < throttle_s:
+            return
+        self._last_tiles_emit_time[slot.detector_name] = now
+
+        # Group clients by viewport so each distinct viewport is encoded once;
+        # a group gets a keyframe if any of its clients asked for one
+        groups: Dict[Viewport, list] = {}
+        keyframes: Set[Viewport] = set()
+        with self._cond:
+            for sid, formats in self._subscribers.items():
+                if FORMAT_TILES not in formats:
+                    continue
+                detector_name, viewport = self._viewports.get(sid, (None, Viewport()))
+                if detector_name is not None and detector_name != slot.detector_name:
+                    continue
+                groups.setdefault(viewport, []).append(sid)
+                if sid in self._keyframe_requests:
+                    self._keyframe_requests.discard(sid)
+                    keyframes.add(viewport)
+
+        # Drop encoders of viewports nobody is looking at anymore
+        for key in [k for k in self._tile_encoders if k[0] == slot.detector_name and k[1] not in groups]:
+            del self._tile_encoders[key]
+            self._tile_packets.pop(key, None)
+            self._tile_settings.pop(key, None)
+
+        params = slot.params
+        for viewport, sids in groups.items():
+            key = (slot.detector_name, viewport)
+            settings = (params.get("stream_compression_algorithm") or "lz4",
+                        params.get("stream_compression_level", 0),
+                        params.get("stream_tile_size", DEFAULT_TILE_SIZE),
+                        params.get("stream_tile_delta_threshold", 0))
+            encoder = self._tile_encoders.get(key)
+            if encoder is None or self._tile_settings.get(key) != settings:
+                config = get_config()
+                encoder = TiledFrameEncoder(
+                    compression_algorithm=settings[0],
+                    compression_level=settings[1],
+                    tile_size=settings[2],
+                    delta_threshold=settings[3],
+                    bitdepth=config.stream_binary_bitdepth_in,
+                    pixfmt=config.stream_binary_pixfmt
+                )
+                self._tile_encoders[key] = encoder
+                self._tile_settings[key] = settings
+                self._tile_packets[key] = 0
+            keyframe = viewport in keyframes or self._tile_packets[key] % TILES_KEYFRAME_INTERVAL == 0
+            packet, _ = encoder.encode_viewport(frame, viewport, keyframe=keyframe)
+            self._tile_packets[key] += 1
+            for sid in sids:
+                self._emit("frame_tiles", packet, sid)
+            self._stats["tiles_encoded"] += 1
+
+    # Statistics
+
+    def reset_stats(self) -> None:
+        self._stats = {
+            "frames_submitted": 0,
+            "frames_dropped": 0,
+            "frames_streamed": 0,
+            "binary_encoded": 0,
+            "jpeg_encoded": 0,
+            "jpeg_encode_time_ms": 0.0,
+            "tiles_encoded": 0,
+            "last_latency_ms": 0.0,
+        }
+
+    def get_stats(self) -> dict:
+        """Return frame counters, subscriptions and the last submit-to-emit latency."""
+        stats = dict(self._stats)
+        stats["clients"] = len(self._subscribers)
+        stats["active_formats"] = sorted(self.active_formats())
+        stats["tile_streams"] = {
+            f"{name}:{','.join(str(v) for v in viewport)}": encoder.get_stats()
+            for (name, viewport), encoder in list(self._tile_encoders.items())
+        }
+        return stats
@@ -5,6 +5,7 @@ from psygnal import emit_queued
 import psygnal
 import asyncio
 import threading
+import multiprocessing
 import os
 import json
 from functools import lru_cache
@@ -25,7 +26,10 @@ import logging
 
 # Try to import config and binary streaming - handle gracefully if not available
 from imswitch.config import get_config
-from imswitch.imcommon.framework.binary_streaming import BinaryFrameEncoder
+from imswitch.imcommon.framework.binary_streaming import BinaryFrameEncoder, Viewport
+from imswitch.imcommon.framework.frame_streaming import (
+    FrameStreamer, DEFAULT_FORMATS, STREAM_FORMATS, stream_room
+)
 HAS_BINARY_STREAMING = True
 class Mutex(abstract.Mutex):
     """Wrapper around the `threading.Lock` class."""
@@ -70,6 +74,63 @@ def _fallback_worker():
         loop.close()
 
 
+# Event loop of the Socket.IO server, captured on the first client connection
+# so that other threads can schedule emits on it
+_sio_loop = None
+
+
+def _emit_to_clients(event, data, room=None):
+    """Thread-safe emit used by the frame streaming stage."""
+    if _sio_loop is not None and _sio_loop.is_running():
+        asyncio.run_coroutine_threadsafe(sio.emit(event, data, to=room), _sio_loop)
+    else:
+        sio.start_background_task(sio.emit, event, data, to=room)
+
+
+frame_streamer = FrameStreamer(_emit_to_clients)
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    global _sio_loop
+    _sio_loop = asyncio.get_running_loop()
+    for fmt in frame_streamer.add_client(sid, DEFAULT_FORMATS):
+        await sio.enter_room(sid, stream_room(fmt))
+
+
+@sio.event
+async def disconnect(sid, *args):
+    frame_streamer.remove_client(sid)
+
+
+@sio.on("subscribe_stream")
+async def subscribe_stream(sid, data):
+    """Select the live stream formats of a client, e.g. {"formats": ["binary"]}."""
+    formats = data.get("formats", DEFAULT_FORMATS) if isinstance(data, dict) else data
+    accepted = frame_streamer.set_client_formats(sid, formats or ())
+    for fmt in STREAM_FORMATS:
+        if fmt in accepted:
+            await sio.enter_room(sid, stream_room(fmt))
+        else:
+            await sio.leave_room(sid, stream_room(fmt))
+    return {"formats": sorted(accepted)}
+
+
+@sio.on("set_viewport")
+async def set_viewport(sid, data):
+    """Select the region/zoom level of a "tiles" client, e.g.
+    {"detector": "WidefieldCamera", "x": 0, "y": 0, "width": 1024, "height": 768, "level": 1}."""
+    data = data or {}
+    viewport = frame_streamer.set_client_viewport(
+        sid,
+        Viewport(data.get("x", 0), data.get("y", 0), data.get("width", 0),
+                 data.get("height", 0), data.get("level", 0)),
+        detector_name=data.get("detector"),
+        keyframe=data.get("keyframe", True)
+    )
+    return viewport._asdict()
+
+
 def _start_fallback_worker():
     """Start the fallback worker thread if not already running."""
     global _fallback_worker_thread
@@ -90,10 +151,6 @@ class SignalInstance(psygnal.SignalInstance):
     image_emit_interval = .2  # Emit at most every 200ms
     IMG_QUALITY = 80  # Set the desired quality level (0-100)
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Initialize timing for binary streaming
-        self._last_binary_emit_time = 0
     def emit(
         self, *args: Any, check_nargs: bool = False, check_types: bool = False
     ) -> None:
@@ -123,7 +180,7 @@ class SignalInstance(psygnal.SignalInstance):
         del message
 
     def _handle_image_signal(self, args):
-        """Compress and broadcast image signals."""
+        """Hand image signals to the streaming stage (encoding happens there)."""
         detectorName = args[0]
         try:pixelSize = np.min(args[3])
         except:pixelSize = 1
@@ -138,125 +195,10 @@ class SignalInstance(psygnal.SignalInstance):
         try:
             for arg in args:
                 if isinstance(arg, np.ndarray):
-                    output_frame = np.ascontiguousarray(arg)  # Avoid memory fragmentation
-                    
-                    # Check stream parameters for binary streaming
-                    stream_compression_algorithm = global_params.get('stream_compression_algorithm')
-                    if stream_compression_algorithm is not None:
-                        self._emit_binary_frame(output_frame, detectorName, pixelSize, global_params)
-                    
-                    # Always emit JPEG (legacy behavior for compatibility)
-                    self._emit_jpeg_frame(output_frame, detectorName, pixelSize, global_params)
-                        
+                    frame_streamer.submit(self.name, detectorName, arg, pixelSize, global_params)
         except Exception as e:
             print(f"Error processing image signal: {e}")
     
-    def _emit_binary_frame(self, img: np.ndarray, detector_name: str, pixel_size: float, global_params: dict):
-        """Emit binary frame via Socket.IO."""
-        if not HAS_BINARY_STREAMING:
-            return
-            
-        # Get throttle interval from global params
-        throttle_ms = global_params.get('stream_throttle_ms', 200) / 1000.0
-        
-        now = time.time()
-        if now - self._last_binary_emit_time < throttle_ms:
-            return  # Throttle binary emissions
-        
-        # Update encoder config from global params
-        compression_algorithm = global_params.get('stream_compression_algorithm', 'lz4')
-        compression_level = global_params.get('stream_compression_level', 0)
-        subsampling_factor = global_params.get('stream_subsampling_factor', 1)
-        subsampling_auto_max_dim = global_params.get('stream_subsampling_auto_max_dim', 0)
-        
-        # Create or update encoder with current parameters
-        try:
-            from imswitch.imcommon.framework.binary_streaming import BinaryFrameEncoder
-            encoder = BinaryFrameEncoder(
-                compression_algorithm=compression_algorithm,
-                compression_level=compression_level,
-                subsampling_factor=subsampling_factor,
-                subsampling_auto_max_dim=subsampling_auto_max_dim
-            )
-        except ImportError:
-            return  # Binary streaming not available
-        
-        try:
-            # Encode frame
-            packet, metadata = encoder.encode_frame(img)
-            
-            # Emit binary frame
-            sio.start_background_task(sio.emit, "frame", packet)
-            
-            # Emit metadata as JSON signal
-            meta_message = {
-                "name": "frame_meta",
-                "detectorname": detector_name,
-                "pixelsize": int(pixel_size),
-                "format": "binary",
-                "metadata": metadata
-            }
-            sio.start_background_task(sio.emit, "signal", json.dumps(meta_message))
-            
-            self._last_binary_emit_time = now
-            
-        except Exception as e:
-            print(f"Error emitting binary frame: {e}")
-            # Fallback to JPEG if binary fails
-            self._emit_jpeg_frame(img, detector_name, pixel_size, global_params)
-    
-    def _emit_jpeg_frame(self, output_frame: np.ndarray, detector_name: str, pixel_size: float, global_params: dict):
-        """Emit JPEG frame (legacy path)."""
-        try:
-            # Apply legacy subsampling logic
-            if output_frame.shape[0] > 640 or output_frame.shape[1] > 480:
-                everyNthsPixel = np.min((np.min([output_frame.shape[0]//240, output_frame.shape[1]//320]), 3))
-            else:
-                everyNthsPixel = 1
-
-            try:
-                output_frame = output_frame[::everyNthsPixel, ::everyNthsPixel]
-            except:
-                output_frame = np.zeros((640,460))
-                
-            # convert 16 bit to 8 bit for visualization
-            if output_frame.dtype == np.uint16:
-                output_frame = np.uint8(output_frame//128) 
-
-            # Get JPEG quality from global params
-            jpegQuality = global_params.get("compressionlevel", self.IMG_QUALITY)
-            encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpegQuality]
-
-            # Compress image using JPEG format
-            flag, compressed = cv2.imencode(".jpg", output_frame, encode_params)
-            encoded_image = base64.b64encode(compressed).decode('utf-8')
-
-            # Create a minimal message
-            message = {
-                "name": self.name,
-                "detectorname": detector_name,
-                "pixelsize": int(pixel_size), # must not be int64
-                "format": "jpeg",
-                "image": encoded_image,
-            }
-            self._safe_broadcast_message(message)
-            del message
-        except Exception as e:
-            print(f"Error processing JPEG image signal: {e}")
-
-            # Create a minimal message
-            message = {
-                "name": self.name,
-                "detectorname": detector_name,
-                "pixelsize": int(pixel_size), # must not be int64
-                "format": "jpeg",
-                "image": encoded_image,
-            }
-            self._safe_broadcast_message(message)
-            del message
-        except Exception as e:
-            self._logger.error(f"Error emitting JPEG frame: {e}")
-    
     def update_binary_config(self, **kwargs):
         """Update binary streaming configuration at runtime."""
         if self._binary_encoder is not None:
@@ -472,4 +414,6 @@ def start_websocket_server():
     server_thread = threading.Thread(target=run_uvicorn, daemon=True)
     server_thread.start()
 
-start_websocket_server()
+# Not in worker processes (e.g. spawned localization workers importing imswitch)
+if multiprocessing.current_process().name == 'MainProcess':
+    start_websocket_server()
@@ -3,3 +3,5 @@ from .VFileCollection import VFileItem, VFileCollection
 from .api import APIExport, generateAPI, UIExport, generateUI
 from .logging import initLogger
 from .shortcut import shortcut, generateShortcuts
+from .startupprofiler import StartupProfiler, startupProfiler
+from .parallelinit import InitError, ParallelInit
@@ -71,15 +71,20 @@ def getAvailableModules():
 dirtools.initUserFilesIfNeeded()
 _modulesFilePath = os.path.join(dirtools.UserFileDirs.Config, 'modules.json')
 
+_modulesJson = None
 if not os.path.isfile(_modulesFilePath):
     # Modules file doesn't exist, create it.
     _modules = _Modules(enabled=['imcontrol', 'imscripting', 'imnotebook'])
 else:
     with open(_modulesFilePath, 'r') as modulesFile:
-        _modules = _Modules.from_json(modulesFile.read(), infer_missing=True)
+        _modulesJson = modulesFile.read()
+    _modules = _Modules.from_json(_modulesJson, infer_missing=True)
 
-with open(_modulesFilePath, 'w') as modulesFile:
-    modulesFile.write(_modules.to_json(indent=4))
+if _modules.to_json(indent=4) != _modulesJson:
+    # Replace atomically, worker processes importing imswitch read it at the same time
+    with open(_modulesFilePath + f'.{os.getpid()}.tmp', 'w') as modulesFile:
+        modulesFile.write(_modules.to_json(indent=4))
+    os.replace(modulesFile.name, _modulesFilePath)
 
 
 # Copyright (C) 2020-2024 ImSwitch developers
@@ -0,0 +1,317 @@
+"""
+Dependency-aware parallel initialization.
+
+Hardware initialization is dominated by waiting (serial handshakes, camera
+enumeration, ...), so independent devices are brought up concurrently, each
+in its own thread. A task starts as soon as all tasks it depends on are done.
+Tasks that talk to the same hardware resource (e.g. one serial port) never
+run at the same time. A task that exceeds its timeout is abandoned, so one
+hanging device can't block the whole boot; its thread is left to finish (or
+hang) in the background.
+
+Each task is recorded in the startup profiler, which yields the startup
+timeline.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .startupprofiler import startupProfiler
+
+# Locks of hardware resources, shared by all initializers
+_resourceLocks: Dict[str, threading.Lock] = {}
+_resourceHolders: Dict[str, 'InitTask'] = {}
+_resourceLocksLock = threading.Lock()
+
+
+def _resourceLock(resource: str) -> threading.Lock:
+    with _resourceLocksLock:
+        return _resourceLocks.setdefault(resource, threading.Lock())
+
+
+class InitError(Exception):
+    """ Raised if a required initialization task failed or timed out. """
+
+
+class InitTask:
+    """ A unit of initialization work and its outcome. """
+
+    def __init__(self, name: str, func: Callable[[], Any], deps: Iterable[str] = (),
+                 timeout: Optional[float] = None, optional: bool = False,
+                 resources: Iterable[str] = (), onLate: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout if timeout else None
+        self.optional = optional
+        self.resources = tuple(sorted(set(resources)))
+        self.onLate = onLate
+        self.status = 'pending'  # running, done, failed, timeout, skipped
+        self.value = None
+        self.error = None
+        self.exception = None
+        self.tStart = None
+        self.tEnd = None
+        self.thread = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed', 'timeout', 'skipped')
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.tStart is None or self.tEnd is None:
+            return None
+        return self.tEnd - self.tStart
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'status': self.status,
+            'optional': self.optional,
+            'deps': list(self.deps),
+            'resources': list(self.resources),
+            'duration_ms': 1e3 * self.duration if self.duration is not None else None,
+            'error': self.error,
+        }
+
+
+class ParallelInit:
+    """ Runs initialization tasks concurrently, respecting dependencies,
+    shared resources and timeouts. """
+
+    def __init__(self, name: str, parallel: bool = True, phase: str = 'construct'):
+        """
+        Args:
+            name: Name used in log messages and thread names
+            parallel: Whether to run tasks in threads. If False, the tasks run
+              one after another in the calling thread (in the order they were
+              added, dependencies first) and timeouts don't apply.
+            phase: Phase under which the tasks are recorded in the startup
+              profiler, None to not record them (e.g. if the tasks record
+              themselves)
+        """
+        self.name = name
+        self.parallel = parallel
+        self.phase = phase
+        self.tasks: Dict[str, InitTask] = {}
+        self._cond = threading.Condition()
+
+    def add(self, name: str, func: Callable[[], Any], deps: Iterable[str] = (),
+            timeout: Optional[float] = None, optional: bool = False,
+            resources: Iterable[str] = (), onLate: Optional[Callable[[Any], None]] = None) -> InitTask:
+        """ Adds a task.
+
+        Args:
+            name: Unique name of the task
+            func: Called without arguments, its return value is the result
+            deps: Names of the tasks that must be done before this one starts
+            timeout: Seconds the task may run (not counting the time it waits
+              for its resources), None for no limit
+            optional: Whether the initialization may go on without this task
+            resources: Names of the hardware resources the task uses, tasks
+              sharing a resource run one after another
+            onLate: Called with the result if the task completes after it
+              timed out, e.g. to release the hardware again
+        """
+        if name in self.tasks:
+            raise ValueError(f'Duplicate init task {name}')
+        task = InitTask(name, func, deps, timeout, optional, resources, onLate)
+        self.tasks[name] = task
+        return task
+
+    def run(self) -> Dict[str, InitTask]:
+        """ Runs all tasks and returns them by name. Failed tasks don't stop
+        the others; tasks depending on them are skipped. Raises InitError
+        after all tasks have finished if a required task did not succeed. """
+        for task in self.tasks.values():
+            unknown = [dep for dep in task.deps if dep not in self.tasks]
+            if unknown:
+                raise ValueError(f'Init task {task.name} depends on unknown tasks {unknown}')
+
+        if self.parallel:
+            self._runParallel()
+        else:
+            self._runSequential()
+
+        failed = [task for task in self.tasks.values()
+                  if task.status != 'done' and not task.optional]
+        if failed:
+            raise InitError(
+                f'{self.name}: ' + ', '.join(f'{task.name} {task.status} ({task.error})' for task in failed)
+            ) from failed[0].exception
+        return self.tasks
+
+    def results(self) -> Dict[str, Any]:
+        """ Results of the tasks that are done. """
+        return {name: task.value for name, task in self.tasks.items() if task.status == 'done'}
+
+    def timeline(self) -> List[Dict[str, Any]]:
+        return [task.to_dict() for task in sorted(
+            self.tasks.values(), key=lambda task: task.tStart if task.tStart is not None else float('inf')
+        )]
+
+    # Execution
+
+    def _ready(self, task: InitTask) -> Optional[bool]:
+        """ True if all dependencies are done, False if one of them did not
+        succeed, None if they are still pending. """
+        deps = [self.tasks[dep] for dep in task.deps]
+        if any(dep.finished and dep.status != 'done' for dep in deps):
+            return False
+        if all(dep.status == 'done' for dep in deps):
+            return True
+        return None
+
+    def _skip(self, task: InitTask) -> None:
+        failedDeps = [dep for dep in task.deps if self.tasks[dep].status != 'done']
+        task.status = 'skipped'
+        task.error = f'dependencies {failedDeps} not initialized'
+        self._record(task, time.perf_counter(), 0.0)
+
+    def _runSequential(self) -> None:
+        pending = list(self.tasks.values())
+        while pending:
+            progressed = False
+            for task in list(pending):
+                ready = self._ready(task)
+                if ready is None:
+                    continue
+                pending.remove(task)
+                progressed = True
+                if ready:
+                    self._execute(task, resources=())
+                else:
+                    self._skip(task)
+            if not progressed:
+                raise ValueError(f'{self.name}: cyclic dependencies between {[t.name for t in pending]}')
+
+    def _runParallel(self) -> None:
+        pending = list(self.tasks.values())
+        running: List[InitTask] = []
+        with self._cond:
+            while pending or running:
+                for task in list(pending):
+                    ready = self._ready(task)
+                    if ready is None:
+                        continue
+                    pending.remove(task)
+                    if not ready:
+                        self._skip(task)
+                        continue
+                    task.status = 'waiting'
+                    task.thread = threading.Thread(
+                        target=self._execute, args=(task, task.resources),
+                        name=f'init-{task.name}', daemon=True
+                    )
+                    running.append(task)
+                    task.thread.start()
+
+                running = [task for task in running if not task.finished]
+                if not running:
+                    if pending:
+                        # Nothing can make progress anymore
+                        raise ValueError(
+                            f'{self.name}: cyclic dependencies between {[t.name for t in pending]}'
+                        )
+                    break
+
+                # Abandon tasks that exceeded their timeout
+                now = time.perf_counter()
+                wait = None
+                for task in running:
+                    if task.status != 'running' or task.timeout is None:
+                        continue
+                    remaining = task.tStart + task.timeout - now
+                    if remaining <= 0:
+                        task.status = 'timeout'
+                        task.error = f'no response within {task.timeout:g} s'
+                        task.tEnd = now
+                        self._record(task, task.tStart, task.timeout)
+                    else:
+                        wait = remaining if wait is None else min(wait, remaining)
+                if any(task.finished for task in running):
+                    continue
+                self._cond.wait(timeout=wait)
+
+    def _acquire(self, task: InitTask, resources: Iterable[str]) -> List[threading.Lock]:
+        acquired = []
+        try:
+            for resource in resources:
+                lock = _resourceLock(resource)
+                while not lock.acquire(timeout=0.1):
+                    holder = _resourceHolders.get(resource)
+                    if holder is not None and holder.status == 'timeout':
+                        raise InitError(f'{resource} is blocked by {holder.name}, which timed out')
+                _resourceHolders[resource] = task
+                acquired.append((resource, lock))
+        except BaseException:
+            self._release(acquired)
+            raise
+        return acquired
+
+    @staticmethod
+    def _release(acquired) -> None:
+        for resource, lock in reversed(acquired):
+            _resourceHolders.pop(resource, None)
+            lock.release()
+
+    def _execute(self, task: InitTask, resources: Iterable[str]) -> None:
+        acquired = []
+        try:
+            acquired = self._acquire(task, resources)
+            with self._cond:
+                task.status = 'running'
+                task.tStart = time.perf_counter()
+                self._cond.notify_all()
+            value = task.func()
+        except BaseException as e:
+            with self._cond:
+                if task.tStart is None:
+                    task.tStart = time.perf_counter()
+                if task.status != 'timeout':
+                    task.status = 'failed'
+                    task.error = f'{type(e).__name__}: {e}'
+                    task.exception = e
+                    task.tEnd = time.perf_counter()
+                    self._record(task, task.tStart, task.tEnd - task.tStart)
+                self._cond.notify_all()
+        else:
+            late = False
+            with self._cond:
+                if task.status == 'timeout':
+                    late = True
+                else:
+                    task.status = 'done'
+                    task.value = value
+                    task.tEnd = time.perf_counter()
+                    self._record(task, task.tStart, task.tEnd - task.tStart)
+                self._cond.notify_all()
+            if late and task.onLate is not None:
+                task.onLate(value)
+        finally:
+            self._release(acquired)
+
+    def _record(self, task: InitTask, tStart: float, duration: float) -> None:
+        if self.phase is None:
+            return
+        startupProfiler.record(self.phase, task.name, tStart, duration,
+                               error=task.error, status=task.status)
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -51,6 +51,14 @@ def dictToROClass(src, *, missingAttributeErrorMsg=None):
     return ROClass()
 
 
+def iterEntryPoints(group):
+    """ Returns the installed entry points of a group, e.g.
+    "imswitch.implugins" (uses importlib.metadata, which is much faster to
+    import than pkg_resources). """
+    from importlib.metadata import entry_points
+    return list(entry_points(group=group))
+
+
 def installExceptHook():
     if not (hasattr(sys.excepthook, 'implements')
             and sys.excepthook.implements('ExceptionHandler')):
@@ -0,0 +1,133 @@
+"""
+Timing of the ImSwitch startup.
+
+Records how long importing and constructing each module (managers,
+controllers, plugins, ...) takes, so the slow parts of boot-to-first-frame
+can be found, e.g. on a Raspberry Pi. Measurements may be nested (the
+construction of a controller can import a manager); each entry holds its
+inclusive time.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List
+
+
+class StartupProfiler:
+    """ Collects import/construct times per module. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """ Forget all measurements and restart the clock. """
+        with self._lock:
+            self._t0 = time.perf_counter()
+            self._events: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def measure(self, phase: str, name: str):
+        """ Context manager that records the time spent in its body as
+        ``phase`` ("import", "construct", ...) of module ``name``. Failures
+        are recorded as well and re-raised. """
+        tStart = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.record(phase, name, tStart, time.perf_counter() - tStart, error)
+
+    def record(self, phase: str, name: str, tStart: float, duration: float, error: str = None,
+               status: str = None) -> None:
+        """ Adds a measurement (times in perf_counter seconds). """
+        event = {
+            "phase": phase,
+            "name": name,
+            "start_ms": 1e3 * (tStart - self._t0),
+            "duration_ms": 1e3 * duration,
+            "thread": threading.current_thread().name,
+        }
+        if error is not None:
+            event["error"] = error
+        if status is not None:
+            event["status"] = status
+        with self._lock:
+            self._events.append(event)
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events)
+
+    def modules(self) -> Dict[str, Dict[str, float]]:
+        """ Total time per module and phase in ms, slowest module first. """
+        totals: Dict[str, Dict[str, float]] = {}
+        for event in self.events:
+            module = totals.setdefault(event["name"], {"total_ms": 0.0})
+            key = f"{event['phase']}_ms"
+            module[key] = module.get(key, 0.0) + event["duration_ms"]
+            module["total_ms"] += event["duration_ms"]
+        return dict(sorted(totals.items(), key=lambda item: -item[1]["total_ms"]))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "elapsed_ms": 1e3 * (time.perf_counter() - self._t0),
+            "modules": self.modules(),
+            "events": self.timeline(),
+        }
+
+    def timeline(self, phases: Iterable[str] = None) -> List[Dict[str, Any]]:
+        """ Events ordered by their start, optionally of some phases only. """
+        events = [event for event in self.events if phases is None or event["phase"] in phases]
+        return sorted(events, key=lambda event: event["start_ms"])
+
+    def timelineReport(self, phases: Iterable[str] = None) -> str:
+        """ Human-readable timeline, e.g. of the parallel hardware init. """
+        lines = [f"{'start ms':>10}{'end ms':>10}  {'status':<8}{'thread':<28}name"]
+        for event in self.timeline(phases):
+            lines.append(
+                f"{event['start_ms']:>10.1f}{event['start_ms'] + event['duration_ms']:>10.1f}  "
+                f"{event.get('status', 'failed' if 'error' in event else 'done'):<8}"
+                f"{event['thread'][:27]:<28}{event['name']}"
+                + (f"  ({event['error']})" if "error" in event else "")
+            )
+        return "\n".join(lines)
+
+    def report(self, limit: int = 30) -> str:
+        """ Human-readable table of the slowest modules. """
+        modules = self.modules()
+        lines = [f"{'module':<40}{'import ms':>12}{'construct ms':>14}{'total ms':>12}"]
+        for name, times in list(modules.items())[:limit]:
+            lines.append(
+                f"{name:<40}{times.get('import_ms', 0.0):>12.1f}"
+                f"{times.get('construct_ms', 0.0):>14.1f}{times['total_ms']:>12.1f}"
+            )
+        if len(modules) > limit:
+            lines.append(f"... {len(modules) - limit} more")
+        return "\n".join(lines)
+
+
+# Profiler of the running application
+startupProfiler = StartupProfiler()
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,114 @@
+"""
+Unit tests for the executor of synchronous API endpoints.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from imswitch.imcontrol.controller.server.apiexecutor import APIExecutor, validateParams
+
+
+class TestAPIExecutor:
+    """Test the thread pool with per-controller limits and jobs."""
+
+    def test_event_loop_stays_responsive(self):
+        """A blocking call runs in the pool while the loop keeps serving."""
+        executor = APIExecutor(maxWorkers=2)
+
+        async def main():
+            slow = asyncio.ensure_future(executor.run("StageController", "move", time.sleep, 0.3))
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            loopDelay = time.perf_counter() - t0
+            await slow
+            return loopDelay
+
+        assert asyncio.run(main()) < 0.1
+        stats = executor.getStats()
+        assert stats["controllers"]["StageController"]["completed"] == 1
+        assert stats["latency"]["StageController/move"]["count"] == 1
+        executor.shutdown()
+
+    def test_controller_concurrency_limit(self):
+        """Calls beyond a controller's limit wait without blocking others."""
+        executor = APIExecutor(maxWorkers=4, maxConcurrentPerController=1)
+        active, maxActive = {"n": 0}, {"n": 0}
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                active["n"] += 1
+                maxActive["n"] = max(maxActive["n"], active["n"])
+            time.sleep(0.05)
+            with lock:
+                active["n"] -= 1
+
+        async def main():
+            await asyncio.gather(*[executor.run("CameraController", "snap", call) for _ in range(4)],
+                                 executor.run("LaserController", "setValue", lambda: None))
+
+        asyncio.run(main())
+        assert maxActive["n"] == 1
+        controllers = executor.getStats()["controllers"]
+        assert controllers["CameraController"]["completed"] == 4
+        assert controllers["CameraController"]["queued"] == 0
+        assert controllers["LaserController"]["completed"] == 1
+        executor.shutdown()
+
+    def test_job_lifecycle(self):
+        """Jobs run in the background and keep their result or error."""
+        executor = APIExecutor(maxWorkers=2)
+        job = executor.submitJob("StageController", "home", lambda value: value * 2, value=21)
+        failing = executor.submitJob("StageController", "fail", lambda: 1 / 0)
+        for _ in range(100):
+            if executor.getJob(job["jobId"])["finished"] and executor.getJob(failing["jobId"])["finished"]:
+                break
+            time.sleep(0.01)
+
+        assert executor.getJob(job["jobId"])["status"] == "done"
+        assert executor.getJobResult(job["jobId"]) == 42
+        assert executor.getJob(failing["jobId"])["status"] == "failed"
+        assert "ZeroDivisionError" in executor.getJob(failing["jobId"])["error"]
+        assert executor.getJob("unknown") is None
+        executor.shutdown()
+
+    def test_cancelled_before_start_leaves_no_queue(self):
+        """A request dropped while its call waits for a pool thread is not counted as queued."""
+        executor = APIExecutor(maxWorkers=1, maxConcurrentPerController=0)
+        release = threading.Event()
+
+        async def main():
+            blocker = asyncio.ensure_future(executor.run("CameraController", "snap", release.wait, 5))
+            pending = asyncio.ensure_future(executor.run("StageController", "move", lambda: None))
+            await asyncio.sleep(0.05)
+            pending.cancel()
+            await asyncio.sleep(0.01)
+            release.set()
+            await blocker
+
+        asyncio.run(main())
+        stats = executor.getStats()
+        assert stats["queueDepth"] == 0
+        assert stats["controllers"]["StageController"]["completed"] == 0
+        executor.shutdown()
+
+    def test_validate_params(self):
+        """Job parameters are converted like request parameters."""
+
+        class Target(BaseModel):
+            x: float
+            y: float = 0.0
+
+        def move(target: Target, speed: int = 1000):
+            return target, speed
+
+        params = validateParams(move, {"target": {"x": "1.5"}, "speed": "20"})
+        assert params == {"target": Target(x=1.5), "speed": 20}
+        with pytest.raises(ValidationError):
+            validateParams(move, {"target": {"x": 1}, "unknown": 1})
+        with pytest.raises(ValidationError):
+            validateParams(move, {"speed": 1})
@@ -0,0 +1,44 @@
+"""
+Unit tests for the focus peak estimation of the autofocus.
+"""
+
+import numpy as np
+from imswitch.imcontrol.controller.controllers.AutofocusController import (
+    fitFocusPeak, hardwareFrameTimes
+)
+
+
+class TestFitFocusPeak:
+    """Test the sub-sample focus peak fit."""
+
+    def test_gaussian_peak_between_samples(self):
+        """A Gaussian focus curve is located well below the sampling step."""
+        z = np.linspace(-50, 50, 21)  # 5 um steps
+        values = 10 + 100 * np.exp(-(z - 3.3) ** 2 / (2 * 8 ** 2))
+        peak, method = fitFocusPeak(z, values)
+        assert method == "gauss"
+        assert abs(peak - 3.3) < 0.1
+
+    def test_noisy_unsorted_samples(self):
+        """Frames from a sweep may arrive unsorted and noisy."""
+        rng = np.random.default_rng(0)
+        z = rng.uniform(-50, 50, 200)
+        values = 5 + 50 * np.exp(-(z + 12.0) ** 2 / (2 * 10 ** 2)) + rng.normal(0, 0.5, z.size)
+        peak, _ = fitFocusPeak(z, values)
+        assert abs(peak + 12.0) < 1.0
+
+    def test_peak_at_border_and_few_samples(self):
+        """Without a maximum inside the range the best sample is returned."""
+        assert fitFocusPeak([0, 1, 2, 3], [1, 2, 3, 4]) == (3.0, "max")
+        assert fitFocusPeak([0, 1], [2, 1]) == (0.0, "max")
+
+    def test_hardware_frame_times(self):
+        """Camera ticks are mapped to host time without the arrival jitter."""
+        rng = np.random.default_rng(1)
+        exposed = 1000.0 + np.arange(40) * 0.02  # 50 fps
+        ticks = np.int64((exposed - 990.0) * 1e8)  # 10 ns camera clock
+        arrival = exposed + 0.005 + rng.exponential(0.004, exposed.size)
+        times = hardwareFrameTimes(ticks, arrival)
+        assert np.abs(np.diff(times) - 0.02).max() < 1e-3
+        assert np.abs(times - exposed - 0.005).max() < 2e-3
+        assert hardwareFrameTimes(np.zeros(40), arrival) is None
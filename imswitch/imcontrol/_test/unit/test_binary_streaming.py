@@ -0,0 +1,189 @@
+"""
+Unit tests for the binary frame streaming encoder.
+"""
+
+import numpy as np
+from imswitch.imcommon.framework.binary_streaming import (
+    BinaryFrameEncoder, FrameBufferPool, TiledFrameEncoder, Viewport,
+    box_downsample, get_detector_encoder, get_detector_encoder_stats
+)
+
+
+class TestBinaryFrameEncoder:
+    """Test encoding/decoding and buffer reuse of the binary frame encoder."""
+
+    def test_roundtrip_uncompressed(self):
+        """Uncompressed frames decode to the original pixels."""
+        encoder = BinaryFrameEncoder(compression_algorithm="none")
+        img = np.arange(64 * 48, dtype=np.uint16).reshape(48, 64)
+
+        packet, metadata = encoder.encode_frame(img)
+        decoded, _ = encoder.decode_frame(packet)
+
+        assert metadata["packet_bytes"] == len(packet)
+        np.testing.assert_array_equal(decoded, img)
+
+    def test_roundtrip_lz4_subsampled(self):
+        """Compressed and subsampled frames decode to the strided image."""
+        encoder = BinaryFrameEncoder(compression_algorithm="lz4", subsampling_factor=2)
+        img = np.random.randint(0, 4096, (100, 80), dtype=np.uint16)
+
+        packet, metadata = encoder.encode_frame(img)
+        decoded, _ = encoder.decode_frame(packet)
+
+        assert metadata["subsampling_factor"] == 2
+        np.testing.assert_array_equal(decoded, img[::2, ::2])
+
+    def test_buffers_are_reused(self):
+        """Encoding frames of the same size does not allocate new buffers."""
+        encoder = BinaryFrameEncoder(compression_algorithm="none", subsampling_factor=2,
+                                     pool_size=2)
+        img = np.zeros((120, 160), dtype=np.uint8)
+        for _ in range(10):
+            encoder.encode_frame_into(img)
+
+        stats = encoder.get_stats()
+        assert stats["frames_encoded"] == 10
+        assert stats["buffer_allocations"] == 2
+        assert stats["scratch_allocations"] == 2  # uint16 conversion + subsampling
+
+    def test_owned_packet_matches_pooled_packet(self):
+        """encode_frame returns the same packet as the pooled view, as bytes."""
+        for algorithm in ("none", "lz4"):
+            encoder = BinaryFrameEncoder(compression_algorithm=algorithm)
+            img = np.random.randint(0, 4096, (48, 64), dtype=np.uint16)
+
+            owned, _ = encoder.encode_frame(img)
+            view, _ = encoder.encode_frame_into(img)
+
+            assert type(owned) is bytes
+            packet = bytes(view)
+            assert owned[:24] == packet[:24]  # header up to the timestamp
+            assert owned[32:] == packet[32:]
+
+    def test_buffer_pool_grows_only_when_needed(self):
+        """The pool only reallocates when a packet does not fit."""
+        pool = FrameBufferPool(pool_size=1)
+        pool.acquire(100)
+        pool.acquire(50)
+        assert pool.allocations == 1
+        pool.acquire(1000)
+        assert pool.allocations == 2
+
+
+class TestTiledFrameEncoder:
+    """Test the version 2 viewport/tile protocol."""
+
+    def test_viewport_full_resolution(self):
+        """A level 0 viewport decodes to the exact sensor region."""
+        encoder = TiledFrameEncoder(compression_algorithm="lz4", tile_size=32)
+        img = np.random.randint(0, 4096, (200, 300), dtype=np.uint16)
+        viewport = Viewport(x=50, y=20, width=100, height=70, level=0)
+
+        packet, metadata = encoder.encode_viewport(img, viewport)
+        decoded, header = encoder.decode_tiled_frame(packet)
+
+        assert header["keyframe"]
+        assert header["roi"] == (50, 20, 100, 70)
+        np.testing.assert_array_equal(decoded, img[20:90, 50:150])
+
+    def test_overview_is_box_filtered(self):
+        """Zoomed-out levels are mean-pooled instead of strided."""
+        img = np.zeros((8, 8), dtype=np.uint16)
+        img[::2, ::2] = 400  # strided subsampling would only see these pixels
+        encoder = TiledFrameEncoder(compression_algorithm="none")
+
+        packet, _ = encoder.encode_viewport(img, Viewport(level=1))
+        decoded, header = encoder.decode_tiled_frame(packet)
+
+        assert header["level"] == 1
+        assert decoded.shape == (4, 4)
+        assert np.all(decoded == 100)
+        np.testing.assert_array_equal(box_downsample(img, 2), decoded)
+
+    def test_deep_overview_does_not_overflow(self):
+        """Block sums of 512 x 512 bright pixels exceed uint32."""
+        img = np.full((2048, 2048), 60000, dtype=np.uint16)
+        level = Viewport(level=9).clamp(2048, 2048).level
+
+        assert level == 9
+        assert np.all(box_downsample(img, 2 ** level) == 60000)
+
+    def test_unchanged_tiles_are_skipped(self):
+        """Delta packets only carry the tiles that changed."""
+        encoder = TiledFrameEncoder(compression_algorithm="lz4", tile_size=16)
+        img = np.random.randint(0, 4096, (64, 64), dtype=np.uint16)
+
+        first, meta1 = encoder.encode_viewport(img, Viewport())
+        previous, _ = encoder.decode_tiled_frame(first)
+        img2 = img.copy()
+        img2[40, 40] += 1
+        second, meta2 = encoder.encode_viewport(img2, Viewport())
+        decoded, header = encoder.decode_tiled_frame(second, previous)
+
+        assert meta1["tiles_sent"] == 16
+        assert meta2["tiles_sent"] == 1
+        assert meta2["tiles_skipped"] == 15
+        assert not header["keyframe"]
+        np.testing.assert_array_equal(decoded, img2)
+
+    def test_viewport_clamped_to_frame(self):
+        """Viewports are clipped to the frame and aligned to the zoom factor."""
+        viewport = Viewport(x=90, y=0, width=500, height=0, level=2).clamp(100, 50)
+        assert viewport == Viewport(90, 0, 8, 48, 2)
+
+
+class TestDetectorEncoderRegistry:
+    """Test the long-lived per-detector encoders."""
+
+    def test_encoder_is_persistent_and_reconfigured(self):
+        """The same encoder is returned until the stream params change."""
+        params = {"stream_compression_algorithm": "none"}
+        encoder = get_detector_encoder("testDetector", params)
+        assert get_detector_encoder("testDetector", dict(params)) is encoder
+        assert encoder.get_stats()["reconfigurations"] == 0
+
+        params["stream_subsampling_factor"] = 4
+        assert get_detector_encoder("testDetector", params) is encoder
+        assert encoder.subsampling_factor == 4
+        assert encoder.get_stats()["reconfigurations"] == 1
+        assert "testDetector" in get_detector_encoder_stats()
+
+
+class TestFrameStreamer:
+    """Test the latest-frame-wins streaming stage."""
+
+    def _make_streamer(self):
+        from imswitch.imcommon.framework.frame_streaming import FrameStreamer
+        emitted = []
+        streamer = FrameStreamer(lambda event, data, room: emitted.append((event, room)))
+        return streamer, emitted
+
+    def test_no_subscribers_no_work(self):
+        """Frames are not accepted when no client is connected."""
+        streamer, emitted = self._make_streamer()
+        assert not streamer.submit("sigUpdateImage", "cam", np.zeros((8, 8), np.uint16))
+        assert emitted == []
+
+    def test_latest_frame_wins(self):
+        """A pending frame is replaced instead of queued."""
+        streamer, _ = self._make_streamer()
+        streamer.add_client("sid1", ["jpeg"])
+        streamer.start = lambda: None  # keep the slot unconsumed
+        for _ in range(3):
+            streamer.submit("sigUpdateImage", "cam", np.zeros((8, 8), np.uint16))
+        stats = streamer.get_stats()
+        assert stats["frames_submitted"] == 3
+        assert stats["frames_dropped"] == 2
+
+    def test_only_subscribed_formats_are_encoded(self):
+        """JPEG is encoded once and only sent to subscribed rooms."""
+        from imswitch.imcommon.framework.frame_streaming import _FrameSlot
+        streamer, emitted = self._make_streamer()
+        streamer.add_client("sid1", ["jpeg"])
+        streamer.add_client("sid2", ["unknown"])
+        slot = _FrameSlot("sigUpdateImage", "cam", np.zeros((16, 16), np.uint16), 1,
+                          {"stream_compression_algorithm": "lz4"})
+        streamer.stream_slot(slot)
+        assert emitted == [("frame_jpeg", "stream_jpeg")]
+        assert streamer.get_stats()["binary_encoded"] == 0
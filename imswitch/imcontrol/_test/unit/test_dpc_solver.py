@@ -0,0 +1,71 @@
+"""
+Unit tests for the precomputed DPC solver and the streaming DPC processor.
+"""
+
+import types
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.controller.controllers.DPCController import DPCProcessor, DPCSolver
+
+
+def _solver(shape=(64, 80)):
+    return DPCSolver(shape=shape, wavelength=.53, na=.3, NAi=0.0, pixelsize=.2, rotation=[0, 180, 90, 270],
+                     reg_u=1e-1, reg_p=5e-3)
+
+
+class TestDPCSolver:
+    """Test the cached inverse filters and the float32 multi-group solve."""
+
+    def test_solve_matches_full_spectrum_inverse(self):
+        solver = _solver((48, 80))  # not cached yet, the frequency grids are computed
+        rng = np.random.default_rng(0)
+        images = (rng.random((8, 48, 80)) * 1000 + 2000).astype(np.uint16)
+        result = solver.solve(images)
+        assert result.shape == (2, 48, 80) and result.dtype == np.complex64
+
+        # unfactored Tikhonov inverse on the full complex spectra
+        solver.sourceGen()
+        solver.WOTFGen()
+        Hu, Hp = solver.Hu, solver.Hp
+        solver.dpc_imgs = images[4:].astype(np.float32)
+        solver.normalization()
+        fIntensity = np.fft.fft2(solver.dpc_imgs)
+        AHA = [(Hu.conj() * Hu).sum(0) + 1e-1, (Hu.conj() * Hp).sum(0),
+               (Hp.conj() * Hu).sum(0), (Hp.conj() * Hp).sum(0) + 5e-3]
+        AHy = [(Hu.conj() * fIntensity).sum(0), (Hp.conj() * fIntensity).sum(0)]
+        determinant = AHA[0] * AHA[3] - AHA[1] * AHA[2]
+        phase = np.fft.ifft2((AHA[0] * AHy[1] - AHA[2] * AHy[0]) / determinant).real
+        np.testing.assert_allclose(result[1].imag, phase, atol=1e-5 * np.abs(phase).max())
+
+        assert _solver((48, 80))._filters is solver._filters
+
+    def test_empty_source_is_rejected(self):
+        with pytest.raises(ValueError, match="NAi"):
+            DPCSolver(shape=(32, 32), wavelength=.53, na=.3, NAi=.3, pixelsize=.2, rotation=[0, 180, 90, 270])
+        solver = _solver((32, 32))
+        with pytest.raises(ValueError, match="NAi"):
+            solver.setParameters(NAi=.4)
+        assert solver.NAi == 0.0 and np.all(np.isfinite(solver._filters))
+
+    def test_processor_streams_all_groups(self):
+        emitted = []
+        parent = types.SimpleNamespace(sigDPCProcessorImageComputed=types.SimpleNamespace(
+            emit=lambda image, name: emitted.append((name, image))))
+        processor = DPCProcessor(parent, (64, 80), None, maxQueue=2)
+        processor.setParameters({"pixelsize": .2, "NA": .3, "NAi": 0.0, "n": 1, "wavelength": .53})
+        solve, results = processor.dpc_solver_obj.solve, []
+        processor.dpc_solver_obj.solve = lambda **kwargs: results.append(solve(**kwargs)) or results[-1]
+        for _ in range(10):
+            for _ in range(4):
+                processor.addFrameToStack(np.full((64, 80), 1000, np.uint16))
+            processor.reconstruct()
+            processor.clearStack()
+        processor.stop()
+        assert processor.getStats()["groups_reconstructed"] == 10
+        names = [name for name, _ in emitted]
+        assert "DPC left/right" in names
+        assert all(np.all(np.isfinite(image)) for _, image in emitted)
+        assert sum(len(result) for result in results) == 10
+        assert all(np.all(np.isfinite(result)) for result in results)
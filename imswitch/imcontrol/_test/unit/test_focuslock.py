@@ -0,0 +1,114 @@
+"""
+Unit tests for the frame-driven focus lock loop.
+"""
+
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.controller.controllers.FocusLockController import (
+    FocusLockController, FocusLockParams
+)
+from imswitch.imcontrol.controller.focusmetrics import FocusMetricFactory
+from imswitch.imcontrol.controller.latencystats import LatencyTracker
+from imswitch.imcontrol.model.managers.detectors.framebuffer import FrameRingBuffer
+
+
+class _Metric:
+    """Records the crops and stops the loop after a number of frames."""
+
+    def __init__(self, controller, buffer, frames):
+        self.controller, self.buffer, self.frames = controller, buffer, frames
+        self.crops = []
+
+    def compute(self, crop):
+        self.crops.append(crop.copy())
+        if len(self.crops) < len(self.frames):
+            self.buffer.push(self.frames[len(self.crops)])
+        else:
+            self.controller._FocusLockController__isPollingFramesActive = False
+        return {"focus": float(crop.mean()), "t": 0.0}
+
+
+def _controller(buffer, frames, cropSize=8):
+    controller = FocusLockController.__new__(FocusLockController)
+    controller._focus_params = FocusLockParams(crop_size=cropSize)
+    controller._focus_metric = _Metric(controller, buffer, frames)
+    controller._state = SimpleNamespace(is_measuring=True)
+    controller.locked = controller.aboutToLock = False
+    controller.pi = controller._csv_logger = None
+    controller.currentZPosition = 0.0
+    controller.pollingFrameUpdatePeriode = 0.0
+    controller._frameEvent = threading.Event()
+    controller._cropBuffer = None
+    controller._frameStats = {"processed": 0, "skipped": 0, "overwritten": 0}
+    controller._latency = LatencyTracker()
+    controller._FocusLockController__isPollingFramesActive = True
+    controller.emitted = []
+    controller.sigFocusValueUpdate = SimpleNamespace(emit=controller.emitted.append)
+    controller.updateSetPointData = lambda: None
+    return controller
+
+
+class TestFocusLockLoop:
+    """Test cropping and the frame handling of the focus loop."""
+
+    @pytest.mark.parametrize("cropSize, center", [(8, None), (7, [10, 20]), (8, [2, 29]), (9, [31, 0])])
+    def test_crop_matches_nip_extract(self, cropSize, center):
+        nip = pytest.importorskip("NanoImagingPack")
+        frame = np.arange(32 * 40, dtype=np.uint16).reshape(32, 40)
+        controller = _controller(None, [], cropSize)
+        controller._focus_params.crop_center = center
+
+        expected = nip.extract(img=frame, ROIsize=(cropSize, cropSize), centerpos=center,
+                               PadValue=0.0, checkComplex=True)
+        np.testing.assert_array_equal(controller._cropIntoBuffer(frame), np.asarray(expected))
+
+    def test_loop_processes_each_frame_once(self):
+        frames = [np.full((16, 16), value, dtype=np.uint16) for value in (10, 20, 30)]
+        buffer = FrameRingBuffer(4)
+        buffer.push(frames[0])
+        controller = _controller(buffer, frames)
+        controller._focusLoop(SimpleNamespace(frameBuffer=buffer))
+
+        assert [crop.mean() for crop in controller._focus_metric.crops] == [10, 20, 30]
+        assert [data["focus_value"] for data in controller.emitted] == [10, 20, 30]
+        assert controller._frameStats == {"processed": 3, "skipped": 0, "overwritten": 0}
+        assert controller._latency.to_dict()["metric"]["count"] == 3
+
+    def test_overwritten_frame_is_dropped(self):
+        frames = [np.full((16, 16), value, dtype=np.uint16) for value in (10, 20)]
+        buffer = FrameRingBuffer(2)
+        buffer.push(frames[0])
+        controller = _controller(buffer, frames[1:])  # stop after one crop
+        crop = controller._cropIntoBuffer
+
+        def cropWhileCameraWrites(frame):
+            # the camera fills the ring while the first frame is cropped
+            result = crop(frame)
+            if buffer.head == 1:
+                buffer.push(frames[0])
+                buffer.push(frames[1])
+            return result
+
+        controller._cropIntoBuffer = cropWhileCameraWrites
+        controller._focusLoop(SimpleNamespace(frameBuffer=buffer))
+
+        assert [crop.mean() for crop in controller._focus_metric.crops] == [20]
+        assert controller._frameStats["overwritten"] == 1
+
+    def test_invalid_params_are_not_stored(self):
+        controller = _controller(None, [])
+        controller._focus_metric = FocusMetricFactory.create("astigmatism")
+        params = controller.getFocusLockParams()
+
+        for invalid in ({"astigmatism_fit": "unknown"}, {"focus_metric": "unknown"}):
+            with pytest.raises(ValueError):
+                controller.setFocusLockParams(**invalid)
+        assert controller.getFocusLockParams() == params
+
+        controller.setFocusLockParams(astigmatism_fit="moments", crop_size=64)
+        assert controller._focus_metric.config.astigmatism_fit == "moments"
+        assert controller._focus_metric.config.crop_radius == 64
@@ -0,0 +1,108 @@
+"""
+Unit tests for the batched focus metric engine.
+"""
+
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from imswitch.imcontrol.controller.focusmetrics import (
+    FocusConfig, FocusMetricFactory, _benchmark_stack
+)
+
+
+@pytest.fixture
+def stack():
+    return _benchmark_stack((4, 96, 128))
+
+
+class TestFocusMetricEngine:
+    """Test the float32 stack processing shared by all focus metrics."""
+
+    def test_preprocess_matches_float64_reference(self, stack):
+        """The in-place float32 preprocessing matches the scipy float64 pipeline."""
+        metric = FocusMetricFactory.create("astigmatism")
+        reference = gaussian_filter(stack[2].astype(float), metric.config.gaussian_sigma)
+        reference = reference / max(reference.max(), 0.1) * 255
+        reference -= reference.mean() / 2.0
+        reference[reference < metric.config.background_threshold] = 0
+
+        result = metric.preprocess_frame(stack[2])
+        assert result.dtype == np.float32
+        np.testing.assert_allclose(result, reference, atol=1e-2)
+
+    @pytest.mark.parametrize("metric_type", ["astigmatism", "center_of_mass", "laplacian", "variance"])
+    def test_batch_matches_single_frames(self, stack, metric_type):
+        """compute_batch gives the same values as compute frame by frame."""
+        metric = FocusMetricFactory.create(metric_type, FocusConfig(num_threads=2))
+        single = [metric.compute(frame)["focus"] for frame in stack]
+        np.testing.assert_allclose(metric.compute_batch(stack), single, rtol=1e-6)
+
+    @pytest.mark.parametrize("metric_type", ["astigmatism", "center_of_mass", "laplacian"])
+    def test_color_frames_use_luma(self, stack, metric_type):
+        """RGB frames give the focus value of their cv2 grayscale conversion."""
+        cv2 = pytest.importorskip("cv2")
+        rng = np.random.default_rng(0)
+        rgb = (stack[1][..., None] * rng.uniform(0.2, 1.0, 3)).astype(np.uint8)
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY).astype(np.float32)
+        metric = FocusMetricFactory.create(metric_type)
+
+        np.testing.assert_allclose(metric.as_float_stack(rgb[None])[0], gray, atol=0.51)
+        expected = FocusMetricFactory.create(metric_type).compute(metric.as_float_stack(rgb[None])[0].copy())
+        assert metric.compute(rgb)["focus"] == pytest.approx(expected["focus"], rel=1e-6)
+
+    def test_working_stack_per_thread(self, stack):
+        """Concurrent callers don't share the float32 working stack."""
+        import threading
+        metric = FocusMetricFactory.create("variance")
+        mine = metric.as_float_stack(stack[:1])
+        other = []
+        thread = threading.Thread(target=lambda: other.append(metric.as_float_stack(stack[1:2])))
+        thread.start()
+        thread.join()
+        assert other[0] is not mine
+        np.testing.assert_array_equal(mine[0], stack[0])
+
+    def test_benchmark_reports_all_metrics(self):
+        """The microbenchmark times every metric once (aliases skipped)."""
+        results = FocusMetricFactory.benchmark(shape=(2, 64, 64), repeats=1)
+        assert set(results) == {"astigmatism", "center_of_mass", "laplacian", "variance"}
+        assert all(r["frame_ms"] > 0 and r["batch_ms"] > 0 for r in results.values())
+
+
+class TestAstigmatismFit:
+    """Test the closed-form width estimators of the astigmatism metric."""
+
+    @pytest.mark.parametrize("estimator", ["estimate_sigma_log_gauss", "estimate_sigma_moments"])
+    def test_closed_form_recovers_gaussian(self, estimator):
+        """Both estimators recover center and width of a Gaussian on an offset."""
+        x = np.arange(200.0)
+        proj = 5 + 100 * np.exp(-(x - 87.3) ** 2 / (2 * 12.5 ** 2))
+        i0, x0, sigma, _ = getattr(FocusMetricFactory.create("astigmatism"), estimator)(proj)
+        assert i0 == pytest.approx(5.0, abs=1e-3)
+        assert x0 == pytest.approx(87.3, abs=1e-3)
+        assert sigma == pytest.approx(12.5, rel=1e-3)
+
+    def test_fast_path_agrees_with_curve_fit(self, stack):
+        """The closed-form focus values follow the iterative fit closely."""
+        fitted = FocusMetricFactory.create("astigmatism", FocusConfig(astigmatism_fit="curve_fit"))
+        fast = FocusMetricFactory.create("astigmatism")
+        reference = [fitted.compute(frame)["focus"] for frame in stack]
+        results = [fast.compute(frame) for frame in stack]
+        assert all(r["fit_method"] == "log_gauss" for r in results)
+        np.testing.assert_allclose([r["focus"] for r in results], reference, rtol=0.03)
+        assert fast.get_timing_stats()["count"] == len(stack)
+
+    def test_flat_projection_falls_back(self):
+        """Without a peak the metric falls back to the (warm-started) fit."""
+        metric = FocusMetricFactory.create("astigmatism")
+        sigma, method = metric.estimate_sigma("x", np.ones(50))
+        assert method in ("curve_fit", "std")
+        assert np.isfinite(sigma)
+
+    def test_failed_frame_reports_compute_time(self):
+        """The error result carries the compute time like a successful one."""
+        metric = FocusMetricFactory.create("astigmatism")
+        result = metric.compute(np.zeros(5))  # not an image
+        assert "error" in result and result["compute_ms"] >= 0
+        assert metric.get_timing_stats()["count"] == 1
@@ -0,0 +1,212 @@
+"""
+Unit tests for the detector frame ring buffer.
+"""
+
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.managers.detectors.DetectorManager import DetectorManager, DetectorNumberParameter
+from imswitch.imcontrol.model.managers.detectors.framebuffer import FrameRingBuffer
+
+
+def _frame(value, shape=(4, 6)):
+    return np.full(shape, value, dtype=np.uint16)
+
+
+class TestFrameRingBuffer:
+    """Test the single-producer/multi-consumer ring buffer."""
+
+    def test_lazy_allocation_and_latest(self):
+        """Storage is allocated on the first frame and keeps metadata."""
+        buffer = FrameRingBuffer(capacity=4)
+        assert not buffer.allocated
+        assert buffer.latest() is None
+
+        buffer.push(_frame(7), frameId=42, timestamp=1000)
+        frame, frameId, timestamp, _ = buffer.latest()
+
+        assert buffer.allocated
+        assert frameId == 42
+        assert timestamp == 1000
+        np.testing.assert_array_equal(frame, _frame(7))
+
+    def test_consumers_do_not_steal_frames(self):
+        """Every cursor sees every frame independently."""
+        buffer = FrameRingBuffer(capacity=8)
+        recorder = buffer.createCursor()
+        liveview = buffer.createCursor()
+        for i in range(3):
+            buffer.push(_frame(i), frameId=i)
+
+        frames, ids, _, _ = recorder.read()
+        assert list(ids) == [0, 1, 2]
+        assert frames.shape == (3, 4, 6)
+        assert len(recorder.read()[1]) == 0
+
+        buffer.push(_frame(3), frameId=3)
+        assert list(liveview.read()[1]) == [0, 1, 2, 3]
+        assert list(recorder.read()[1]) == [3]
+
+    def test_wraparound_and_overruns(self):
+        """Slow consumers lose the oldest frames and count them."""
+        buffer = FrameRingBuffer(capacity=4)
+        cursor = buffer.createCursor()
+        for i in range(10):
+            buffer.push(_frame(i), frameId=i)
+
+        frames, ids, _, _ = cursor.read()
+        # The slot written next is never handed out, so capacity - 1 remain
+        assert list(ids) == [7, 8, 9]
+        assert cursor.overruns == 7
+        np.testing.assert_array_equal(frames[:, 0, 0], [7, 8, 9])
+
+    def test_max_frames(self):
+        """Reads can be limited and continue where they stopped."""
+        buffer = FrameRingBuffer(capacity=8)
+        cursor = buffer.createCursor()
+        for i in range(5):
+            buffer.push(_frame(i), frameId=i)
+        assert list(cursor.read(maxFrames=2)[1]) == [0, 1]
+        assert list(cursor.read()[1]) == [2, 3, 4]
+
+    def test_reallocation_on_shape_change(self):
+        """A new frame shape reallocates and resets the cursors."""
+        buffer = FrameRingBuffer(capacity=4)
+        cursor = buffer.createCursor()
+        buffer.push(_frame(1))
+        buffer.push(_frame(2, shape=(8, 8)), frameId=5)
+
+        assert buffer.frameShape == (8, 8)
+        frames, ids, _, _ = cursor.read()
+        assert list(ids) == [5]
+        assert frames.shape == (1, 8, 8)
+
+    def test_capacity_limited_by_max_bytes(self):
+        """The capacity is reduced to respect the memory budget."""
+        buffer = FrameRingBuffer(capacity=100, maxBytes=10 * 4 * 6 * 2)
+        buffer.push(_frame(0))
+        assert buffer.capacity == 10
+
+    def test_shared_memory_attach(self):
+        """Another process view sees the frames written by the producer."""
+        buffer = FrameRingBuffer(capacity=4, shared=True)
+        try:
+            buffer.push(_frame(3), frameId=1)
+            reader = FrameRingBuffer.attach(buffer.info())
+            buffer.push(_frame(4), frameId=2)
+
+            frame, frameId, _, _ = reader.latest()
+            assert frameId == 2
+            np.testing.assert_array_equal(frame, _frame(4))
+            reader.close()
+        finally:
+            buffer.close()
+
+    def test_shared_views_outlive_release(self):
+        """Views into a released segment stay valid until they are dropped."""
+        buffer = FrameRingBuffer(capacity=4, shared=True)
+        buffer.push(_frame(5))
+        view = buffer.latest(copy=False)[0]
+        buffer.push(_frame(6, shape=(8, 8)))  # reallocates the segment
+        buffer.close()
+        np.testing.assert_array_equal(view, _frame(5))
+        assert len(buffer._retiredShm) == 1
+
+        del view
+        buffer.close()
+        assert buffer._retiredShm == []
+
+    def test_first_after_host_time(self):
+        """Frames are found by their arrival time."""
+        buffer = FrameRingBuffer(capacity=4)
+        assert buffer.firstAfter(0, 0.0) is None
+        for i in range(6):
+            buffer.push(_frame(i), frameId=i, hostTime=100.0 + i)
+        assert buffer.firstAfter(0, 0.0) == 3  # oldest readable
+        assert buffer.firstAfter(0, 104.5) == 5
+        assert buffer.firstAfter(0, 106.0) is None
+
+
+class _Detector(DetectorManager):
+    def __init__(self, frameNumbers=True):
+        info = types.SimpleNamespace(managerProperties={'readoutTimeMs': 10}, forAcquisition=True,
+                                     forFocusLock=False)
+        parameters = {'exposure': DetectorNumberParameter(group='Misc', value=30, valueUnits='ms',
+                                                          editable=True)}
+        super().__init__(info, 'test', fullShape=(6, 4), supportedBinnings=[1], model='test',
+                         parameters=parameters)
+        self.frameNumbers = frameNumbers
+        self.frameId = 0
+
+    def getLatestFrame(self, returnFrameNumber=False):
+        frame = _frame(self.frameId)
+        if not returnFrameNumber:
+            return frame
+        if not self.frameNumbers:
+            raise TypeError
+        return frame, self.frameId
+
+    pixelSizeUm = [1, 1, 1]
+    crop = getChunk = flushBuffers = startAcquisition = stopAcquisition = lambda *args: None
+
+
+class TestFrameAfter:
+    """Test that getFrameAfter skips frames exposed before the requested time."""
+
+    def test_pushed_frames(self):
+        detector = _Detector()
+        assert detector.exposureTime == 0.03 and detector.readoutTime == 0.01
+
+        def camera():
+            for i in range(1, 30):
+                time.sleep(0.01)
+                detector.pushFrame(_frame(i), frameId=i)
+
+        detector.pushFrame(_frame(0), frameId=0)
+        thread = threading.Thread(target=camera)
+        thread.start()
+        t = time.time()
+        frame, info = detector.getFrameAfter(t, returnInfo=True)
+        assert info['hostTime'] - 0.04 >= t and info['exposureStart'] >= t
+        assert frame[0, 0] == info['frameId'] >= 4
+        thread.join()
+        with pytest.raises(TimeoutError):
+            detector.getFrameAfter(timeout=0.05)
+
+    def test_scan_continues_after_checked_frames(self):
+        detector = _Detector()
+        buffer = detector.frameBuffer
+        detector.pushFrame(_frame(0), frameId=0)
+        firstAfter, starts = buffer.firstAfter, []
+        buffer.firstAfter = lambda start, hostTime: starts.append(start) or firstAfter(start, hostTime)
+
+        def camera():
+            for i in range(1, 20):
+                time.sleep(0.01)
+                detector.pushFrame(_frame(i), frameId=i)
+
+        thread = threading.Thread(target=camera)
+        thread.start()
+        frame, info = detector.getFrameAfter(time.time(), returnInfo=True)
+        thread.join()
+        assert frame[0, 0] == info['frameId'] >= 4
+        assert starts == sorted(starts) and starts[-1] >= 4  # earlier frames are not rescanned
+
+    def test_polled_frames(self):
+        detector = _Detector()
+
+        def camera():
+            for i in range(1, 20):
+                time.sleep(0.01)
+                detector.frameId = i
+
+        thread = threading.Thread(target=camera)
+        thread.start()
+        t = time.time()
+        frame, info = detector.getFrameAfter(t, returnInfo=True)
+        assert info['hostTime'] - 0.04 >= t and frame[0, 0] == info['frameId']
+        thread.join()
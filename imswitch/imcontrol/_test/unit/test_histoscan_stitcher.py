@@ -0,0 +1,58 @@
+"""
+Unit tests for the memory-mapped HistoScan stitcher.
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from imswitch.imcontrol.controller.controllers.HistoScanController import ImageStitcher
+
+
+class TestImageStitcher:
+    """Test the queued, feathered stitching into a memory-mapped canvas."""
+
+    def test_feathered_blend_on_memmap_canvas(self, tmp_path):
+        stitcher = ImageStitcher(None, origin_coords=(0, 0), max_coords=(100, 0), folder=str(tmp_path),
+                                 file_name="scan", extension=".ome.tif", resolution_scale=0.5,
+                                 image_dims=(200, 80), pixel_size=1.0, flipX=False, flipY=False,
+                                 max_queue=1)
+        # two tiles overlapping by 100 px with different brightness
+        assert stitcher.add_image(np.full((80, 200), 1000, np.uint16), (0, 0), {})
+        assert stitcher.add_image(np.full((80, 200), 3000, np.uint16), (100, 0), {})
+        canvas = stitcher.get_stitched_image()
+
+        assert isinstance(canvas, np.memmap) and canvas.shape == (40, 150)
+        row = canvas[20].astype(np.float64)
+        assert row[:45].max() == 1000 and row[105:].min() == 3000
+        overlap = row[50:100]
+        assert np.all(np.diff(overlap) >= 0) and 1000 < overlap.mean() < 3000  # smooth ramp, no seam
+
+        assert not stitcher.add_image(np.zeros((80, 200), np.uint16), (0, 0), {})
+        assert sorted(os.listdir(tmp_path)) == ["scan.ome.tif", "scan_stitched.json", "scan_stitched.npy"]
+        with open(tmp_path / "scan_stitched.json") as f:
+            assert len(json.load(f)["tiles"]) == 2
+
+    def test_dead_worker_does_not_block(self, tmp_path, monkeypatch):
+        import imswitch.imcontrol.controller.controllers.HistoScanController as histoscan
+
+        def failingWriter(*args, **kwargs):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(histoscan.tifffile, "TiffWriter", failingWriter)
+        monkeypatch.setattr(histoscan, "_PUT_POLL", 0.01)
+        stitcher = ImageStitcher(None, origin_coords=(0, 0), max_coords=(0, 0), folder=str(tmp_path),
+                                 file_name="scan", extension=".ome.tif", image_dims=(20, 20),
+                                 pixel_size=1.0, max_queue=1)
+        stitcher.processing_thread.join(timeout=5)
+
+        tile = np.zeros((20, 20), np.uint16)
+        with pytest.raises(RuntimeError, match="disk full"):
+            for _ in range(3):  # more tiles than the queue holds
+                stitcher.add_image(tile, (0, 0), {})
+        stitcher.close()
+        assert isinstance(stitcher.error, OSError)
@@ -0,0 +1,110 @@
+"""
+Unit tests for the HistoScan mosaic tile server.
+"""
+
+import json
+import threading
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+from PIL import Image
+
+from imswitch.imcontrol.controller.controllers.histoscan_tiles import MosaicPyramid, MosaicTileServer
+
+
+def _mosaic(tmp_path):
+    # 600 x 1000 canvas, the right half was not scanned
+    canvas = np.lib.format.open_memmap(tmp_path / "scan_stitched.npy", mode="w+", dtype=np.uint16, shape=(600, 1000))
+    canvas[:, :500] = np.arange(500, dtype=np.uint16)[np.newaxis]*100
+    canvas.flush()
+    with open(tmp_path / "scan_stitched.json", "w") as f:
+        json.dump({"shape": [600, 1000], "resolution_scale": 0.5, "origin": [0, 0], "pixel_size": 1.0,
+                   "stage_origin": [100, 200], "tiles": [[0, 0, 600, 500]]}, f)
+    return MosaicPyramid.from_file(str(tmp_path / "scan_stitched.npy"))
+
+
+class TestMosaicTileServer:
+    """Test that scanned regions never move the stage and unscanned ones are coalesced."""
+
+    def test_pyramid_tiles_from_cache(self, tmp_path):
+        mosaic = _mosaic(tmp_path)
+        assert mosaic.max_zoom == 2 and [level.shape for level in mosaic.levels] == [(600, 1000), (300, 500), (150, 250)]
+        assert mosaic.grid.um_per_px == 2.0 and mosaic.grid.stage_center(2, 0, 0) == (356.0, 456.0)
+
+        server = MosaicTileServer(acquire=lambda x, y: pytest.fail("stage moved"), grid=None)
+        server.set_mosaic(mosaic)
+        tile = server.get_tile(2, 1, 0)
+        assert tile.status == 200 and tile.media_type == "image/png"
+        image = np.asarray(Image.open(BytesIO(tile.data)))
+        np.testing.assert_array_equal(image[0], (np.arange(256, 512)*100 >> 8).clip(0) * (np.arange(256, 512) < 500))
+
+        assert server.get_tile(2, 1, 0).data == tile.data
+        assert server.get_tile(2, 1, 0, if_none_match=tile.etag).status == 304
+        webp = server.get_tile(0, 0, 0, fmt="webp")
+        assert Image.open(BytesIO(webp.data)).format == "WEBP"
+        assert Image.open(BytesIO(webp.data)).size == (256, 256)
+        stats = server.get_stats()
+        assert stats["hits"] == 1 and stats["not_modified"] == 1 and stats["stage_moves"] == 0
+        server.close()
+
+    def test_unscanned_tiles_are_acquired_once(self, tmp_path):
+        moves = []
+        gate = threading.Event()
+
+        def acquire(x, y):
+            gate.wait(5)
+            moves.append((x, y))
+            # 600 x 600 camera frame at 1 µm, its top left at the requested center - 300 µm
+            return np.full((600, 600), 4000, np.uint16), (x - 300, y - 300), 1.0
+
+        server = MosaicTileServer(acquire=acquire)
+        server.set_mosaic(_mosaic(tmp_path))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(server.get_tile(2, 2, 1))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while server.get_stats()["acquisitions"]["coalesced"] < 2:
+            gate.wait(0.01)
+        gate.set()
+        for thread in threads:
+            thread.join()
+        assert len(moves) == 1 and len({r.etag for r in results}) == 1
+
+        # the neighbouring tile lies in the same 300 x 300 px field
+        assert server.get_tile(3, 4, 2).status == 200
+        # zoomed out, unscanned regions stay blank instead of moving the stage
+        assert server.get_tile(1, 1, 0).etag == '"blank.png"'
+        assert len(moves) == 1
+        server.close()
+
+
+class TestHistoScanTileAPI:
+    """Test the tile endpoints of the HistoScan controller."""
+
+    def test_canvas_must_be_in_data_dir(self, tmp_path, monkeypatch):
+        from fastapi import HTTPException
+        from imswitch.imcommon.model import dirtools
+        from imswitch.imcontrol.controller.controllers.HistoScanController import HistoScanController
+
+        dataDir, otherDir = tmp_path / "data", tmp_path / "other"
+        for folder in (dataDir, otherDir):
+            folder.mkdir()
+            _mosaic(folder)
+        monkeypatch.setattr(dirtools.UserFileDirs, "Data", str(dataDir))
+        controller = HistoScanController.__new__(HistoScanController)
+        controller.tileServer = MosaicTileServer(acquire=lambda x, y: pytest.fail("stage moved"), grid=None)
+        controller._logger = type("Logger", (), {"debug": lambda self, msg: None})()
+
+        assert controller.loadMosaicTiles("scan_stitched.npy")["max_zoom"] == 2
+        assert controller.loadMosaicTiles(str(dataDir / "scan_stitched.npy"))["max_zoom"] == 2
+        for path, status in [(str(otherDir / "scan_stitched.npy"), 403), ("../other/scan_stitched.npy", 403),
+                             ("scan_stitched.json", 403), ("missing_stitched.npy", 404)]:
+            with pytest.raises(HTTPException) as error:
+                controller.loadMosaicTiles(path)
+            assert error.value.status_code == status
+
+        assert controller.get_tile(0, 0, 0, fmt="webp").media_type == "image/webp"
+        controller.tileServer.close()
@@ -0,0 +1,50 @@
+"""
+Unit tests for the latency histograms.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.controller.latencystats import LatencyHistogram, LatencyTracker
+
+
+class TestLatencyHistogram:
+    """Test the log-binned latency histogram."""
+
+    def test_percentiles_within_bin_width(self):
+        """Percentiles are estimated to within the bin width."""
+        latencies = np.random.default_rng(0).lognormal(mean=1.0, sigma=0.5, size=5000)
+        histogram = LatencyHistogram()
+        for latency in latencies:
+            histogram.record(latency)
+
+        stats = histogram.to_dict()
+        assert stats["count"] == len(latencies)
+        assert stats["mean_ms"] == pytest.approx(latencies.mean())
+        assert stats["max_ms"] == pytest.approx(latencies.max())
+        for q in (50, 95, 99):
+            assert stats[f"p{q}_ms"] == pytest.approx(np.percentile(latencies, q), rel=0.15)
+
+    def test_under_and_overflow(self):
+        """Values outside of the bin range are kept in the outer bins."""
+        histogram = LatencyHistogram(min_ms=1.0, max_ms=100.0)
+        for latency in (0.1, 0.5, 5.0, 1000.0):
+            histogram.record(latency)
+
+        bins = histogram.to_dict(include_bins=True)["bins"]
+        assert sum(b["count"] for b in bins) == 4
+        assert bins[0] == {"from_ms": 0.0, "to_ms": 1.0, "count": 2}
+        assert bins[-1]["to_ms"] is None
+        json.dumps(histogram.to_dict(include_bins=True), allow_nan=False)
+        assert histogram.percentile(100) == 1000.0
+
+    def test_tracker_reset(self):
+        """The tracker creates histograms on demand and resets all of them."""
+        tracker = LatencyTracker(("metric",))
+        tracker.record_since("metric", 1.0, 1.002)
+        tracker.record("command", 3.0)
+        assert tracker.to_dict()["metric"]["p50_ms"] == pytest.approx(2.0, rel=0.15)
+        tracker.reset()
+        assert tracker.to_dict() == {"metric": {"count": 0}, "command": {"count": 0}}
@@ -0,0 +1,49 @@
+"""
+Unit tests for the lazily imported managers and the startup profiler.
+"""
+
+import importlib
+
+import pytest
+
+from imswitch.imcommon.model import StartupProfiler
+
+
+class TestStartupProfiler:
+    """Test the import/construct time bookkeeping."""
+
+    def test_totals_per_module(self):
+        profiler = StartupProfiler()
+        with profiler.measure("import", "A"):
+            pass
+        with profiler.measure("construct", "A"):
+            pass
+        with pytest.raises(RuntimeError):
+            with profiler.measure("construct", "B"):
+                raise RuntimeError("no hardware")
+
+        modules = profiler.modules()
+        assert set(modules) == {"A", "B"}
+        assert set(modules["A"]) == {"import_ms", "construct_ms", "total_ms"}
+        assert modules["A"]["total_ms"] == pytest.approx(
+            modules["A"]["import_ms"] + modules["A"]["construct_ms"])
+        assert "no hardware" in profiler.events[-1]["error"]
+        assert "A" in profiler.report()
+
+
+class TestLazyManagers:
+    """Test the lazy exports of imswitch.imcontrol.model.managers."""
+
+    def test_exports_resolve_to_classes(self):
+        from imswitch.imcontrol.model import managers
+        # Importing a submodule directly must not hide the class of the same name
+        importlib.import_module("imswitch.imcontrol.model.managers.ROIScanManager")
+        assert isinstance(managers.ROIScanManager, type)
+        from imswitch.imcontrol.model import ROIScanManager, RecMode
+        assert ROIScanManager is managers.ROIScanManager
+        assert RecMode.__name__ == "RecMode"
+
+    def test_unknown_name(self):
+        from imswitch.imcontrol import model
+        with pytest.raises(AttributeError):
+            model.NoSuchManager
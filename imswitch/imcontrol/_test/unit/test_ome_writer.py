@@ -0,0 +1,48 @@
+"""
+Unit tests for the incremental pyramid levels of the OME writer.
+"""
+
+import types
+
+import numpy as np
+import pytest
+
+zarr = pytest.importorskip("zarr")
+from imswitch.imcontrol.controller.controllers.experiment_controller.ome_writer import (
+    OMEWriter, OMEWriterConfig
+)
+
+
+def _pool(image):
+    h, w = image.shape[-2] // 2, image.shape[-1] // 2
+    blocks = image[..., :2 * h, :2 * w].astype(np.uint32)
+    summed = blocks.reshape(image.shape[:-2] + (h, 2, w, 2)).sum(axis=(-3, -1))
+    return ((summed + 2) // 4).astype(np.uint16)
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_pyramid_levels_follow_tiles(tmp_path):
+    """Tiles written in any order yield mean-pooled levels for every z plane."""
+    tile_h, tile_w, nx, ny = 101, 150, 4, 3
+    paths = types.SimpleNamespace(zarr_dir=str(tmp_path / "scan.ome.zarr"),
+                                  base_dir=str(tmp_path), tiff_dir=str(tmp_path))
+    config = OMEWriterConfig(min_period=0, n_z_planes=2)
+    writer = OMEWriter(paths, (tile_h, tile_w), (nx, ny), (0, 0, 100, 100), config)
+
+    rng = np.random.default_rng(0)
+    full = rng.integers(0, 60000, (2, ny * tile_h, nx * tile_w)).astype(np.uint16)
+    order = [(z, ix, iy) for z in range(2) for ix in range(nx) for iy in range(ny)]
+    rng.shuffle(order)
+    for z, ix, iy in order:
+        tile = full[z, iy * tile_h:(iy + 1) * tile_h, ix * tile_w:(ix + 1) * tile_w]
+        writer.write_frame(tile, {"x": ix * 100, "y": iy * 100, "z_index": z})
+    writer.finalize()
+
+    root = zarr.open_group(paths.zarr_dir, mode="r")
+    datasets = root.attrs["multiscales"][0]["datasets"]
+    assert [d["path"] for d in datasets] == ["0", "1", "2"]
+
+    expected = full
+    for level in (1, 2):
+        expected = _pool(expected)
+        np.testing.assert_array_equal(root[str(level)][0, 0], expected)
@@ -0,0 +1,67 @@
+"""
+Unit tests for the parallel hardware initialization.
+"""
+
+import threading
+import time
+
+import pytest
+
+from imswitch.imcommon.model import InitError, ParallelInit
+
+
+class TestParallelInit:
+    """Test dependencies, shared resources and timeouts."""
+
+    def test_independent_tasks_overlap_and_deps_wait(self):
+        init = ParallelInit("test")
+        order = []
+        init.add("base", lambda: order.append("base"))
+        for name in ("a", "b", "c"):
+            init.add(name, lambda name=name: (time.sleep(0.2), order.append(name)), deps=["base"])
+
+        tStart = time.perf_counter()
+        tasks = init.run()
+        assert time.perf_counter() - tStart < 0.5  # not 0.6 s one after another
+        assert order[0] == "base"
+        assert all(task.status == "done" for task in tasks.values())
+
+    def test_shared_resource_is_serialized(self):
+        init = ParallelInit("test")
+        active, maxActive = [0], [0]
+        lock = threading.Lock()
+
+        def useSerialPort():
+            with lock:
+                active[0] += 1
+                maxActive[0] = max(maxActive[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+        for name in ("laser", "stage", "led"):
+            init.add(name, useSerialPort, resources=["rs232:test-port"])
+        init.run()
+        assert maxActive[0] == 1
+
+    def test_optional_timeout_and_failures(self):
+        init = ParallelInit("test")
+        late = threading.Event()
+        init.add("hanging", lambda: time.sleep(0.5), timeout=0.1, optional=True,
+                 onLate=lambda _: late.set())
+        init.add("after-hanging", lambda: None, deps=["hanging"], optional=True)
+        init.add("camera", lambda: "ok")
+
+        tStart = time.perf_counter()
+        tasks = init.run()
+        assert time.perf_counter() - tStart < 0.4
+        assert tasks["hanging"].status == "timeout"
+        assert tasks["after-hanging"].status == "skipped"
+        assert init.results() == {"camera": "ok"}
+        assert late.wait(1.0)
+
+        init = ParallelInit("test", parallel=False)
+        init.add("stage", lambda: 1 / 0)
+        with pytest.raises(InitError):
+            init.run()
+        assert init.tasks["stage"].status == "failed"
@@ -0,0 +1,75 @@
+"""
+Unit tests for the bounded-queue TIFF writers of the experiment controller.
+"""
+
+import numpy as np
+import tifffile
+
+from imswitch.imcontrol.controller.controllers.experiment_controller import queued_tiff_writer
+
+from imswitch.imcontrol.controller.controllers.experiment_controller.OmeTiffStitcher import OmeTiffStitcher
+from imswitch.imcontrol.controller.controllers.experiment_controller.SingleTiffWriter import SingleTiffWriter
+from imswitch.imcontrol.controller.controllers.experiment_controller.queued_tiff_writer import downsample_2x
+
+
+def test_downsample_2x_averages_blocks():
+    """2x2 blocks are averaged and odd trailing pixels dropped."""
+    image = np.arange(30, dtype=np.uint16).reshape(5, 6)
+    pooled = downsample_2x(image)
+    assert pooled.shape == (2, 3)
+    assert pooled.dtype == np.uint16
+    assert pooled[0, 0] == round((0 + 1 + 6 + 7) / 4)
+
+
+def test_stitcher_writes_tiled_pyramids(tmp_path):
+    """Every image becomes a tiled, compressed series with SubIFD levels."""
+    path = str(tmp_path / "stitched.ome.tif")
+    stitcher = OmeTiffStitcher(path, compression="zlib")
+    stitcher.start()
+    for i in range(2):
+        stitcher.add_image(np.full((600, 700), i, np.uint16), i * 10.0, 0.0, i, 0, 0.5)
+    stitcher.close()
+
+    with tifffile.TiffFile(path) as tif:
+        assert tif.is_ome
+        assert len(tif.series) == 2
+        levels = tif.series[0].levels
+        assert [level.shape for level in levels] == [(600, 700), (300, 350), (150, 175)]
+        assert tif.pages[0].is_tiled
+        np.testing.assert_array_equal(tif.series[1].asarray(), 1)
+
+
+def test_single_writer_drops_when_full(tmp_path):
+    """With drop_newest, images beyond the queue size are dropped instead of buffered."""
+    path = str(tmp_path / "single.ome.tif")
+    writer = SingleTiffWriter(path, max_queue=2, drop_policy="drop_newest")
+    # Queue before the writer thread runs, so the queue fills up
+    accepted = [writer.add_image(np.zeros((64, 64), np.uint16), {"x": i, "y": 0})
+                for i in range(4)]
+    writer.start()
+    writer.close()
+
+    assert accepted == [True, True, False, False]
+    stats = writer.get_stats()
+    assert stats["written"] == 2
+    assert stats["dropped"] == 2
+    with tifffile.TiffFile(path) as tif:
+        assert len(tif.series) == 2
+
+
+def test_dead_writer_does_not_block(tmp_path, monkeypatch):
+    """Producers and close() give up once the writer thread has died."""
+    def failing_writer(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(queued_tiff_writer.tifffile, "TiffWriter", failing_writer)
+    monkeypatch.setattr(queued_tiff_writer, "_PUT_POLL", 0.01)
+    writer = SingleTiffWriter(str(tmp_path / "single.ome.tif"), max_queue=1)
+    writer.start()
+    writer._thread.join(timeout=5)
+
+    accepted = [writer.add_image(np.zeros((8, 8), np.uint16), {"x": i, "y": 0}) for i in range(2)]
+    writer.close()
+
+    assert accepted == [False, False]
+    assert writer.get_stats()["dropped"] == 2
@@ -0,0 +1,123 @@
+"""
+Unit tests for the recording frame writers.
+"""
+
+import threading
+
+import h5py
+import numpy as np
+import pytest
+import tifffile as tiff
+
+from imswitch.imcontrol.model.managers.RecordingManager import (
+    BackgroundFrameWriter, FrameWriter, HDF5FrameWriter, TiffFrameWriter, ZarrFrameWriter,
+    _frameChunks
+)
+
+
+def _frames(n, shape=(32, 48), start=0):
+    return np.stack([np.full(shape, 60000 + i, dtype=np.uint16) for i in range(start, start + n)])
+
+
+class _SlowWriter(FrameWriter):
+    def __init__(self):
+        self.release = threading.Event()
+        self.frames = []
+
+    def write(self, frames):
+        self.release.wait()
+        self.frames.extend(frames)
+
+
+class TestFrameWriters:
+    """Test the preallocated dataset writers and the background writer."""
+
+    def test_frame_chunks(self):
+        """Chunks hold single frames and are split only for large frames."""
+        assert _frameChunks((512, 640), 2) == (1, 512, 640)
+        chunks = _frameChunks((4096, 4096), 2)
+        assert chunks[0] == 1
+        assert chunks[1] * chunks[2] * 2 <= 4 * 1024 ** 2
+
+    def test_hdf5_preallocated_and_trimmed(self, tmp_path):
+        """The dataset is allocated once, keeps uint16 and is trimmed on close."""
+        with h5py.File(tmp_path / 'rec.hdf5', 'w') as file:
+            writer = HDF5FrameWriter(file, 'cam', (32, 48), {'exposure': 10}, numFrames=10)
+            writer.write(_frames(4))
+            assert writer.dataset.shape[0] == 10
+            writer.write(_frames(3, start=4))
+            writer.close()
+            data = file['cam']
+            assert data.shape == (7, 32, 48)
+            assert data.dtype == np.uint16
+            assert data[6, 0, 0] == 60006
+            assert data.attrs['exposure'] == 10
+            assert not data.attrs['writing']
+
+    def test_hdf5_grows_without_frame_count(self, tmp_path):
+        """Without a known frame count the dataset grows as needed."""
+        with h5py.File(tmp_path / 'rec.hdf5', 'w') as file:
+            writer = HDF5FrameWriter(file, 'cam', (32, 48))
+            for i in range(5):
+                writer.write(_frames(30, start=30 * i))
+            writer.close()
+            assert file['cam'].shape == (150, 32, 48)
+
+    def test_hdf5_empty_recording(self, tmp_path):
+        """An empty dataset is kept if no frames were captured."""
+        with h5py.File(tmp_path / 'rec.hdf5', 'w') as file:
+            writer = HDF5FrameWriter(file, 'cam', (32, 48), numFrames=10)
+            writer.close()
+            assert file['cam'].shape == (0, 32, 48)
+
+    def test_zarr_keeps_dtype(self, tmp_path):
+        """Zarr recordings keep the frame dtype instead of forcing int16."""
+        zarr = pytest.importorskip('zarr')
+        group = zarr.open_group(str(tmp_path / 'rec.zarr'), mode='w')
+        writer = ZarrFrameWriter(group, 'cam', (32, 48), numFrames=4)
+        writer.write(_frames(6))
+        writer.close()
+        assert group['cam'].shape == (6, 32, 48)
+        assert group['cam'].dtype == np.uint16
+        assert group['cam'][5, 0, 0] == 60005
+
+    def test_tiff_appends_frames(self, tmp_path):
+        """Frames of all batches end up in one file."""
+        writer = TiffFrameWriter(str(tmp_path / 'rec.tiff'))
+        writer.write(_frames(2))
+        writer.write(_frames(3, start=2))
+        writer.close()
+        data = tiff.imread(str(tmp_path / 'rec.tiff'))
+        assert data.shape == (5, 32, 48)
+
+    def test_background_writer_drops_when_full(self):
+        """With dropWhenFull, batches exceeding the queue size are counted as dropped."""
+        slow = _SlowWriter()
+        batch = _frames(2)
+        writer = BackgroundFrameWriter(slow, 'cam', maxQueueBytes=2 * batch.nbytes,
+                                       dropWhenFull=True)
+        accepted = [writer.submit(_frames(2, start=2 * i)) for i in range(4)]
+        assert accepted == [True, True, False, False]
+
+        slow.release.set()
+        writer.close()
+        stats = writer.getStats()
+        assert stats['framesWritten'] == 4
+        assert stats['framesDropped'] == 4
+        assert len(slow.frames) == 4
+
+    def test_background_writer_backpressure(self):
+        """Without dropping, submit blocks until the writer caught up and no frames are lost."""
+        slow = _SlowWriter()
+        batch = _frames(2)
+        writer = BackgroundFrameWriter(slow, 'cam', maxQueueBytes=batch.nbytes)
+        writer.submit(batch)
+        threading.Timer(0.05, slow.release.set).start()
+        for i in range(1, 5):
+            assert writer.submit(_frames(2, start=2 * i))
+        writer.close()
+        stats = writer.getStats()
+        assert stats['framesWritten'] == 10
+        assert stats['framesDropped'] == 0
+        assert stats['blockedSeconds'] > 0
+        assert [int(f[0, 0]) for f in slow.frames] == list(range(60000, 60010))
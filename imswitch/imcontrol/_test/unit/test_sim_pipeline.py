@@ -0,0 +1,103 @@
+"""
+Unit tests for the queued SIM reconstruction pipeline and the filter cache.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.controller.controllers.sim_processing import (
+    SIMFilterCache, SIMFilterSet, SIMReconstructionPipeline)
+
+
+class TestSIMPipeline:
+    """Test that no stack is dropped and that filters are calibrated once."""
+
+    def test_pipeline_blocks_instead_of_dropping(self):
+        results = []
+        pipeline = SIMReconstructionPipeline(lambda item: (time.sleep(0.01), results.append(item)),
+                                             workers=2, max_queue=2)
+        try:
+            for i in range(20):
+                assert pipeline.submit(i)
+            assert pipeline.join(timeout=5)
+            stats = pipeline.get_stats()
+        finally:
+            pipeline.close()
+        assert sorted(results) == list(range(20))
+        assert stats["completed"] == 20 and stats["failed"] == 0
+        assert stats["max_queue_depth"] <= 2 and stats["blocked_time_s"] > 0
+        assert not pipeline.submit(20)
+
+    def test_filter_cache_calibrates_once_per_key(self):
+        ny, nx = 32, 48
+        filters = SIMFilterSet(np.ones((ny, nx)), np.full((9, 2 * ny, 2 * nx), 1 / 9),
+                               np.ones((2 * ny, 2 * nx)))
+        cache = SIMFilterCache()
+        calibrations = []
+
+        def calibrate():
+            calibrations.append(1)
+            time.sleep(0.05)
+            return filters
+
+        key = cache.key(488, (9, ny, nx))
+        threads = [threading.Thread(target=cache.get_or_create, args=(key, calibrate)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calibrations) == 1 and cache.get_stats()["hits"] == 3
+
+        # all-pass filters: the reconstruction is the mean image, upsampled 2x
+        stack = np.random.default_rng(0).random((9, ny, nx)).astype(np.float32)
+        image = cache.get(key).reconstruct(stack)
+        assert image.shape == (2 * ny, 2 * nx) and image.dtype == np.float32
+        np.testing.assert_allclose(image.mean() * 4, stack.mean(), rtol=1e-4)
+
+        cache.invalidate(488)
+        assert cache.get(key) is None
+
+
+def _sim_stack(n=64, period=4.0, seed=0):
+    """Blurred random sample under 3 angles x 3 phases of sinusoidal illumination."""
+    from scipy.ndimage import gaussian_filter
+    sample = gaussian_filter(np.random.default_rng(seed).random((n, n)), 1.0)
+    y, x = np.mgrid[:n, :n]
+    stack = []
+    for angle in np.deg2rad([0, 60, 120]):
+        kx, ky = 2 * np.pi / period * np.cos(angle), 2 * np.pi / period * np.sin(angle)
+        for phase in 2 * np.pi / 3 * np.arange(3):
+            stack.append(gaussian_filter(sample * (1 + 0.8 * np.cos(kx * x + ky * y + phase)), 1.0))
+    return (1000 * np.array(stack)).astype(np.float32)
+
+
+class TestSIMFilterSet:
+    """Test the cached float32 filters against the processor they were taken from."""
+
+    def test_matches_processor_reconstruction(self):
+        processors = pytest.importorskip("napari_sim_processor.processors.convSimProcessor")
+        processor = processors.ConvSimProcessor()
+        processor.debug = False
+        processor.usePhases = False
+        processor.magnification = 60
+        processor.NA = 0.8
+        processor.n = 1.0
+        processor.wavelength = 0.52
+        processor.pixelsize = 6.5
+        processor.alpha = 0.5
+        processor.beta = 0.98
+        processor.w = 0.2
+        processor.eta = 0.7
+        stack = _sim_stack()
+        processor.calibrate(stack)
+
+        filters = SIMFilterSet.from_processor(processor)
+        expected = np.asarray(processor.reconstruct_rfftw(stack))
+        result = filters.reconstruct(stack)
+
+        assert result.shape == expected.shape == (128, 128)
+        np.testing.assert_allclose(result, expected, atol=1e-4 * np.abs(expected).max())
+        assert set(filters.parameters) >= {"kx", "ky"}
@@ -0,0 +1,180 @@
+"""
+Unit tests for the batched STORM localization.
+"""
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from imswitch.imcontrol.controller.controllers.microEye.fitting.batch import (
+    BatchLocalizer, HistogramRenderer, LocalizationTable, LocalizerParams,
+    phasor_fit_batch, quantile_uint8)
+from imswitch.imcontrol.controller.controllers.microEye.fitting.phasor_fit import phasor_fit
+
+
+def _blinkingFrame(rng, points, shape=(128, 128)):
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    frame = rng.poisson(100, shape).astype(np.float64)
+    for x, y in points:
+        frame += 1000 * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * 1.5 ** 2))
+    return frame.astype(np.uint16)
+
+
+class TestBatchLocalization:
+    """Test the vectorized fit, the table and the renderer."""
+
+    def test_phasor_fit_batch_matches_phasor_fit(self):
+        rng = np.random.default_rng(0)
+        points = rng.uniform(0, 128, (50, 2)).astype(np.float32)  # incl. ROIs at the border
+        frame = _blinkingFrame(rng, points)
+        np.testing.assert_allclose(phasor_fit_batch(frame, points, roi_size=9),
+                                   phasor_fit(frame, points, roi_size=9), rtol=1e-5)
+
+        image = rng.integers(0, 256, (97, 131)).astype(np.uint8)
+        assert quantile_uint8(image, 1 - 1e-4) == pytest.approx(np.quantile(image, 1 - 1e-4))
+
+    def test_localize_table_and_render(self):
+        rng = np.random.default_rng(1)
+        points = np.array([[30.3, 40.6], [90.8, 70.2]])
+        frames = [_blinkingFrame(rng, points) for _ in range(4)]
+
+        localizer = BatchLocalizer(workers=0)
+        try:
+            columns = localizer.submit(frames, 10, LocalizerParams()).result()
+        finally:
+            localizer.close()
+        assert set(np.unique(columns['frame'])) <= {10, 11, 12, 13}
+        assert np.abs(columns['x'][:, None] - points[:, 0]).min(axis=1).max() < 0.5
+
+        # spawned worker processes give the same localizations
+        localizer = BatchLocalizer(workers=1)
+        try:
+            spawned = localizer.submit(frames, 10, LocalizerParams()).result(timeout=60)
+        finally:
+            localizer.close()
+        np.testing.assert_allclose(np.sort(spawned['x']), np.sort(columns['x']))
+
+        table = LocalizationTable(capacity=1)
+        table.append(columns)
+        table.append(columns)
+        assert len(table) == 2 * len(columns['x'])
+        assert table.to_array().shape == (len(table), len(table.names))
+
+        renderer = HistogramRenderer(frames[0].shape)
+        renderer.add(table.column('x'), table.column('y'))
+        assert renderer.image().sum() == len(table)
+        assert renderer.display().max() == 255
+
+
+class TestLocalizationStore:
+    """Test the HDF5 localization store and its frame/tile index."""
+
+    def test_query_and_render_match_brute_force(self, tmp_path):
+        pytest.importorskip("h5py")
+        from imswitch.imcontrol.controller.controllers.microEye.fitting.store import LocalizationStore
+
+        rng = np.random.default_rng(2)
+        store = LocalizationStore(str(tmp_path / "locs.h5"), tile_size=16, block_rows=500)
+        batches = []
+        for frame in range(0, 200, 10):
+            batch = {"frame": rng.integers(frame, frame + 10, 100),
+                     "x": rng.uniform(0, 128, 100).astype(np.float32),
+                     "y": rng.uniform(0, 96, 100).astype(np.float32)}
+            assert store.append(batch)
+            batches.append(batch)
+        store.close()
+        data = {name: np.concatenate([b[name] for b in batches]) for name in batches[0]}
+        with pytest.raises(OSError):  # an existing store is never truncated
+            LocalizationStore(str(tmp_path / "locs.h5"))
+
+        store = LocalizationStore.open(str(tmp_path / "locs.h5"))
+        try:
+            assert len(store) == len(data["x"])
+            roi, frames = (20.5, 10, 70, 50.2), (50, 120)
+            expected = ((data["frame"] >= 50) & (data["frame"] < 120)
+                        & (data["x"] >= 20.5) & (data["x"] < 70)
+                        & (data["y"] >= 10) & (data["y"] < 50.2))
+            result = store.query(frames, roi)
+            assert len(result["x"]) == expected.sum()
+            assert np.isnan(result["sigmax"]).all()  # not provided, filled with NaN
+            image = store.render(roi, pixel_size=0.5, frames=frames)
+            assert image.shape == (81, 99) and image.sum() == expected.sum()
+        finally:
+            store.close()
+
+
+class TestDriftCorrection:
+    """Test the online drift estimation and the drift corrected store."""
+
+    @staticmethod
+    def _drift(frames):
+        return 2.0 * np.sin(frames / 3000), 1.5 * frames / 10000
+
+    def test_online_drift_recovers_simulated_drift(self, tmp_path):
+        from imswitch.imcontrol.controller.controllers.microEye.fitting.drift import (
+            OnlineDriftCorrector, interpolate_drift)
+
+        rng = np.random.default_rng(3)
+        emitters = rng.uniform(10, 246, (3000, 2))
+        corrector = OnlineDriftCorrector((256, 256), window_frames=500)
+        batches = []
+        for first in range(0, 10000, 100):
+            frames = np.sort(rng.integers(first, first + 100, 1500))
+            dx, dy = self._drift(frames)
+            index = rng.integers(0, len(emitters), len(frames))
+            batch = {"frame": frames,
+                     "x": (emitters[index, 0] + dx + rng.normal(0, 0.1, len(frames))).astype(np.float32),
+                     "y": (emitters[index, 1] + dy + rng.normal(0, 0.1, len(frames))).astype(np.float32)}
+            corrector.add(batch["frame"], batch["x"], batch["y"])
+            batches.append(batch)
+        corrector.finish()
+        assert corrector.updates == 19
+
+        centers, dx, dy = corrector.trajectory
+        tx, ty = self._drift(centers)
+        assert np.abs(dx - (tx - tx[0])).max() < 0.05
+        assert np.abs(dy - (ty - ty[0])).max() < 0.05
+
+        pytest.importorskip("h5py")
+        from imswitch.imcontrol.controller.controllers.microEye.fitting.store import LocalizationStore
+
+        store = LocalizationStore(str(tmp_path / "locs.h5"))
+        for batch in batches:
+            store.append(batch)
+        store.set_drift(corrector.trajectory)
+        store.close()
+        store = LocalizationStore.open(str(tmp_path / "locs.h5"))
+        try:
+            raw = store.query(drift_corrected=False)
+            corrected = store.query()
+            cx, cy = interpolate_drift(store.drift, raw["frame"])
+            np.testing.assert_allclose(corrected["x"], raw["x"] - cx, atol=1e-4)
+            roi = (50, 50, 100, 100)
+            inside = store.query(roi=roi)
+            expected = ((corrected["x"] >= 50) & (corrected["x"] < 100)
+                        & (corrected["y"] >= 50) & (corrected["y"] < 100))
+            assert len(inside["x"]) == expected.sum()
+        finally:
+            store.close()
+
+    def test_sparse_solve_rejects_outliers(self):
+        from imswitch.imcontrol.controller.controllers.microEye.fitting.drift import (
+            solve_drift, windows_connected)
+
+        rng = np.random.default_rng(4)
+        n = 400
+        true = np.cumsum(rng.normal(0, 0.3, (n, 2)), axis=0)
+        true -= true[0]
+        pairs = np.array([(i, j) for j in range(n) for i in range(max(0, j - 6), j)])
+        shifts = true[pairs[:, 1]] - true[pairs[:, 0]] + rng.normal(0, 0.02, (len(pairs), 2))
+        shifts[::97] += 3  # inconsistent pairs
+        drift, used = solve_drift(pairs, shifts, n, rmax=1.0)
+        assert not used[::97].any() and used.sum() == len(pairs) - len(shifts[::97])
+        assert np.abs(drift - true).max() < 0.15  # noise accumulates along the chain
+
+        # warm start from a previous estimate converges to the same drift
+        warm, _ = solve_drift(pairs, shifts, n, rmax=1.0, initial=drift + 0.1)
+        np.testing.assert_allclose(warm, drift, atol=1e-6)
+        assert windows_connected(pairs, n)
+        assert not windows_connected(pairs[(pairs != 200).all(axis=1)], n)  # window 200 isolated
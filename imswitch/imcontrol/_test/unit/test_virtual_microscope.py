@@ -0,0 +1,117 @@
+"""
+Unit tests for the frame synthesis of the virtual microscope.
+"""
+
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model.managers.rs232 import VirtualMicroscopeManager as vm
+
+
+def _camera(highThroughput, sensorShape=(60, 80)):
+    camera = vm.Camera.__new__(vm.Camera)
+    camera.filePath = "image"
+    camera.highThroughput = highThroughput
+    camera.targetFps = None
+    camera._nextFrameTime = 0.0
+    camera._otfCache, camera._otfCacheSize = {}, 4
+    camera.lock = threading.Lock()
+    camera.SensorHeight, camera.SensorWidth = sensorShape
+    camera.image = (np.random.default_rng(0).random((100, 120)) * 1000).astype(np.float32)
+    camera.noiseStack = np.zeros((100,) + sensorShape, dtype=np.float32)
+    return camera
+
+
+def _positioner(camera):
+    positioner = vm.Positioner.__new__(vm.Positioner)
+    positioner._parent = SimpleNamespace(camera=camera)
+    positioner.mDimensions = (camera.SensorHeight, camera.SensorWidth)
+    positioner._psfCache, positioner._psfCacheSize = {}, 4
+    return positioner
+
+
+class TestVirtualCamera:
+    """Test that the high-throughput synthesis reproduces the original frames."""
+
+    def test_fast_mode_matches_original_path(self, monkeypatch):
+        pytest.importorskip("NanoImagingPack")
+        monkeypatch.setattr(vm.time, "sleep", lambda _: None)
+        frames = {}
+        for highThroughput in (False, True):
+            camera = _camera(highThroughput)
+            positioner = _positioner(camera)
+            positioner.compute_psf(20)
+            psf = np.squeeze(positioner.get_psf())
+            frames[highThroughput] = camera.produce_frame(x_offset=7, y_offset=-5, z_offset=20,
+                                                          light_intensity=2.0, defocusPSF=psf)
+
+        assert frames[True].dtype == frames[False].dtype == np.uint16
+        np.testing.assert_allclose(frames[True], frames[False], atol=1)
+
+    def test_psf_is_cached_per_defocus(self):
+        pytest.importorskip("NanoImagingPack")
+        positioner = _positioner(_camera(False))
+        positioner.compute_psf(10)
+        psf = positioner.get_psf()
+        positioner.compute_psf(0)
+        assert positioner.get_psf() is None
+        positioner.compute_psf(10)
+        assert positioner.get_psf() is psf
+
+
+class TestSMLMEmitterField:
+    """Test the cell index and the blinking kinetics of the SMLM emitters."""
+
+    def test_candidates_are_the_emitters_of_overlapping_cells(self):
+        structure = np.random.default_rng(1).random((200, 260)) < 0.05
+        field = vm.SMLMEmitterField(structure, cell_size=32, seed=0)
+        y0, x0, h, w, margin = 180, 230, 50, 40, 3  # wraps around both borders
+
+        idx = field._candidates(y0, x0, h, w, margin)
+        rows = (y0 - margin + np.arange(h + 2 * margin)) % 200 // 32
+        cols = (x0 - margin + np.arange(w + 2 * margin)) % 260 // 32
+        inCells = (np.isin(field.y.astype(int) // 32, rows)
+                   & np.isin(field.x.astype(int) // 32, cols))
+        np.testing.assert_array_equal(np.sort(idx), np.flatnonzero(inCells))
+
+    def test_blinking_follows_the_kinetics(self):
+        structure = np.zeros((64, 64), dtype=bool)
+        structure[::2, ::2] = True
+        field = vm.SMLMEmitterField(structure, on_fraction=0.2, mean_on_frames=4, seed=0)
+        everything = np.arange(len(field.state))
+
+        states = []
+        for _ in range(400):
+            field.frame += 1
+            field._advance(everything)
+            states.append(field.state.copy())
+        states = np.array(states)
+        stayOn = (states[1:] & states[:-1]).sum() / states[:-1].sum()
+
+        assert states.mean() == pytest.approx(0.2, abs=0.01)
+        assert stayOn == pytest.approx(1 - 1 / 4, abs=0.01)
+
+    def test_emitters_out_of_view_relax_to_steady_state(self):
+        structure = np.ones((100, 100), dtype=bool)
+        field = vm.SMLMEmitterField(structure, on_fraction=0.1, mean_on_frames=3, seed=0)
+        field.state[:] = True
+        field.frame = 1000  # not rendered for a long time
+        field._advance(np.arange(len(field.state)))
+
+        assert field.state.mean() == pytest.approx(0.1, abs=0.01)
+        assert np.all(field.last_frame == 1000)
+
+    def test_only_visible_emitters_are_advanced(self):
+        structure = np.random.default_rng(2).random((300, 300)) < 0.02
+        field = vm.SMLMEmitterField(structure, seed=0)
+        image = field.render(0, 0, 50, 60, photons=1000, photons_std=10)
+
+        assert image.shape == (50, 60) and image.dtype == np.float32
+        margin = int(np.ceil(4 * float(field.sigma.max()))) + 1
+        vy = (field.y + margin) % 300 - margin
+        vx = (field.x + margin) % 300 - margin
+        visible = (np.abs(vy - 25) < 25 + margin) & (np.abs(vx - 30) < 30 + margin)
+        np.testing.assert_array_equal(field.last_frame == 1, visible)
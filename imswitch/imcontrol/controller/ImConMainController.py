@@ -1,10 +1,9 @@
 import dataclasses
-import pkg_resources
-import h5py
 from imswitch import IS_HEADLESS
 from imswitch.imcommon.controller import MainController, PickDatasetsController
 from imswitch.imcommon.model import (
-    ostools, initLogger, generateAPI, generateUI, generateShortcuts, SharedAttributes
+    ostools, initLogger, generateAPI, generateUI, generateShortcuts, SharedAttributes,
+    pythontools, startupProfiler
 )
 from imswitch.imcommon.framework import Thread
 from .server import ImSwitchServer
@@ -31,8 +30,9 @@ class ImConMainController(MainController):
 
         # Init communication channel and master controller
         self.__commChannel = CommunicationChannel(self, self.__setupInfo)
-        self.__masterController = MasterController(self.__setupInfo, self.__commChannel,
-                                                   self._moduleCommChannel)
+        with startupProfiler.measure('construct', 'MasterController'):
+            self.__masterController = MasterController(self.__setupInfo, self.__commChannel,
+                                                       self._moduleCommChannel)
 
         # List of Controllers for the GUI Widgets
         self.__factory = ImConWidgetControllerFactory(
@@ -67,7 +67,8 @@ class ImConMainController(MainController):
             #if hasattr(controllers, controller_name):
             #    controller_class = getattr(controllers, controller_name)
             try:
-                module = importlib.import_module(f'imswitch.imcontrol.controller.controllers.{controller_name}')
+                with startupProfiler.measure('import', controller_name):
+                    module = importlib.import_module(f'imswitch.imcontrol.controller.controllers.{controller_name}')
                 controller_class = getattr(module, controller_name)
                 #module = importlib.import_module(f'.{controller_name}', package='imswitch.imcontrol.controller.controllers')
             except Exception as e:
@@ -75,7 +76,8 @@ class ImConMainController(MainController):
                 continue
             if controller_class is not None:
                 try:
-                    self.controllers[widgetKey] = self.__factory.createController(controller_class, widget)
+                    with startupProfiler.measure('construct', controller_name):
+                        self.controllers[widgetKey] = self.__factory.createController(controller_class, widget)
                 except Exception as e:
                     self.__logger.error(f"Could not create controller for {controller_name}: {e}")
             else:
@@ -134,11 +136,13 @@ class ImConMainController(MainController):
         self._thread = threading.Thread(target=self._serverWorker.run)
         self._thread.start()
 
+        self.__logger.info(f'Startup profile (slowest modules):\n{startupProfiler.report(limit=15)}')
+
 
     def loadPlugin(self, widgetKey):
         # try to get it from the plugins
         foundPluginController = False
-        for entry_point in pkg_resources.iter_entry_points(f'imswitch.implugins'):
+        for entry_point in pythontools.iterEntryPoints('imswitch.implugins'):
             if entry_point.name == f'{widgetKey}_controller':
                 packageController = entry_point.load()
                 return packageController
@@ -161,6 +165,7 @@ class ImConMainController(MainController):
         if not filePath:
             return
 
+        import h5py
         with h5py.File(filePath) as file:
             datasetsInFile = file.keys()
             if len(datasetsInFile) < 1:
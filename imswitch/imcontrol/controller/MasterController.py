@@ -1,46 +1,10 @@
-from imswitch.imcommon.model import VFileItem, initLogger
-
-import pkg_resources
-
-# TODO: Import managers dynamically - similar to the controllers - to save time
-from imswitch.imcontrol.model import (
-    DetectorsManager,
-    LasersManager,
-    MultiManager,
-    PositionersManager,
-    RecordingManager,
-    RS232sManager,
-    SLMManager,
-    SIMManager,
-    DPCManager,
-    LEDMatrixsManager,
-    MCTManager,
-    ROIScanManager,
-    WebRTCManager,
-    HyphaManager,
-    UC2ConfigManager,
-    AutofocusManager,
-    HistoScanManager,
-    StresstestManager,
-    PixelCalibrationManager,
-    LightsheetManager,
-    NidaqManager,
-    FOVLockManager,
-    StandManager,
-    RotatorsManager,
-    LEDsManager,
-    ScanManagerBase,
-    ScanManagerPointScan,
-    ScanManagerMoNaLISA,
-    FlatfieldManager,
-    FlowStopManager,
-    WorkflowManager,
-    TimelapseManager,
-    LepmonManager,
-    ExperimentManager,
-    ObjectiveManager,
-    ArkitektManager,
+import threading
+
+from imswitch.config import get_config
+from imswitch.imcommon.model import (
+    VFileItem, initLogger, pythontools, startupProfiler, ParallelInit
 )
+from imswitch.imcontrol import model
 
 
 class MasterController:
@@ -55,101 +19,106 @@ class MasterController:
         self.__commChannel = commChannel
         self.__moduleCommChannel = moduleCommChannel
 
-        # Init managers
-        self.rs232sManager = RS232sManager(self.__setupInfo.rs232devices)
+        # Managers that are only needed by optional widgets (or never touched
+        # by the active setup) are constructed on first access in lazy mode,
+        # see __getattr__
+        self.__lazy = get_config().lazy_managers
+        self._lazyManagers = {}
+        self._lazyLock = threading.RLock()
 
-        lowLevelManagers = {"rs232sManager": self.rs232sManager}
+        # Init managers. The hardware managers only depend on the RS232
+        # devices, so they come up concurrently (in headless mode)
+        config = get_config()
+        init = ParallelInit("MasterController", parallel=config.parallel_init and config.is_headless,
+                            phase=None)  # the managers record their construction themselves
 
-        self.detectorsManager = DetectorsManager(
-            self.__setupInfo.detectors, updatePeriod=100, **lowLevelManagers
-        )
-        self.lasersManager = LasersManager(self.__setupInfo.lasers, **lowLevelManagers)
-        self.positionersManager = PositionersManager(
-            self.__setupInfo.positioners, self.__commChannel, **lowLevelManagers
-        )
-        self.LEDMatrixsManager = LEDMatrixsManager(
-            self.__setupInfo.LEDMatrixs, **lowLevelManagers
-        )
-        self.rotatorsManager = RotatorsManager(
-            self.__setupInfo.rotators, **lowLevelManagers
-        )
+        def lowLevelManagers():
+            return {"rs232sManager": self.rs232sManager}
 
-        self.LEDsManager = LEDsManager(self.__setupInfo.LEDs)
+        init.add("rs232sManager", lambda: self._addManager(
+            "rs232sManager", "RS232sManager", self.__setupInfo.rs232devices))
+        init.add("detectorsManager", lambda: self._addManager(
+            "detectorsManager", "DetectorsManager",
+            self.__setupInfo.detectors, updatePeriod=100, **lowLevelManagers()
+        ), deps=["rs232sManager"])
+        init.add("lasersManager", lambda: self._addManager(
+            "lasersManager", "LasersManager", self.__setupInfo.lasers, **lowLevelManagers()
+        ), deps=["rs232sManager"])
+        init.add("positionersManager", lambda: self._addManager(
+            "positionersManager", "PositionersManager",
+            self.__setupInfo.positioners, self.__commChannel, **lowLevelManagers()
+        ), deps=["rs232sManager"])
+        init.add("LEDMatrixsManager", lambda: self._addManager(
+            "LEDMatrixsManager", "LEDMatrixsManager", self.__setupInfo.LEDMatrixs, **lowLevelManagers()
+        ), deps=["rs232sManager"])
+        init.add("rotatorsManager", lambda: self._addManager(
+            "rotatorsManager", "RotatorsManager", self.__setupInfo.rotators, **lowLevelManagers()
+        ), deps=["rs232sManager"])
+        init.add("LEDsManager", lambda: self._addManager(
+            "LEDsManager", "LEDsManager", self.__setupInfo.LEDs))
         # self.scanManager = ScanManager(self.__setupInfo)
-        self.recordingManager = RecordingManager(self.detectorsManager)
-        if "SLM" in self.__setupInfo.availableWidgets:
-            self.slmManager = SLMManager(self.__setupInfo.slm)
-        self.UC2ConfigManager = UC2ConfigManager(
-            self.__setupInfo.uc2Config, lowLevelManagers
+        init.add("recordingManager", lambda: self._addManager(
+            "recordingManager", "RecordingManager", self.detectorsManager
+        ), deps=["detectorsManager"])
+        init.run()
+        self.__logger.info(
+            "Hardware init timeline:\n" + startupProfiler.timelineReport(phases=("construct",))
         )
-        if "SIM" in self.__setupInfo.availableWidgets:
-            self.simManager = SIMManager(self.__setupInfo.sim)
-        if "DPC" in self.__setupInfo.availableWidgets:
-            self.dpcManager = DPCManager(self.__setupInfo.dpc)
-        if "MCT" in self.__setupInfo.availableWidgets:
-            self.mctManager = MCTManager(self.__setupInfo.mct)
-        self.nidaqManager = NidaqManager(self.__setupInfo.nidaq)
-        self.roiscanManager = ROIScanManager(self.__setupInfo.roiscan)
-        if "Lightsheet" in self.__setupInfo.availableWidgets:
-            self.lightsheetManager = LightsheetManager(self.__setupInfo.lightsheet)
-        if "WebRTC" in self.__setupInfo.availableWidgets:
-            self.webrtcManager = WebRTCManager(self.__setupInfo.webrtc)
-        if "Timelapse" in self.__setupInfo.availableWidgets:
-            self.timelapseManager = TimelapseManager()
-        if "Experiment" in self.__setupInfo.availableWidgets:
-            self.experimentManager = ExperimentManager(self.__setupInfo.experiment)
-        if "Objective" in self.__setupInfo.availableWidgets:
-            self.objectiveManager = ObjectiveManager(self.__setupInfo.objective)
-        if "HistoScan" in self.__setupInfo.availableWidgets:
-            self.HistoScanManager = HistoScanManager(self.__setupInfo.HistoScan)
-        if "Stresstest" in self.__setupInfo.availableWidgets:
-            self.StresstestManager = StresstestManager(self.__setupInfo.Stresstest)
-        if "FlowStop" in self.__setupInfo.availableWidgets:
-            self.FlowStopManager = FlowStopManager(self.__setupInfo.FlowStop)
-        if "Lepmon" in self.__setupInfo.availableWidgets:
-            self.LepmonManager = LepmonManager(self.__setupInfo.Lepmon)
-        if "FlatField" in self.__setupInfo.availableWidgets:
-            self.FlatfieldManager = FlatfieldManager(self.__setupInfo.Flatfield)
-        if "PixelCalibration" in self.__setupInfo.availableWidgets:
-            self.PixelCalibrationManager = PixelCalibrationManager(
-                self.__setupInfo.PixelCalibration
-            )
-        if "AutoFocus" in self.__setupInfo.availableWidgets:
-            self.AutoFocusManager = AutofocusManager(self.__setupInfo.autofocus)
-        if "FOV" in self.__setupInfo.availableWidgets:
-            self.FOVLockManager = FOVLockManager(self.__setupInfo.fovLock)
-        if "Workflow" in self.__setupInfo.availableWidgets:
-            self.workflowManager = WorkflowManager()
-        if "Arkitekt" in self.__setupInfo.availableWidgets:
-            if ArkitektManager is not None:
-                self.arkitektManager = ArkitektManager(self.__setupInfo.arkitekt)
-            else:
-                self.__logger.warning(
-                    "Arkitekt widget requested but ArkitektManager is unavailable. "
-                    "Install optional dependencies to enable it.")
+
+        lowLevelManagers = lowLevelManagers()
+
+        # Not tied to a widget, constructed when first used
+        self._addManager("UC2ConfigManager", "UC2ConfigManager",
+                         self.__setupInfo.uc2Config, lowLevelManagers, lazy=True)
+        self._addManager("nidaqManager", "NidaqManager", self.__setupInfo.nidaq, lazy=True)
+        self._addManager("roiscanManager", "ROIScanManager", self.__setupInfo.roiscan, lazy=True)
+
+        # Only available if the setup uses the widget: (widget, attribute, class, args)
+        widgetManagers = [
+            ("SLM", "slmManager", "SLMManager", (self.__setupInfo.slm,)),
+            ("SIM", "simManager", "SIMManager", (self.__setupInfo.sim,)),
+            ("DPC", "dpcManager", "DPCManager", (self.__setupInfo.dpc,)),
+            ("MCT", "mctManager", "MCTManager", (self.__setupInfo.mct,)),
+            ("Lightsheet", "lightsheetManager", "LightsheetManager", (self.__setupInfo.lightsheet,)),
+            ("WebRTC", "webrtcManager", "WebRTCManager", (self.__setupInfo.webrtc,)),
+            ("Timelapse", "timelapseManager", "TimelapseManager", ()),
+            ("Experiment", "experimentManager", "ExperimentManager", (self.__setupInfo.experiment,)),
+            ("Objective", "objectiveManager", "ObjectiveManager", (self.__setupInfo.objective,)),
+            ("HistoScan", "HistoScanManager", "HistoScanManager", (self.__setupInfo.HistoScan,)),
+            ("Stresstest", "StresstestManager", "StresstestManager", (self.__setupInfo.Stresstest,)),
+            ("FlowStop", "FlowStopManager", "FlowStopManager", (self.__setupInfo.FlowStop,)),
+            ("Lepmon", "LepmonManager", "LepmonManager", (self.__setupInfo.Lepmon,)),
+            ("FlatField", "FlatfieldManager", "FlatfieldManager", (self.__setupInfo.Flatfield,)),
+            ("PixelCalibration", "PixelCalibrationManager", "PixelCalibrationManager",
+             (self.__setupInfo.PixelCalibration,)),
+            ("AutoFocus", "AutoFocusManager", "AutofocusManager", (self.__setupInfo.autofocus,)),
+            ("FOV", "FOVLockManager", "FOVLockManager", (self.__setupInfo.fovLock,)),
+            ("Workflow", "workflowManager", "WorkflowManager", ()),
+            ("Arkitekt", "arkitektManager", "ArkitektManager", (self.__setupInfo.arkitekt,)),
+        ]
+        for widget, attrName, className, args in widgetManagers:
+            if self.__setupInfo.hasWidget(widget):
+                self._addManager(attrName, className, *args, lazy=True)
+
         # load all implugin-related managers and add them to the class
         # try to get it from the plugins
         # If there is a imswitch_sim_manager, we want to add this as self.imswitch_sim_widget to the
         # MasterController Class
-
-        for entry_point in pkg_resources.iter_entry_points(f"imswitch.implugins"):
-            InfoClass = None
+        with startupProfiler.measure("import", "imswitch.implugins"):
+            pluginEntryPoints = {
+                entry_point.name: entry_point
+                for entry_point in pythontools.iterEntryPoints("imswitch.implugins")
+            }
+        for entry_point in pluginEntryPoints.values():
             print(f"entry_point: {entry_point.name}")
             try:
                 if entry_point.name.find("manager") >= 0:
-                    # check if there is an info class, too
-                    try:
-                        InfoClassName = entry_point.name.split("_manager")[0] + "_info"
-                        # load the info class from InfoClassName
-                        InfoClass = pkg_resources.load_entry_point(
-                            "imswitch", "imswitch.implugins", InfoClassName
-                        )
-                    except Exception as e:
-                        InfoClass = None
-                    ManagerClass = entry_point.load(InfoClass)  # Load the manager class
+                    with startupProfiler.measure("import", entry_point.name):
+                        ManagerClass = entry_point.load()  # Load the manager class
                     # self.__setupInfo.add_attribute(attr_name=entry_point.name.split("_manager")[0], attr_value={})
                     moduleInfo = None  # TODO: This is not complete yet - the setupinfo would need to be added to the class in the very begnning prior to detecing external plugins/hooks
-                    manager = ManagerClass(moduleInfo)  # Initialize the manager
+                    with startupProfiler.measure("construct", entry_point.name):
+                        manager = ManagerClass(moduleInfo)  # Initialize the manager
                     setattr(
                         self, entry_point.name, manager
                     )  # Add the manager to the class
@@ -157,18 +126,17 @@ class MasterController:
                 self.__logger.error(e)
 
         if self.__setupInfo.microscopeStand:
-            self.standManager = StandManager(
-                self.__setupInfo.microscopeStand, **lowLevelManagers
-            )
+            self._addManager("standManager", "StandManager",
+                             self.__setupInfo.microscopeStand, **lowLevelManagers)
 
         # Generate scanManager type according to setupInfo
         if self.__setupInfo.scan:
             if self.__setupInfo.scan.scanWidgetType == "PointScan":
-                self.scanManager = ScanManagerPointScan(self.__setupInfo)
+                self._addManager("scanManager", "ScanManagerPointScan", self.__setupInfo)
             elif self.__setupInfo.scan.scanWidgetType == "Base":
-                self.scanManager = ScanManagerBase(self.__setupInfo)
+                self._addManager("scanManager", "ScanManagerBase", self.__setupInfo)
             elif self.__setupInfo.scan.scanWidgetType == "MoNaLISA":
-                self.scanManager = ScanManagerMoNaLISA(self.__setupInfo)
+                self._addManager("scanManager", "ScanManagerMoNaLISA", self.__setupInfo)
             else:
                 self.__logger.error(
                     'ScanWidgetType in SetupInfo["scan"] not recognized, choose one of the following:'
@@ -200,6 +168,63 @@ class MasterController:
             self.slmManager.sigSLMMaskUpdated.connect(cc.sigSLMMaskUpdated)
             self.simManager.sigSIMMaskUpdated.connect(cc.sigSIMMaskUpdated)
 
+    def _addManager(self, attrName, className, *args, lazy=False, **kwargs):
+        """ Constructs a manager and sets it as attribute attrName. With
+        lazy=True (and lazy managers enabled in the config), the manager is
+        only imported and constructed when the attribute is first accessed. """
+        if lazy and self.__lazy:
+            self._lazyManagers[attrName] = (className, args, kwargs)
+            return
+        self._constructManager(attrName, className, args, kwargs)
+
+    def _constructManager(self, attrName, className, args, kwargs):
+        managerClass = getattr(model, className)  # imports the manager module
+        if managerClass is None:
+            # Optional manager whose dependencies are not installed
+            self.__logger.warning(
+                f"{className} is unavailable. Install optional dependencies to enable it.")
+            return None
+        with startupProfiler.measure("construct", className):
+            manager = managerClass(*args, **kwargs)
+        setattr(self, attrName, manager)
+        return manager
+
+    def __getattr__(self, name):
+        # Only called if name is not a regular attribute, i.e. for managers
+        # that have not been constructed yet
+        lazyManagers = self.__dict__.get("_lazyManagers")
+        if lazyManagers is None or name not in lazyManagers:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        with self._lazyLock:
+            if name in self.__dict__:  # constructed by another thread meanwhile
+                return self.__dict__[name]
+            className, args, kwargs = lazyManagers[name]
+            self.__logger.debug(f"Constructing {className} on first use")
+            try:
+                manager = self._constructManager(name, className, args, kwargs)
+            finally:
+                del lazyManagers[name]
+        if manager is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        return manager
+
+    def getFailedDevices(self):
+        """ Returns the devices that could not be initialized, per manager. """
+        return {
+            attrName: attr.getFailedDevices() for attrName, attr in list(vars(self).items())
+            if isinstance(attr, model.MultiManager) and attr.getFailedDevices()
+        }
+
+    def getManagerStates(self):
+        """ Returns which managers are constructed and which are still
+        waiting for their first use. """
+        states = {
+            attrName: "constructed" for attrName, attr in vars(self).items()
+            if attrName.endswith("Manager") or attrName.endswith("_manager")
+        }
+        states.update({attrName: "lazy" for attrName in list(self._lazyManagers)})
+        return states
+
     def memoryRecordingAvailable(self, name, file, filePath, savedToDisk):
         self.__moduleCommChannel.memoryRecordings[name] = VFileItem(
             data=file, filePath=filePath, savedToDisk=savedToDisk
@@ -208,9 +233,9 @@ class MasterController:
     def closeEvent(self):
         self.recordingManager.endRecording(emitSignal=False, wait=True)
 
-        for attrName in dir(self):
-            attr = getattr(self, attrName)
-            if isinstance(attr, MultiManager):
+        # Managers that were never used have not been constructed either
+        for attr in list(vars(self).values()):
+            if isinstance(attr, model.MultiManager):
                 attr.finalize()
 
 
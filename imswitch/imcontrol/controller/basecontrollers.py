@@ -22,6 +22,11 @@ class ImConWidgetController(WidgetController):
     All WidgetControllers should have access to the setup information,
     MasterController, CommunicationChannel and the linked Widget. """
 
+    # Number of synchronous API calls to this controller that may run at the
+    # same time (None: api_max_concurrent_per_controller, one by default).
+    # Controllers whose endpoints are thread-safe may allow more.
+    apiConcurrency = None
+
     def __init__(self, setupInfo, commChannel, master, *args, **kwargs):
         # Protected attributes, which should only be accessed from controller and its subclasses
         self._setupInfo = setupInfo
@@ -1,18 +1,91 @@
 from imswitch import IS_HEADLESS
 import time
 import numpy as np
-import scipy.ndimage as ndi
 import threading
 from imswitch.imcommon.model import initLogger, APIExport
 from ..basecontrollers import ImConWidgetController
+from ..focusmetrics import FocusConfig, LaplacianFocusMetric, VarianceFocusMetric
 from skimage.filters import gaussian
 from imswitch.imcommon.framework import Signal
-import cv2
 import queue
 
 # Global axis for Z-positioning - should be Z
 gAxis = "Z"
 
+
+def fitFocusPeak(positions, values):
+    """ Sub-sample estimate of the position of the focus maximum.
+
+    The points above half maximum around the highest value are fitted with a
+    Gaussian (a parabola in log space, weighted by the signal); if that fails
+    a parabola is fitted to the raw values, and as a last resort the position
+    of the maximum is returned.
+
+    Returns:
+        Tuple ``(position, method)`` with method "gauss", "parabola" or "max".
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(positions)
+    positions, values = positions[order], values[order]
+    iMax = int(np.argmax(values))
+    if len(values) < 3:
+        return float(positions[iMax]), "max"
+
+    # Contiguous window above half maximum, at least the neighbours of the peak
+    baseline = np.min(values)
+    halfMax = baseline + 0.5 * (values[iMax] - baseline)
+    lo, hi = iMax, iMax
+    while lo > 0 and values[lo - 1] > halfMax:
+        lo -= 1
+    while hi < len(values) - 1 and values[hi + 1] > halfMax:
+        hi += 1
+    lo, hi = max(0, min(lo, iMax - 1)), min(len(values) - 1, max(hi, iMax + 1))
+    if hi - lo < 2:
+        return float(positions[iMax]), "max"
+    z, v = positions[lo:hi + 1], values[lo:hi + 1]
+    zMin, zMax = z[0], z[-1]
+    zCenter = z.mean()
+
+    signal = v - baseline
+    if np.all(signal > 0):
+        a, b, _ = np.polyfit(z - zCenter, np.log(signal), 2, w=signal)
+        if a < 0:
+            return float(np.clip(zCenter - b / (2 * a), zMin, zMax)), "gauss"
+    a, b, _ = np.polyfit(z - zCenter, v, 2)
+    if a < 0:
+        return float(np.clip(zCenter - b / (2 * a), zMin, zMax)), "parabola"
+    return float(positions[iMax]), "max"
+
+
+def hardwareFrameTimes(timestamps, hostTimes):
+    """ Maps hardware frame timestamps (camera ticks) to host time.
+
+    The tick period is fitted to the host arrival times, refined on the less
+    delayed half of the frames (arrival delays are one-sided), and the clock
+    offset is taken from the least delayed frame. The frame intervals thus
+    come from the camera clock without the transfer jitter of the arrivals.
+
+    Returns:
+        Host times (s) of the frames or None if the camera provides no
+        usable timestamps (fewer than 3 frames or not strictly increasing).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    hostTimes = np.asarray(hostTimes, dtype=np.float64)
+    if len(timestamps) < 3 or np.any(np.diff(timestamps) <= 0):
+        return None
+    ticks = timestamps - timestamps[0]
+    fast = np.ones(len(ticks), dtype=bool)
+    for _ in range(3):
+        secondsPerTick, offset = np.polyfit(ticks[fast], hostTimes[fast], 1)
+        delays = hostTimes - offset - ticks * secondsPerTick
+        fast = delays <= np.median(delays)
+    if not secondsPerTick > 0:
+        return None
+    times = ticks * secondsPerTick
+    return times + np.min(hostTimes - times)
+
+
 class AutofocusController(ImConWidgetController):
     """Linked to AutofocusWidget."""
     sigUpdateFocusPlot = Signal(object, object)
@@ -63,6 +136,23 @@ class AutofocusController(ImConWidgetController):
         )
         self._AutofocusThead.start()
 
+    @APIExport(runOnUIThread=True)
+    def autoFocusSweep(self, rangez: float = 100, sweepTime: float = 0.4, refineRange: float = 0,
+                       defocusz: int = 0):
+        """ Autofocus with a continuous Z sweep instead of stop-and-go steps.
+
+        Z moves at constant speed (2 * rangez / sweepTime) while the camera
+        streams; every frame gets the Z position interpolated from its
+        timestamp. A second, finer sweep over +-refineRange around the coarse
+        peak (default: a fifth of rangez) refines the result. """
+        self.isAutofusRunning = True
+        self._AutofocusThead = threading.Thread(
+            target=self.doAutofocusSweepBackground,
+            args=(rangez, sweepTime, refineRange, defocusz),
+            daemon=True
+        )
+        self._AutofocusThead.start()
+
     @APIExport(runOnUIThread=True)
     def stopAutofocus(self):
         self.isAutofusRunning = False
@@ -85,6 +175,12 @@ class AutofocusController(ImConWidgetController):
 
     def doAutofocusBackground(self, rangez=100, resolutionz=10, defocusz=0):
         self._commChannel.sigAutoFocusRunning.emit(True)
+        final_z = self._steppedAutofocus(rangez, resolutionz, defocusz)
+        self._finishAutofocus({"bestzpos": final_z})
+        return final_z
+
+    def _steppedAutofocus(self, rangez, resolutionz, defocusz):
+        """ Stop-and-go scan over +-rangez, moves to and returns the best focus. """
         mProcessor = FrameProcessor()
         if defocusz != 0:
             flatfieldImage = self.recordFlatfield(defocusPosition=defocusz)
@@ -116,35 +212,179 @@ class AutofocusController(ImConWidgetController):
             else:
                 self.sigUpdateFocusPlot.emit(coordinates[:len(allfocusvals)], allfocusvals)
 
-            best_index = np.argmax(allfocusvals)
-            bestzpos_rel = relative_positions[best_index]
+            bestzpos_rel, _ = fitFocusPeak(relative_positions[:len(allfocusvals)], allfocusvals)
 
             # Move to best focus
             self.stages.move(value=-2 * rangez, axis="Z", is_absolute=False, is_blocking=True)
             self.stages.move(value=(rangez + bestzpos_rel), axis="Z", is_absolute=False, is_blocking=True)
-        else:
-            # Return to initial absolute position if stopped
-            self.stages.move(value=initialPosition, axis="Z", is_absolute=True, is_blocking=True)
+            return bestzpos_rel + initialPosition
+
+        # Return to initial absolute position if stopped
+        self.stages.move(value=initialPosition, axis="Z", is_absolute=True, is_blocking=True)
+        return initialPosition
 
+    def _finishAutofocus(self, result):
         self._commChannel.sigAutoFocusRunning.emit(False)
         self.isAutofusRunning = False
         if not IS_HEADLESS:
             self._widget.focusButton.setText('Autofocus')
+        self.sigUpdateFocusValue.emit(result)
+
+    def doAutofocusSweepBackground(self, rangez=100, sweepTime=0.4, refineRange=0, defocusz=0):
+        self._commChannel.sigAutoFocusRunning.emit(True)
+        t0 = time.time()
+        mProcessor = FrameProcessor(startWorker=False)  # frames are evaluated while streaming
+        if defocusz != 0:
+            flatfieldImage = self.recordFlatfield(defocusPosition=defocusz)
+            mProcessor.setFlatfieldFrame(flatfieldImage)
+
+        initialPosition = self.stages.getPosition()[gAxis]
+        rangez = abs(rangez)
+        refineRange = abs(refineRange) if refineRange else rangez / 5
+        speed = 2 * rangez / max(sweepTime, 1e-3)
+
+        # Coarse sweep over the full range, fine sweep around the coarse peak
+        bestz = None
+        allPositions, allValues = np.empty(0), np.empty(0)
+        sweeps = [(initialPosition - rangez, initialPosition + rangez, speed)]
+        while sweeps and self.isAutofusRunning:
+            zStart, zEnd, sweepSpeed = sweeps.pop(0)
+            sweep = self._sweepFocus(zStart, zEnd, sweepSpeed, mProcessor)
+            if sweep is None:
+                break
+            positions, values = sweep
+            bestz, method = fitFocusPeak(positions, values)
+            allPositions = np.concatenate((allPositions, positions))
+            allValues = np.concatenate((allValues, values))
+            self.__logger.debug(f"Sweep {zStart:.1f} -> {zEnd:.1f}: {len(values)} frames, "
+                                f"peak at {bestz:.2f} ({method})")
+            if len(allValues) == len(values) and refineRange < rangez:
+                # Same sweep time over the smaller range -> denser sampling
+                sweeps.append((bestz - refineRange, bestz + refineRange,
+                               sweepSpeed * refineRange / rangez))
+
+        if bestz is None and self.isAutofusRunning:
+            # Stage or camera can't stream (e.g. the move returned immediately)
+            self.__logger.warning("Continuous sweep failed, falling back to the stepped autofocus")
+            self.stages.move(value=initialPosition, axis=gAxis, is_absolute=True, is_blocking=True)
+            final_z = self._steppedAutofocus(rangez, max(rangez / 10, 1), 0)
+            self._finishAutofocus({"bestzpos": final_z, "nFrames": 0, "duration": time.time() - t0})
+            return final_z
+
+        if self.isAutofusRunning:
+            order = np.argsort(allPositions)
+            if not IS_HEADLESS:
+                self._widget.focusPlotCurve.setData(allPositions[order], allValues[order])
+            else:
+                self.sigUpdateFocusPlot.emit(allPositions[order], allValues[order])
+            # Approach the focus from below, like the stepped autofocus
+            self.stages.move(value=bestz - refineRange, axis=gAxis, is_absolute=True, is_blocking=True)
+            final_z = bestz
+        else:
+            final_z = initialPosition
+        self.stages.move(value=final_z, axis=gAxis, is_absolute=True, is_blocking=True)
 
-        final_z = bestzpos_rel + initialPosition if self.isAutofusRunning else initialPosition
-        self.sigUpdateFocusValue.emit({"bestzpos": final_z})
+        self._finishAutofocus({"bestzpos": final_z, "nFrames": int(len(allValues)),
+                               "duration": time.time() - t0})
         return final_z
 
+    def _frameTimeOffset(self):
+        """ Seconds between the middle of the exposure and the arrival of a frame. """
+        exposure = self.camera.parameters.get('exposure')
+        try:
+            return float(exposure.value) / 2000  # ms -> s, half the exposure
+        except (AttributeError, TypeError, ValueError):
+            return 0.0
+
+    def _sweepFocus(self, zStart, zEnd, speed, processor, consumerName="autofocus"):
+        """ Moves Z from zStart to zEnd at constant speed while evaluating the
+        focus of every streamed frame.
+
+        Returns:
+            ``(positions, focusValues)`` of the frames exposed during the move,
+            or None if fewer than 3 frames could be assigned to the sweep.
+        """
+        self.stages.move(value=zStart, axis=gAxis, is_absolute=True, is_blocking=True)
+        useBuffer = self.camera.frameBuffer.allocated
+        if useBuffer:
+            self.camera.registerFrameConsumer(consumerName).skipToLatest()
+        timeOffset = self._frameTimeOffset()
+
+        moveTimes = {}
+
+        def move():
+            moveTimes['start'] = time.time()
+            try:
+                self.stages.move(value=zEnd, axis=gAxis, is_absolute=True, is_blocking=True,
+                                 speed=speed)
+                moveTimes['end'] = time.time()
+            except Exception as e:
+                # e.g. positioners without a speed argument
+                moveTimes['error'] = e
+
+        mover = threading.Thread(target=move, daemon=True)
+        mover.start()
+        frameTimes, timestamps, values = [], [], []
+        lastFrame = None
+        try:
+            while True:
+                moving = mover.is_alive()
+                if not self.isAutofusRunning:
+                    break
+                if useBuffer:
+                    frames, _, frameTimestamps, hostTimes = self.camera.getNewFrames(consumerName)
+                    if len(frames):
+                        frameTimes.extend(hostTimes)
+                        timestamps.extend(frameTimestamps)
+                        values.extend(processor.computeFocusValues(frames))
+                    elif moving:
+                        time.sleep(0.001)
+                else:
+                    frame = self.camera.getLatestFrame()
+                    if frame is not None and frame is not lastFrame:
+                        frameTimes.append(time.time())
+                        values.append(processor.computeFocusValue(frame))
+                        lastFrame = frame
+                    elif moving:
+                        time.sleep(0.001)
+                if not moving:
+                    break
+            mover.join()
+        finally:
+            if useBuffer:
+                self.camera.unregisterFrameConsumer(consumerName)
+
+        if 'error' in moveTimes:
+            self.__logger.warning(f"Sweep move to {zEnd:.1f} failed: {moveTimes['error']}")
+            return None
+
+        # Middle of the exposure of each frame, from the camera clock if it has one
+        hardwareTimes = hardwareFrameTimes(timestamps, frameTimes) if useBuffer else None
+        frameTimes = np.asarray(frameTimes if hardwareTimes is None else hardwareTimes) - timeOffset
+        values = np.asarray(values, dtype=np.float64)
+
+        # Z of each frame, interpolated over the constant-velocity move
+        tStart, tEnd = moveTimes.get('start', 0), moveTimes.get('end', 0)
+        inSweep = (frameTimes >= tStart) & (frameTimes <= tEnd)
+        if tEnd <= tStart or np.count_nonzero(inSweep) < 3:
+            return None
+        positions = zStart + (frameTimes[inSweep] - tStart) / (tEnd - tStart) * (zEnd - zStart)
+        return positions, values[inSweep]
+
 class FrameProcessor:
-    def __init__(self, nGauss=7, nCropsize=2048):
-        self.isRunning = True
+    def __init__(self, nGauss=7, nCropsize=2048, startWorker=True):
+        self.isRunning = startWorker
         self.frame_queue = queue.Queue()
         self.allfocusvals = []
-        self.worker_thread = threading.Thread(target=self.process_frames, daemon=True)
-        self.worker_thread.start()
+        self.worker_thread = None
+        if startWorker:  # evaluates the frames passed to add_frame
+            self.worker_thread = threading.Thread(target=self.process_frames, daemon=True)
+            self.worker_thread.start()
         self.flatFieldFrame = None
         self.nGauss = nGauss
         self.nCropsize = nCropsize
+        config = FocusConfig(enable_gaussian_blur=False)
+        self._focusMetrics = {"LAPE": LaplacianFocusMetric(config), "GLVA": VarianceFocusMetric(config)}
 
     def setFlatfieldFrame(self, flatfieldFrame):
         self.flatFieldFrame = flatfieldFrame
@@ -158,36 +398,26 @@ class FrameProcessor:
             self.process_frame(img, iz)
 
     def process_frame(self, img, iz):
-        if self.flatFieldFrame is not None:
-            img = img / self.flatFieldFrame
-        img = self.extract(img, self.nCropsize)
-        if len(img.shape) > 2:
-            img = np.mean(img, -1)
-        if 0:
-            imagearraygf = ndi.gaussian_filter(img, self.nGauss)
-            is_success, buffer = cv2.imencode(".jpg", imagearraygf, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-            focusquality = len(buffer) if is_success else 0
-        else:
-            focusquality = self.calculate_focus_measure(img)
-        self.allfocusvals.append(focusquality)
-
-    def calculate_focus_measure(self, image, method="LAPE"):
-        if len(image.shape) == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)  # optional
-        if method == "LAPE":
-            if image.dtype == np.uint16:
-                lap = cv2.Laplacian(image, cv2.CV_32F)
-            else:
-                lap = cv2.Laplacian(image, cv2.CV_16S)
-            focus_measure = np.mean(np.square(lap))
-        elif method == "GLVA":
-            focus_measure = np.std(image, axis=None)  # GLVA
-        else:
-            focus_measure = np.std(image, axis=None)  # GLVA
-        return focus_measure
+        self.allfocusvals.append(self.computeFocusValue(img))
 
+    def computeFocusValue(self, img):
+        return self.computeFocusValues(img[np.newaxis])[0]
 
+    def computeFocusValues(self, frames, method="LAPE"):
+        """ Focus values of a stack of frames (N, H, W[, C]) in one batched pass. """
+        frames = np.asarray(frames)
+        h, w = frames.shape[1:3]
+        y0, x0 = max(0, h // 2 - self.nCropsize // 2), max(0, w // 2 - self.nCropsize // 2)
+        frames = frames[:, y0:y0 + self.nCropsize, x0:x0 + self.nCropsize]
+        if self.flatFieldFrame is not None:
+            flatField = self.extract(np.asarray(self.flatFieldFrame, dtype=np.float32), self.nCropsize)
+            frames = frames / flatField
+        return self._focusMetrics[method].compute_batch(frames)
 
+    def calculate_focus_measure(self, image, method="LAPE"):
+        if image.ndim == 3:
+            image = image[np.newaxis]
+        return self._focusMetrics[method].compute_batch(image)[0]
 
     @staticmethod
     def extract(marray, crop_size):
@@ -3,8 +3,10 @@ import json
 import os
 
 import numpy as np
+import queue
 import time
 import threading
+from collections import deque
 from datetime import datetime
 import tifffile as tif
 
@@ -26,6 +28,8 @@ naxis = np.newaxis
 F     = lambda x: np.fft.fft2(x)
 IF    = lambda x: np.fft.ifft2(x)
 
+_STOP = object()
+
 class DPCController(ImConWidgetController):
     """Linked to DPCWidget."""
 
@@ -182,6 +186,7 @@ class DPCController(ImConWidgetController):
                 self.active = False
                 self._master.detectorsManager.startAcquisition(liveView=True)
                 self.dpcThread.join()
+                self.DPCProcessor.stop()
                 self._widget.startDPCAcquisition.setText("Start")
 
     def toggleRecording(self):
@@ -200,14 +205,18 @@ class DPCController(ImConWidgetController):
         Iterate over all DPC patterns, display them and acquire images
         """
         self.patternID = 0
-        self.isReconstructing = False
         while self.active:
 
             if not self.active:
                 break
             # initialize the processor
             processor = self.DPCProcessor
-            processor.setParameters(dpc_info_dict)
+            try:
+                processor.setParameters(dpc_info_dict)
+            except ValueError as e:
+                self._logger.error(e)
+                self.active = False
+                break
 
             '''
             # iterating over all illumination patterns
@@ -268,16 +277,20 @@ class DPCController(ImConWidgetController):
 
 
             # We will collect N*M images and process them with the DPC processor
-            # process the frames and display
-            if not self.isReconstructing:
-                self.isReconstructing=True
-                # reconstruct and save the stack in background to not block the main thread
-                processor.reconstruct(self.isRecording)
+            # queue the group for the reconstruction worker (waits if it falls behind)
+            processor.reconstruct(self.isRecording)
 
-                # reset the per-colour stack to add new frames in the next imaging series
-                processor.clearStack()
+            # reset the per-colour stack to add new frames in the next imaging series
+            processor.clearStack()
 
 
+    @APIExport()
+    def getDPCReconstructionStats(self):
+        """ Throughput and queue depth of the DPC reconstruction. """
+        if not hasattr(self, "DPCProcessor"):
+            return {"success": False, "error": "DPC is not configured"}
+        return {"success": True, **self.DPCProcessor.getStats()}
+
     def getInfoDict(self, generalParams=None):
         state_general = None
         if generalParams is not None:
@@ -296,9 +309,11 @@ class DPCController(ImConWidgetController):
 
 class DPCProcessor(object):
 
-    def __init__(self, parent, shape, infoDict):
+    def __init__(self, parent, shape, infoDict, maxQueue=8, maxBatch=8):
         '''
         setup parameters
+        maxQueue: groups waiting for reconstruction before reconstruct() blocks
+        maxBatch: queued groups that are solved together
         '''
         # initialize logger
         self._logger = initLogger(self, tryInheritParent=False)
@@ -308,18 +323,27 @@ class DPCProcessor(object):
         self.shape = shape
         self.pixelsize = .2
         self.NA= .3
-        self.NAi = .3
+        self.NAi = 0.0
         self.n= 1
         self.wavelength = .53
         self.rotation = [0, 180, 90, 270]
 
-        self.dpc_solver_obj = DPCSolver(shape=self.shape, wavelength=self.wavelength, na=self.NA, NAi=self.NAi, pixelsize=self.pixelsize, rotation=self.rotation)
         #parameters for Tikhonov regurlarization [absorption, phase] ((need to tune this based on SNR)
-        self.dpc_solver_obj.setTikhonovRegularization(reg_u = 1e-1, reg_p = 5e-3)
+        self.dpc_solver_obj = DPCSolver(shape=self.shape, wavelength=self.wavelength, na=self.NA, NAi=self.NAi, pixelsize=self.pixelsize,
+                                        rotation=self.rotation, reg_u=1e-1, reg_p=5e-3)
 
         # stack to store the individual DPC images
         self.stack = []
 
+        # groups of images are reconstructed by one persistent worker
+        self.queue = queue.Queue(maxsize=max(1, int(maxQueue)))
+        self.maxBatch = max(1, int(maxBatch))
+        self.mReconstructionThread = None
+        self.groupsReconstructed = 0
+        self.solveTime = 0.0
+        self.maxQueueDepth = 0
+        self._groupTimes = deque(maxlen=64)
+
     def setParameters(self, dpc_info_dict):
         # uses parameters from GUI
         self.pixelsize = dpc_info_dict["pixelsize"]
@@ -329,6 +353,9 @@ class DPCProcessor(object):
         self.wavelength = dpc_info_dict["wavelength"]
         self.rotation = [0, 180, 90, 270]
         self.dpc_num = 4
+        # the inverse filters are only computed for new parameters
+        self.dpc_solver_obj.setParameters(wavelength=self.wavelength, na=self.NA, NAi=self.NAi,
+                                          pixelsize=self.pixelsize, rotation=self.rotation)
 
     def addFrameToStack(self, frame):
         '''
@@ -354,41 +381,120 @@ class DPCProcessor(object):
 
     def reconstruct(self, isRecording=False):
         '''
-        reconstruction
+        queue the complete groups of the stack for reconstruction,
+        blocks while the reconstruction is maxQueue groups behind
+        '''
+        stackToReconstruct = np.array(self.stack)
+        if len(stackToReconstruct) < self.dpc_solver_obj.dpc_num:
+            return
+        self.start()
+        self.queue.put((stackToReconstruct, isRecording))
+        self.maxQueueDepth = max(self.maxQueueDepth, self.queue.qsize())
+
+    def start(self):
+        '''
+        start the reconstruction worker (done by the first reconstruct call)
+        '''
+        if self.mReconstructionThread is None:
+            self.mReconstructionThread = threading.Thread(target=self._processQueue, daemon=True)
+            self.mReconstructionThread.start()
+
+    def stop(self):
+        '''
+        reconstruct the queued groups, then stop the worker
         '''
-        self.stackToReconstruct = np.array(self.stack)
-        self.mReconstructionThread = threading.Thread(target=self.reconstructThread, args=(isRecording,), daemon=True)
-        self.mReconstructionThread.start()
+        if self.mReconstructionThread is None:
+            return
+        self.queue.put(_STOP)
+        self.mReconstructionThread.join()
+        self.mReconstructionThread = None
+
+    def _processQueue(self):
+        while True:
+            items = [self.queue.get()]
+            # solve all queued groups (of the same shape) at once to keep up with the camera
+            while items[-1] is not _STOP and len(items) < self.maxBatch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP and item[0].shape[1:] != items[0][0].shape[1:]:
+                    self.reconstructThread(items)
+                    items = []
+                items.append(item)
+            stop = items[-1] is _STOP
+            if stop:
+                items.pop()
+            if items:
+                self.reconstructThread(items)
+            if stop:
+                break
 
-    def reconstructThread(self, isRecording):
-        # compute image
-        # initialize the model
+    def reconstructThread(self, items):
+        '''
+        reconstruct a batch of queued (stack, isRecording) items and display the latest group
+        '''
         try:
             self._logger.debug("Processing frames")
-            qdpc_result = self.dpc_solver_obj.solve(dpc_imgs=self.stackToReconstruct)
+            dpc_num = self.dpc_solver_obj.dpc_num
+            stacks = [stack[:len(stack)//dpc_num*dpc_num] for stack, _ in items]
+            stackToReconstruct = np.concatenate(stacks)
+            if self.dpc_solver_obj.shape[-2:] != stackToReconstruct.shape[-2:]:
+                # e.g. a changed camera ROI, the filters of the old shape stay cached
+                self.shape = stackToReconstruct.shape[-2:]
+                solver = self.dpc_solver_obj
+                self.dpc_solver_obj = DPCSolver(shape=self.shape, wavelength=solver.wavelength, na=solver.na,
+                                                NAi=solver.NAi, pixelsize=solver.pixel_size, rotation=solver.rotation,
+                                                reg_u=solver.reg_u, reg_p=solver.reg_p)
+            tStart = time.perf_counter()
+            qdpc_result = self.dpc_solver_obj.solve(dpc_imgs=stackToReconstruct)
+            self.solveTime += time.perf_counter() - tStart
 
             # save images eventually
-            if isRecording:
-                date = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
-                mFilenameRecon = f"{date}_DPC_Reconstruction.tif"
-                tif.imwrite(mFilenameRecon, qdpc_result)
-
-            # compute gradient images
-            dpc_result_1 = (self.stackToReconstruct[0]-self.stackToReconstruct[1])/(self.stackToReconstruct[0]+self.stackToReconstruct[1])
-            dpc_result_2 = (self.stackToReconstruct[2]-self.stackToReconstruct[3])/(self.stackToReconstruct[2]+self.stackToReconstruct[3])
+            iGroup = 0
+            for stack, (_, isRecording) in zip(stacks, items):
+                nGroups = len(stack)//dpc_num
+                if isRecording:
+                    date = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
+                    mFilenameRecon = f"{date}_DPC_Reconstruction_{self.groupsReconstructed+iGroup}.tif"
+                    tif.imwrite(mFilenameRecon, qdpc_result[iGroup:iGroup+nGroups])
+                iGroup += nGroups
+            self.groupsReconstructed += iGroup
+            self._groupTimes.append((time.perf_counter(), self.groupsReconstructed))
+
+            # compute gradient images of the latest group
+            latest = stackToReconstruct[-dpc_num:].astype(np.float32)
+            dpc_result_1 = (latest[0]-latest[1])/(latest[0]+latest[1])
+            dpc_result_2 = (latest[2]-latest[3])/(latest[2]+latest[3])
 
             # display images
             #self.parent.sigDPCProcessorImageComputed.emit(np.angle(np.array(qdpc_result)), "qDPC Reconstruction (Phase)")
             #self.parent.sigDPCProcessorImageComputed.emit(np.abs(np.array(qdpc_result)), "qDPC Reconstruction (Magnitude)")
-            self.parent.sigDPCProcessorImageComputed.emit(np.array(dpc_result_1), "DPC left/right")
-            self.parent.sigDPCProcessorImageComputed.emit(np.array(dpc_result_2), "DPC top/bottom")
-            self.parent.isReconstructing = False
+            self.parent.sigDPCProcessorImageComputed.emit(dpc_result_1, "DPC left/right")
+            self.parent.sigDPCProcessorImageComputed.emit(dpc_result_2, "DPC top/bottom")
             return dpc_result_1, dpc_result_2, qdpc_result
         except Exception as e:
             self._logger.error(f"Error during reconstruction: {e}")
-            self.parent.isReconstructing = False
             return None
 
+    def getStats(self):
+        '''
+        throughput of the reconstruction worker
+        '''
+        times = list(self._groupTimes)
+        groupsPerSecond = 0.0
+        if len(times) > 1 and times[-1][0] > times[0][0]:
+            groupsPerSecond = (times[-1][1]-times[0][1])/(times[-1][0]-times[0][0])
+        return {
+            "groups_reconstructed": self.groupsReconstructed,
+            "groups_per_s": groupsPerSecond,
+            "mean_solve_time_per_group_s": self.solveTime/self.groupsReconstructed if self.groupsReconstructed else 0.0,
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.maxQueueDepth,
+            "running": self.mReconstructionThread is not None,
+            "cached_filters": len(_dpcFilterCache),
+        }
+
 # (C) Wallerlab 2019
 # https://github.com/Waller-Lab/DPC/blob/master/python_code/dpc_algorithm.py
 import numpy as np
@@ -398,10 +504,18 @@ from skimage import io
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import numpy as np
 from scipy.ndimage import uniform_filter
+import scipy.fft
+
+# Inverse filters per (shape, optics, rotations, regularization), shared by all solvers
+_DPC_FILTER_CACHE_SIZE = 4
+_dpcFilterCache = {}
+_dpcFilterCacheLock = threading.Lock()
+
 
 class DPCSolver:
-    def __init__(self, shape, wavelength, na, NAi, pixelsize, rotation):
-        self.shape = shape
+    def __init__(self, shape, wavelength, na, NAi, pixelsize, rotation, reg_u=1e-6, reg_p=1e-6, workers=-1):
+        self._checkApertures(na, NAi)
+        self.shape = tuple(shape)
         if self.shape[0] == 0:
             self.shape = (512, 512)
 
@@ -410,29 +524,90 @@ class DPCSolver:
         self.NAi      = NAi
         self.pixel_size = pixelsize
         self.dpc_num    = len(rotation)
-        self.rotation   = rotation
+        self.rotation   = list(rotation)
+        self.reg_u      = reg_u
+        self.reg_p      = reg_p
+        self.workers    = workers  # threads of the real FFTs (scipy.fft), -1: all cores
+        self._updateFilters()
+
+    def setTikhonovRegularization(self, reg_u = 1e-6, reg_p = 1e-6):
+        self.reg_u      = reg_u
+        self.reg_p      = reg_p
+        self._updateFilters()
+
+    def setParameters(self, wavelength=None, na=None, NAi=None, pixelsize=None, rotation=None):
+        ''' change the optical parameters, the filters are taken from the cache if known '''
+        self._checkApertures(self.na if na is None else na, self.NAi if NAi is None else NAi)
+        if wavelength is not None: self.wavelength = wavelength
+        if na is not None: self.na = na
+        if NAi is not None: self.NAi = NAi
+        if pixelsize is not None: self.pixel_size = pixelsize
+        if rotation is not None:
+            self.rotation = list(rotation)
+            self.dpc_num = len(self.rotation)
+        self._updateFilters()
+
+    @staticmethod
+    def _checkApertures(na, NAi):
+        ''' the half-annulus sources between NAi and na must not be empty (NAi = 0: half discs) '''
+        if not 0 <= NAi < na:
+            raise ValueError(f"The inner illumination NA (NAi={NAi}) must be smaller than "
+                             f"the objective NA (NA={na}), otherwise the DPC source is empty")
+
+    def _filterKey(self):
+        return (self.shape[-2:], float(self.wavelength), float(self.na), float(self.NAi),
+                float(self.pixel_size), tuple(float(r) for r in self.rotation),
+                float(self.reg_u), float(self.reg_p))
+
+    def _updateFilters(self):
+        key = self._filterKey()
+        with _dpcFilterCacheLock:
+            filters = _dpcFilterCache.get(key)
+        if filters is None:
+            filters = self._computeFilters()
+            with _dpcFilterCacheLock:
+                _dpcFilterCache[key] = filters
+                while len(_dpcFilterCache) > _DPC_FILTER_CACHE_SIZE:
+                    _dpcFilterCache.pop(next(iter(_dpcFilterCache)))
+        # (2, dpc_num, Ny, Nx//2+1): per image weights of absorption and phase, replaced atomically
+        self._filters = filters
+
+    def _computeFilters(self):
+        '''
+        Precompute the Tikhonov inverse of the weak object transfer functions.
+        absorption = IF(sum_k Wu_k F(I_k)), phase = IF(sum_k Wp_k F(I_k)), with
+        Wu_k = (AHA[3] Hu_k* - AHA[1] Hp_k*) / det and Wp_k = (AHA[0] Hp_k* - AHA[2] Hu_k*) / det.
+        All terms are Hermitian, so only the half spectra of the real FFTs are kept.
+        '''
         self.fxlin      = np.fft.ifftshift(self.genGrid(self.shape[-1], 1.0/self.shape[-1]/self.pixel_size))
         self.fylin      = np.fft.ifftshift(self.genGrid(self.shape[-2], 1.0/self.shape[-2]/self.pixel_size))
         self.pupil      = self.pupilGen(self.fxlin, self.fylin, self.wavelength, self.na)
         self.sourceGen()
         self.WOTFGen()
-
-    def setTikhonovRegularization(self, reg_u = 1e-6, reg_p = 1e-6):
-        self.reg_u      = reg_u
-        self.reg_p      = reg_p
+        Hu, Hp = self.Hu, self.Hp
+        AHA         = [(Hu.conj()*Hu).sum(axis=0)+self.reg_u, (Hu.conj()*Hp).sum(axis=0),\
+                       (Hp.conj()*Hu).sum(axis=0)           , (Hp.conj()*Hp).sum(axis=0)+self.reg_p]
+        determinant = AHA[0]*AHA[3]-AHA[1]*AHA[2]
+        nx = self.shape[-1]//2+1
+        filters = np.empty((2, self.dpc_num, self.shape[-2], nx), dtype=np.complex64)
+        filters[0] = ((AHA[3]*Hu.conj()-AHA[1]*Hp.conj())/determinant)[..., :nx]
+        filters[1] = ((AHA[0]*Hp.conj()-AHA[2]*Hu.conj())/determinant)[..., :nx]
+        # the full complex128 transfer functions are not needed anymore
+        self.source = self.Hu = self.Hp = None
+        return filters
 
     def normalization(self):
-        for img in self.dpc_imgs:
-            img          /= uniform_filter(img, size=img.shape[0]//2)
-            meanIntensity = img.mean()
-            img          /= meanIntensity        # normalize intensity with DC term
-            img          -= 1.0                  # subtract the DC term
+        ''' normalize all images at once (in place, float32) '''
+        size = self.dpc_imgs.shape[-2]//2
+        self.dpc_imgs /= uniform_filter(self.dpc_imgs, size=(1, size, size))
+        self.dpc_imgs /= self.dpc_imgs.mean(axis=(-2, -1), keepdims=True)    # normalize intensity with DC term
+        self.dpc_imgs -= 1.0                                                   # subtract the DC term
 
     def sourceGen(self):
         self.source = []
         pupil = self.pupilGen(self.fxlin, self.fylin, self.wavelength, self.na, NAi=self.NAi)
         for rotIdx in range(self.dpc_num):
-            self.source.append(np.zeros((self.shape)))
+            self.source.append(np.zeros((self.shape[-2:])))
             rotdegree = self.rotation[rotIdx]
             if rotdegree < 180:
                 self.source[-1][self.fylin[:, naxis]*np.cos(np.deg2rad(rotdegree))+1e-15>=
@@ -457,21 +632,28 @@ class DPCSolver:
         self.Hp = np.asarray(self.Hp)
 
     def solve(self, dpc_imgs, xini=None, plot_verbose=False, **kwargs):
-        self.dpc_imgs   = dpc_imgs.astype('float64')
+        '''
+        reconstruct all complete groups of dpc_num images
+        returns (groups, Ny, Nx) complex64 absorption + 1j*phase
+        '''
+        filters = self._filters
+        dpc_num, ny, nx = filters.shape[1], self.shape[-2], self.shape[-1]
+        groups = len(dpc_imgs)//dpc_num
+        self.dpc_imgs   = np.array(dpc_imgs[:groups*dpc_num], dtype=np.float32)
+        if self.dpc_imgs.shape[-2:] != (ny, nx):
+            raise ValueError(f"Images of shape {self.dpc_imgs.shape[-2:]} do not match the solver shape {(ny, nx)}")
         self.normalization()
 
-        dpc_result  = []
-        AHA         = [(self.Hu.conj()*self.Hu).sum(axis=0)+self.reg_u,            (self.Hu.conj()*self.Hp).sum(axis=0),\
-                       (self.Hp.conj()*self.Hu).sum(axis=0)           , (self.Hp.conj()*self.Hp).sum(axis=0)+self.reg_p]
-        determinant = AHA[0]*AHA[3]-AHA[1]*AHA[2]
-        for frame_index in range(self.dpc_imgs.shape[0]//self.dpc_num):
-            fIntensity = np.asarray([F(self.dpc_imgs[frame_index*self.dpc_num+image_index]) for image_index in range(self.dpc_num)])
-            AHy        = np.asarray([(self.Hu.conj()*fIntensity).sum(axis=0), (self.Hp.conj()*fIntensity).sum(axis=0)])
-            absorption = IF((AHA[3]*AHy[0]-AHA[1]*AHy[1])/determinant).real
-            phase      = IF((AHA[0]*AHy[1]-AHA[2]*AHy[0])/determinant).real
-            dpc_result.append(absorption+1.0j*phase)
+        fIntensity = scipy.fft.rfft2(self.dpc_imgs.reshape(groups, dpc_num, ny, nx), workers=self.workers)
+        fResult = fIntensity[:, 0, naxis]*filters[:, 0]
+        for image_index in range(1, dpc_num):
+            fResult += fIntensity[:, image_index, naxis]*filters[:, image_index]
+        absorption_phase = scipy.fft.irfft2(fResult, s=(ny, nx), workers=self.workers)
 
-        return np.asarray(dpc_result)
+        dpc_result = np.empty((groups, ny, nx), dtype=np.complex64)
+        dpc_result.real = absorption_phase[:, 0]
+        dpc_result.imag = absorption_phase[:, 1]
+        return dpc_result
 
 
     def pupilGen(self, fxlin, fylin, wavelength, na, NAi=0.0):
@@ -481,7 +663,7 @@ class DPCSolver:
         return pupil
 
     def genGrid(self, size, dx):
-        xlin = np.arange(size, dtype='complex128')
+        xlin = np.arange(size, dtype=np.float64)
         return (xlin-size//2)*dx
 
 
@@ -21,6 +21,7 @@ from imswitch import IS_HEADLESS
 from imswitch.imcontrol.controller.pidcontroller import PIDController
 from imswitch.imcontrol.controller.loggingutils import FocusLockCSVLogger
 from imswitch.imcontrol.controller.focusmetrics import FocusMetricFactory, FocusConfig
+from imswitch.imcontrol.controller.latencystats import LatencyTracker
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -39,6 +40,7 @@ class FocusLockParams:
     two_foci_enabled: bool = False
     z_stack_enabled: bool = False
     z_step_limit_nm: float = 40.0
+    astigmatism_fit: str = "log_gauss" # "log_gauss", "moments", "curve_fit"
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -51,6 +53,7 @@ class FocusLockParams:
             "two_foci_enabled": self.two_foci_enabled,
             "z_stack_enabled": self.z_stack_enabled,
             "z_step_limit_nm": self.z_step_limit_nm,
+            "astigmatism_fit": self.astigmatism_fit,
         }
 
 
@@ -200,6 +203,7 @@ class FocusLockController(ImConWidgetController):
             background_threshold=self._focus_params.background_threshold,
             crop_radius=self._focus_params.crop_size or 300,
             enable_gaussian_blur=True,
+            astigmatism_fit=self._focus_params.astigmatism_fit,
         )
         self._focus_metric = FocusMetricFactory.create(self._focus_params.focus_metric, focus_config)
 
@@ -282,6 +286,14 @@ class FocusLockController(ImConWidgetController):
         # Thread control
         self.__isPollingFramesActive = True
         self.pollingFrameUpdatePeriode = 1.0 / self._focus_params.update_freq
+
+        # Frame events of the focus camera, crop buffer and loop latencies
+        # (frame arrival -> pickup -> metric -> stage command)
+        self._frameEvent = threading.Event()
+        self._cropBuffer = None
+        self._frameStats = {"processed": 0, "skipped": 0, "overwritten": 0}
+        self._latency = LatencyTracker(("frame_to_pickup", "metric", "frame_to_metric",
+                                        "stage_command", "frame_to_command", "loop_period"))
         
         # About-to-lock logic
         self.aboutToLockDiffMax = 0.4
@@ -363,31 +375,44 @@ class FocusLockController(ImConWidgetController):
     @APIExport(runOnUIThread=True)
     def setFocusLockParams(self, **kwargs) -> Dict[str, Any]:
         for key, value in kwargs.items():
-            if hasattr(self._focus_params, key):
-                setattr(self._focus_params, key, value)
-                if key == "focus_metric":
-                    # Update focus metric computer
-                    focus_config = FocusConfig(
-                        gaussian_sigma=self._focus_params.gaussian_sigma,
-                        background_threshold=self._focus_params.background_threshold,
-                        crop_radius=self._focus_params.crop_size or 300,
-                    )
-                    self._focus_metric = FocusMetricFactory.create(value, focus_config)
-                elif key == "two_foci_enabled":
-                    self.twoFociVar = value
-                elif key == "z_stack_enabled":
-                    self.zStackVar = value
-                elif key == "update_freq":
-                    self.pollingFrameUpdatePeriode = 1.0 / max(1e-3, float(value))
-                    # keep PID dt in sync
-                    self._pi_params.sample_time = self.pollingFrameUpdatePeriode
-                    if self.pi:
-                        self.pi.update_parameters(sample_time=self._pi_params.sample_time)
-                elif key in ["gaussian_sigma", "background_threshold", "crop_size"]:
-                    # Update focus metric config
-                    self._focus_metric.update_config(**{key: value})
+            if not hasattr(self._focus_params, key):
+                continue
+            # validate (metric/config updates raise ValueError) before storing the value
+            if key == "focus_metric":
+                # Update focus metric computer
+                focus_config = FocusConfig(
+                    gaussian_sigma=self._focus_params.gaussian_sigma,
+                    background_threshold=self._focus_params.background_threshold,
+                    crop_radius=self._focus_params.crop_size or 300,
+                    astigmatism_fit=self._focus_params.astigmatism_fit,
+                )
+                self._focus_metric = FocusMetricFactory.create(value, focus_config)
+            elif key == "crop_size":
+                self._focus_metric.update_config(crop_radius=value or 300)
+            elif key in ["gaussian_sigma", "background_threshold", "astigmatism_fit"]:
+                # Update focus metric config
+                self._focus_metric.update_config(**{key: value})
+            elif key == "update_freq":
+                updatePeriode = 1.0 / max(1e-3, float(value))
+            setattr(self._focus_params, key, value)
+
+            if key == "two_foci_enabled":
+                self.twoFociVar = value
+            elif key == "z_stack_enabled":
+                self.zStackVar = value
+            elif key == "update_freq":
+                self.pollingFrameUpdatePeriode = updatePeriode
+                # keep PID dt in sync
+                self._pi_params.sample_time = self.pollingFrameUpdatePeriode
+                if self.pi:
+                    self.pi.update_parameters(sample_time=self._pi_params.sample_time)
         return self._focus_params.to_dict()
 
+    @APIExport(runOnUIThread=True)
+    def getFocusMetricTiming(self) -> Dict[str, float]:
+        """ Per-frame compute time of the focus metric (recent frames, in ms). """
+        return self._focus_metric.get_timing_stats()
+
     @APIExport(runOnUIThread=True)
     def getPIControllerParams(self) -> Dict[str, Any]:
         return self._pi_params.to_dict()
@@ -560,43 +585,139 @@ class FocusLockController(ImConWidgetController):
         except Exception as e:
             self._logger.error(f"Failed to set gain: {e}")
 
+    def _onFocusFrame(self, frameId, timestamp):
+        # Called from the camera thread for every pushed frame
+        self._frameEvent.set()
+
+    def _waitForFocusFrame(self, detector, lastFrameKey):
+        """ Waits for a frame that was not processed yet.
+
+        Cameras that push their frames into the detector ring buffer wake the
+        loop through a frame listener; others are polled once per call.
+
+        Returns:
+            ``(frame, frameTime, frameKey, skippedFrames)`` or None if no new
+            frame arrived. The frame may be a view into the ring buffer, check
+            ``_frameOverwritten`` after copying from it.
+        """
+        buffer = detector.frameBuffer
+        if buffer.allocated:
+            if (buffer.generation, buffer.head) == lastFrameKey:
+                self._frameEvent.wait(timeout=max(self.pollingFrameUpdatePeriode, 0.1))
+            self._frameEvent.clear()
+            frameKey = (buffer.generation, buffer.head)
+            if frameKey == lastFrameKey or frameKey[1] == 0:
+                return None
+            frames, _, _, hostTimes, _ = buffer.read(frameKey[1] - 1, frameKey[1], copy=False)
+            if len(hostTimes) == 0:
+                return None
+            frame, frameTime = frames[0], float(hostTimes[0])
+            skipped = 0
+            if lastFrameKey is not None and lastFrameKey[0] == frameKey[0]:
+                skipped = max(0, frameKey[1] - lastFrameKey[1] - 1)
+            return frame, frameTime, frameKey, skipped
+
+        frame = detector.getLatestFrame()
+        if frame is None or frame is self._lastPolledFrame:
+            time.sleep(min(self.pollingFrameUpdatePeriode, 0.005))
+            return None
+        self._lastPolledFrame = frame
+        return frame, time.time(), None, 0
+
+    @staticmethod
+    def _frameOverwritten(detector, frameKey) -> bool:
+        """ True if the camera has started to overwrite the ring buffer slot
+        of the frame picked up with frameKey. """
+        if frameKey is None:
+            return False
+        buffer = detector.frameBuffer
+        return buffer.generation != frameKey[0] or buffer.oldestReadable() > frameKey[1] - 1
+
+    def _cropIntoBuffer(self, frame: np.ndarray) -> np.ndarray:
+        """ Copies the focus crop (crop_size around crop_center, in array
+        order y/x) into a preallocated buffer; pixels outside of the frame
+        are zero. """
+        h, w = frame.shape[:2]
+        size = int(self._focus_params.crop_size or min(h, w) // 2)
+        center = self._focus_params.crop_center
+        cy, cx = (h // 2, w // 2) if center is None else (int(center[0]), int(center[1]))
+        y0, x0 = cy - size // 2, cx - size // 2
+
+        shape = (size, size) + frame.shape[2:]
+        if self._cropBuffer is None or self._cropBuffer.shape != shape or self._cropBuffer.dtype != frame.dtype:
+            self._cropBuffer = np.empty(shape, dtype=frame.dtype)
+        sy0, sx0 = max(0, y0), max(0, x0)
+        sy1, sx1 = min(h, y0 + size), min(w, x0 + size)
+        if (sy0, sx0, sy1, sx1) != (y0, x0, y0 + size, x0 + size):
+            self._cropBuffer.fill(0)
+        if sy1 > sy0 and sx1 > sx0:
+            np.copyto(self._cropBuffer[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0], frame[sy0:sy1, sx0:sx1])
+        return self._cropBuffer
+
+    @APIExport(runOnUIThread=True)
+    def getFocusLockLatency(self, includeBins: bool = False) -> Dict[str, Any]:
+        """ Latency histograms of the focus lock loop in ms: frame arrival to
+        pickup, metric computation, frame to metric, stage command call,
+        frame to stage command and the loop period. """
+        return {
+            "latency": self._latency.to_dict(includeBins),
+            "frames": dict(self._frameStats),
+            "metric": self._focus_metric.get_timing_stats(),
+        }
+
+    @APIExport(runOnUIThread=True)
+    def resetFocusLockLatency(self) -> None:
+        self._latency.reset()
+        self._frameStats = {"processed": 0, "skipped": 0, "overwritten": 0}
+
     def _pollFrames(self):
+        detector = self._master.detectorsManager[self.camera]
+        detector.addFrameListener(self._onFocusFrame)
+        try:
+            self._focusLoop(detector)
+        finally:
+            detector.removeFrameListener(self._onFocusFrame)
+
+    def _focusLoop(self, detector):
         tLast = 0
         # store a history of the last 5 values and filter out outliers
         lastPosition = self.currentZPosition
-        nFreeBufferFrames = 3
+        lastFrameKey = None
+        self._lastPolledFrame = None
         while self.__isPollingFramesActive:
-            
-            if (time.time() - tLast) < self.pollingFrameUpdatePeriode:
-                time.sleep(0.001)
-                continue
-            self._logger.debug("Current frame polling frequency: %.2f Hz", 1.0 / (time.time() - tLast))
-            tLast = time.time()
+            # Limit to update_freq, then wait for a frame that was not processed yet
+            remaining = self.pollingFrameUpdatePeriode - (time.time() - tLast)
+            if remaining > 0:
+                time.sleep(remaining)
             if not self._state.is_measuring and not self.locked and not self.aboutToLock:
+                tLast = time.time()
+                lastFrameKey = None
                 continue
-            
-            for i in range(nFreeBufferFrames): # Kinda clear buffer and wait a bit? 
-                im = self._master.detectorsManager[self.camera].getLatestFrame()
-
-            # Crop (prefer NiP if present)
-            try:
-                import NanoImagingPack as nip
-                self.cropped_im = nip.extract(
-                    img=im,
-                    ROIsize=(self._focus_params.crop_size, self._focus_params.crop_size),
-                    centerpos=self._focus_params.crop_center,
-                    PadValue=0.0,
-                    checkComplex=True,
-                )
-            except Exception:
-                self.cropped_im = self.extract(im, crop_size=self._focus_params.crop_size,
-                                               crop_center=self._focus_params.crop_center)
 
+            newFrame = self._waitForFocusFrame(detector, lastFrameKey)
+            if newFrame is None:
+                continue
+            frame, frameTime, lastFrameKey, skipped = newFrame
+            tPickup = time.time()
+            if tLast:
+                self._latency.record_since("loop_period", tLast, tPickup)
+            tLast = tPickup
+            self._latency.record_since("frame_to_pickup", frameTime, tPickup)
+            self._frameStats["processed"] += 1
+            self._frameStats["skipped"] += skipped
+
+            self.cropped_im = self._cropIntoBuffer(frame)
+            if self._frameOverwritten(detector, lastFrameKey):
+                # Torn crop, the next frame is already there
+                self._frameStats["overwritten"] += 1
+                continue
 
-            
             # Compute focus value using extracted focus metrics module
             focus_result = self._focus_metric.compute(self.cropped_im)
             self.current_focus_value = focus_result.get("focus", 0.0)
+            tMetric = time.time()
+            self._latency.record_since("metric", tPickup, tMetric)
+            self._latency.record_since("frame_to_metric", frameTime, tMetric)
             
             # TODO: Remove outliers in PID loop
 
@@ -656,7 +777,11 @@ class FocusLockController(ImConWidgetController):
                         self.unlockFocus()
                     else:
                         lastPosition = new_z_position
+                    tCommand = time.time()
                     self.stage.move(value=new_z_position, axis="Z", speed=MAX_SPEED, is_blocking=False, is_absolute=True)
+                    tCommandDone = time.time()
+                    self._latency.record_since("stage_command", tCommand, tCommandDone)
+                    self._latency.record_since("frame_to_command", frameTime, tCommandDone)
                     self._travel_used_um += abs(step_um) # TODO: Still not sure if we need to use this! 
                     # travel budget acts like safety_distance_limit
                     if self._pi_params.safety_motion_active and self._travel_used_um > self._pi_params.safety_distance_limit:
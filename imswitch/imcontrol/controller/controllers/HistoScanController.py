@@ -4,11 +4,13 @@ import base64
 from fastapi import FastAPI, Response, HTTPException
 from imswitch import IS_HEADLESS, __file__
 from  imswitch.imcontrol.controller.controllers.camera_stage_mapping import OFMStageMapping
+from imswitch.imcontrol.controller.controllers.histoscan_tiles import MosaicPyramid, MosaicTileServer, TileGrid
 from imswitch.imcommon.model import initLogger, ostools
 import numpy as np
 import time
 import tifffile
 import threading
+import queue
 from datetime import datetime
 import cv2
 import numpy as np
@@ -29,7 +31,7 @@ from pydantic import BaseModel
 from typing import List, Optional, Union
 from PIL import Image
 import io
-from fastapi import Header
+from fastapi import Header, Query
 import os
 from tempfile import TemporaryDirectory
 import numpy as np
@@ -211,6 +213,11 @@ class HistoScanController(LiveUpdatedController):
         # compute optimal scan step size based on camera resolution and pixel size
         self.bestScanSizeX, self.bestScanSizeY = self.computeOptimalScanStepSize(overlap = self.initialOverlap)
 
+        # XYZ tiles from the last finished mosaic, the stage only moves for unscanned regions
+        defaultGrid = TileGrid(origin_um=(0, 0), um_per_px=self.microscopeDetector.pixelSizeUm[-1]/self.currentResizeFactor,
+                               max_zoom=8)
+        self.tileServer = MosaicTileServer(acquire=self._acquireTileField, grid=defaultGrid)
+
         if not IS_HEADLESS:
             '''
             Set up the GUI
@@ -1213,6 +1220,7 @@ class HistoScanController(LiveUpdatedController):
             nChannels = mFrame.shape[-1]
 
         # perform timelapse imaging
+        stitcher = None
         for i in range(nTimes):
             tz = datetime.timezone.utc
             ft = "%Y-%m-%dT%H_%M_%S"
@@ -1231,7 +1239,9 @@ class HistoScanController(LiveUpdatedController):
             else: folder = self._widget.getDefaulSavePath()
             t0 = time.time()
 
-            # create a new image stitcher
+            # create a new image stitcher (finalizing the one of the previous round)
+            if stitcher is not None:
+                stitcher.close()
             if self.flatfieldManager is not None:
                 flatfieldImage = self.flatfieldManager.getFlatfieldImage()
             else:
@@ -1239,7 +1249,8 @@ class HistoScanController(LiveUpdatedController):
             stitcher = ImageStitcher(self, origin_coords=(0,0), max_coords=(maxPosPixX, maxPosPixY), folder=folder, image_dims=image_dims,
                                      nChannels=nChannels, file_name=file_name, extension=extension, flatfieldImage=flatfieldImage,
                                      flipX=flipX, flipY=flipY, isStitchAshlar=isStitchAshlar, pixel_size=self.microscopeDetector.pixelSizeUm[1],
-                                     resolution_scale=resizeFactor, tile_shape=(1, nStepsX, nStepsY, NpixY, NpixX))
+                                     resolution_scale=resizeFactor, tile_shape=(1, nStepsX, nStepsY, NpixY, NpixX),
+                                     stage_origin=(minPosX, minPosY))
 
             # move to the first position
             self.stages.move(value=positionList[0], axis="XY", is_absolute=True, is_blocking=True, acceleration=(self.acceleration,self.acceleration))
@@ -1278,26 +1289,7 @@ class HistoScanController(LiveUpdatedController):
                     if not self.ishistoscanRunning:
                         break
                     self.stages.move(value=self.currentPosition, axis="XY", is_absolute=True, is_blocking=True, acceleration=(self.acceleration,self.acceleration))
-                    time.sleep(self.tSettle)
-
-                    # always mmake sure we get a frame that is not the same as the one with illumination off eventually
-                    timeoutFrameRequest = 1 # seconds # TODO: Make dependent on exposure time
-                    cTime = time.time()
-                    frameSync=3
-                    lastFrameNumber=-1
-                    while(1):
-                        # get frame and frame number to get one that is newer than the one with illumination off eventually
-                        mFrame, currentFrameNumber = self.microscopeDetector.getLatestFrame(returnFrameNumber=True)
-                        if lastFrameNumber==-1:
-                            # first round
-                            lastFrameNumber = currentFrameNumber
-                        if time.time()-cTime> timeoutFrameRequest:
-                            # in case exposure time is too long we need break at one point
-                            break
-                        if currentFrameNumber <= lastFrameNumber+frameSync:
-                            time.sleep(0.01) # off-load CPU
-                        else:
-                            break
+                    mFrame = self._getFrameAfterSettle()
 
                     def addImage(mFrame, positionList):
                         metadata = {'Pixels': {
@@ -1317,16 +1309,21 @@ class HistoScanController(LiveUpdatedController):
                         posX_pix_value = (float(positionList[0])-minPosX)/self.microscopeDetector.pixelSizeUm[-1]
                         iPosPix = (posX_pix_value, posY_pix_value)
                         stitcher.add_image(np.copy(mFrame), np.copy(iPosPix), metadata.copy())
-                    threading.Thread(target=addImage, args=(mFrame,iPos)).start()
+                    # queued for the stitcher's worker, waits only if it falls behind
+                    addImage(mFrame, iPos)
 
                 except Exception as e:
                     self._logger.error(e)
+                    if not stitcher.processing_thread.is_alive():
+                        self.ishistoscanRunning = False  # tiles can't be stored anymore
+                        break
 
             # wait until we go for the next timelapse
             while 1:
                 if time.time()-t0 > tPeriod:
                     break
                 if not self.ishistoscanRunning:
+                    stitcher.close()
                     return
                 time.sleep(.1)
         # return to initial position
@@ -1344,12 +1341,22 @@ class HistoScanController(LiveUpdatedController):
             # display and save result
             mDate = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
             largeImage = stitcher.get_stitched_image()
+            if stitcher.canvas_path is not None:
+                self._serveMosaic(stitcher.canvas_path) # browse the result without stage moves
             dirPath  = os.path.join(dirtools.UserFileDirs.Root, 'recordings', mDate)
             os.makedirs(dirPath, exist_ok=True)
             tifffile.imwrite(os.path.join(dirPath, "stitchedImage.tif"), largeImage, append=False)
             self.setImageForDisplay(largeImage, "histoscanStitch"+mDate)
         threading.Thread(target=getStitchedResult).start()
 
+    def _getFrameAfterSettle(self):
+        # first frame exposed after the stage has settled from a blocking move
+        try:
+            return self.microscopeDetector.getFrameAfter(time.time()+self.tSettle)
+        except TimeoutError as e:
+            self._logger.warning(e)
+            return self.microscopeDetector.getLatestFrame()
+
     def getSaveFilePath(self, date, filename, extension):
         mFilename =  f"{date}_{filename}.{extension}"
         dirPath  = os.path.join(dirtools.UserFileDirs.Data, 'recordings', date)
@@ -1432,99 +1439,126 @@ class HistoScanController(LiveUpdatedController):
         }
 
     # For a request like: GET /microscope/tiles/{z}/{x}/{y}.png
-    # Convert (z, x, y) to an image tile from the mosaic or request a stage move for capturing.
+    # Scanned regions come from the mosaic pyramid, only unscanned ones are acquired.
     @APIExport()
-    def get_tile(self, z:float, x:float, y:float):
+    def get_tile(self, z:int, x:int, y:int, fmt:str=Query("png", alias="format"), if_none_match:Optional[str]=Header(None)):
         """
-        1) Determine lens from zoom level z
-        2) Switch lens (set pixel_size, do stage's internal configuration)
-        3) Calculate physical stage area from (x,y,z)
-        4) Move stage to cover that region (coarse or fine)
-        5) Acquire an image from the camera
-        6) Crop/scale image to 256x256 tile
-        7) Return PNG
+        Return the XYZ tile (z, x, y) as PNG or WebP.
+
+        Tiles of the last finished (or loaded) mosaic are served from an LRU
+        cache with ETags, a matching If-None-Match header returns 304. Tiles of
+        regions that were never scanned are acquired at the native zoom level
+        through a queue that coalesces requests and orders them by stage travel.
         """
-        LENS_CONFIG = {
-            '4x':  (1.6, (2048, 2048)),
-            '10x': (0.64, (2048, 2048)),
-            '20x': (0.32, (2048, 2048)),
-        }
-        # The range of stage motion in microns
-        STAGE_LIMIT_X = 1024  # 0 <= X <= 100000 mm
-        STAGE_LIMIT_Y = 1024  # 0 <= Y <= 100000 mm
-        stage_extent = (0, 0, STAGE_LIMIT_X, STAGE_LIMIT_Y)
-        tile_size = 256  # 256x256 pixel tiles
-        zoom_level = int(z)
-        x_tile = int(x)
-        y_tile = int(y)
-        mPixelSizeEff = self.microscopeDetector.pixelSizeUm[-1]
-        mPixelX, mPixelY = 400,300
-        x_tile_pos = x_tile*mPixelSizeEff*mPixelX
-        y_tile_pos = y_tile*mPixelSizeEff*mPixelY
-        #mCoordinates = self.compute_tile_coordinates(stage_extent, tile_size, zoom_level, x_tile, y_tile)
-        #print(mCoordinates)
-
-        # Move the stage (absolute movement)
-        print("PosX: ", x_tile_pos+tile_size//2, "PosY: ", y_tile_pos+tile_size//2)
-        self.stages.move(value=(x_tile_pos+tile_size//2, y_tile_pos+tile_size//2), axis="XY", is_absolute=True, is_blocking=True)
-        mFrame = self.microscopeDetector.getLatestFrame() # NxM array
+        if not isinstance(fmt, str):
+            fmt = "png" # called directly, not through FastAPI
+        if not isinstance(if_none_match, str):
+            if_none_match = None
+        try:
+            tile = self.tileServer.get_tile(z, x, y, fmt=fmt, if_none_match=if_none_match)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except (RuntimeError, TimeoutError) as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        headers = {"ETag": tile.etag, "Cache-Control": "no-cache"}
+        if tile.status == 304:
+            return Response(status_code=304, headers=headers)
+        return Response(content=tile.data, media_type=tile.media_type, headers=headers)
 
-        if len(mFrame.shape)==2:
-            mFrame = np.repeat(mFrame[:,:,np.newaxis], 3, axis=2)
+    @APIExport()
+    def loadMosaicTiles(self, canvasPath:str) -> dict:
+        """
+        Serve the tiles of a finished scan, e.g. .../<name>_stitched.npy of an earlier session.
+        Only canvases inside the data directory can be loaded, relative paths are relative to it.
+        """
+        dataDir = os.path.realpath(dirtools.UserFileDirs.Data)
+        path = os.path.realpath(os.path.join(dataDir, canvasPath or ""))
+        if os.path.commonpath([dataDir, path]) != dataDir or not path.endswith(".npy"):
+            raise HTTPException(status_code=403, detail=f"{canvasPath} is not a stitched canvas in the data directory")
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail=f"No stitched canvas at {canvasPath}")
+        return self._serveMosaic(path)
+
+    def _serveMosaic(self, canvasPath):
+        mosaic = MosaicPyramid.from_file(canvasPath)
+        self.tileServer.set_mosaic(mosaic)
+        self._logger.debug(f"Serving tiles of {canvasPath} up to zoom level {mosaic.max_zoom}")
+        return {"mosaic": mosaic.id, "shape": list(mosaic.levels[0].shape), "max_zoom": mosaic.max_zoom,
+                "origin_um": list(mosaic.grid.origin_um), "um_per_px": mosaic.grid.um_per_px}
 
-        # crop center region of the image
-        #mFrame = mFrame[int(mPixelY/2-tile_size/2):int(mPixelY/2+tile_size/2), int(mPixelX/2-tile_size/2):int(mPixelX/2+tile_size/2)]
-        # flip in X
+    @APIExport()
+    def getTileServerStats(self) -> dict:
+        """Cache hits, 304 responses and stage moves of the tile server."""
+        return self.tileServer.get_stats()
+
+    def closeEvent(self):
+        # finish the pending tile acquisitions
+        if getattr(self, 'tileServer', None) is not None:
+            self.tileServer.close()
+
+    def _acquireTileField(self, posX, posY):
+        # runs on the tile server's acquisition worker, one request at a time
+        if self.ishistoscanRunning:
+            raise RuntimeError("The stage is busy with a scan")
+        if not self.microscopeDetector._running: self.microscopeDetector.startAcquisition()
+        pixelSize = self.microscopeDetector.pixelSizeUm[-1]
+        width, height = self.microscopeDetector.shape[:2]
+        # stage positions refer to the top left pixel of the frame, as in the scan
+        topLeft = (posX-width*pixelSize/2, posY-height*pixelSize/2)
+        self.stages.move(value=topLeft, axis="XY", is_absolute=True, is_blocking=True)
+        mFrame = self._getFrameAfterSettle()
         if self.flipX: mFrame = np.flip(mFrame, axis=1)
-        # flip in Y
         if self.flipY: mFrame = np.flip(mFrame, axis=0)
-
-        # Convert to PNG
-        try:
-            img = Image.fromarray(np.uint8(mFrame), 'RGB')
-            buffer = BytesIO()
-            img.save(buffer, format="PNG")
-            buffer.seek(0)
-            return StreamingResponse(buffer , media_type="image/png")
-        except Exception as e:
-            return {"error": str(e)}
-
+        return mFrame, topLeft, pixelSize
 
 
+_STOP = object()
+_PUT_POLL = 0.5  # s, how often a waiting add_image checks that the worker is alive
 
 
 class ImageStitcher:
+    """
+    Stitches the tiles of a scan into a downscaled canvas on a single worker.
+
+    Tiles are queued (add_image blocks while the bounded queue is full), written
+    to the OME-TIFF file and blended into the canvas. The canvas and the blending
+    weights are memory-mapped .npy files next to the TIFF file, so whole-slide
+    scans don't have to fit into RAM. Overlapping tiles are blended with linear
+    feathering: each pixel is the weighted mean of all tiles covering it, with
+    weights ramping up from the tile edges.
+    """
 
     def __init__(self, parent, origin_coords, max_coords,  folder, file_name, extension,
                  resolution_scale=.25, nChannels = 3, flatfieldImage=None, image_dims=None,
                  flipX=True, flipY=True, isStitchAshlar=False, pixel_size = -1,
-                 tile_shape=(1,1), dtype=np.uint16):
+                 tile_shape=(1,1), dtype=np.uint16, feather=0.2, max_queue=16, stage_origin=(0, 0)):
         # Initial min and max coordinates
         self._parent = parent
+        self._logger = parent._logger if parent is not None else initLogger(self)
         self.isStitchAshlar = isStitchAshlar
         self.flipX = flipX
         self.flipY = flipY
         self.pixel_size = pixel_size
+        self.stage_origin = tuple(float(v) for v in stage_origin) # stage position (X, Y) in µm of the scan origin
         self.tile_shape = tile_shape[-2:] # tile_shape -> (channels, rows, columns, height, width)
         self.grid_shape = tile_shape[1:3] # (rows, columns)
         self.dtype = dtype
+        self.feather = feather  # width of the blending ramp as fraction of the tile size
 
         # determine write location
         self.file_name = file_name
         self.file_path = os.sep.join([folder, file_name + extension])
+        os.makedirs(folder, exist_ok=True)
 
-        # Queue to hold incoming images
-        self.queue = deque()
-
-        # Thread lock for thread safety
-        self.lock = threading.Lock()
-
-        # Start a background thread for processing the queue
-        self.processing_thread = threading.Thread(target=self._process_queue)
-        self.isRunning = True
-        self.processing_thread.start()
+        # Bounded queue to hold incoming images, add_image waits if it is full
+        self.queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self.max_queue_depth = 0
+        self.placed_tiles = []  # (y0, x0, y1, x1) on the canvas
+        self.place_time = 0.0
+        self._featherWeights = {}
 
         # differentiate between ASHLAR and simple memory based stitching
+        self.canvas_path = None
         if self.isStitchAshlar and IS_ASHLAR_AVAILABLE:
             self.ashlarImageList = []
             self.ashlarPositionList = []
@@ -1532,9 +1566,19 @@ class ImageStitcher:
             self.resolution_scale = resolution_scale                        # how much we want to downscale the result to save memory?
             self.origin_coords = np.int32(np.array(origin_coords))          # origin coordinate of the stage (e.g. x=0, y=0)
             image_width, image_height = image_dims[0], image_dims[1]        # physical size of the image in microns
-            size = np.array((max_coords[1]+image_height,max_coords[0]+image_width))/pixel_size # size of the final image that contains all tiles in microns
-            mshape = np.int32(np.ceil(size)*self.resolution_scale*pixel_size)          # size of the final image in pixels (i.e. canvas)
-            self.stitched_image = np.zeros(mshape.T, dtype=np.uint16)       # create a canvas for the stitched image
+            size = (max_coords[1]+image_height/pixel_size, max_coords[0]+image_width/pixel_size) # size of the area that contains all tiles in pixels
+            mshape = tuple(int(n) for n in np.ceil(np.array(size)*self.resolution_scale))  # size of the final image in pixels (i.e. canvas)
+            # memory-mapped canvas for the stitched image and the accumulated blending weights
+            self.canvas_path = os.sep.join([folder, file_name + "_stitched.npy"])
+            self._weights_path = os.sep.join([folder, file_name + "_weights.npy"])
+            self.stitched_image = np.lib.format.open_memmap(self.canvas_path, mode="w+", dtype=np.uint16, shape=mshape)
+            self._weights = np.lib.format.open_memmap(self._weights_path, mode="w+", dtype=np.float32, shape=mshape)
+
+        # Start a background thread for processing the queue
+        self.error = None  # set if the worker failed (e.g. the TIFF file could not be opened)
+        self.processing_thread = threading.Thread(target=self._process_queue, daemon=True)
+        self.isRunning = True
+        self.processing_thread.start()
 
 
     def process_ashlar(self, arrays, position_list, pixel_size, output_filename='ashlar_output_numpy.tif', maximum_shift_microns=10, flip_x=False, flip_y=False):
@@ -1572,63 +1616,170 @@ class ImageStitcher:
                         position_list=position_list,
                         pixel_size=pixel_size)
 
-    def add_image(self, img, coords, metadata):
+    def add_image(self, img, coords, metadata, timeout=None):
         '''
-        Add an image to the queue for processing
+        Add an image to the queue for processing, waits while the queue is full
         img - 2/3D numpy array (grayscale or RGB)
         coords - tuple of (x, y) stage coordinates in pixels
         metadata - dictionary of metadata
+        returns False if the stitcher is closed or the timeout expired
+        raises RuntimeError if the worker has stopped
+        '''
+        if not self.isRunning:
+            return False
+        if not self._put((img, coords, metadata), timeout):
+            return False
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def _put(self, item, timeout=None):
+        '''
+        timed put that fails instead of blocking forever once the worker is gone
         '''
-        with self.lock:
-            self.queue.append((img, coords, metadata))
+        deadline = None if timeout is None else time.monotonic()+timeout
+        while self.processing_thread.is_alive():
+            wait = _PUT_POLL if deadline is None else min(_PUT_POLL, deadline-time.monotonic())
+            if wait <= 0:
+                return False
+            try:
+                self.queue.put(item, timeout=wait)
+                return True
+            except queue.Full:
+                pass
+        raise RuntimeError(f"Stitcher worker stopped: {self.error}")
 
     def _process_queue(self):
+        try:
+            self._write_queue()
+        except Exception as e:
+            self.error = e
+            self._logger.error(f"Stitcher worker failed: {e}")
+
+    def _write_queue(self):
         #https://forum.image.sc/t/python-tifffile-ome-full-metadata-support/56526/11?u=beniroquai
         with tifffile.TiffWriter(self.file_path, bigtiff=True, append=True) as tif:
-            while self.isRunning:
-                if not self.queue:
-                    time.sleep(.02) # unload CPU
-                    continue
-                img, coords, metadata = self.queue.popleft()
-                
+            while True:
+                item = self.queue.get()
+                if item is _STOP:
+                    break
+                img, coords, metadata = item
+
                 # flip image if needed
                 if self.flipX:
                     img = np.fliplr(img)
                 if self.flipY:
                     img = np.flipud(img)
-                #
-                
-                self._place_on_canvas(img, coords)
-                # write image to disk
-                #metadata e.g. {"Pixels": {"PhysicalSizeX": 0.2, "PhysicalSizeXUnit": "\\u00b5m", "PhysicalSizeY": 0.2, "PhysicalSizeYUnit": "\\u00b5m"}, "Plane": {"PositionX": -100, "PositionY": -100, "IndexX": 0, "IndexY": 0}}
-                tif.write(data=img, metadata=metadata)
-                
+
+                try:
+                    self._place_on_canvas(img, coords)
+                    # write image to disk
+                    #metadata e.g. {"Pixels": {"PhysicalSizeX": 0.2, "PhysicalSizeXUnit": "\\u00b5m", "PhysicalSizeY": 0.2, "PhysicalSizeYUnit": "\\u00b5m"}, "Plane": {"PositionX": -100, "PositionY": -100, "IndexX": 0, "IndexY": 0}}
+                    tif.write(data=img, metadata=metadata)
+                except Exception as e:
+                    self._logger.error(f"Error stitching tile at {coords}: {e}")
+
+    def _getFeatherWeights(self, shape):
+        '''
+        separable linear ramp from (almost) 0 at the tile edges to 1 at feather*size from them
+        '''
+        weights = self._featherWeights.get(shape)
+        if weights is None:
+            ramps = []
+            for n in shape:
+                distance = np.minimum(np.arange(n), np.arange(n)[::-1]) + 0.5
+                ramps.append(np.clip(distance / max(1.0, self.feather*n), 1e-3, 1.0).astype(np.float32))
+            weights = self._featherWeights[shape] = ramps[0][:, np.newaxis]*ramps[1][np.newaxis, :]
+        return weights
+
     def _place_on_canvas(self, img, coords):
         if self.isStitchAshlar and IS_ASHLAR_AVAILABLE:
             # in case we want to process it with ASHLAR later on
             self.ashlarImageList.append(img)
             self.ashlarPositionList.append(coords)
+            return
+
+        tStart = time.perf_counter()
+        # scale to the uint16 range of the canvas (as skimage.img_as_uint)
+        img = np.asarray(img)
+        if np.issubdtype(img.dtype, np.integer):
+            scale = 65535.0/np.iinfo(img.dtype).max
         else:
-            # subsample the image
-            coords = np.flip(coords) # YX
-            img = skimage.transform.rescale(img, self.resolution_scale, anti_aliasing=False)
-            if len(img.shape)==3: img = np.mean(img, axis=-1)  # RGB
-            if img.dtype != np.float64 or img.dtype != np.float32:
-                img = np.abs(img)*(img<1)
-            img = skimage.img_as_uint(img)
-            # Round position so paste will skip the expensive subpixel shift.
-            pos = np.round((coords-self.origin_coords)*self.resolution_scale)
-            utils.paste(self.stitched_image, img, pos, np.maximum)
+            img = np.clip(img, 0, 1)
+            scale = 65535.0
+        img = img.astype(np.float32)
+        if len(img.shape)==3: img = np.mean(img, axis=-1)  # RGB
+        # subsample the image (area averaging)
+        height = max(1, int(round(img.shape[0]*self.resolution_scale)))
+        width = max(1, int(round(img.shape[1]*self.resolution_scale)))
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)*scale
+
+        # Round position so we can skip the expensive subpixel shift, crop to the canvas
+        coords = np.flip(np.asarray(coords, dtype=np.float64)) # YX
+        y0, x0 = (int(v) for v in np.round((coords-self.origin_coords)*self.resolution_scale))
+        canvasHeight, canvasWidth = self.stitched_image.shape
+        cy0, cx0 = max(y0, 0), max(x0, 0)
+        cy1, cx1 = min(y0+height, canvasHeight), min(x0+width, canvasWidth)
+        if cy1 <= cy0 or cx1 <= cx0:
+            return
+        region = (slice(cy0, cy1), slice(cx0, cx1))
+        tile = img[cy0-y0:cy1-y0, cx0-x0:cx1-x0]
+        weights = self._getFeatherWeights((height, width))[cy0-y0:cy1-y0, cx0-x0:cx1-x0]
+
+        # running weighted mean: canvas = sum(w*tile)/sum(w)
+        accumulated = self._weights[region]
+        total = accumulated + weights
+        blended = (self.stitched_image[region]*accumulated + tile*weights)/total
+        self.stitched_image[region] = np.clip(np.rint(blended), 0, 65535).astype(np.uint16)
+        self._weights[region] = total
+        self.placed_tiles.append((cy0, cx0, cy1, cx1))
+        self.place_time += time.perf_counter()-tStart
 
     def get_tile_list(self):
         '''
         return the list of unstitched images and their positions
         '''
+        self.close()
         return self.ashlarImageList, self.ashlarPositionList
 
+    def close(self):
+        '''
+        process the queued tiles, close the TIFF file and finalize the canvas
+        '''
+        if not self.isRunning:
+            return
+        self.isRunning = False
+        try:
+            self._put(_STOP)
+        except RuntimeError as e:
+            self._logger.error(e)  # nothing left to drain
+        self.processing_thread.join()
+        if self.canvas_path is not None:
+            self.stitched_image.flush()
+            # the weights are only needed while blending
+            self._weights = None
+            try:
+                os.remove(self._weights_path)
+            except OSError:
+                pass
+            with open(os.path.splitext(self.canvas_path)[0]+".json", "w") as f:
+                json.dump({"shape": list(self.stitched_image.shape),
+                           "resolution_scale": self.resolution_scale,
+                           "origin": self.origin_coords.tolist(),
+                           "stage_origin": self.stage_origin,
+                           "pixel_size": self.pixel_size,
+                           "tiles": self.placed_tiles}, f)
+
+    def get_stats(self):
+        return {
+            "placed_tiles": len(self.placed_tiles),
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "place_time_s": self.place_time,
+        }
+
     def get_stitched_image(self):
-        # introduce a little delay to free the queue ? # TODO
-        time.sleep(0.5)
+        # wait for all queued tiles
+        self.close()
         if self.isStitchAshlar and IS_ASHLAR_AVAILABLE:
             # convert the image and positionlist
             arrays = [np.expand_dims(np.array(self.ashlarImageList),1)]  # (num_images, num_channels, height, width)
@@ -1638,15 +1789,8 @@ class ImageStitcher:
             stitched = tifffile.imread(self.file_path)
             return stitched
         else:
-            # Normalize by the weight image to get the final result
-            stitched = self.stitched_image.copy()
-            '''
-            if len(stitched.shape)>2:
-                stitched = stitched/np.max(stitched)
-                stitched = np.uint8(stitched*255)
-            '''
-            self.isRunning = False
-            return stitched
+            # memory-mapped, read pages on demand
+            return self.stitched_image
 
     def save_stitched_image(self, filename):
         stitched = self.get_stitched_image()
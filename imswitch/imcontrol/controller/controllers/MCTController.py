@@ -541,24 +541,12 @@ class MCTController(ImConWidgetController):
                     mIllumination.setValue(illuValue)
                     mIllumination.setEnabled(True)
 
-                    # always mmake sure we get a frame that is not the same as the one with illumination off eventually
-                    timeoutFrameRequest = 1 # seconds # TODO: Make dependent on exposure time
-                    cTime = time.time()
-                    frameSync=3
-                    lastFrameNumber=-1
-                    while(1):
-                        # get frame and frame number to get one that is newer than the one with illumination off eventually
-                        mFrame, currentFrameNumber = self.detector.getLatestFrame(returnFrameNumber=True)
-                        if lastFrameNumber==-1:
-                            # first round
-                            lastFrameNumber = currentFrameNumber
-                        if time.time()-cTime> timeoutFrameRequest:
-                            # in case exposure time is too long we need break at one point
-                            break
-                        if currentFrameNumber <= lastFrameNumber+frameSync:
-                            time.sleep(0.01) # off-load CPU
-                        else:
-                            break
+                    # first frame exposed with the illumination on
+                    try:
+                        mFrame = self.detector.getFrameAfter(time.time())
+                    except TimeoutError as e:
+                        self._logger.warning(e)
+                        mFrame = self.detector.getLatestFrame()
                     # store frames
                     allChannelFrames.append(mFrame)
                     mIllumination.setEnabled(False)
@@ -771,6 +771,18 @@ class RecordingController(ImConWidgetController):
                 self._commChannel.sigAbortScan.emit()
             self._master.recordingManager.endRecording()
 
+    @APIExport()
+    def getRecordingStats(self) -> dict:
+        """Returns the write throughput (MB/s), writer queue fill level and
+        dropped frames per detector of the current or last recording."""
+        return self._master.recordingManager.getRecordingStats()
+
+    @APIExport(requestType="POST")
+    def setRecordingWriterOptions(self, maxQueueMB: float = None, dropWhenFull: bool = None) -> None:
+        """Sets the writer queue size per detector and whether frames are
+        dropped instead of stalling the recording when the disk can't keep up."""
+        self._master.recordingManager.setWriterOptions(maxQueueMB, dropWhenFull)
+
     @APIExport(runOnUIThread=True)
     def setRecModeSpecFrames(self, numFrames: int) -> None:
         """Sets the recording mode to record a specific number of frames."""
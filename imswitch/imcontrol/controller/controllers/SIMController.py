@@ -13,6 +13,7 @@ from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 
 from ..basecontrollers import LiveUpdatedController
+from .sim_processing import SIMFilterCache, SIMFilterSet, SIMReconstructionPipeline
 
 import os
 import time
@@ -86,7 +87,6 @@ class SIMController(ImConWidgetController):
         self.LaserWL = 0
 
         self.simFrameVal = 0
-        self.nsimFrameSyncVal = 2
 
         # Choose which laser will be recorded
         self.is488 = True
@@ -143,10 +143,24 @@ class SIMController(ImConWidgetController):
         self.positionerName = self._master.positionersManager.getAllDeviceNames()[0]
         self.positioner = self._master.positionersManager[self.positionerName]
 
+        # reconstructions and file saving run on bounded queues, stacks are never dropped;
+        # the acquisition waits if the workers fall behind
+        self.simFilterCache = SIMFilterCache()
+        self.reconstructionPipeline = SIMReconstructionPipeline(
+            self._reconstructQueued, workers=max(1, min(4, (os.cpu_count() or 2) - 1)), max_queue=8,
+            on_error=lambda item, e: self._logger.error(f"SIM reconstruction failed: {e}"))
+        self.savingPipeline = SIMReconstructionPipeline(
+            self._saveQueued, workers=1, max_queue=16, name="SIMSaving",
+            on_error=lambda item, e: self._logger.error(f"Saving {item[1]} failed: {e}"))
+
         # setup the SIM processors
         sim_parameters = SIMParameters()
-        self.SimProcessorLaser1 = SIMProcessor(self, sim_parameters, wavelength=sim_parameters.wavelength_1)
-        self.SimProcessorLaser2 = SIMProcessor(self, sim_parameters, wavelength=sim_parameters.wavelength_2)
+        self.SimProcessorLaser1 = SIMProcessor(self, sim_parameters, wavelength=sim_parameters.wavelength_1,
+                                               pipeline=self.reconstructionPipeline,
+                                               filterCache=self.simFilterCache)
+        self.SimProcessorLaser2 = SIMProcessor(self, sim_parameters, wavelength=sim_parameters.wavelength_2,
+                                               pipeline=self.reconstructionPipeline,
+                                               filterCache=self.simFilterCache)
 
         self.initFastAPISIM(self._master.simManager.fastAPISIMParams)
 
@@ -218,6 +232,32 @@ class SIMController(ImConWidgetController):
         #self.imageComputationThread.quit()
         #self.imageComputationThread.wait()
 
+    def closeEvent(self):
+        # finish the queued reconstructions and files
+        for pipeline in (getattr(self, 'reconstructionPipeline', None), getattr(self, 'savingPipeline', None)):
+            if pipeline is not None:
+                pipeline.close()
+
+    def _reconstructQueued(self, item):
+        processor, stack, context = item
+        processor.reconstructSIMStackBackground(stack, **context)
+
+    def _saveQueued(self, item):
+        self.saveImageInBackground(*item)
+
+    @APIExport()
+    def getSIMReconstructionStats(self):
+        """ Throughput and queue depth of the reconstruction and saving pipelines
+        and the cached calibration filters. """
+        if not hasattr(self, 'reconstructionPipeline'):
+            return {"success": False, "error": "SIM is not configured"}
+        return {
+            "success": True,
+            "reconstruction": self.reconstructionPipeline.get_stats(),
+            "saving": self.savingPipeline.get_stats(),
+            "filters": self.simFilterCache.get_stats(),
+        }
+
     def toggleSIMDisplay(self, enabled=True):
         self._widget.setSIMDisplayVisible(enabled)
 
@@ -459,35 +499,14 @@ class SIMController(ImConWidgetController):
                     else:
                         # we need to capture images and display patterns one-by-one
                         self.SIMStack = []
-                        try:
-                            mExposureTime = self.detector.getParameter("exposure")/1e6 # s^-1
-                        except:
-                            mExposureTime = 0.1
                         for iPattern in range(9):
                             self.SIMClient.display_pattern(iPattern)
-                            time.sleep(mExposureTime) # make sure we take the next newest frame to avoid motion blur from the pattern change
-
-                            # Todo: Need to ensure thatwe have the right pattern displayed and the buffer is free - this heavily depends on the exposure time..
-                            mFrame = None
-                            lastFrameNumber = -1
-                            timeoutFrameRequest = 3 # seconds
-                            cTime = time.time()
-                            frameRequestNumber = 0
-                            while(1):
-                                # something went wrong while capturing the frame
-                                if time.time()-cTime> timeoutFrameRequest:
-                                    break
-                                mFrame, currentFrameNumber = self.detector.getLatestFrame(returnFrameNumber=True)
-                                if currentFrameNumber <= lastFrameNumber:
-                                    time.sleep(0.05)
-                                    continue
-                                frameRequestNumber += 1
-                                if frameRequestNumber > self.nsimFrameSyncVal:
-                                    print(f"Frame number used for stack: {currentFrameNumber}")
-                                    break
-                                lastFrameNumber = currentFrameNumber
-
-                                #mFrame = self.detector.getLatestFrame() # get the next frame after the pattern has been updated
+                            # first frame exposed with the new pattern, avoids motion blur from the pattern change
+                            try:
+                                mFrame = self.detector.getFrameAfter(time.time())
+                            except TimeoutError as e:
+                                self._logger.error(e)
+                                mFrame = self.detector.getLatestFrame()
                             self.SIMStack.append(mFrame)
                         if self.SIMStack is None:
                             self._logger.error("No image received")
@@ -508,7 +527,7 @@ class SIMController(ImConWidgetController):
                         date = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
                         processor.setDate(date)
                         mFilenameStack = f"{date}_SIM_Stack_{self.LaserWL}nm_{zPos+zPosInitially}mum.tif"
-                        threading.Thread(target=self.saveImageInBackground, args=(self.SIMStack, mFilenameStack,), daemon=True).start()
+                        self.savingPipeline.submit((self.SIMStack, mFilenameStack))
                     # self.detector.stopAcquisition()
                     # We will collect N*M images and process them with the SIM processor
 
@@ -583,35 +602,14 @@ class SIMController(ImConWidgetController):
             else:
                 # we need to capture images and display patterns one-by-one
                 self.SIMStack = []
-                try:
-                    mExposureTime = self.detector.getParameter("exposure")/1e6 # s^-1
-                except:
-                    mExposureTime = 0.1
                 for iPattern in range(9):
                     self.SIMClient.display_pattern(iPattern)
-                    time.sleep(mExposureTime) # make sure we take the next newest frame to avoid motion blur from the pattern change
-
-                    # Todo: Need to ensure thatwe have the right pattern displayed and the buffer is free - this heavily depends on the exposure time..
-                    mFrame = None
-                    lastFrameNumber = -1
-                    timeoutFrameRequest = 3 # seconds
-                    cTime = time.time()
-                    frameRequestNumber = 0
-                    while(1):
-                        # something went wrong while capturing the frame
-                        if time.time()-cTime> timeoutFrameRequest:
-                            break
-                        mFrame, currentFrameNumber = self.detector.getLatestFrame(returnFrameNumber=True)
-                        if currentFrameNumber <= lastFrameNumber:
-                            time.sleep(0.05)
-                            continue
-                        frameRequestNumber += 1
-                        if frameRequestNumber > self.nsimFrameSyncVal:
-                            print(f"Frame number used for stack: {currentFrameNumber}")
-                            break
-                        lastFrameNumber = currentFrameNumber
-
-                        #mFrame = self.detector.getLatestFrame() # get the next frame after the pattern has been updated
+                    # first frame exposed with the new pattern, avoids motion blur from the pattern change
+                    try:
+                        mFrame = self.detector.getFrameAfter(time.time())
+                    except TimeoutError as e:
+                        self._logger.error(e)
+                        mFrame = self.detector.getLatestFrame()
                     self.SIMStack.append(mFrame)
                 if self.SIMStack is None:
                     self._logger.error("No image received")
@@ -633,7 +631,7 @@ class SIMController(ImConWidgetController):
                 date = datetime.now().strftime("%Y_%m_%d-%I-%M-%S_%p")
                 processor.setDate(date)
                 mFilenameStack = f"{date}_SIM_Stack_{self.LaserWL}nm_{uniqueID}.tif"
-                threading.Thread(target=self.saveImageInBackground, args=(self.SIMStack, mFilenameStack,), daemon=True).start()
+                self.savingPipeline.submit((self.SIMStack, mFilenameStack))
             # self.detector.stopAcquisition()
             # We will collect N*M images and process them with the SIM processor
 
@@ -728,9 +726,11 @@ class SIMParameters(object):
 
 class SIMProcessor(object):
 
-    def __init__(self, parent, simParameters, wavelength=488):
+    def __init__(self, parent, simParameters, wavelength=488, pipeline=None, filterCache=None):
         '''
         setup parameters
+        pipeline: SIMReconstructionPipeline the stacks are queued to (None: reconstruct synchronously)
+        filterCache: SIMFilterCache shared between processors
         '''
         #current parameters is setting for 60x objective 488nm illumination
         self.parent = parent
@@ -755,8 +755,17 @@ class SIMProcessor(object):
 
         # processing parameters
         self.isRecording = False
+        self.date = None
+        self.LaserWL = wavelength
         self.allPatterns = []
-        self.isReconstructing = False
+
+        # calibration filters per wavelength/shape, queued reconstructions
+        self.pipeline = pipeline
+        self.filterCache = filterCache if filterCache is not None else SIMFilterCache()
+        self._opticalParameters = None
+        self._calibratedKey = None
+        # self.h is stateful: calibration and its own reconstruct methods run one at a time
+        self._processorLock = threading.RLock()
 
         # initialize logger
         self._logger = initLogger(self, tryInheritParent=False)
@@ -816,6 +825,15 @@ class SIMProcessor(object):
         #self.use_gpu = False #sim_parameters["useGPU"]
         self.eta =  sim_parameters.eta
         self.magnification = sim_parameters.magnification
+        opticalParameters = (self.pixelsize, self.NA, self.n, self.eta, self.magnification)
+        if self._opticalParameters is not None and opticalParameters != self._opticalParameters:
+            self._invalidateCalibration()
+        self._opticalParameters = opticalParameters
+
+    def _invalidateCalibration(self):
+        self.filterCache.invalidate(self.wavelength)
+        self._calibratedKey = None
+        self.isCalibrated = False
 
     def setReconstructionMethod(self, method):
         self.reconstructionMethod = method
@@ -948,14 +966,12 @@ class SIMProcessor(object):
     def reconstructSIMStack(self):
         '''
         reconstruct the image stack asychronously
+        the stack is queued (blocking while the queue is full), never dropped
         '''
-        # TODO: Perhaps we should work with quees?
-        # reconstruct and save the stack in background to not block the main thread
-        if not self.isReconstructing:  # not
-            self.isReconstructing=True
-            mStackCopy = np.array(self.stack.copy())
-            self.mReconstructionThread = threading.Thread(target=self.reconstructSIMStackBackground, args=(mStackCopy,), daemon=True)
-            self.mReconstructionThread.start()
+        mStackCopy = np.array(self.stack)
+        context = {"date": self.date, "wavelength": self.LaserWL, "isRecording": self.isRecording}
+        if self.pipeline is None or not self.pipeline.submit((self, mStackCopy, context)):
+            self.reconstructSIMStackBackground(mStackCopy, **context)
 
     def setRecordingMode(self, isRecording):
         self.isRecording = isRecording
@@ -968,40 +984,53 @@ class SIMProcessor(object):
 
     def setWavelength(self, wavelength, sim_parameters):
         self.LaserWL = wavelength
+        previousWavelength = getattr(self.h, "wavelength", None)
         if self.LaserWL == 488:
             self.h.wavelength = sim_parameters.wavelength_1
         elif self.LaserWL == 635:
             self.h.wavelength = sim_parameters.wavelength_2
+        if previousWavelength is not None and self.h.wavelength != previousWavelength:
+            self._invalidateCalibration()
 
-    def reconstructSIMStackBackground(self, mStack):
+    def getFilters(self, stack):
         '''
-        reconstruct the image stack asychronously
-        the stack is a list of 9 images (3 angles, 3 phases)
+        cached reconstruction filters for the wavelength and shape of the stack,
+        calibrates on the first stack of a new wavelength/shape
         '''
-        # compute image
-        # initialize the model
+        key = self.filterCache.key(self.wavelength, np.shape(stack))
+
+        def calibrateFilters():
+            with self._processorLock:
+                self._logger.debug(f"Calibrating for {key}")
+                self.setReconstructor()
+                self.calibrate(stack)
+                self._calibratedKey = key
+                return SIMFilterSet.from_processor(self.h)
+
+        return self.filterCache.get_or_create(key, calibrateFilters)
 
+    def reconstructSIMStackBackground(self, mStack, date=None, wavelength=None, isRecording=None):
+        '''
+        reconstruct the image stack (on a worker of the reconstruction pipeline)
+        the stack is a list of 9 images (3 angles, 3 phases)
+        date, wavelength, isRecording: state at the time the stack was queued
+        '''
         self._logger.debug("Processing frames")
-        if not self.getIsCalibrated():
-            self.setReconstructor()
-            self.calibrate(mStack)
-        SIMReconstruction = self.reconstruct(mStack)
-
-        # save images eventually
-        if self.isRecording:
-            def saveImageInBackground(image, filename = None):
-                try:
-                    self.folder = SIMParameters.path
-                    self.filename = os.path.join(self.folder,filename) #FIXME: Remove hardcoded path
-                    tif.imwrite(self.filename, image)
-                    self._logger.debug("Saving file: "+self.filename)
-                except  Exception as e:
-                    self._logger.error(e)
-            mFilenameRecon = f"{self.date}_SIM_Reconstruction_{self.LaserWL}nm.tif"
-            threading.Thread(target=saveImageInBackground, args=(SIMReconstruction, mFilenameRecon,)).start()
+        date = self.date if date is None else date
+        wavelength = self.LaserWL if wavelength is None else wavelength
+        isRecording = self.isRecording if isRecording is None else isRecording
+        SIMReconstruction = self.reconstruct(np.asarray(mStack))
+
+        # save images eventually (already on a worker thread)
+        if isRecording:
+            try:
+                filename = os.path.join(SIMParameters.path, f"{date}_SIM_Reconstruction_{wavelength}nm.tif") #FIXME: Remove hardcoded path
+                tif.imwrite(filename, SIMReconstruction)
+                self._logger.debug("Saving file: "+filename)
+            except  Exception as e:
+                self._logger.error(e)
 
         self.parent.sigImageReceived.emit(np.array(SIMReconstruction), "SIM Reconstruction", np.float32(self.pixelsize/2.0))
-        self.isReconstructing = False
 
     def reconstruct(self, currentImage):
         '''
@@ -1010,15 +1039,23 @@ class SIMProcessor(object):
         if self.reconstructionMethod == "napari":
             # we use the napari reconstruction method
             self._logger.debug("reconstructing the stack with napari")
-            assert self.isCalibrated, 'SIM processor not calibrated, unable to perform SIM reconstruction'
 
             dshape= np.shape(currentImage)
             phases_angles = self.phases_number*self.angles_number
             rdata = currentImage[:phases_angles, :, :].reshape(phases_angles, dshape[-2],dshape[-1])
+            filters = self.getFilters(rdata)
             if self.use_gpu:
-                imageSIM = self.h.reconstruct_pytorch(rdata.astype(np.float32)) #TODO:this is left after conversion from torch
+                key = self.filterCache.key(self.wavelength, rdata.shape)
+                with self._processorLock:
+                    if self._calibratedKey != key:
+                        # self.h holds the calibration of another shape
+                        self.setReconstructor()
+                        self.calibrate(rdata)
+                        self._calibratedKey = key
+                    imageSIM = self.h.reconstruct_pytorch(rdata.astype(np.float32)) #TODO:this is left after conversion from torch
             else:
-                imageSIM = self.h.reconstruct_rfftw(rdata)
+                # only FFT-multiply-IFFT with the cached float32 filters, thread-safe
+                imageSIM = filters.reconstruct(rdata)
 
             return imageSIM
 
@@ -1034,6 +1071,9 @@ class SIMProcessor(object):
             imgs = tifffile.imread(fname_data)
             '''
             self._logger.debug("reconstructing the stack with mcsim")
+            with self._processorLock:
+                if not self.getIsCalibrated():
+                    self.calibrate(currentImage)
 
             imgset_next = sim.SimImageSet({"pixel_size": self.dxy,
                                         "na": self.na,
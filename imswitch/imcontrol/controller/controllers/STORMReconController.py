@@ -9,6 +9,7 @@ from dataclasses import dataclass
 import threading
 from pathlib import Path
 
+from fastapi import Response
 from imswitch.imcommon.framework import Signal
 from imswitch.imcommon.model import initLogger, dirtools
 from ..basecontrollers import LiveUpdatedController
@@ -33,10 +34,16 @@ except ImportError:
     HAS_STORM_MODELS = False
 
 try:
+    import cv2
     from .microEye.Filters import BandpassFilter
     from .microEye.fitting.fit import CV_BlobDetector
     from .microEye.fitting.results import FittingMethod
     from .microEye.fitting.fit import localize_frame
+    from .microEye.fitting.batch import (DRIFT_COLUMNS, PHASOR_COLUMNS, BatchLocalizer,
+                                         HistogramRenderer, LocalizationTable,
+                                         LocalizerParams, ThroughputMeter)
+    from .microEye.fitting.drift import OnlineDriftCorrector, interpolate_drift
+    from .microEye.fitting.store import LocalizationStore
     isMicroEye = True
 except ImportError:
     isMicroEye = False
@@ -135,6 +142,8 @@ class STORMReconController(LiveUpdatedController):
         self._local_processing_enabled = False  # Flag for local processing during acquisition
         self._last_reconstruction_path = ""
         self._last_reconstruction_path = None
+        self._localization_store = None
+        self._last_localizations_path = None
         # Initialize Arkitekt integration if available
         self._arkitekt_app = None
         self._arkitekt_handle = None
@@ -731,6 +740,14 @@ class STORMReconController(LiveUpdatedController):
         # Enable local processing if requested
         if process_locally and isMicroEye:
             self.imageComputationWorker.setActive(True)
+            self.imageComputationWorker.resetReconstruction()
+            batchSize, workers = self._getBatchParameters()
+            if batchSize > 0:
+                self.imageComputationWorker.startBatchMode(batchSize, workers)
+            self.imageComputationWorker.setDriftCorrection(
+                self._getProcessingParameter('drift_window_frames', 500)
+                if self._getProcessingParameter('drift_correction', False) else 0)
+            self._openLocalizationStore()
             self._logger.info("Local processing enabled for acquisition")
 
         # Determine acquisition mode and initialize saving
@@ -769,6 +786,50 @@ class STORMReconController(LiveUpdatedController):
             "local_processing": process_locally
         }
 
+    def _openLocalizationStore(self):
+        """Open a new localization store in the session directory (or the data directory)."""
+        self._closeLocalizationStore()
+        # one file per acquisition, named after the session and the start time
+        timeStamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        fileName = f"{self._current_session_id or 'localizations'}_{timeStamp}.h5"
+        if self._session_directory:
+            filePath = Path(self._session_directory) / "localizations" / fileName
+        else:
+            filePath = Path(dirtools.UserFileDirs.Data) / "STORMController" / "localizations" / fileName
+        try:
+            self._localization_store = LocalizationStore(str(filePath), attrs={
+                'pixel_size_nm': self._getProcessingParameter('pixel_size_nm', 117.5),
+                'session_id': self._current_session_id or ""
+            })
+        except Exception as e:
+            self._logger.error(f"Failed to open localization store {filePath}: {e}")
+            self._localization_store = None
+        self.imageComputationWorker.store = self._localization_store
+
+    def _closeLocalizationStore(self):
+        """Write the remaining localizations and close the store."""
+        store, self._localization_store = self._localization_store, None
+        if store is None:
+            return
+        if hasattr(self, 'imageComputationWorker'):
+            self.imageComputationWorker.store = None
+        try:
+            store.close()
+            self._last_localizations_path = store.file_path
+            self._logger.info(f"Localizations saved: {store.file_path} ({len(store)} localizations)")
+        except Exception as e:
+            self._logger.error(f"Failed to close localization store: {e}")
+
+    def _getProcessingParameter(self, name, default=None):
+        if HAS_STORM_MODELS:
+            return getattr(self._processing_params, name, default)
+        return self._processing_params.get(name, default)
+
+    def _getBatchParameters(self):
+        """Frames per localization batch (0: frame by frame) and number of worker processes."""
+        return (self._getProcessingParameter('batch_size', 0),
+                self._getProcessingParameter('localization_workers'))
+
     def _updateProcessingParametersFromDict(self, params: Dict[str, Any]):
         """Update processing parameters from dictionary."""
         if HAS_STORM_MODELS:
@@ -809,16 +870,22 @@ class STORMReconController(LiveUpdatedController):
 
         self._acquisition_active = False
 
-        # Disable local processing if it was enabled
-        if self._local_processing_enabled and isMicroEye:
-            self.imageComputationWorker.setActive(False)
-            self._local_processing_enabled = False
-
         # Stop direct saving acquisition thread if running
         if self._direct_saving_mode and self._acquisition_thread is not None:
             self._acquisition_thread.join(timeout=5.0)  # Wait up to 5 seconds
             self._acquisition_thread = None
 
+        # Localize the frames still queued for batched localization
+        if isMicroEye and hasattr(self, 'imageComputationWorker'):
+            self.imageComputationWorker.stopBatchMode()
+            self.imageComputationWorker.finishDriftCorrection()
+        self._closeLocalizationStore()
+
+        # Disable local processing if it was enabled
+        if self._local_processing_enabled and isMicroEye:
+            self.imageComputationWorker.setActive(False)
+            self._local_processing_enabled = False
+
         # Stop detector acquisition
         if hasattr(self.detector, 'stopAcquisition'):
             self.detector.stopAcquisition()
@@ -830,6 +897,7 @@ class STORMReconController(LiveUpdatedController):
 
         session_id = self._current_session_id
         self._current_session_id = None
+        self._session_directory = ""
         self._direct_saving_mode = False
         self._saveDirectory = None
         self._frame_count = 0
@@ -1072,6 +1140,9 @@ class STORMReconController(LiveUpdatedController):
         if not self._acquisition_active:
             return {"success": False, "error": "No acquisition active"}
 
+        # stopping clears the session
+        session_id = self._current_session_id
+        dataDirectory = self._session_directory
         try:
             # Stop acquisition
             result = self.stopFastSTORMAcquisition()
@@ -1082,15 +1153,13 @@ class STORMReconController(LiveUpdatedController):
                 final_path = self.imageComputationWorker.saveImage()
                 self._last_reconstruction_path = final_path
 
-            session_id = self._current_session_id
-
             self._logger.info(f"Local STORM reconstruction stopped: {session_id}")
 
             return {
                 "success": True,
                 "session_id": session_id,
                 "final_reconstruction_path": self._last_reconstruction_path,
-                "data_directory": str(self._session_directory) if self._session_directory else None,
+                "data_directory": str(dataDirectory) if dataDirectory else None,
                 "message": "Local STORM reconstruction completed"
             }
 
@@ -1325,6 +1394,113 @@ class STORMReconController(LiveUpdatedController):
             self._logger.error(f"Failed to set detector parameters: {e}")
             return {"success": False, "error": str(e)}
 
+    @APIExport()
+    def getSTORMLocalizationStats(self) -> Dict[str, Any]:
+        """
+        Get throughput of the local localization and the number of localizations.
+
+        Returns:
+            Statistics of the localization worker
+        """
+        if not isMicroEye or not hasattr(self, 'imageComputationWorker'):
+            return {"success": False, "error": "MicroEye not available"}
+        return {"success": True, **self.imageComputationWorker.getLocalizationStats()}
+
+    @APIExport()
+    def getSTORMDriftTrajectory(self) -> Dict[str, Any]:
+        """
+        Get the drift estimated by the online drift correction.
+
+        Returns:
+            Window center frames and the drift in camera pixels and nm
+        """
+        if not isMicroEye or not hasattr(self, 'imageComputationWorker'):
+            return {"success": False, "error": "MicroEye not available"}
+        corrector = self.imageComputationWorker.driftCorrector
+        if corrector is None:
+            return {"success": True, "enabled": False, "frames": [], "drift_x_nm": [], "drift_y_nm": []}
+        frames, dx, dy = corrector.trajectory
+        pixelSize = self._getProcessingParameter('pixel_size_nm', 117.5)
+        return {
+            "success": True,
+            "enabled": True,
+            "window_frames": corrector.window_frames,
+            "updates": corrector.updates,
+            "frames": frames.tolist(),
+            "drift_x_px": dx.tolist(),
+            "drift_y_px": dy.tolist(),
+            "drift_x_nm": (dx * pixelSize).tolist(),
+            "drift_y_nm": (dy * pixelSize).tolist(),
+        }
+
+    @APIExport()
+    def getSTORMLocalizationStoreInfo(self) -> Dict[str, Any]:
+        """
+        Get the state of the localization store of the running (or last) acquisition.
+
+        Returns:
+            File path, number of written localizations and writer statistics
+        """
+        if self._localization_store is not None:
+            return {"success": True, "active": True, **self._localization_store.get_stats()}
+        return {"success": True, "active": False, "file_path": self._last_localizations_path}
+
+    @APIExport(runOnUIThread=False)
+    def renderSTORMLocalizations(self, x_min: float = None, y_min: float = None,
+                                 x_max: float = None, y_max: float = None,
+                                 pixel_size_nm: float = None,
+                                 frame_start: int = None, frame_stop: int = None,
+                                 file_path: str = None):
+        """
+        Render a super-resolution image from the localization store.
+
+        Parameters:
+        - x_min, y_min, x_max, y_max: Region in camera pixels (default: all localizations)
+        - pixel_size_nm: Rendered pixel size (default: super_resolution_pixel_size_nm)
+        - frame_start, frame_stop: Frame range, stop excluded (default: all frames)
+        - file_path: Store to render (default: the running or last acquisition)
+
+        Returns:
+        - PNG image
+        """
+        if not isMicroEye:
+            return {"success": False, "error": "MicroEye not available"}
+        store, ownsStore = self._localization_store, False
+        try:
+            if file_path is not None or store is None:
+                file_path = file_path or self._last_localizations_path
+                if file_path is None:
+                    return {"success": False, "error": "No localizations stored yet"}
+                store, ownsStore = LocalizationStore.open(file_path), True
+            else:
+                store.flush(timeout=5.0)
+
+            bounds = store.bounds()
+            if bounds is None:
+                return {"success": False, "error": "No localizations stored yet"}
+            roi = tuple(bounds[i] if value is None else value
+                        for i, value in enumerate((x_min, y_min, x_max, y_max)))
+            if pixel_size_nm is None:
+                pixel_size_nm = self._getProcessingParameter('super_resolution_pixel_size_nm', 10.0)
+            pixelSize = pixel_size_nm / self._getProcessingParameter('pixel_size_nm', 117.5)
+            if max(roi[2] - roi[0], roi[3] - roi[1]) / pixelSize > 8192:
+                return {"success": False, "error": "Rendered image would exceed 8192 pixels, "
+                                                   "increase pixel_size_nm or reduce the region"}
+            frames = None
+            if frame_start is not None or frame_stop is not None:
+                frames = (frame_start or 0, frame_stop if frame_stop is not None else np.iinfo(np.int64).max)
+
+            image = store.render(roi, pixelSize, frames)
+            image = (image / image.max() * 255 if image.max() > 0 else image).astype(np.uint8)
+            _, png = cv2.imencode(".png", image)
+            return Response(content=png.tobytes(), media_type="image/png")
+        except Exception as e:
+            self._logger.error(f"Failed to render localizations: {e}")
+            return {"success": False, "error": str(e)}
+        finally:
+            if ownsStore:
+                store.close()
+
     @APIExport()
     def getLastReconstructedImagePath(self) -> Optional[str]:
         """
@@ -1352,7 +1528,9 @@ class STORMReconController(LiveUpdatedController):
             "last_reconstruction_path": self._last_reconstruction_path,
             "session_directory": str(self._session_directory) if self._session_directory else None,
             "processing_parameters": self._processing_params.model_dump() if HAS_STORM_MODELS else self._processing_params,
-            "microeye_worker_available": hasattr(self, 'imageComputationWorker')
+            "microeye_worker_available": hasattr(self, 'imageComputationWorker'),
+            "localization_stats": self.imageComputationWorker.getLocalizationStats() if hasattr(self, 'imageComputationWorker') else None,
+            "localizations_path": self._localization_store.file_path if self._localization_store is not None else self._last_localizations_path
         }
 
         return enhanced_status
@@ -1414,13 +1592,7 @@ class STORMReconController(LiveUpdatedController):
                 tif.imwrite(str(filepath), frame_to_save)
                 self._last_reconstruction_path = str(filepath)
 
-                # Save localizations if available
-                if localizations is not None and len(localizations) > 0:
-                    loc_filename = f"localizations_{timestamp}.csv"
-                    loc_filepath = self._session_directory / "localizations" / loc_filename
-                    np.savetxt(str(loc_filepath), localizations, delimiter=',',
-                              header='x,y,background,intensity,magnitude_x,magnitude_y')
-
+                # The localizations go to the localization store (see _openLocalizationStore)
                 return str(filepath)
 
         except Exception as e:
@@ -1460,6 +1632,9 @@ class STORMReconController(LiveUpdatedController):
                     if frames_chunk is not None:
                         # Handle different chunk formats from different cameras
                         frames_to_process = self._normalizeFrameChunk(frames_chunk)
+                        batchMode = (self._local_processing_enabled and isMicroEye and
+                                     self.imageComputationWorker.batchModeActive)
+                        batchFrames, batchFirstFrame = [], self._frame_count
 
                         for frame in frames_to_process:
                             if not self._acquisition_active:
@@ -1472,7 +1647,9 @@ class STORMReconController(LiveUpdatedController):
                                              crop['x']:crop['x']+crop['width']]
 
                             # Process frame locally if enabled
-                            if self._local_processing_enabled:
+                            if batchMode:
+                                batchFrames.append(frame)
+                            elif self._local_processing_enabled:
                                 try:
                                     processed_path = self._enhancedProcessFrame(frame)
                                     if processed_path:
@@ -1512,6 +1689,13 @@ class STORMReconController(LiveUpdatedController):
                                 self._logger.info(f"Reached max frames limit: {max_frames}")
                                 self._acquisition_active = False
                                 break
+
+                        if batchFrames:
+                            try:
+                                self.imageComputationWorker.addFramesToBatch(batchFrames, batchFirstFrame)
+                            except Exception as e:
+                                self._logger.error(f"Error in batched localization: {e}")
+                                self.sigErrorOccurred.emit(f"Local processing error: {e}")
                     # Small delay to prevent excessive CPU usage
                     time.sleep(0.001)
 
@@ -1724,7 +1908,31 @@ class STORMReconImageComputationWorker:
         self.peakDetector = None
         self.fittingMethod = None
         self.tempEnabled = False
-        self.accumulatedReconstruction = None
+
+        # Localizations and the incrementally binned reconstruction
+        self.localizations = LocalizationTable(PHASOR_COLUMNS + DRIFT_COLUMNS) if isMicroEye else None
+        self.store = None  # LocalizationStore the localizations are also written to
+        self.renderer = None
+        self._lastEmittedFrame = 0
+
+        # Online drift correction (0: disabled). Re-binning all localizations
+        # with an updated drift runs on its own thread, off the frame path.
+        self.driftWindowFrames = 0
+        self.driftCorrector = None
+        self._renderLock = threading.Lock()  # appends to the table/renderer and renderer swaps
+        self._renderGeneration = 0
+        self._driftRenderThread = None
+        self._driftRenderTrajectory = None
+        self.driftRenders = 0
+
+        # Batched localization in worker processes
+        self.batch_size = 0
+        self._batchLocalizer = None
+        self._batchParams = None
+        self._batchFrames = []
+        self._batchFirstFrame = 0
+        self._pendingBatches = queue.Queue()
+        self._throughput = ThroughputMeter() if isMicroEye else None
 
     def reconSTORMFrame(self, frame, preFilter=None, peakDetector=None,
                         rel_threshold=0.4, PSFparam=np.array([1.5]),
@@ -1742,17 +1950,13 @@ class STORMReconImageComputationWorker:
             peakDetector = self.peakDetector
 
         try:
-            index = 1
-            filtered = frame.copy()
-            varim = None
-
-            # Perform localization
+            # localize_frame doesn't modify the frame, no need to copy it
             frames, params, crlbs, loglike = localize_frame(
-                index, frame, filtered, varim,
+                1, frame, frame, None,
                 preFilter, peakDetector, rel_threshold,
                 PSFparam, roiSize, method
             )
-            self.frameIterator += 1 
+            self.frameIterator += 1
 
             # Create simple reconstruction visualization
             frameLocalized = np.zeros_like(frame, dtype=np.float32)
@@ -1764,21 +1968,13 @@ class STORMReconImageComputationWorker:
                 except Exception as e:
                     self._logger.warning(f"Error creating localization visualization: {e}")
 
-            # accumulate reconstructed localization maps 
-            try:
-                if self.accumulatedReconstruction is None: 
-                    self.accumulatedReconstruction = frameLocalized
-                else:
-                    self.accumulatedReconstruction += frameLocalized
-            except Exception as e:
-                self._logger.error(f"Error in accumulating frames:  {e}")
-                
-            # emit current frame reconstruction signal through parent controller
-            if self._parent_controller is not None:
-                if self.frameIterator % self.update_rate == 0:
-                    #self._parent_controller.sigUpdatedSTORMReconstruction.emit(params)
-                    #self._parent_controller.sigUpdatedSTORMReconstructionImage(frameLocalized)
-                    self._parent_controller.sigExperimentImageUpdate.emit("STORM", self.accumulatedReconstruction/np.max(self.accumulatedReconstruction)*255, False, [], False)
+                self._addLocalizations({
+                    'frame': np.full(len(params), self.frameIterator - 1, np.int64),
+                    'x': params[:, 0], 'y': params[:, 1],
+                    'background': params[:, 2], 'intensity': params[:, 3],
+                    'ratio x/y': params[:, 4]
+                }, frame.shape)
+            self._emitReconstruction()
 
             return frameLocalized, params
 
@@ -1786,6 +1982,200 @@ class STORMReconImageComputationWorker:
             self._logger.error(f"Error in STORM frame reconstruction: {e}")
             return frame, None
 
+    def _addLocalizations(self, columns, frameShape):
+        """Append localizations to the table (and the store) and bin them into the
+        reconstruction, corrected by the current drift estimate."""
+        if self.renderer is None or self.renderer.shape != tuple(frameShape[:2]):
+            self.renderer = HistogramRenderer(frameShape[:2])
+        updated = False
+        dx = dy = 0
+        if self.driftWindowFrames > 0:
+            if self.driftCorrector is None or self.driftCorrector.frame_shape != tuple(frameShape[:2]):
+                self.driftCorrector = OnlineDriftCorrector(frameShape[:2], self.driftWindowFrames)
+            updated = self.driftCorrector.add(columns['frame'], columns['x'], columns['y'])
+            dx, dy = self.driftCorrector.drift_at(columns['frame'])
+            columns = {**columns, 'drift x': dx, 'drift y': dy}
+        with self._renderLock:
+            self.localizations.append(columns)
+            self.renderer.add(columns['x'] - dx, columns['y'] - dy)
+        if updated:
+            self._applyDrift()
+        # The store keeps the raw coordinates and the drift trajectory
+        if self.store is not None:
+            self.store.append(columns)
+
+    def _applyDrift(self):
+        """Re-correct all localizations with the updated drift trajectory, in the
+        background. Updates arriving while a re-render runs are coalesced."""
+        trajectory = self.driftCorrector.trajectory
+        if self.store is not None:
+            self.store.set_drift(trajectory)
+        with self._renderLock:
+            self._driftRenderTrajectory = trajectory
+            if self._driftRenderThread is None:
+                self._driftRenderThread = threading.Thread(
+                    target=self._renderDrift, name='STORMDriftRender', daemon=True)
+                self._driftRenderThread.start()
+
+    def _renderDrift(self):
+        while True:
+            with self._renderLock:
+                trajectory, self._driftRenderTrajectory = self._driftRenderTrajectory, None
+                if trajectory is None:
+                    self._driftRenderThread = None
+                    return
+                generation, renderer = self._renderGeneration, self.renderer
+                columns = self.localizations.columns(['frame', 'x', 'y'])
+                n = len(columns['frame'])
+                columns = {name: values.copy() for name, values in columns.items()}
+            dx, dy = interpolate_drift(trajectory, columns['frame'])
+            shape = (renderer.shape[0] // renderer.upsampling, renderer.shape[1] // renderer.upsampling)
+            rendered = HistogramRenderer(shape, renderer.upsampling)
+            rendered.add(columns['x'] - dx, columns['y'] - dy)
+            with self._renderLock:
+                if generation != self._renderGeneration or renderer is not self.renderer:
+                    continue  # reset in the meantime
+                # localizations appended meanwhile were corrected when they were added
+                tail = self.localizations.columns(['x', 'y', 'drift x', 'drift y'])
+                rendered.add(tail['x'][n:] - tail['drift x'][n:], tail['y'][n:] - tail['drift y'][n:])
+                self.localizations.update_column('drift x', dx)
+                self.localizations.update_column('drift y', dy)
+                self.renderer = rendered
+                self.driftRenders += 1
+
+    def waitDriftRender(self, timeout: Optional[float] = None):
+        """Wait until the reconstruction is re-rendered with the latest drift."""
+        thread = self._driftRenderThread
+        if thread is not None:
+            thread.join(timeout)
+
+    def setDriftCorrection(self, windowFrames: int):
+        """Enable the online drift correction with windows of windowFrames frames (0: disable)."""
+        self.driftWindowFrames = max(0, int(windowFrames))
+        self.driftCorrector = None
+
+    def finishDriftCorrection(self):
+        """Estimate the drift including the last (partial) window."""
+        if self.driftCorrector is not None and self.driftCorrector.finish():
+            self._applyDrift()
+            self.waitDriftRender()
+            self._emitReconstruction(force=True)
+
+    def _emitReconstruction(self, force=False):
+        """Emit the reconstruction every update_rate localized frames."""
+        if self._parent_controller is None or self.renderer is None:
+            return
+        if not force and self.frameIterator - self._lastEmittedFrame < self.update_rate:
+            return
+        self._lastEmittedFrame = self.frameIterator
+        self._parent_controller.sigExperimentImageUpdate.emit(
+            "STORM", self.renderer.display(), False, [], False)
+
+    @property
+    def accumulatedReconstruction(self):
+        """Histogram of all localizations so far (camera pixel grid)."""
+        return self.renderer.image() if self.renderer is not None else None
+
+    def startBatchMode(self, batchSize: int, workers: Optional[int] = None):
+        """Localize frames in batches of batchSize frames in worker processes
+        (workers=None: one per spare CPU core, 0: in the calling thread)."""
+        self.stopBatchMode()
+        self.batch_size = max(1, int(batchSize))
+        self._batchParams = LocalizerParams.from_components(
+            self.preFilter, self.peakDetector, self.threshold, self.fit_roi_size)
+        self._batchLocalizer = BatchLocalizer(workers, mp_context="spawn")
+        self._batchFrames = []
+        self._logger.info(f"Batched localization started: {self.batch_size} frames per batch, "
+                          f"{self._batchLocalizer.workers} worker processes")
+
+    def stopBatchMode(self):
+        """Localize the remaining frames, wait for all batches and release the workers."""
+        if self._batchLocalizer is None:
+            return
+        try:
+            self._submitBatch()
+            self.collectBatches(block=True)
+        finally:
+            self._batchLocalizer.close()
+            self._batchLocalizer = None
+            self._emitReconstruction(force=True)
+
+    @property
+    def batchModeActive(self) -> bool:
+        return self._batchLocalizer is not None
+
+    def addFramesToBatch(self, frames, firstFrame: int):
+        """Queue frames (numbered from firstFrame on) for batched localization.
+        Blocks if the workers fall more than a few batches behind."""
+        if self._batchLocalizer is None or not self.active:
+            return
+        for i, frame in enumerate(frames):
+            if not self._batchFrames:
+                self._batchFirstFrame = firstFrame + i
+            self._batchFrames.append(frame)
+            if len(self._batchFrames) >= self.batch_size:
+                self._submitBatch()
+        maxPending = 2 * max(1, self._batchLocalizer.workers)
+        while self._pendingBatches.qsize() > maxPending:
+            self.collectBatches(block=True, maxBatches=1)
+        self.collectBatches()
+
+    def _submitBatch(self):
+        if not self._batchFrames:
+            return
+        frames, self._batchFrames = self._batchFrames, []
+        future = self._batchLocalizer.submit(frames, self._batchFirstFrame, self._batchParams)
+        self._pendingBatches.put((future, len(frames), frames[0].shape))
+
+    def collectBatches(self, block=False, maxBatches=None):
+        """Add the results of finished batches (in submission order) to the
+        localizations and the reconstruction."""
+        collected = 0
+        while not self._pendingBatches.empty() and (maxBatches is None or collected < maxBatches):
+            future, nFrames, frameShape = self._pendingBatches.queue[0]
+            if not block and not future.done():
+                break
+            self._pendingBatches.get()
+            collected += 1
+            try:
+                columns = future.result()
+            except Exception as e:
+                self._logger.error(f"Error in batched STORM localization: {e}")
+                continue
+            self._addLocalizations(columns, frameShape)
+            self.frameIterator += nFrames
+            self._throughput.add(nFrames)
+        if collected:
+            self._emitReconstruction()
+        return collected
+
+    def getLocalizationStats(self) -> Dict[str, Any]:
+        """Throughput and size of the localization table."""
+        return {
+            "batch_mode": self.batchModeActive,
+            "batch_size": self.batch_size,
+            "workers": self._batchLocalizer.workers if self._batchLocalizer is not None else 0,
+            "frames_localized": self.frameIterator,
+            "localizations": len(self.localizations) if self.localizations is not None else 0,
+            "pending_batches": self._pendingBatches.qsize(),
+            "batch_fps": self._throughput.fps if self._throughput is not None else 0.0,
+            "drift_correction": self.driftWindowFrames > 0,
+            "drift_updates": self.driftCorrector.updates if self.driftCorrector is not None else 0,
+            "drift_renders": self.driftRenders,
+        }
+
+    def resetReconstruction(self):
+        """Forget all localizations and the reconstruction."""
+        with self._renderLock:
+            self._renderGeneration += 1  # discards a running re-render
+            if self.localizations is not None:
+                self.localizations.clear()
+            if self.renderer is not None:
+                self.renderer.reset()
+        self.driftCorrector = None
+        self.frameIterator = 0
+        self._lastEmittedFrame = 0
+
     def processFrame(self, frame):
         """Process a single frame (modern interface)."""
         if not self.active:
@@ -1834,6 +2224,8 @@ class STORMReconImageComputationWorker:
     def saveImage(self, filename="STORMRecon", fileExtension="tif"):
         """Save accumulated reconstruction to file."""
         if self.sumReconstruction is None:
+            self.sumReconstruction = self.accumulatedReconstruction
+        if self.sumReconstruction is None or not self.sumReconstruction.max() > 0:
             return None
 
         try:
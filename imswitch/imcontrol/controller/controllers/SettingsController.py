@@ -4,6 +4,10 @@ from typing import Any, List, Tuple
 import numpy as np
 
 from imswitch import IS_HEADLESS
+from imswitch.imcommon import framework
+from imswitch.imcommon.framework.binary_streaming import (
+    get_detector_encoder_stats, reset_detector_encoder_stats
+)
 from imswitch.imcommon.model import APIExport
 from imswitch.imcontrol.model import configfiletools
 from imswitch.imcontrol.view import guitools as guitools
@@ -498,13 +502,15 @@ class SettingsController(ImConWidgetController):
         return self._master.detectorsManager.getGlobalDetectorParams()
     
     @APIExport(requestType="POST")
-    def setStreamParams(self, compression: dict = None, subsampling: dict = None, throttle_ms: int = None):
+    def setStreamParams(self, compression: dict = None, subsampling: dict = None, throttle_ms: int = None,
+                        tiles: dict = None):
         """Set streaming parameters for binary frame streaming.
         
         Args:
             compression: Dict with 'algorithm' and 'level' keys
             subsampling: Dict with 'factor' and 'auto_max_dim' keys  
             throttle_ms: Throttling interval in milliseconds
+            tiles: Dict with 'tile_size' and 'delta_threshold' keys (viewport tile stream)
         """
         
         update_params = {}
@@ -523,6 +529,12 @@ class SettingsController(ImConWidgetController):
         
         if throttle_ms is not None:
             update_params['stream_throttle_ms'] = throttle_ms
+
+        if tiles:
+            if 'tile_size' in tiles:
+                update_params['stream_tile_size'] = tiles['tile_size']
+            if 'delta_threshold' in tiles:
+                update_params['stream_tile_delta_threshold'] = tiles['delta_threshold']
             
         # Update using the same mechanism as compressionlevel
         self._master.detectorsManager.updateGlobalDetectorParams(update_params)
@@ -544,13 +556,63 @@ class SettingsController(ImConWidgetController):
                     "factor": global_params.get('stream_subsampling_factor', 1),
                     "auto_max_dim": global_params.get('stream_subsampling_auto_max_dim', 0)
                 },
-                "throttle_ms": global_params.get('stream_throttle_ms', 200)
+                "throttle_ms": global_params.get('stream_throttle_ms', 200),
+                "tiles": {
+                    "tile_size": global_params.get('stream_tile_size', 256),
+                    "delta_threshold": global_params.get('stream_tile_delta_threshold', 0)
+                }
             },
             "jpeg": {
                 "compression_level": global_params.get('compressionlevel', 80)
             }
         }
 
+    @APIExport()
+    def getStreamStats(self, reset: bool = False):
+        """Get allocation and encode-time statistics of the per-detector
+        binary stream encoders and the live streaming stage.
+
+        Args:
+            reset: Reset the statistics after reading them
+        """
+        stats = {"encoders": get_detector_encoder_stats()}
+        frameStreamer = getattr(framework, "frame_streamer", None)  # headless only
+        if frameStreamer is not None:
+            stats["streamer"] = frameStreamer.get_stats()
+        if reset:
+            reset_detector_encoder_stats()
+            if frameStreamer is not None:
+                frameStreamer.reset_stats()
+        return stats
+
+    @APIExport()
+    def getDetectorFrameBufferInfo(self, detectorName: str = None) -> dict:
+        """ Returns the frame ring buffer state of a detector (capacity, frame
+        shape, shared memory name for out-of-process consumers and the
+        position/overruns of every consumer cursor). """
+        if detectorName is None:
+            detectorName = self._master.detectorsManager.getCurrentDetectorName()
+        return self._master.detectorsManager[detectorName].getFrameBufferInfo()
+
+    @APIExport(requestType="POST")
+    def setLiveViewMode(self, mode: str = "timer", updatePeriod: int = None) -> dict:
+        """ Sets how the live view is fed: "timer" polls the latest frame of
+        every detector each update period, "push" updates the preview from the
+        detectors' new-frame callbacks (coalesced to one update per period).
+
+        Args:
+            mode: "timer" or "push"
+            updatePeriod: Optional preview update period in ms
+        """
+        self._master.detectorsManager.setLiveViewMode(mode, updatePeriod)
+        return self.getPreviewStats()
+
+    @APIExport()
+    def getPreviewStats(self) -> dict:
+        """ Returns the live view mode and the frame-to-preview latency
+        statistics of the acquisition detectors. """
+        return self._master.detectorsManager.getPreviewStats()
+
     @APIExport()
     def getDetectorParameters(self) -> dict:
         """ Returns the current parameters of the current detector. """
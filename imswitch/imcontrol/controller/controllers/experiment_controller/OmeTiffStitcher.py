@@ -1,33 +1,25 @@
-import time
-import threading
-import numpy as np
-import tifffile
-from collections import deque
-import os
-class OmeTiffStitcher:
-    def __init__(self, file_path, bigtiff=True):
+try:
+    from .queued_tiff_writer import QueuedTiffWriter
+except ImportError:
+    from queued_tiff_writer import QueuedTiffWriter
+
+
+class OmeTiffStitcher(QueuedTiffWriter):
+    def __init__(self, file_path, bigtiff=True, max_queue=64, drop_policy="block",
+                 put_timeout=None, tile=(256, 256), compression=None, pyramid=True):
         """
         file_path: Where to write the OME-TIFF
         bigtiff:   Whether to use bigtiff=True (recommended if large or many images)
+        max_queue: Maximum number of images waiting to be written
+        drop_policy: "block", "drop_newest" or "drop_oldest" when the queue is full
+        put_timeout: Maximum time add_image blocks in "block" mode before dropping
+        tile:      Tile shape of the written pages (None writes strips)
+        compression: tifffile compression, e.g. "zlib"
+        pyramid:   Whether to store downsampled levels as SubIFDs
         """
-        self.file_path = file_path
-        self.bigtiff = bigtiff
-        self.queue = deque()       # Holds (image_array, metadata_dict)
-        self.lock = threading.Lock()
-        self.is_running = False
-        self._thread = None
-
-    def start(self):
-        """Begin the background thread that writes images to disk as they arrive."""
-        self.is_running = True
-        self._thread = threading.Thread(target=self._process_queue, daemon=True)
-        self._thread.start()
-
-    def stop(self):
-        """Signal the thread to stop, then join it."""
-        self.is_running = False
-        if self._thread is not None:
-            self._thread.join()
+        super().__init__(file_path, bigtiff=bigtiff, max_queue=max_queue,
+                         drop_policy=drop_policy, put_timeout=put_timeout, tile=tile,
+                         compression=compression, pyramid=pyramid)
 
     def add_image(self, image, position_x, position_y, index_x, index_y, pixel_size):
         """
@@ -38,6 +30,7 @@ class OmeTiffStitcher:
         :param index_x:   tile index X (used for some readers)
         :param index_y:   tile index Y
         :param pixel_size: pixel size in microns
+        :return: False if the image was dropped because the queue was full
         """
         # A minimal OME-like metadata block that Fiji can often interpret.
         # The "Plane" section stores stage position; "Pixels" sets physical pixel size.
@@ -55,45 +48,4 @@ class OmeTiffStitcher:
                 "IndexY": index_y
             },
         }
-        with self.lock:
-            self.queue.append((image, metadata))
-
-    def _process_queue(self):
-        """
-        Background loop: open the OME-TIFF in append mode, pop images from queue,
-        and write them with embedded metadata.
-        """
-        # ensure the folder exists if it does not create it
-        if not os.path.exists(os.path.dirname(self.file_path)):
-            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-        with tifffile.TiffWriter(self.file_path, bigtiff=self.bigtiff, append=True) as tif:
-            # Keep running until stop() is called AND the queue is empty
-            while self.is_running or len(self.queue) > 0:
-                with self.lock:
-                    if self.queue:
-                        image, metadata = self.queue.popleft()
-                    else:
-                        image = None
-
-                if image is not None:
-                    # Each call writes a new series/plane in append mode.
-                    try:
-                        tif.write(data=image, metadata=metadata)
-                    except Exception as e:
-                        print(f"Error writing image: {e}")
-                else:
-                    # Sleep briefly to avoid busy loop when queue is empty
-                    time.sleep(0.01)
-
-    def close(self):
-        """Close the OME-TIFF file. Not strictly necessary if using stop()."""
-        self.stop()
-        if self._thread is not None:
-            self._thread.join()
-            self._thread = None
-        self.is_running = False
-        self.queue.clear()
-        self.lock = None
-        self._thread = None
-        self.queue = None
-        self.file_path = None
\ No newline at end of file
+        return self._enqueue(image, metadata)
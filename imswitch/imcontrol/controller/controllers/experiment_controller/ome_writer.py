@@ -11,6 +11,7 @@ import zarr
 import numcodecs
 import tifffile as tif
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any, List
 from dataclasses import dataclass
 import numpy as np
@@ -22,6 +23,13 @@ except ImportError:
     from SingleTiffWriter import SingleTiffWriter
 
 
+def _mean_pool_2x2(block):
+    """Average 2x2 pixel blocks of a uint16 image with even height and width."""
+    h, w = block.shape[0] // 2, block.shape[1] // 2
+    summed = block.reshape(h, 2, w, 2).sum(axis=(1, 3), dtype=np.uint32)
+    return ((summed + 2) // 4).astype(np.uint16)
+
+
 @dataclass
 class OMEWriterConfig:
     """Configuration for OME writer behavior."""
@@ -38,6 +46,15 @@ class OMEWriterConfig:
     n_time_points: int = 1  # Number of time points
     n_z_planes: int = 1     # Number of z planes
     n_channels: int = 1     # Number of channels
+    # Pyramid support (levels are updated while tiles are written)
+    n_pyramid_levels: int = 4  # Including full resolution
+    n_pyramid_workers: int = 2
+    # Stitched/single TIFF writers (tiled BigTIFF with SubIFD pyramids)
+    tiff_queue_size: int = 64  # Images waiting to be written
+    tiff_drop_policy: str = "block"  # "block", "drop_newest" or "drop_oldest"
+    tiff_tile_size: int = 256
+    tiff_pyramid: bool = True
+    tiff_compression: Optional[str] = None  # e.g. "zlib"
     
     
     def __post_init__(self):
@@ -89,6 +106,11 @@ class OMEWriter:
         self.store = None
         self.root = None
         self.canvas = None
+        self.levels = []  # [canvas, level 1, ...]
+
+        # One single-thread lane per worker; every (t, c, z) plane always goes
+        # to the same lane so that no two threads touch the same chunk
+        self._pyramid_lanes = []
         
         # Stitched TIFF writer
         self.tiff_stitcher = None
@@ -129,30 +151,50 @@ class OMEWriter:
             compressor=self.config.zarr_compressor # Has proper BLOSC compression (based on v3)
         )
 
-        # Set OME-Zarr metadata
-        self.root.attrs["multiscales"] = [{
-            "version": "0.4",
-            "datasets": [
-                {
-                    "path": "0",
-                    "coordinateTransformations": [
-                        {"type": "scale", "scale": [1, 1, 1, 1, 1]}
-                    ]
-                }
-            ],
-            "axes": [
-                {"name": "t", "type": "time"},
-                {"name": "c", "type": "channel"},
-                {"name": "z", "type": "space"},
-                {"name": "y", "type": "space"},
-                {"name": "x", "type": "space"},
-            ],
-        }]
-    
+        self.levels = [self.canvas]
+        self._setup_pyramid_levels()
+
+        # Set OME-Zarr metadata (lists all levels, so the dataset is viewable
+        # as multiscale while the scan is running)
+        self._update_multiscales_metadata()
+
+    def _setup_pyramid_levels(self):
+        """Create the downsampled pyramid levels (2x per level) next to the canvas."""
+        level_shape = self.canvas.shape[-2:]
+        for level in range(1, self.config.n_pyramid_levels):
+            level_shape = (level_shape[0] // 2, level_shape[1] // 2)
+            # Stop if the image becomes too small
+            if level_shape[0] < 64 or level_shape[1] < 64:
+                break
+            self.levels.append(self.root.create_array(
+                name=str(level),
+                shape=self.canvas.shape[:3] + level_shape,  # t c z y x
+                chunks=(1, 1, 1, int(min(self.tile_h, level_shape[0])),
+                        int(min(self.tile_w, level_shape[1]))),
+                dtype="uint16",
+                compressor=self.config.zarr_compressor
+            ))
+        if len(self.levels) > 1:
+            self._pyramid_lanes = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"OMEPyramid{i}")
+                for i in range(max(1, self.config.n_pyramid_workers))
+            ]
+
+    def _tiff_writer_options(self) -> Dict[str, Any]:
+        """Queue and layout options of the stitched/single TIFF writers."""
+        tile = (self.config.tiff_tile_size, self.config.tiff_tile_size) if self.config.tiff_tile_size else None
+        return {
+            "max_queue": self.config.tiff_queue_size,
+            "drop_policy": self.config.tiff_drop_policy,
+            "tile": tile,
+            "compression": self.config.tiff_compression,
+            "pyramid": self.config.tiff_pyramid,
+        }
+
     def _setup_tiff_stitcher(self):
         """Set up the TIFF stitcher for creating stitched OME-TIFF files."""
         stitched_tiff_path = os.path.join(self.file_paths.base_dir, "stitched.ome.tif")
-        self.tiff_stitcher = OmeTiffStitcher(stitched_tiff_path, bigtiff=True)
+        self.tiff_stitcher = OmeTiffStitcher(stitched_tiff_path, bigtiff=True, **self._tiff_writer_options())
         self.tiff_stitcher.start()
         if self.logger:
             self.logger.debug(f"TIFF stitcher initialized: {stitched_tiff_path}")
@@ -160,7 +202,7 @@ class OMEWriter:
     def _setup_single_tiff_writer(self):
         """Set up the single TIFF writer for appending tiles with metadata."""
         single_tiff_path = os.path.join(self.file_paths.base_dir, "single_tiles.ome.tif")
-        self.single_tiff_writer = SingleTiffWriter(single_tiff_path, bigtiff=True)
+        self.single_tiff_writer = SingleTiffWriter(single_tiff_path, bigtiff=True, **self._tiff_writer_options())
         self.single_tiff_writer.start()
         if self.logger:
             self.logger.debug(f"Single TIFF writer initialized: {single_tiff_path}")
@@ -238,6 +280,12 @@ class OMEWriter:
         
         # Write to canvas with proper indexing
         self.canvas[t_idx, c_idx, z_idx, y0:y1, x0:x1] = frame
+
+        # Update the pyramid levels covering this tile in the background
+        if self._pyramid_lanes:
+            plane = (t_idx, c_idx, z_idx)
+            lane = self._pyramid_lanes[hash(plane) % len(self._pyramid_lanes)]
+            lane.submit(self._update_pyramid_region, plane, np.asarray(frame), (y0, y1, x0, x1))
         
         # Return chunk information for frontend updates
         rel_chunk = f"0/{iy}.{ix}"  # NGFF v0.4 layout
@@ -283,111 +331,47 @@ class OMEWriter:
             time.sleep(self.config.min_period - (t_now - self.t_last))
         self.t_last = t_now
     
-    def _build_vanilla_zarr_pyramids(self):
-        """
-        Build pyramid levels for OME-Zarr format using memory-efficient processing.
-        This creates downsampled versions of the full resolution data.
+    def _update_pyramid_region(self, plane, tile, bounds):
         """
-        if self.canvas is None:
-            return
-            
-        # Start pyramid generation in background thread for better performance
-        def _generate_pyramids():
-            try:
-                self._generate_pyramids_sync()
-            except Exception as e:
-                if self.logger:
-                    self.logger.error(f"Pyramid generation failed: {e}")
-        
-        # Run in background thread to avoid blocking
-        pyramid_thread = threading.Thread(target=_generate_pyramids, daemon=True)
-        pyramid_thread.start()
-        
-        # For now, wait for completion to maintain backward compatibility
-        # In future versions, this could be made fully asynchronous
-        pyramid_thread.join()
-    
-    def _generate_pyramids_sync(self):
-        """
-        Synchronous pyramid generation with memory-efficient processing.
-        """
-        # Get dimensions of the full resolution data
-        full_shape = self.canvas.shape[-2:]  # Get y,x dimensions from t,c,z,y,x
-        
-        # Create pyramid levels with 2x downsampling
-        max_levels = 4  # Create up to 4 pyramid levels
-        
-        for level in range(1, max_levels):
-            # Calculate new shape for this level (2x downsampling)
-            new_shape = (full_shape[0] // (2**level), full_shape[1] // (2**level))
-            
-            # Stop if the image becomes too small
-            if new_shape[0] < 64 or new_shape[1] < 64:
-                break
-            
-            # Create new dataset for this pyramid level
-            level_canvas = self.root.create_dataset(
-                str(level),
-                shape=(1, 1, 1, int(new_shape[0]), int(new_shape[1])),  # t c z y x
-                chunks=(1, 1, 1, int(min(self.tile_h, new_shape[0])), int(min(self.tile_w, new_shape[1]))),
-                dtype="uint16",
-                compressor=self.config.zarr_compressor
-            )
-            
-            # Process data in chunks to avoid loading entire array into memory
-            self._downsample_in_chunks(self.canvas, level_canvas, level)
-            
-            if self.logger:
-                self.logger.debug(f"Created pyramid level {level} with shape {new_shape}")
-        
-        # Update the multiscales metadata to include all pyramid levels
-        self._update_multiscales_metadata()
-    
-    def _downsample_in_chunks(self, source_canvas, target_canvas, level):
-        """
-        Downsample data in chunks to avoid memory issues with large arrays.
-        
+        Propagate a freshly written tile through all pyramid levels.
+
+        Each level is computed by 2x2 mean pooling of the level below. The
+        pooled block of one level is reused as the source of the next one;
+        only where a block does not line up with the 2x2 grid the missing
+        border pixels are read back from the previous level.
+
         Args:
-            source_canvas: Source zarr array
-            target_canvas: Target zarr array for downsampled data
-            level: Pyramid level (1, 2, 3, ...)
+            plane: (t, c, z) indices of the tile
+            tile: Tile data as written to level 0
+            bounds: (y0, y1, x0, x1) of the tile in level 0 coordinates
         """
-        # Get source and target shapes
-        source_shape = source_canvas.shape[-2:]  # y, x
-        target_shape = target_canvas.shape[-2:]  # y, x
-        
-        # Define chunk size for processing (adjust based on available memory)
-        chunk_size = min(1024, source_shape[0], source_shape[1])
-        
-        # Process in overlapping chunks to handle downsampling
-        downsample_factor = 2 ** level
-        
-        for y_start in range(0, target_shape[0], chunk_size):
-            y_end = min(y_start + chunk_size, target_shape[0])
-            
-            for x_start in range(0, target_shape[1], chunk_size):
-                x_end = min(x_start + chunk_size, target_shape[1])
-                
-                # Calculate corresponding region in source
-                src_y_start = y_start * downsample_factor
-                src_y_end = min(y_end * downsample_factor, source_shape[0])
-                src_x_start = x_start * downsample_factor
-                src_x_end = min(x_end * downsample_factor, source_shape[1])
-                
-                # Read source data chunk
-                source_chunk = source_canvas[0, 0, 0, src_y_start:src_y_end, src_x_start:src_x_end]
-                
-                # Downsample using simple subsampling
-                downsampled_chunk = source_chunk[::downsample_factor, ::downsample_factor]
-                
-                # Calculate actual target region size
-                actual_y_size = min(downsampled_chunk.shape[0], y_end - y_start)
-                actual_x_size = min(downsampled_chunk.shape[1], x_end - x_start)
-                
-                # Write downsampled chunk to target
-                target_canvas[0, 0, 0, y_start:y_start+actual_y_size, x_start:x_start+actual_x_size] = \
-                    downsampled_chunk[:actual_y_size, :actual_x_size]
-    
+        try:
+            source = tile
+            y0, y1, x0, x1 = bounds
+            for level in range(1, len(self.levels)):
+                previous = self.levels[level - 1]
+                prev_h, prev_w = previous.shape[-2:]
+                # Expand to the 2x2 grid of the previous level
+                ey0, ex0 = y0 - y0 % 2, x0 - x0 % 2
+                ey1, ex1 = min(y1 + y1 % 2, prev_h), min(x1 + x1 % 2, prev_w)
+                if (ey0, ey1, ex0, ex1) != (y0, y1, x0, x1):
+                    source = previous[plane + (slice(ey0, ey1), slice(ex0, ex1))]
+                ty0, ty1, tx0, tx1 = ey0 // 2, ey1 // 2, ex0 // 2, ex1 // 2
+                if ty1 <= ty0 or tx1 <= tx0:
+                    break
+                source = _mean_pool_2x2(source[:2 * (ty1 - ty0), :2 * (tx1 - tx0)])
+                self.levels[level][plane + (slice(ty0, ty1), slice(tx0, tx1))] = source
+                y0, y1, x0, x1 = ty0, ty1, tx0, tx1
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Pyramid update failed: {e}")
+
+    def _wait_for_pyramids(self):
+        """Wait until all queued pyramid updates are written."""
+        for lane in self._pyramid_lanes:
+            lane.shutdown(wait=True)
+        self._pyramid_lanes = []
+
     def _update_multiscales_metadata(self):
         """Update the multiscales metadata to include all pyramid levels."""
         datasets = []
@@ -417,13 +401,9 @@ class OMEWriter:
     def finalize(self):
         """Finalize the writing process and optionally build pyramids."""
         if self.config.write_zarr and self.store is not None:
-            try:
-                self._build_vanilla_zarr_pyramids()
-                if self.logger:
-                    self.logger.info("Vanilla Zarr pyramid generated successfully")
-            except Exception as err:
-                if self.logger:
-                    self.logger.warning(f"Pyramid generation failed: {err}")
+            self._wait_for_pyramids()
+            if self.logger:
+                self.logger.info(f"Vanilla Zarr pyramid completed ({len(self.levels)} levels)")
         
         # Close stitched TIFF writer
         if self.config.write_stitched_tiff and self.tiff_stitcher is not None:
@@ -0,0 +1,215 @@
+"""
+Background TIFF writer fed by a bounded queue.
+
+Shared base of the OME-TIFF writers of the experiment controller. Images are
+handed to a writer thread through a bounded queue; when the disk can't keep up
+the producer either blocks (backpressure) or images are dropped, so memory use
+stays bounded. Images are written tiled and, optionally, with a pyramid of
+downsampled SubIFDs so that the files open instantly in QuPath/Fiji.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import tifffile
+
+DROP_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+_STOP = object()
+_PUT_POLL = 0.5  # s, how often a blocked put checks that the writer thread is alive
+
+logger = logging.getLogger(__name__)
+
+
+def downsample_2x(image: np.ndarray) -> np.ndarray:
+    """
+    Average 2x2 pixel blocks of a 2D (y, x) or 3D (y, x, samples) image.
+
+    Args:
+        image: Image with at least 2 pixels along y and x
+
+    Returns:
+        Image of half the size (odd trailing rows/columns are dropped) with the
+        dtype of the input
+    """
+    h, w = image.shape[0] // 2, image.shape[1] // 2
+    blocks = image[:2 * h, :2 * w].reshape((h, 2, w, 2) + image.shape[2:])
+    pooled = blocks.mean(axis=(1, 3), dtype=np.float32)
+    if np.issubdtype(image.dtype, np.integer):
+        pooled = np.rint(pooled)
+    return pooled.astype(image.dtype)
+
+
+def pyramid_level_count(shape: Tuple[int, ...], tile: Optional[Tuple[int, int]],
+                        max_levels: int = 6) -> int:
+    """Number of 2x reduced levels until the image fits into a single tile."""
+    if tile is None:
+        return 0
+    h, w = shape[0], shape[1]
+    levels = 0
+    while levels < max_levels and (h > tile[0] or w > tile[1]) and min(h, w) >= 4:
+        h, w = h // 2, w // 2
+        levels += 1
+    return levels
+
+
+class QueuedTiffWriter:
+    """
+    Writes queued images to a (Big)TIFF file on a background thread.
+
+    Subclasses implement ``_build_metadata`` to turn the per-image metadata into
+    the OME metadata that is written with each image.
+    """
+
+    def __init__(self, file_path: str, bigtiff: bool = True, max_queue: int = 64,
+                 drop_policy: str = "block", put_timeout: Optional[float] = None,
+                 tile: Optional[Tuple[int, int]] = (256, 256), compression: Optional[str] = None,
+                 pyramid: bool = True):
+        """
+        Args:
+            file_path: Where to write the TIFF file
+            bigtiff: Whether to use BigTIFF (recommended if large or many images)
+            max_queue: Maximum number of images waiting to be written
+            drop_policy: What add_image does when the queue is full: "block" waits
+                for the writer (optionally only up to put_timeout, then drops the
+                image), "drop_newest" discards the new image, "drop_oldest"
+                discards the oldest queued image
+            put_timeout: Maximum time in seconds to block in "block" mode
+            tile: Tile shape (multiples of 16) or None to write strips
+            compression: Compression passed to tifffile, e.g. "zlib" or "zstd"
+            pyramid: Whether to append downsampled SubIFDs (requires tile)
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {drop_policy}, expected one of {DROP_POLICIES}")
+        self.file_path = file_path
+        self.bigtiff = bigtiff
+        self.drop_policy = drop_policy
+        self.put_timeout = put_timeout
+        self.tile = tuple(tile) if tile is not None else None
+        self.compression = compression
+        self.pyramid = pyramid and tile is not None
+        self.queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self.is_running = False
+        self._thread = None
+        self.image_count = 0
+        self.dropped_count = 0
+        self.max_queue_depth = 0
+        self.write_time = 0.0
+
+    def start(self):
+        """Begin the background thread that writes images to disk as they arrive."""
+        self.is_running = True
+        self._thread = threading.Thread(target=self._process_queue, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write the remaining queued images, then stop the thread."""
+        if self._thread is None:
+            return
+        self.is_running = False
+        if not self._put(_STOP):
+            logger.error(f"Writer thread of {self.file_path} died, {self.queue.qsize()} images not written")
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        """Finish writing and close the TIFF file."""
+        self.stop()
+
+    def _put(self, item, timeout: Optional[float] = None) -> bool:
+        """Blocking put that gives up (returns False) on timeout or once the writer thread died."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._thread is None or self._thread.is_alive():
+            wait = _PUT_POLL if deadline is None else min(_PUT_POLL, deadline - time.monotonic())
+            if wait <= 0:
+                return False
+            try:
+                self.queue.put(item, timeout=wait)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _enqueue(self, image: np.ndarray, metadata: Dict[str, Any]) -> bool:
+        """Queue an image according to the drop policy. Returns False if it was dropped."""
+        item = (image, metadata)
+        try:
+            if self.drop_policy == "block":
+                if not self._put(item, self.put_timeout):
+                    raise queue.Full
+            elif self.drop_policy == "drop_newest":
+                self.queue.put_nowait(item)
+            else:
+                while True:
+                    try:
+                        self.queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        try:
+                            self.queue.get_nowait()
+                            self.dropped_count += 1
+                        except queue.Empty:
+                            pass
+        except queue.Full:
+            self.dropped_count += 1
+            return False
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def _build_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        return metadata
+
+    def _write_image(self, tif: tifffile.TiffWriter, image: np.ndarray, metadata: Dict[str, Any]):
+        """Write one image as tiled page with its pyramid levels as SubIFDs."""
+        options = {"compression": self.compression}
+        if self.tile is not None:
+            options["tile"] = self.tile
+        levels = pyramid_level_count(image.shape, self.tile) if self.pyramid else 0
+        if image.ndim == 3:
+            options["photometric"] = "rgb" if image.shape[-1] in (3, 4) else "minisblack"
+        tif.write(data=image, metadata=metadata, subifds=levels or None, **options)
+        level = image
+        for _ in range(levels):
+            level = downsample_2x(level)
+            tif.write(data=level, subfiletype=1, metadata=None, **options)
+
+    def _process_queue(self):
+        """Background loop: pop images from the queue and append them to the TIFF file."""
+        try:
+            self._write_queue()
+        except Exception:
+            logger.exception(f"Writer thread of {self.file_path} failed")
+
+    def _write_queue(self):
+        # ensure the folder exists if it does not create it
+        folder = os.path.dirname(self.file_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        with tifffile.TiffWriter(self.file_path, bigtiff=self.bigtiff, append=True) as tif:
+            while True:
+                item = self.queue.get()
+                if item is _STOP:
+                    break
+                image, metadata = item
+                t_start = time.perf_counter()
+                try:
+                    self._write_image(tif, image, self._build_metadata(metadata))
+                    self.image_count += 1
+                except Exception as e:
+                    logger.error(f"Error writing image to {self.file_path}: {e}")
+                self.write_time += time.perf_counter() - t_start
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the number of written/dropped images and the queue fill level."""
+        return {
+            "written": self.image_count,
+            "dropped": self.dropped_count,
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "write_time_s": self.write_time,
+        }
@@ -0,0 +1,16 @@
+"""
+HistoScan tile service: mosaic pyramid, tile cache and on-demand acquisition queue.
+"""
+
+from .acquisition import TileAcquisitionQueue, TileRequest
+from .mosaic import MosaicPyramid, TileGrid
+from .server import MosaicTileServer, TileResponse
+
+__all__ = [
+    'MosaicPyramid',
+    'MosaicTileServer',
+    'TileAcquisitionQueue',
+    'TileGrid',
+    'TileRequest',
+    'TileResponse',
+]
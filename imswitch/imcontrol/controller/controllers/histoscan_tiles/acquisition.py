@@ -0,0 +1,133 @@
+"""
+Coalescing request queue for tiles that have to be acquired with the hardware.
+
+Requests for the same key share one pending entry, so a browser asking for a
+tile several times moves the stage once. A single worker processes the
+pending requests, always taking the one closest to the previous stage position
+next, so that a burst of tile requests from a panned map turns into a short
+path instead of a random walk over the slide.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TileRequest:
+    """Pending hardware tile, resolved by the worker."""
+
+    def __init__(self, key: Hashable, position: Tuple[float, float]):
+        self.key = key
+        self.position = position
+        self.waiters = 1
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        '''
+        wait for the result, raises TimeoutError or the exception of the worker
+        '''
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Tile {self.key} was not acquired within {timeout} s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+
+class TileAcquisitionQueue:
+    """
+    Processes tile requests with ``process(request)`` on one worker thread.
+    """
+
+    def __init__(self, process: Callable[[TileRequest], Any], max_pending: int = 64,
+                 name: str = "HistoScanTileAcquisition"):
+        '''
+        process - acquires the tile of a request, its return value is the request's result
+        max_pending - maximum number of distinct pending requests
+        '''
+        self.process = process
+        self.max_pending = max(1, int(max_pending))
+        self._pending: Dict[Hashable, TileRequest] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._lastPosition = None
+        self._running = True
+        self.requested = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.processed = 0
+        self.process_time = 0.0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def request(self, key: Hashable, position: Tuple[float, float]) -> Optional[TileRequest]:
+        '''
+        queue a tile at the stage position (X, Y) or join the pending request for the same key,
+        returns None if the queue is full or closed
+        '''
+        with self._lock:
+            self.requested += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.waiters += 1
+                self.coalesced += 1
+                return pending
+            if not self._running or len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                return None
+            pending = self._pending[key] = TileRequest(key, position)
+            self._wakeup.notify()
+            return pending
+
+    def _next(self) -> TileRequest:
+        # nearest pending position to the last one (oldest first if there is none yet)
+        if self._lastPosition is None:
+            return next(iter(self._pending.values()))
+        lx, ly = self._lastPosition
+        return min(self._pending.values(),
+                   key=lambda r: (r.position[0] - lx)**2 + (r.position[1] - ly)**2)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._running and not self._pending:
+                    self._wakeup.wait()
+                if not self._pending:
+                    break
+                request = self._next()
+            tStart = time.perf_counter()
+            try:
+                request.result = self.process(request)
+            except Exception as e:
+                request.error = e
+            with self._lock:
+                # new waiters can join until the request leaves the pending list
+                del self._pending[request.key]
+                self._lastPosition = request.position
+                self.processed += 1
+                self.process_time += time.perf_counter() - tStart
+            request._done.set()
+
+    def close(self, timeout: Optional[float] = None):
+        '''
+        process the pending requests, then stop the worker
+        '''
+        with self._lock:
+            self._running = False
+            self._wakeup.notify()
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "requested": self.requested,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "mean_process_time_s": self.process_time/self.processed if self.processed else 0.0,
+            }
@@ -0,0 +1,159 @@
+"""
+Tile grid and image pyramid of a stitched HistoScan mosaic.
+
+The stitcher leaves a memory-mapped canvas (``<name>_stitched.npy``) and a JSON
+sidecar describing where it lies on the stage. ``MosaicPyramid`` adds 2x
+downsampled levels next to the canvas, so that a tile at any zoom level is a
+single 256x256 crop of one level instead of a resampled read of the whole
+canvas.
+"""
+
+import json
+import math
+import os
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class TileGrid:
+    """
+    XYZ tile grid over the stage.
+
+    Level-0 pixels have a size of ``um_per_px`` and pixel (0, 0) lies at the
+    stage position ``origin_um``. Zoom level ``max_zoom`` shows level-0 pixels
+    1:1, every zoom level below halves the resolution.
+    """
+
+    def __init__(self, origin_um: Tuple[float, float], um_per_px: float, max_zoom: int,
+                 tile_size: int = 256):
+        self.origin_um = (float(origin_um[0]), float(origin_um[1]))  # X, Y
+        self.um_per_px = float(um_per_px)
+        self.max_zoom = int(max_zoom)
+        self.tile_size = int(tile_size)
+
+    def tile_rect(self, z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+        """Level-0 pixel rectangle (y0, x0, y1, x1) covered by a tile."""
+        size = self.tile_size * 2.0**(self.max_zoom - z)
+        return y*size, x*size, (y + 1)*size, (x + 1)*size
+
+    def stage_center(self, z: int, x: int, y: int) -> Tuple[float, float]:
+        """Stage position (X, Y) in µm of the tile center."""
+        y0, x0, y1, x1 = self.tile_rect(z, x, y)
+        return self.to_stage((x0 + x1)/2, (y0 + y1)/2)
+
+    def to_stage(self, px: float, py: float) -> Tuple[float, float]:
+        return self.origin_um[0] + px*self.um_per_px, self.origin_um[1] + py*self.um_per_px
+
+    def to_pixels(self, x_um: float, y_um: float) -> Tuple[float, float]:
+        return (x_um - self.origin_um[0])/self.um_per_px, (y_um - self.origin_um[1])/self.um_per_px
+
+
+class MosaicPyramid:
+    """
+    Read-only image pyramid of a finished mosaic.
+
+    Level k is the canvas downsampled by 2**k (area averaging). For a
+    file-backed canvas the levels are memory-mapped ``_L<k>.npy`` files next to
+    it and are reused by later sessions; otherwise they are kept in memory.
+    """
+
+    def __init__(self, canvas: np.ndarray, origin_um=(0, 0), um_per_px: float = 1.0,
+                 tiles=None, tile_size: int = 256, path: Optional[str] = None, strip_rows: int = 1024):
+        '''
+        canvas - 2D (grayscale) stitched image, level 0 of the pyramid
+        origin_um - stage position (X, Y) of the canvas pixel (0, 0)
+        um_per_px - size of a canvas pixel in µm
+        tiles - rectangles (y0, x0, y1, x1) of the placed camera frames, None: all scanned
+        path - .npy file of the canvas, the levels are written next to it
+        '''
+        if canvas.ndim != 2:
+            raise ValueError(f"Expected a 2D canvas, got shape {canvas.shape}")
+        self.path = path
+        self.tiles = None if tiles is None else np.asarray(tiles, dtype=np.float64).reshape(-1, 4)
+        height, width = canvas.shape
+        max_zoom = max(0, int(math.ceil(math.log2(max(height, width, 1)/tile_size))))
+        self.grid = TileGrid(origin_um, um_per_px, max_zoom, tile_size)
+        self.levels = [canvas]
+        for k in range(1, max_zoom + 1):
+            self.levels.append(self._openLevel(k, strip_rows))
+        if path is not None:
+            self.id = f"{os.path.basename(path)}-{int(os.path.getmtime(path))}"
+        else:
+            self.id = f"mem{id(canvas):x}"
+
+    @classmethod
+    def from_file(cls, canvas_path: str, stage_origin_um=None, tile_size: int = 256):
+        '''
+        open the canvas and the JSON sidecar left by ImageStitcher.close()
+        '''
+        canvas = np.load(canvas_path, mmap_mode="r")
+        with open(os.path.splitext(canvas_path)[0] + ".json") as f:
+            meta = json.load(f)
+        scale = meta["resolution_scale"]
+        pixel_size = meta["pixel_size"]
+        if stage_origin_um is None:
+            stage_origin_um = meta.get("stage_origin", (0, 0))
+        # canvas pixel c lies at stage pixel c/scale + origin
+        originY, originX = meta.get("origin", (0, 0))[::-1]
+        origin_um = (stage_origin_um[0] + originX*pixel_size, stage_origin_um[1] + originY*pixel_size)
+        tiles = np.asarray(meta.get("tiles", []), dtype=np.float64).reshape(-1, 4)
+        return cls(canvas, origin_um, pixel_size/scale, tiles=tiles, tile_size=tile_size, path=canvas_path)
+
+    @property
+    def max_zoom(self) -> int:
+        return self.grid.max_zoom
+
+    def _openLevel(self, k, strip_rows):
+        source = self.levels[k - 1]
+        shape = ((source.shape[0] + 1)//2, (source.shape[1] + 1)//2)
+        if self.path is None:
+            level = np.empty(shape, dtype=source.dtype)
+        else:
+            levelPath = os.path.splitext(self.path)[0] + f"_L{k}.npy"
+            if os.path.exists(levelPath) and os.path.getmtime(levelPath) >= os.path.getmtime(self.path):
+                level = np.load(levelPath, mmap_mode="r")
+                if level.shape == shape:
+                    return level
+            level = np.lib.format.open_memmap(levelPath, mode="w+", dtype=source.dtype, shape=shape)
+        # downsample in strips of an even number of rows to bound the memory use
+        step = max(2, strip_rows - strip_rows % 2)
+        for r in range(0, source.shape[0], step):
+            strip = np.asarray(source[r:r + step], dtype=np.float32)
+            rows = (strip.shape[0] + 1)//2
+            level[r//2:r//2 + rows] = np.rint(cv2.resize(strip, (shape[1], rows), interpolation=cv2.INTER_AREA))
+        if isinstance(level, np.memmap):
+            level.flush()
+        return level
+
+    def covers(self, z: int, x: int, y: int) -> bool:
+        '''
+        True if any placed camera frame overlaps the tile
+        '''
+        y0, x0, y1, x1 = self.grid.tile_rect(z, x, y)
+        height, width = self.levels[0].shape
+        if y0 >= height or x0 >= width or y1 <= 0 or x1 <= 0:
+            return False
+        if self.tiles is None:
+            return True
+        t = self.tiles
+        return bool(np.any((t[:, 0] < y1) & (t[:, 2] > y0) & (t[:, 1] < x1) & (t[:, 3] > x0)))
+
+    def render(self, z: int, x: int, y: int) -> np.ndarray:
+        '''
+        tile_size x tile_size crop of the matching level (zero outside of the canvas),
+        zoom levels above max_zoom are upsampled from level 0
+        '''
+        tile_size = self.grid.tile_size
+        k = max(0, self.max_zoom - z)
+        oversampling = 2**max(0, z - self.max_zoom)
+        size = max(1, tile_size//oversampling)
+        level = self.levels[min(k, len(self.levels) - 1)]
+        y0, x0 = y*size, x*size
+        tile = np.zeros((size, size), dtype=level.dtype)
+        crop = np.asarray(level[max(y0, 0):y0 + size, max(x0, 0):x0 + size])
+        tile[:crop.shape[0], :crop.shape[1]] = crop
+        if oversampling > 1:
+            tile = cv2.resize(tile, (tile_size, tile_size), interpolation=cv2.INTER_NEAREST)
+        return tile
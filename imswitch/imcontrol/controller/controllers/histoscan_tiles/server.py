@@ -0,0 +1,237 @@
+"""
+XYZ tile server for HistoScan mosaics.
+
+Tiles of scanned regions are cut from the pyramid of the last finished mosaic,
+encoded once (WebP or PNG) and kept in an LRU cache keyed by their ETag. Only
+tiles of regions that were never scanned fall back to the hardware: they are
+queued on a ``TileAcquisitionQueue`` and the acquired camera frame is kept as a
+"live field", so neighbouring tiles inside the same frame need no further
+stage moves.
+"""
+
+import threading
+from collections import OrderedDict, deque, namedtuple
+from io import BytesIO
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .acquisition import TileAcquisitionQueue
+from .mosaic import MosaicPyramid, TileGrid
+
+TileResponse = namedtuple("TileResponse", ["status", "data", "media_type", "etag"])
+
+_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+class _LiveField:
+    """Camera frame acquired on demand, at level-0 resolution of the grid."""
+
+    def __init__(self, seq, image, y0, x0):
+        self.seq = seq
+        self.image = image
+        self.rect = (y0, x0, y0 + image.shape[0], x0 + image.shape[1])
+
+    def contains(self, rect):
+        return (self.rect[0] <= rect[0] and self.rect[1] <= rect[1]
+                and rect[2] <= self.rect[2] and rect[3] <= self.rect[3])
+
+
+class MosaicTileServer:
+    """
+    Serves encoded XYZ tiles from the mosaic pyramid, the live fields or the hardware.
+    """
+
+    def __init__(self, acquire: Optional[Callable] = None, grid: Optional[TileGrid] = None,
+                 cache_bytes: int = 64*1024**2, max_live_fields: int = 32, max_oversampling_zoom: int = 3,
+                 acquisition_timeout: float = 30.0, max_pending: int = 64):
+        '''
+        acquire - called with the stage position (X, Y) in µm the frame should be centered on,
+                  returns (frame, (X0, Y0) stage position of the frame's top left pixel, µm per camera pixel);
+                  None disables the hardware fallback
+        grid - tile grid used while no mosaic is loaded
+        cache_bytes - size of the encoded tile cache
+        max_oversampling_zoom - number of zoom levels above the native resolution
+        '''
+        self.acquire = acquire
+        self.default_grid = grid
+        self.cache_bytes = int(cache_bytes)
+        self.max_oversampling_zoom = int(max_oversampling_zoom)
+        self.acquisition_timeout = acquisition_timeout
+        self._mosaic = None
+        self._cache = OrderedDict()  # etag -> encoded tile
+        self._cacheSize = 0
+        self._fields = deque(maxlen=max(1, int(max_live_fields)))
+        self._fieldSeq = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.stage_moves = 0
+        self.acquisitions = None
+        if acquire is not None:
+            self.acquisitions = TileAcquisitionQueue(self._acquireTile, max_pending=max_pending)
+
+    @property
+    def mosaic(self) -> Optional[MosaicPyramid]:
+        return self._mosaic
+
+    @property
+    def grid(self) -> Optional[TileGrid]:
+        mosaic = self._mosaic
+        return mosaic.grid if mosaic is not None else self.default_grid
+
+    def set_mosaic(self, mosaic: Optional[MosaicPyramid]):
+        '''
+        serve the tiles of a finished scan, drops the cached tiles and live fields
+        '''
+        with self._lock:
+            self._mosaic = mosaic
+            self._cache.clear()
+            self._cacheSize = 0
+            self._fields.clear()
+
+    def get_tile(self, z: int, x: int, y: int, fmt: str = "png",
+                 if_none_match: Optional[str] = None) -> TileResponse:
+        '''
+        encoded tile (status 200) or status 304 if if_none_match is its current ETag
+        '''
+        fmt = fmt.lower()
+        if fmt not in _MEDIA_TYPES:
+            raise ValueError(f"Unsupported tile format {fmt}, use one of {list(_MEDIA_TYPES)}")
+        z, x, y = int(z), int(x), int(y)
+        mosaic, grid = self._mosaic, self.grid
+        if grid is None or x < 0 or y < 0 or not 0 <= z <= grid.max_zoom + self.max_oversampling_zoom:
+            return self._respond(f'"blank.{fmt}"', fmt, if_none_match, self._blank)
+
+        if mosaic is not None and mosaic.covers(z, x, y):
+            return self._respond(f'"{mosaic.id}/{z}/{x}/{y}.{fmt}"', fmt, if_none_match,
+                                 lambda: mosaic.render(z, x, y))
+
+        # unscanned region: a frame acquired before, the hardware or nothing
+        rect = grid.tile_rect(z, x, y)
+        field = self._findField(rect)
+        if field is None and self.acquisitions is not None and z >= grid.max_zoom:
+            request = self.acquisitions.request((z, x, y), grid.stage_center(z, x, y))
+            if request is None:
+                raise RuntimeError("Too many pending tile acquisitions")
+            field = request.wait(self.acquisition_timeout)
+        if field is None:
+            return self._respond(f'"blank.{fmt}"', fmt, if_none_match, self._blank)
+        return self._respond(f'"live{field.seq}/{z}/{x}/{y}.{fmt}"', fmt, if_none_match,
+                             lambda: self._renderField(field, rect))
+
+    def _respond(self, etag, fmt, if_none_match, render):
+        media_type = _MEDIA_TYPES[fmt]
+        if if_none_match is not None and etag in (t.strip() for t in if_none_match.split(",")):
+            with self._lock:
+                self.not_modified += 1
+            return TileResponse(304, b"", media_type, etag)
+        with self._lock:
+            data = self._cache.get(etag)
+            if data is not None:
+                self._cache.move_to_end(etag)
+                self.hits += 1
+                return TileResponse(200, data, media_type, etag)
+            self.misses += 1
+        data = self._encode(render(), fmt)
+        with self._lock:
+            if etag not in self._cache:
+                self._cache[etag] = data
+                self._cacheSize += len(data)
+                while self._cacheSize > self.cache_bytes and len(self._cache) > 1:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cacheSize -= len(evicted)
+        return TileResponse(200, data, media_type, etag)
+
+    def _blank(self):
+        size = self.grid.tile_size if self.grid is not None else 256
+        return np.zeros((size, size), dtype=np.uint16)
+
+    @staticmethod
+    def _encode(tile, fmt):
+        # 16 bit canvas to 8 bit display values, same mapping for all tiles
+        if tile.dtype == np.uint16:
+            tile = (tile >> 8).astype(np.uint8)
+        elif tile.dtype != np.uint8:
+            tile = np.clip(tile, 0, 255).astype(np.uint8)
+        buffer = BytesIO()
+        if fmt == "webp":
+            Image.fromarray(tile).save(buffer, format="WEBP", quality=90)
+        else:
+            Image.fromarray(tile).save(buffer, format="PNG", compress_level=3)
+        return buffer.getvalue()
+
+    def _findField(self, rect):
+        with self._lock:
+            for field in reversed(self._fields):
+                if field.contains(rect):
+                    return field
+        return None
+
+    def _renderField(self, field, rect):
+        tile_size = self.grid.tile_size
+        y0, x0, y1, x1 = (int(round(v)) for v in rect)
+        fy, fx = field.rect[:2]
+        crop = field.image[y0 - fy:y1 - fy, x0 - fx:x1 - fx]
+        if crop.shape != (tile_size, tile_size):
+            crop = cv2.resize(crop, (tile_size, tile_size), interpolation=cv2.INTER_NEAREST)
+        return crop
+
+    def _acquireTile(self, request):
+        # a frame acquired for an earlier request may already contain this tile
+        grid = self.grid
+        rect = grid.tile_rect(*request.key)
+        field = self._findField(rect)
+        if field is not None:
+            return field
+        frame, topLeft, umPerPx = self.acquire(*request.position)
+        self.stage_moves += 1
+        field = self._toField(frame, topLeft, umPerPx, grid)
+        with self._lock:
+            self._fields.append(field)
+        return field
+
+    def _toField(self, frame, topLeft, umPerPx, grid):
+        # scale to uint16 and resample to level-0 pixels, as the stitcher does
+        frame = np.asarray(frame)
+        if np.issubdtype(frame.dtype, np.integer):
+            scale = 65535.0/np.iinfo(frame.dtype).max
+        else:
+            frame = np.clip(frame, 0, 1)
+            scale = 65535.0
+        frame = frame.astype(np.float32)
+        if frame.ndim == 3:
+            frame = frame.mean(axis=-1)
+        factor = umPerPx/grid.um_per_px
+        height = max(1, int(round(frame.shape[0]*factor)))
+        width = max(1, int(round(frame.shape[1]*factor)))
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)*scale
+        image = np.clip(np.rint(frame), 0, 65535).astype(np.uint16)
+        px, py = grid.to_pixels(*topLeft)
+        with self._lock:
+            self._fieldSeq += 1
+            seq = self._fieldSeq
+        return _LiveField(seq, image, int(round(py)), int(round(px)))
+
+    def close(self):
+        if self.acquisitions is not None:
+            self.acquisitions.close()
+
+    def get_stats(self):
+        with self._lock:
+            stats = {
+                "mosaic": None if self._mosaic is None else self._mosaic.id,
+                "cached_tiles": len(self._cache),
+                "cache_bytes": self._cacheSize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "live_fields": len(self._fields),
+                "stage_moves": self.stage_moves,
+            }
+        if self.acquisitions is not None:
+            stats["acquisitions"] = self.acquisitions.get_stats()
+        return stats
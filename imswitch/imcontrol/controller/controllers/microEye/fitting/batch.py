@@ -0,0 +1,559 @@
+'''Batched single-molecule localization.
+
+Frames are localized in chunks rather than one at a time: a chunk is copied
+once into a shared memory slab and split among a pool of worker processes,
+each of which runs the pre-filter, the peak detection and a vectorized phasor
+fit on its share of the frames. The localizations are collected in a growing
+columnar table and binned incrementally into the super-resolution image.
+
+Only numpy and OpenCV are needed here, so the workers start quickly and do
+not depend on the optional packages of the other fitting methods.
+'''
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context, shared_memory
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from ..Filters import BandpassFilter
+from .phasor_fit import roi_mask
+
+# Columns filled by the phasor fit (names as in results.py)
+PHASOR_COLUMNS = (
+    ('frame', np.int64),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('background', np.float32),
+    ('intensity', np.float32),
+    ('ratio x/y', np.float32),
+    ('sigmax', np.float32),
+    ('sigmay', np.float32),
+    ('CRLB x', np.float32),
+    ('CRLB y', np.float32),
+)
+
+# Drift (in pixels) subtracted from x, y by the online drift correction
+DRIFT_COLUMNS = (
+    ('drift x', np.float32),
+    ('drift y', np.float32),
+)
+
+# Attributes of cv2.SimpleBlobDetector_Params (which can't be pickled)
+_BLOB_PARAMS = (
+    'blobColor', 'filterByArea', 'filterByCircularity', 'filterByColor',
+    'filterByConvexity', 'filterByInertia', 'maxArea', 'maxCircularity',
+    'maxConvexity', 'maxInertiaRatio', 'maxThreshold', 'minArea',
+    'minCircularity', 'minConvexity', 'minDistBetweenBlobs',
+    'minInertiaRatio', 'minRepeatability', 'minThreshold', 'thresholdStep',
+)
+
+# Effective settings of CV_BlobDetector() (including those forced by
+# get_blob_detector)
+_DEFAULT_BLOB = (
+    ('filterByColor', True), ('blobColor', 255),
+    ('filterByArea', True), ('minArea', 1.5), ('maxArea', 80.0),
+    ('filterByCircularity', False), ('minCircularity', 0.000001),
+    ('filterByConvexity', False), ('minConvexity', 0.000001),
+    ('filterByInertia', False), ('minInertiaRatio', 0.000001),
+    ('minThreshold', 0.0), ('maxThreshold', 255.0), ('thresholdStep', 10.0),
+    ('minDistBetweenBlobs', 10.0),
+)
+
+
+def phasor_fit_batch(image: np.ndarray, points: np.ndarray,
+                     roi_size=7, intensity=True, precision=False):
+    '''Vectorized version of phasor_fit, fits all points of a frame at once.
+
+    Instead of an FFT per ROI, only the two first-harmonic Fourier
+    coefficients the phasor method needs are computed, for all ROIs
+    together. Returns the same (N, 5) array as phasor_fit.
+
+    With precision=True (requires intensity) four columns are appended:
+    the PSF widths sigmax, sigmay estimated from the decay of the first
+    harmonic (|F1| / F0 = exp(-2 pi^2 sigma^2 / roi_size^2) for a Gaussian
+    spot) and the localization precisions CRLB x, CRLB y from the Gaussian
+    MLE bound of Mortensen et al. (2010) for these widths, the intensity
+    and the background. All in pixels, NaN where undefined.
+    '''
+    if points is None or len(points) < 1:
+        return None
+
+    points = np.asarray(points)
+    height, width = image.shape
+    harmonic = np.exp(-2j * np.pi * np.arange(roi_size) / roi_size)
+
+    idx, idy = _roi_origins(points[:, 0], points[:, 1], roi_size, width, height)
+    rois = _gather_rois(image, idx, idy, roi_size)
+
+    fx = rois.sum(axis=1) @ harmonic  # fft2(roi)[0, 1]
+    fy = rois.sum(axis=2) @ harmonic  # fft2(roi)[1, 0]
+    theta_x = np.angle(fx)
+    theta_y = np.angle(fy)
+    theta_x[theta_x > 0] -= 2 * np.pi
+    theta_y[theta_y > 0] -= 2 * np.pi
+
+    sub_fit = np.zeros((points.shape[0], 9 if precision else 5), points.dtype)
+    sub_fit[:, 0] = idx + np.abs(theta_x) / (2 * np.pi / roi_size)
+    sub_fit[:, 1] = idy + np.abs(theta_y) / (2 * np.pi / roi_size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sub_fit[:, 4] = np.abs(fx) / np.abs(fy)
+
+    if intensity:
+        bg_mask, sig_mask = roi_mask(roi_size)
+        idx, idy = _roi_origins(
+            sub_fit[:, 0], sub_fit[:, 1], roi_size, width, height)
+        rois = _gather_rois(image, idx, idy, roi_size)
+        background = np.percentile(rois[:, bg_mask], 56, axis=1)
+        signal = rois[:, sig_mask].sum(axis=1) - np.sum(sig_mask) * background
+        sub_fit[:, 2] = background
+        sub_fit[:, 3] = np.maximum(signal, 0)
+
+        if precision:
+            net = rois.sum(axis=(1, 2)) - roi_size**2 * background
+            sigmas = [_phasor_sigma(np.abs(f), net, roi_size) for f in (fx, fy)]
+            sub_fit[:, 5:7] = np.stack(sigmas, axis=1)
+            sub_fit[:, 7:9] = np.stack([
+                _mle_precision(sigma, sub_fit[:, 3], background) for sigma in sigmas], axis=1)
+
+    return sub_fit
+
+
+def _phasor_sigma(magnitude, net, roi_size):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = magnitude / net
+        sigma = roi_size / (np.pi * np.sqrt(2)) * np.sqrt(-np.log(ratio))
+    sigma[~((net > 0) & (ratio > 0) & (ratio < 1))] = np.nan
+    return sigma
+
+
+def _mle_precision(sigma, photons, background):
+    # Mortensen et al., Nat. Methods 7, 377 (2010), pixel size 1
+    sigma_a2 = sigma**2 + 1 / 12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = 2 * np.pi * sigma_a2 * np.maximum(background, 0) / photons
+        variance = sigma_a2 / photons * (1 + 4 * tau + np.sqrt(2 * tau / (1 + 4 * tau)))
+        precision = np.sqrt(variance)
+    precision[~(photons > 0)] = np.nan
+    return precision
+
+
+def _roi_origins(x, y, roi_size, width, height):
+    # Same truncation and clamping as phasor_fit
+    idx = np.trunc(np.asarray(x, np.float64) - roi_size // 2).astype(np.intp)
+    idy = np.trunc(np.asarray(y, np.float64) - roi_size // 2).astype(np.intp)
+    idx = np.minimum(np.maximum(idx, 0), width - roi_size)
+    idy = np.minimum(np.maximum(idy, 0), height - roi_size)
+    return idx, idy
+
+
+def _gather_rois(image, idx, idy, roi_size):
+    offsets = np.arange(roi_size)
+    rows = (idy[:, None] + offsets)[:, :, None]
+    cols = (idx[:, None] + offsets)[:, None, :]
+    return image[rows, cols].astype(np.float64)
+
+
+def equalize_lut(image: np.ndarray) -> np.ndarray:
+    '''Stretches the 0.001 % to 99.99 % percentile range of an image to
+    0..255, as uImage.equalizeLUT(None, True) does.'''
+    if image.dtype not in (np.uint8, np.uint16):
+        image = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+    n_bins = 2**16 if image.dtype == np.uint16 else 256
+    cdf = np.cumsum(cv2.calcHist(
+        [image], [0], None, [n_bins], [0, n_bins]).ravel()) / image.size
+    lo = int(np.argmax(cdf >= 0.00001))
+    hi = int(np.argmax(cdf >= 0.9999))
+    lut = np.zeros(n_bins, dtype=np.uint8)
+    lut[lo:hi] = np.linspace(0, 255, hi - lo, dtype=np.uint8)
+    lut[hi:] = 255
+    return lut[image]
+
+
+def quantile_uint8(image: np.ndarray, q: float) -> float:
+    '''np.quantile(image, q) of an 8-bit image from its histogram,
+    without sorting the pixels.'''
+    cdf = np.cumsum(cv2.calcHist([image], [0], None, [256], [0, 256]).ravel())
+    pos = q * (image.size - 1)
+    lo = int(np.floor(pos))
+    value_lo = np.searchsorted(cdf, lo, side='right')
+    if pos == lo:
+        return float(value_lo)
+    value_hi = np.searchsorted(cdf, lo + 1, side='right')
+    return float(value_lo + (pos - lo) * (value_hi - value_lo))
+
+
+@dataclass(frozen=True)
+class LocalizerParams:
+    '''Picklable settings of the localization pipeline.'''
+    threshold: float = 0.2
+    roi_size: int = 13
+    filter_center: float = 40.0
+    filter_width: float = 90.0
+    filter_type: str = 'gauss'
+    detector: Tuple[Tuple[str, object], ...] = _DEFAULT_BLOB
+
+    @classmethod
+    def from_components(cls, pre_filter: BandpassFilter, detector,
+                        threshold=0.2, roi_size=13) -> 'LocalizerParams':
+        '''Captures the settings of a configured BandpassFilter and
+        CV_BlobDetector.'''
+        params = getattr(detector, 'params', None)
+        if params is None:
+            blob = _DEFAULT_BLOB
+        else:
+            blob = tuple((name, getattr(params, name))
+                         for name in _BLOB_PARAMS if hasattr(params, name))
+        return cls(
+            threshold=float(threshold), roi_size=int(roi_size),
+            filter_center=float(pre_filter._center),
+            filter_width=float(pre_filter._width),
+            filter_type=str(pre_filter._type), detector=blob)
+
+    def create_filter(self) -> BandpassFilter:
+        pre_filter = BandpassFilter()
+        pre_filter._center = self.filter_center
+        pre_filter._width = self.filter_width
+        pre_filter._type = self.filter_type
+        return pre_filter
+
+    def create_detector(self) -> cv2.SimpleBlobDetector:
+        params = cv2.SimpleBlobDetector_Params()
+        for name, value in self.detector:
+            setattr(params, name, value)
+        return cv2.SimpleBlobDetector_create(params)
+
+
+# Filter and detector per settings, kept for the lifetime of a process
+_components = {}
+
+
+def _get_components(params: LocalizerParams):
+    components = _components.get(params)
+    if components is None:
+        _components.clear()
+        components = _components[params] = (
+            params.create_filter(), params.create_detector())
+    return components
+
+
+def localize_frames(frames: np.ndarray, first_frame: int,
+                    params: LocalizerParams) -> Dict[str, np.ndarray]:
+    '''Localizes the molecules in a stack of frames with the same pipeline
+    as fit.localize_frame (LUT equalization, bandpass filter, relative
+    threshold, blob detection, phasor fit).
+
+    Returns the localizations as columns (see PHASOR_COLUMNS), frames are
+    numbered from first_frame on.
+    '''
+    pre_filter, detector = _get_components(params)
+    fits, frame_numbers = [], []
+    for i, frame in enumerate(frames):
+        img = pre_filter.run(equalize_lut(frame))
+        # The filter is cached until the frame shape changes
+        pre_filter._refresh = False
+
+        _, th_img = cv2.threshold(
+            img, quantile_uint8(img, 1 - 1e-4) * params.threshold,
+            255, cv2.THRESH_BINARY)
+        points = cv2.KeyPoint_convert(detector.detect(th_img))
+        fit = phasor_fit_batch(frame, points, roi_size=params.roi_size,
+                               precision=True)
+        if fit is not None:
+            fits.append(fit)
+            frame_numbers.append(np.full(len(fit), first_frame + i, np.int64))
+
+    fits = np.concatenate(fits) if fits else np.zeros((0, 9), np.float32)
+    columns = {'frame': np.concatenate(frame_numbers) if frame_numbers
+               else np.zeros(0, np.int64)}
+    for col, (name, dtype) in enumerate(PHASOR_COLUMNS[1:]):
+        columns[name] = fits[:, col].astype(dtype)
+    return columns
+
+
+def _init_worker():
+    # Parallelism comes from the processes, not from OpenCV's threads
+    cv2.setNumThreads(1)
+
+
+def _localize_shared(shm_name, shape, dtype, start, stop, first_frame, params):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = np.ndarray(shape, dtype, buffer=shm.buf)
+        return localize_frames(frames[start:stop], first_frame + start, params)
+    finally:
+        frames = None
+        shm.close()
+
+
+def concat_columns(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts])
+            for name in parts[0]}
+
+
+class BatchLocalizer:
+    '''Localizes chunks of frames in a pool of worker processes.
+
+    A chunk is copied into a shared memory slab (slabs are reused) and its
+    frames are split evenly among the workers. With workers=0 the chunks
+    are localized in the calling thread.
+    '''
+
+    def __init__(self, workers: Optional[int] = None, mp_context: str = 'spawn'):
+        '''
+        Parameters
+        ----------
+        workers : int, optional
+            Number of worker processes, by default one less than the
+            number of CPU cores (0 on a single core machine)
+        mp_context : str, optional
+            Multiprocessing start method, by default 'spawn'; forking a
+            multithreaded process can deadlock the workers on locks held
+            by its other threads
+        '''
+        if workers is None:
+            workers = (os.cpu_count() or 1) - 1
+        self.workers = max(0, int(workers))
+        self._executor = None
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=get_context(mp_context),
+                initializer=_init_worker)
+        self._free_slabs = []
+        self._slabs = []
+        self._lock = threading.Lock()
+
+    def submit(self, frames, first_frame: int,
+               params: LocalizerParams) -> Future:
+        '''Starts localizing a stack or a list of equally shaped frames.
+        The returned future resolves to the localization columns.'''
+        n_frames = len(frames)
+        if self._executor is None or n_frames == 0:
+            future = Future()
+            try:
+                future.set_result(localize_frames(frames, first_frame, params))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        shape = (n_frames,) + tuple(frames[0].shape)
+        dtype = np.dtype(frames[0].dtype)
+        slab = self._acquire_slab(int(np.prod(shape)) * dtype.itemsize)
+        stack = np.ndarray(shape, dtype, buffer=slab.buf)
+        for i, frame in enumerate(frames):
+            stack[i] = frame
+        del stack
+
+        n_parts = min(self.workers, n_frames)
+        bounds = np.linspace(0, n_frames, n_parts + 1).astype(int)
+        parts = [self._executor.submit(
+            _localize_shared, slab.name, shape, dtype.str,
+            int(start), int(stop), first_frame, params)
+            for start, stop in zip(bounds[:-1], bounds[1:])]
+
+        future = Future()
+        remaining = [len(parts)]
+
+        def part_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+                self._free_slabs.append(slab)
+            try:
+                future.set_result(concat_columns([part.result() for part in parts]))
+            except Exception as e:
+                future.set_exception(e)
+
+        for part in parts:
+            part.add_done_callback(part_done)
+        return future
+
+    def _acquire_slab(self, nbytes: int) -> shared_memory.SharedMemory:
+        with self._lock:
+            for slab in self._free_slabs:
+                if slab.size >= nbytes:
+                    self._free_slabs.remove(slab)
+                    return slab
+            slab = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+            self._slabs.append(slab)
+            return slab
+
+    def close(self):
+        '''Waits for the submitted chunks and releases the workers and
+        the shared memory.'''
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            for slab in self._slabs:
+                slab.close()
+                try:
+                    slab.unlink()
+                except FileNotFoundError:
+                    pass
+            self._slabs.clear()
+            self._free_slabs.clear()
+
+
+def missing_value(dtype):
+    '''Fill value of a column the fit doesn't provide.'''
+    return np.nan if np.issubdtype(dtype, np.floating) else 0
+
+
+class LocalizationTable:
+    '''Growing columnar table of localizations.
+
+    Each column is a numpy array whose capacity doubles when it is full, so
+    appending is amortized O(1) and columns can be read as array views
+    without copying.
+    '''
+
+    def __init__(self, columns=PHASOR_COLUMNS, capacity=4096):
+        self._dtypes = {name: np.dtype(dtype) for name, dtype in columns}
+        self._capacity = max(1, int(capacity))
+        self._size = 0
+        self._data = {name: np.zeros(self._capacity, dtype)
+                      for name, dtype in self._dtypes.items()}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def names(self):
+        return list(self._dtypes)
+
+    def append(self, columns: Dict[str, np.ndarray]) -> Tuple[int, int]:
+        '''Appends rows given as columns of equal length, columns of the
+        table that are missing are filled with NaN (or 0 if integer).
+        Returns the range of the new rows.'''
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        with self._lock:
+            start, stop = self._size, self._size + n_rows
+            if stop > self._capacity:
+                capacity = self._capacity
+                while capacity < stop:
+                    capacity *= 2
+                for name, array in self._data.items():
+                    grown = np.zeros(capacity, array.dtype)
+                    grown[:start] = array[:start]
+                    self._data[name] = grown
+                self._capacity = capacity
+            for name, array in self._data.items():
+                array[start:stop] = columns[name] if name in columns \
+                    else missing_value(array.dtype)
+            self._size = stop
+        return start, stop
+
+    def update_column(self, name: str, values, start=0):
+        '''Overwrites the rows from start on of a column.'''
+        with self._lock:
+            values = np.asarray(values)
+            self._data[name][start:start + len(values)] = values
+
+    def column(self, name: str) -> np.ndarray:
+        '''The filled part of a column (a view, valid until cleared).'''
+        with self._lock:
+            return self._data[name][:self._size]
+
+    def columns(self, names=None) -> Dict[str, np.ndarray]:
+        with self._lock:
+            return {name: self._data[name][:self._size]
+                    for name in (names or self._dtypes)}
+
+    def to_array(self, names=None) -> np.ndarray:
+        '''The table as an (N, len(names)) float64 array.'''
+        columns = self.columns(names)
+        return np.stack(list(columns.values()), axis=1).astype(np.float64) \
+            if columns else np.zeros((0, 0))
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+
+
+class HistogramRenderer:
+    '''Super-resolution image built up incrementally by binning the
+    localizations of each new batch into an accumulator.'''
+
+    def __init__(self, shape, upsampling=1):
+        '''
+        Parameters
+        ----------
+        shape : tuple
+            (height, width) of the camera frames
+        upsampling : int, optional
+            Rendered pixels per camera pixel, by default 1
+        '''
+        self.upsampling = max(1, int(upsampling))
+        self.shape = (int(shape[0]) * self.upsampling,
+                      int(shape[1]) * self.upsampling)
+        self._accumulator = np.zeros(self.shape, np.float32)
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, x: np.ndarray, y: np.ndarray, weights=None):
+        '''Bins localizations given in camera pixels.'''
+        if len(x) == 0:
+            return
+        ix = (np.asarray(x) * self.upsampling).astype(np.intp)
+        iy = (np.asarray(y) * self.upsampling).astype(np.intp)
+        inside = (ix >= 0) & (ix < self.shape[1]) & (iy >= 0) & (iy < self.shape[0])
+        flat = iy[inside] * self.shape[1] + ix[inside]
+        if len(flat) == 0:
+            return
+        with self._lock:
+            accumulator = self._accumulator.ravel()
+            np.add.at(accumulator, flat,
+                      1 if weights is None else np.asarray(weights)[inside])
+            # Bins only grow, so the maximum can only change where we added
+            self._max = max(self._max, float(accumulator[flat].max()))
+
+    @property
+    def max(self) -> float:
+        return self._max
+
+    def image(self) -> np.ndarray:
+        '''Copy of the accumulated histogram.'''
+        with self._lock:
+            return self._accumulator.copy()
+
+    def display(self) -> np.ndarray:
+        '''The image scaled to 0..255 as uint8.'''
+        with self._lock:
+            if self._max <= 0:
+                return np.zeros(self.shape, np.uint8)
+            return cv2.convertScaleAbs(self._accumulator, alpha=255.0 / self._max)
+
+    def reset(self):
+        with self._lock:
+            self._accumulator.fill(0)
+            self._max = 0.0
+
+
+class ThroughputMeter:
+    '''Frames per second over a sliding window of batches.'''
+
+    def __init__(self, window=20):
+        self._batches = deque(maxlen=window)
+
+    def add(self, n_frames: int):
+        self._batches.append((time.perf_counter(), n_frames))
+
+    @property
+    def fps(self) -> float:
+        if len(self._batches) < 2:
+            return 0.0
+        elapsed = self._batches[-1][0] - self._batches[0][0]
+        frames = sum(n for _, n in list(self._batches)[1:])
+        return frames / elapsed if elapsed > 0 else 0.0
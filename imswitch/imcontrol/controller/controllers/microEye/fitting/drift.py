@@ -0,0 +1,366 @@
+'''Drift estimation by redundant cross-correlation.
+
+The localizations are split into windows of consecutive frames, each window
+is rendered as a histogram and the displacement between windows is measured
+by FFT cross-correlation. Measuring not only consecutive windows but every
+pair of nearby windows gives an overdetermined system for the drift of each
+window, which is solved by least squares after rejecting inconsistent pairs
+(RCC, Wang et al., Opt. Express 22, 15982 (2014)). The system is sparse (two
+entries per pair) and is solved iteratively, starting from the previous
+estimate when windows are added one by one.
+
+All spectra and correlations are computed batched with numpy's real FFT in
+single precision. OnlineDriftCorrector applies this to the localization
+stream, updating the drift each time a window of frames is complete.
+'''
+
+from collections import deque
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import lsqr
+
+
+def histogram_stack(x, y, labels, n_images: int, shape: Tuple[int, int],
+                    bin_size: float = 1.0) -> np.ndarray:
+    '''Renders localizations into a stack of 2D histograms.
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        Coordinates in pixels
+    labels : np.ndarray
+        Image of each localization (0..n_images-1, others are skipped)
+    n_images : int
+        Number of images
+    shape : tuple
+        (height, width) of the images in bins
+    bin_size : float, optional
+        Bin size in pixels, by default 1
+
+    Returns
+    -------
+    np.ndarray
+        float32 stack (n_images, height, width)
+    '''
+    ix = np.floor(np.asarray(x) / bin_size).astype(np.intp)
+    iy = np.floor(np.asarray(y) / bin_size).astype(np.intp)
+    labels = np.asarray(labels, np.intp)
+    inside = ((ix >= 0) & (ix < shape[1]) & (iy >= 0) & (iy < shape[0])
+              & (labels >= 0) & (labels < n_images))
+    flat = (labels[inside] * shape[0] + iy[inside]) * shape[1] + ix[inside]
+    counts = np.bincount(flat, minlength=n_images * shape[0] * shape[1])
+    return counts.reshape((n_images,) + tuple(shape)).astype(np.float32)
+
+
+def image_spectra(images: np.ndarray, sigma: float = 1.0) -> np.ndarray:
+    '''Real FFTs of a stack of images, low-pass filtered as if the images
+    were blurred by a Gaussian of sigma bins (histograms of localizations
+    are too sparse to correlate directly).'''
+    images = np.asarray(images, np.float32)
+    spectra = np.fft.rfft2(images)
+    height, width = images.shape[-2:]
+    ky = np.fft.fftfreq(height).astype(np.float32)[:, None]
+    kx = np.fft.rfftfreq(width).astype(np.float32)[None, :]
+    spectra *= np.exp(-2 * np.pi**2 * sigma**2 * (kx**2 + ky**2))
+    spectra[..., 0, 0] = 0  # mean
+    return spectra
+
+
+def correlate_spectra(spectra_a: np.ndarray, spectra_b: np.ndarray,
+                      shape: Tuple[int, int], max_shift: Optional[float] = None,
+                      chunk: int = 16) -> np.ndarray:
+    '''Displacements of images b relative to images a, pairwise.
+
+    Parameters
+    ----------
+    spectra_a, spectra_b : np.ndarray
+        Stacks of spectra from image_spectra, of equal length
+    shape : tuple
+        (height, width) of the images
+    max_shift : float, optional
+        Largest displacement searched for in bins, by default a quarter of
+        the image
+    chunk : int, optional
+        Pairs correlated at once (bounds the memory use)
+
+    Returns
+    -------
+    np.ndarray
+        (N, 2) displacements (dx, dy) in bins with sub-bin precision
+        (parabolic interpolation of the correlation peak)
+    '''
+    height, width = shape
+    if max_shift is None:
+        max_shift = min(height, width) / 4
+    m = int(min(np.ceil(max_shift), height // 2 - 1, width // 2 - 1))
+    shifts = np.zeros((len(spectra_a), 2))
+    for start in range(0, len(spectra_a), chunk):
+        stop = min(start + chunk, len(spectra_a))
+        cc = np.fft.irfft2(spectra_b[start:stop] * np.conj(spectra_a[start:stop]), s=shape)
+        # Displacements -m..m, around zero
+        rows = np.arange(-m, m + 1) % height
+        cols = np.arange(-m, m + 1) % width
+        cc = cc[:, rows[:, None], cols[None, :]]
+        n = len(cc)
+        peak = cc.reshape(n, -1).argmax(axis=1)
+        py, px = np.unravel_index(peak, cc.shape[1:])
+        rng = np.arange(n)
+        offsets = []
+        for p, axis in ((px, 2), (py, 1)):
+            lo = np.maximum(p - 1, 0)
+            hi = np.minimum(p + 1, 2 * m)
+            if axis == 2:
+                left, center, right = cc[rng, py, lo], cc[rng, py, p], cc[rng, py, hi]
+            else:
+                left, center, right = cc[rng, lo, px], cc[rng, p, px], cc[rng, hi, px]
+            denominator = left - 2 * center + right
+            with np.errstate(divide='ignore', invalid='ignore'):
+                offset = np.where((denominator < 0) & (lo < p) & (hi > p),
+                                  0.5 * (left - right) / denominator, 0.0)
+            offsets.append(p - m + np.clip(offset, -0.5, 0.5))
+        shifts[start:stop] = np.stack(offsets, axis=1)
+    return shifts
+
+
+def windows_connected(pairs: np.ndarray, n_windows: int) -> bool:
+    '''True if the pairs connect all windows, i.e. the drift of every
+    window relative to window 0 is determined.'''
+    pairs = np.asarray(pairs, np.intp).reshape(-1, 2)
+    if n_windows < 2:
+        return True
+    graph = sparse.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+                              shape=(n_windows, n_windows))
+    return connected_components(graph, directed=False)[0] == 1
+
+
+def solve_drift(pairs: np.ndarray, shifts: np.ndarray, n_windows: int,
+                rmax: Optional[float] = 1.0,
+                initial: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    '''Least-squares drift of each window from pairwise displacements.
+
+    Parameters
+    ----------
+    pairs : np.ndarray
+        (N, 2) window indices (i, j)
+    shifts : np.ndarray
+        (N, 2) displacement of window j relative to window i
+    n_windows : int
+        Number of windows, the drift of window 0 is zero
+    rmax : float, optional
+        Pairs whose residual exceeds rmax (same unit as shifts) are dropped
+        and the drift is solved again, as long as every window remains
+        connected. None to keep all pairs.
+    initial : np.ndarray, optional
+        (n_windows, 2) starting point of the iterative solver, e.g. the
+        previous estimate
+
+    Returns
+    -------
+    tuple(np.ndarray, np.ndarray)
+        (n_windows, 2) drift and the mask of the pairs used
+    '''
+    pairs = np.asarray(pairs, np.intp).reshape(-1, 2)
+    shifts = np.asarray(shifts, np.float64).reshape(-1, 2)
+    drift = np.zeros((n_windows, 2))
+    used = np.ones(len(pairs), bool)
+    if n_windows < 2 or not len(pairs):
+        return drift, used
+
+    # one row per pair: drift[j] - drift[i], window 0 is fixed at zero
+    rows = np.repeat(np.arange(len(pairs)), 2)
+    values = np.tile([-1.0, 1.0], len(pairs))
+    design = sparse.csr_matrix((values, (rows, pairs.ravel())), shape=(len(pairs), n_windows))
+    design = design[:, 1:]
+    if initial is None:
+        start = np.zeros((n_windows - 1, 2))
+    else:
+        start = np.asarray(initial, np.float64)[1:n_windows]
+
+    def solve(mask, x0):
+        matrix = design[mask]
+        return np.stack([lsqr(matrix, shifts[mask, k], x0=x0[:, k], atol=1e-10, btol=1e-10,
+                              iter_lim=20 * n_windows)[0] for k in range(2)], axis=1)
+
+    solution = solve(used, start)
+    if rmax is not None:
+        residuals = np.linalg.norm(design @ solution - shifts, axis=1)
+        keep = residuals <= rmax
+        if not keep.all() and windows_connected(pairs[keep], n_windows):
+            used = keep
+            solution = solve(used, solution)
+    drift[1:] = solution
+    return drift, used
+
+
+def rcc(images: np.ndarray, max_shift: Optional[float] = None, sigma: float = 1.0,
+        rmax: Optional[float] = 1.0, max_distance: Optional[int] = None) -> np.ndarray:
+    '''Drift of each image of a stack by redundant cross-correlation.
+
+    Parameters
+    ----------
+    images : np.ndarray
+        (N, height, width) renderings of consecutive time windows
+    max_shift : float, optional
+        Largest displacement between two windows in bins
+    sigma : float, optional
+        Blur of the renderings in bins
+    rmax : float, optional
+        Residual above which pairs are rejected, in bins
+    max_distance : int, optional
+        Only correlate windows at most this many windows apart, by default
+        all pairs
+
+    Returns
+    -------
+    np.ndarray
+        (N, 2) drift (dx, dy) in bins relative to the first image
+    '''
+    images = np.asarray(images)
+    n = len(images)
+    spectra = image_spectra(images, sigma)
+    i, j = np.triu_indices(n, 1)
+    if max_distance is not None:
+        near = (j - i) <= max_distance
+        i, j = i[near], j[near]
+    shifts = correlate_spectra(spectra[i], spectra[j], images.shape[-2:], max_shift)
+    return solve_drift(np.stack([i, j], axis=1), shifts, n, rmax)[0]
+
+
+class OnlineDriftCorrector:
+    '''Estimates the drift while localizations are streamed in.
+
+    Localizations are collected per window of window_frames frames. When a
+    window is complete it is rendered and correlated with the previous
+    max_pairs windows, and the drift of all windows is solved again. The
+    drift between window centers is interpolated linearly and held constant
+    before the first and after the last center.
+    '''
+
+    def __init__(self, shape: Tuple[int, int], window_frames: int = 500,
+                 bin_size: Optional[float] = None, max_shift: float = 8.0,
+                 sigma: float = 1.0, max_pairs: int = 6, rmax: float = 0.5,
+                 min_localizations: int = 100, max_bins: int = 1024):
+        '''
+        Parameters
+        ----------
+        shape : tuple
+            (height, width) of the camera frames
+        window_frames : int, optional
+            Frames per window, by default 500
+        bin_size : float, optional
+            Bin size of the window renderings in camera pixels, by default
+            as fine as possible with at most max_bins bins per side (and not
+            finer than 0.5 pixels)
+        max_shift : float, optional
+            Largest displacement between two windows in camera pixels
+        sigma : float, optional
+            Blur of the renderings in bins
+        max_pairs : int, optional
+            Previous windows each new window is correlated with
+        rmax : float, optional
+            Residual above which pairs are rejected, in camera pixels
+        min_localizations : int, optional
+            Windows with fewer localizations are skipped
+        max_bins : int, optional
+            Upper limit of the rendering size, bounds the FFT cost
+        '''
+        self.frame_shape = (int(shape[0]), int(shape[1]))
+        self.window_frames = max(1, int(window_frames))
+        if bin_size is None:
+            bin_size = max(0.5, max(self.frame_shape) / max_bins)
+        self.bin_size = float(bin_size)
+        self.shape = (int(np.ceil(self.frame_shape[0] / self.bin_size)),
+                      int(np.ceil(self.frame_shape[1] / self.bin_size)))
+        self.max_shift = max_shift
+        self.sigma = sigma
+        self.max_pairs = max(1, int(max_pairs))
+        self.rmax = rmax
+        self.min_localizations = min_localizations
+        self.reset()
+
+    def reset(self):
+        self._window = None
+        self._x, self._y = [], []
+        self._count = 0
+        self._spectra = deque(maxlen=self.max_pairs)  # (window index, spectrum)
+        self._centers = []
+        self._pairs = []
+        self._shifts = []
+        self._drift = np.zeros((0, 2))
+        self.updates = 0
+
+    def add(self, frames, x, y) -> bool:
+        '''Adds localizations (in frame order). Returns True if the drift
+        estimate changed.'''
+        frames = np.asarray(frames)
+        if len(frames) == 0:
+            return False
+        windows = frames // self.window_frames
+        updated = False
+        for window in np.unique(windows):
+            if self._window is not None and window > self._window:
+                updated |= self._close_window()
+            if self._window is None or window > self._window:
+                self._window = int(window)
+            mask = windows == window
+            self._x.append(np.asarray(x)[mask])
+            self._y.append(np.asarray(y)[mask])
+            self._count += int(mask.sum())
+        return updated
+
+    def finish(self) -> bool:
+        '''Closes the current window, e.g. at the end of the acquisition.'''
+        return self._close_window() if self._window is not None else False
+
+    def _close_window(self) -> bool:
+        x = np.concatenate(self._x) if self._x else np.zeros(0)
+        y = np.concatenate(self._y) if self._y else np.zeros(0)
+        count, window = self._count, self._window
+        self._x, self._y, self._count = [], [], 0
+        if count < self.min_localizations:
+            return False
+
+        image = histogram_stack(x, y, np.zeros(len(x)), 1, self.shape, self.bin_size)
+        spectrum = image_spectra(image, self.sigma)[0]
+        index = len(self._centers)
+        self._centers.append((window + 0.5) * self.window_frames)
+        if self._spectra:
+            previous = list(self._spectra)
+            shifts = correlate_spectra(
+                np.stack([s for _, s in previous]),
+                np.repeat(spectrum[None], len(previous), axis=0),
+                self.shape, self.max_shift / self.bin_size)
+            self._pairs.extend((i, index) for i, _ in previous)
+            self._shifts.extend(shifts * self.bin_size)
+        self._spectra.append((index, spectrum))
+        if index == 0:
+            self._drift = np.zeros((1, 2))
+            return False
+        # warm start: the previous drift, the new window at the drift of the last one
+        initial = np.concatenate([self._drift, self._drift[-1:]])
+        self._drift = solve_drift(
+            np.array(self._pairs), np.array(self._shifts), index + 1, self.rmax, initial)[0]
+        self.updates += 1
+        return True
+
+    def drift_at(self, frames) -> Tuple[np.ndarray, np.ndarray]:
+        '''Interpolated drift (dx, dy) in camera pixels at the given frames.'''
+        return interpolate_drift(self.trajectory, frames)
+
+    @property
+    def trajectory(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''Window centers (frames) and the drift (dx, dy) in camera pixels.'''
+        return np.asarray(self._centers), self._drift[:, 0].copy(), self._drift[:, 1].copy()
+
+
+def interpolate_drift(trajectory: Sequence[np.ndarray], frames) -> Tuple[np.ndarray, np.ndarray]:
+    '''Drift (dx, dy) at frames from a trajectory (centers, dx, dy), linear
+    between the centers and constant outside.'''
+    centers, dx, dy = trajectory
+    frames = np.asarray(frames, np.float64)
+    if len(centers) == 0:
+        return np.zeros(len(frames)), np.zeros(len(frames))
+    return np.interp(frames, centers, dx), np.interp(frames, centers, dy)
@@ -6,6 +6,7 @@ from scipy.interpolate import interp1d
 
 from ..Rendering import gauss_hist_render
 from .processing import *
+from .drift import rcc
 
 from enum import Enum
 
@@ -571,7 +572,8 @@ class FittingResults:
 
         return fittingResults
 
-    def drift_cross_correlation(self, n_bins=10, pixelSize=10, upsampling=100):
+    def drift_cross_correlation(
+            self, n_bins=10, pixelSize=10, upsampling=100, redundant=False):
         '''Corrects the XY drift using cross-correlation measurments
 
         Parameters
@@ -583,6 +585,10 @@ class FittingResults:
         upsampling : int, optional
             phase_cross_correlation upsampling (check skimage.registration),
             by default 100
+        redundant : bool, optional
+            Estimate the drift from the cross-correlations of all pairs of
+            bins (redundant cross-correlation, see drift.rcc) instead of
+            each bin against the first one, by default False
 
         Returns
         -------
@@ -629,7 +635,12 @@ class FittingResults:
         print(
             'Shift Estimation ...',
             end="\r")
-        shifts = shift_estimation(np.array(sub_images), pixelSize, upsampling)
+        if redundant:
+            # rcc returns (dx, dy) in super-res pixels, shifts are (y, x) in nm
+            shifts = rcc(np.array(sub_images))[:, ::-1] * pixelSize
+        else:
+            shifts = shift_estimation(
+                np.array(sub_images), pixelSize, upsampling)
         # for idx, img in enumerate(sub_images):
         #     shift = phase_cross_correlation(
         #         img, sub_images[0], upsample_factor=upsampling)
@@ -0,0 +1,386 @@
+'''Append-only columnar localization store.
+
+Localizations are written by a background thread into a chunked HDF5 file,
+one resizable dataset per column (group "localizations"). Rows are written in
+blocks; within a block they are sorted by spatial tile, and every (block,
+tile) run is recorded in an index together with its frame range. Queries by
+frame range and region of interest therefore only read the rows of the
+matching runs, so a super-resolution image of any region can be rendered at
+any pixel size directly from the file, also while it is still being written.
+
+The rows keep the raw coordinates. A drift trajectory (dataset "drift") can
+be stored with the localizations; queries subtract the drift interpolated at
+each frame.
+'''
+
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import h5py
+import numpy as np
+
+from .batch import PHASOR_COLUMNS, missing_value
+from .drift import interpolate_drift
+
+# Index row: tile x, tile y, first row, stop row, first frame, last frame
+INDEX_FIELDS = ('tile_x', 'tile_y', 'row_start', 'row_stop', 'frame_min', 'frame_max')
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class LocalizationStore:
+    '''Chunked HDF5 file of localizations with a frame/tile index.'''
+
+    def __init__(self, file_path: str, mode: str = 'w', columns=PHASOR_COLUMNS,
+                 tile_size: float = 64, block_rows: int = 65536,
+                 flush_interval: float = 1.0, max_queue: int = 256,
+                 put_timeout: Optional[float] = None, compression: Optional[str] = 'lzf',
+                 attrs: Optional[Dict[str, Any]] = None):
+        '''
+        Parameters
+        ----------
+        file_path : str
+            The HDF5 file
+        mode : str, optional
+            'w' to create a new file (raises if it exists) and start the writer thread, 'r' to open
+            an existing store for queries only, by default 'w'
+        columns : tuple, optional
+            (name, dtype) of the columns, must contain frame, x and y
+        tile_size : float, optional
+            Edge length of the spatial index tiles in camera pixels
+        block_rows : int, optional
+            Rows collected before a block is written (also the HDF5 chunk
+            length)
+        flush_interval : float, optional
+            Maximum seconds between writes of incomplete blocks
+        max_queue : int, optional
+            Maximum number of batches waiting for the writer
+        put_timeout : float, optional
+            Maximum seconds append blocks on a full queue before the batch
+            is dropped, by default it waits
+        compression : str, optional
+            HDF5 compression filter of the columns
+        attrs : dict, optional
+            Attributes stored with the file, e.g. the pixel size
+        '''
+        if mode not in ('w', 'r'):
+            raise ValueError(f'Unknown mode {mode}, expected "w" or "r"')
+        self.file_path = file_path
+        self.mode = mode
+        self.put_timeout = put_timeout
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._file_lock = threading.Lock()
+        self._index = np.zeros((0, len(INDEX_FIELDS)), np.int64)
+        self._rows = 0
+        self._drift = None
+        self._thread = None
+        self.batch_count = 0
+        self.dropped_count = 0
+        self.max_queue_depth = 0
+        self.write_time = 0.0
+
+        if mode == 'r':
+            self._file = h5py.File(file_path, 'r')
+            group = self._file['localizations']
+            self.columns = tuple((name, group[name].dtype) for name in group.attrs['columns'])
+            self.tile_size = float(self._file.attrs['tile_size'])
+            self.block_rows = group[self.columns[0][0]].chunks[0]
+            self._index = self._file['index'][...]
+            self._rows = int(self._index[:, 3].max()) if len(self._index) else 0
+            if 'drift' in self._file:
+                self._drift = tuple(self._file['drift'][...].T)
+            return
+
+        self.columns = tuple((name, np.dtype(dtype)) for name, dtype in columns)
+        self.tile_size = float(tile_size)
+        self.block_rows = max(1, int(block_rows))
+        folder = os.path.dirname(file_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # never truncate the localizations of an earlier acquisition
+        self._file = h5py.File(file_path, 'w-')
+        self._file.attrs['tile_size'] = self.tile_size
+        self._file.attrs['index_fields'] = list(INDEX_FIELDS)
+        for key, value in (attrs or {}).items():
+            self._file.attrs[key] = value
+        group = self._file.create_group('localizations')
+        group.attrs['columns'] = [name for name, _ in self.columns]
+        for name, dtype in self.columns:
+            group.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype,
+                                 chunks=(self.block_rows,), compression=compression)
+        self._file.create_dataset('index', shape=(0, len(INDEX_FIELDS)),
+                                  maxshape=(None, len(INDEX_FIELDS)), dtype=np.int64,
+                                  chunks=(4096, len(INDEX_FIELDS)))
+        self._thread = threading.Thread(target=self._process_queue, daemon=True,
+                                        name='LocalizationStore')
+        self._thread.start()
+
+    @classmethod
+    def open(cls, file_path: str) -> 'LocalizationStore':
+        '''Opens an existing store for queries.'''
+        return cls(file_path, mode='r')
+
+    def __len__(self):
+        '''Number of rows written so far.'''
+        return self._rows
+
+    # Writing
+
+    def append(self, columns: Dict[str, np.ndarray]) -> bool:
+        '''Queues localizations given as columns of equal length. Returns
+        False if they were dropped because the writer fell behind.'''
+        if self._thread is None:
+            raise RuntimeError(f'{self.file_path} is not open for writing')
+        try:
+            self.queue.put({name: np.asarray(value) for name, value in columns.items()},
+                           timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped_count += 1
+            return False
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        '''Waits until everything appended so far is written and indexed.'''
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def set_drift(self, trajectory):
+        '''Stores the drift trajectory (frames, dx, dy), in pixels, which
+        is subtracted from the coordinates by query and render.'''
+        frames, dx, dy = (np.asarray(a, np.float64) for a in trajectory)
+        with self._file_lock:
+            if self.mode == 'w':
+                if 'drift' in self._file:
+                    del self._file['drift']
+                dataset = self._file.create_dataset('drift', data=np.stack([frames, dx, dy], axis=1))
+                dataset.attrs['columns'] = ['frame', 'drift x', 'drift y']
+            self._drift = (frames, dx, dy)
+
+    @property
+    def drift(self):
+        '''The stored drift trajectory (frames, dx, dy) or None.'''
+        return self._drift
+
+    def close(self):
+        '''Writes the remaining localizations and closes the file.'''
+        if self._thread is not None:
+            self.queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        with self._file_lock:
+            if self._file:
+                self._file.close()
+
+    def _process_queue(self):
+        pending, n_pending = [], 0
+        last_write = time.perf_counter()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if isinstance(item, dict):
+                n_rows = len(next(iter(item.values()))) if item else 0
+                if n_rows:
+                    pending.append(item)
+                    n_pending += n_rows
+                self.batch_count += 1
+            due = time.perf_counter() - last_write >= self.flush_interval
+            if pending and (n_pending >= self.block_rows or due or item is _STOP
+                            or isinstance(item, threading.Event)):
+                try:
+                    self._write_block(pending)
+                except Exception as e:
+                    logger.error(f'Error writing localizations to {self.file_path}: {e}')
+                pending, n_pending = [], 0
+                last_write = time.perf_counter()
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                break
+
+    def _write_block(self, batches):
+        t_start = time.perf_counter()
+        block = {}
+        for name, dtype in self.columns:
+            parts = [batch[name] if name in batch
+                     else np.full(len(next(iter(batch.values()))), missing_value(dtype), dtype)
+                     for batch in batches]
+            block[name] = np.concatenate(parts).astype(dtype, copy=False)
+
+        tiles_x, tiles_y = self._tiles(block['x'], block['y'])
+        order = np.lexsort((block['frame'], tiles_x, tiles_y))
+        tiles_x, tiles_y = tiles_x[order], tiles_y[order]
+        frames = block['frame'][order]
+        run_starts = np.flatnonzero(np.r_[True, (np.diff(tiles_x) != 0) | (np.diff(tiles_y) != 0)])
+        run_stops = np.r_[run_starts[1:], len(order)]
+
+        start = self._rows
+        index = np.stack([
+            tiles_x[run_starts], tiles_y[run_starts],
+            start + run_starts, start + run_stops,
+            np.minimum.reduceat(frames, run_starts), np.maximum.reduceat(frames, run_starts),
+        ], axis=1).astype(np.int64)
+
+        stop = start + len(order)
+        with self._file_lock:
+            group = self._file['localizations']
+            for name, _ in self.columns:
+                dataset = group[name]
+                dataset.resize((stop,))
+                dataset[start:stop] = block[name][order]
+            dataset = self._file['index']
+            dataset.resize((len(self._index) + len(index), len(INDEX_FIELDS)))
+            dataset[len(self._index):] = index
+            self._file.flush()
+            self._index = np.concatenate([self._index, index])
+            self._rows = stop
+        self.write_time += time.perf_counter() - t_start
+
+    def _tiles(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        return (np.floor(np.asarray(x, np.float64) / self.tile_size).astype(np.int64),
+                np.floor(np.asarray(y, np.float64) / self.tile_size).astype(np.int64))
+
+    # Queries
+
+    def query(self, frames: Optional[Tuple[int, int]] = None,
+              roi: Optional[Tuple[float, float, float, float]] = None,
+              columns: Optional[Sequence[str]] = None,
+              drift_corrected: bool = True) -> Dict[str, np.ndarray]:
+        '''Reads the localizations of a frame range and region.
+
+        Parameters
+        ----------
+        frames : tuple, optional
+            (first, stop) frame numbers, stop excluded
+        roi : tuple, optional
+            (x_min, y_min, x_max, y_max) in camera pixels, max excluded
+        columns : list, optional
+            Columns to return, by default all
+        drift_corrected : bool, optional
+            Whether to subtract the stored drift from x and y (and to apply
+            the region to the corrected coordinates), by default True
+
+        Returns
+        -------
+        dict
+            The matching rows as columns (in file order)
+        '''
+        names = list(columns) if columns is not None else [name for name, _ in self.columns]
+        read = list(dict.fromkeys(names + ['frame', 'x', 'y']))
+        drift = self._drift if drift_corrected and self._drift is not None \
+            and len(self._drift[0]) else None
+        with self._file_lock:
+            index = self._index
+            selected = np.ones(len(index), bool)
+            if frames is not None:
+                selected &= (index[:, 5] >= frames[0]) & (index[:, 4] < frames[1])
+            if roi is not None:
+                # The tiles hold raw coordinates, widen the region by the drift
+                mx = np.abs(drift[1]).max() if drift is not None else 0
+                my = np.abs(drift[2]).max() if drift is not None else 0
+                tx0 = math.floor((roi[0] - mx) / self.tile_size)
+                ty0 = math.floor((roi[1] - my) / self.tile_size)
+                # max is excluded
+                tx1 = math.ceil((roi[2] + mx) / self.tile_size) - 1
+                ty1 = math.ceil((roi[3] + my) / self.tile_size) - 1
+                selected &= ((index[:, 0] >= tx0) & (index[:, 0] <= tx1)
+                             & (index[:, 1] >= ty0) & (index[:, 1] <= ty1))
+            ranges = _merge_ranges(index[selected, 2], index[selected, 3])
+            group = self._file['localizations']
+            data = {name: np.concatenate([group[name][a:b] for a, b in ranges])
+                    if ranges else np.zeros(0, group[name].dtype) for name in read}
+
+        if drift is not None:
+            dx, dy = interpolate_drift(drift, data['frame'])
+            data['x'] = (data['x'] - dx).astype(data['x'].dtype)
+            data['y'] = (data['y'] - dy).astype(data['y'].dtype)
+
+        keep = np.ones(len(data['x']), bool)
+        if frames is not None:
+            keep &= (data['frame'] >= frames[0]) & (data['frame'] < frames[1])
+        if roi is not None:
+            keep &= ((data['x'] >= roi[0]) & (data['x'] < roi[2])
+                     & (data['y'] >= roi[1]) & (data['y'] < roi[3]))
+        if keep.all():
+            return {name: data[name] for name in names}
+        return {name: data[name][keep] for name in names}
+
+    def render(self, roi: Tuple[float, float, float, float], pixel_size: float = 0.1,
+               frames: Optional[Tuple[int, int]] = None, weights: Optional[str] = None) -> np.ndarray:
+        '''Renders a region as 2D histogram of the localizations.
+
+        Parameters
+        ----------
+        roi : tuple
+            (x_min, y_min, x_max, y_max) in camera pixels
+        pixel_size : float, optional
+            Rendered pixel size in camera pixels, by default 0.1
+        frames : tuple, optional
+            (first, stop) frame numbers, by default all
+        weights : str, optional
+            Column to weight the localizations with, e.g. "intensity"
+
+        Returns
+        -------
+        np.ndarray
+            float32 image of ceil(height / pixel_size) x
+            ceil(width / pixel_size) pixels
+        '''
+        x_min, y_min, x_max, y_max = roi
+        shape = (int(np.ceil((y_max - y_min) / pixel_size)),
+                 int(np.ceil((x_max - x_min) / pixel_size)))
+        data = self.query(frames, roi, ['x', 'y'] + ([weights] if weights else []))
+        ix = ((data['x'] - x_min) / pixel_size).astype(np.intp)
+        iy = ((data['y'] - y_min) / pixel_size).astype(np.intp)
+        inside = (ix < shape[1]) & (iy < shape[0])
+        image = np.bincount(
+            iy[inside] * shape[1] + ix[inside],
+            weights=data[weights][inside] if weights else None,
+            minlength=shape[0] * shape[1])
+        return image.reshape(shape).astype(np.float32)
+
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        '''(x_min, y_min, x_max, y_max) of the indexed tiles.'''
+        index = self._index
+        if not len(index):
+            return None
+        return (float(index[:, 0].min() * self.tile_size), float(index[:, 1].min() * self.tile_size),
+                float((index[:, 0].max() + 1) * self.tile_size),
+                float((index[:, 1].max() + 1) * self.tile_size))
+
+    def get_stats(self) -> Dict[str, Any]:
+        '''Number of written rows, index entries, drops and the queue fill level.'''
+        return {
+            'file_path': self.file_path,
+            'rows': self._rows,
+            'index_entries': len(self._index),
+            'batches': self.batch_count,
+            'dropped': self.dropped_count,
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'write_time_s': self.write_time,
+        }
+
+
+def _merge_ranges(starts, stops):
+    '''Sorted row ranges with adjacent ranges joined, to read fewer slices.'''
+    if len(starts) == 0:
+        return []
+    order = np.argsort(starts)
+    starts, stops = starts[order], stops[order]
+    breaks = np.flatnonzero(starts[1:] > stops[:-1]) + 1
+    return list(zip(starts[np.r_[0, breaks]].tolist(),
+                    np.maximum.reduceat(stops, np.r_[0, breaks]).tolist()))
@@ -0,0 +1,12 @@
+"""
+SIM reconstruction helpers: cached calibration filters and a queued worker pool.
+"""
+
+from .filters import SIMFilterCache, SIMFilterSet
+from .pipeline import SIMReconstructionPipeline
+
+__all__ = [
+    'SIMFilterCache',
+    'SIMFilterSet',
+    'SIMReconstructionPipeline',
+]
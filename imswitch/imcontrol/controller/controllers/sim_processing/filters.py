@@ -0,0 +1,151 @@
+"""
+Calibration-derived SIM reconstruction filters.
+
+Calibrating a SIM processor (carrier frequencies, phases, band separation,
+Wiener filter and apodization) is expensive, but its result only depends on
+the wavelength, the image shape and the optical parameters. The resulting
+filters are kept in a ``SIMFilterSet`` so that every following stack only
+needs the FFT-multiply-IFFT steps, and ``SIMFilterCache`` keeps one set per
+wavelength and image shape.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class SIMFilterSet:
+    """
+    Reconstruction filters of one calibration, in float32.
+
+    ``reconstruct`` is a pure function of the stack and the (read-only) filters,
+    so one filter set can be used by several reconstruction workers at once.
+    """
+
+    def __init__(self, prefilter: np.ndarray, reconfactor: np.ndarray, postfilter: np.ndarray,
+                 parameters: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            prefilter: (Ny, Nx) filter applied to the spectra of the raw images
+                (fftshifted to the FFT layout)
+            reconfactor: (nsteps, 2 Ny, 2 Nx) per-image factors that shift and
+                combine the separated bands on the upsampled grid
+            postfilter: (2 Ny, 2 Nx) Wiener filter and apodization (FFT layout)
+            parameters: Calibration results to keep along, e.g. carriers
+        """
+        self.nsteps, ny2, nx2 = reconfactor.shape
+        self.shape = (ny2 // 2, nx2 // 2)
+        ny, nx = self.shape
+        if prefilter.shape != self.shape or postfilter.shape != (ny2, nx2):
+            raise ValueError(f"Filter shapes {prefilter.shape}, {reconfactor.shape}, "
+                             f"{postfilter.shape} do not match")
+        # Only the half spectra used by the real FFTs are kept
+        self.prefilter = np.ascontiguousarray(prefilter[:, :nx // 2 + 1], dtype=np.float32)
+        self.reconfactor = np.ascontiguousarray(reconfactor, dtype=np.float32)
+        self.postfilter = np.ascontiguousarray(postfilter[:, :nx + 1], dtype=np.float32)
+        self.parameters = dict(parameters or {})
+
+    @classmethod
+    def from_processor(cls, processor) -> "SIMFilterSet":
+        """Take the filters of a calibrated napari-sim-processor processor."""
+        parameters = {name: np.array(getattr(processor, name))
+                      for name in ("kx", "ky", "p", "ampl") if hasattr(processor, name)}
+        return cls(processor._prefilter, processor._reconfactor, processor._postfilter, parameters)
+
+    def reconstruct(self, stack: np.ndarray) -> np.ndarray:
+        """
+        Reconstruct a super-resolved image of twice the size of the raw images.
+
+        Args:
+            stack: (nsteps, Ny, Nx) raw images, further images are ignored
+
+        Returns:
+            (2 Ny, 2 Nx) float32 reconstruction
+        """
+        stack = np.asarray(stack)
+        if stack.shape[0] < self.nsteps or stack.shape[1:] != self.shape:
+            raise ValueError(f"Expected a stack of {self.nsteps} images of shape {self.shape}, "
+                             f"got {stack.shape}")
+        ny, nx = self.shape
+        spectra = np.fft.rfft2(stack[:self.nsteps].astype(np.float32, copy=False))
+        spectra *= self.prefilter
+        # Zero-pad the spectra to the upsampled grid
+        padded = np.zeros((self.nsteps, 2 * ny, nx + 1), np.complex64)
+        padded[:, :ny // 2, :nx // 2 + 1] = spectra[:, :ny // 2]
+        padded[:, 3 * ny // 2:, :nx // 2 + 1] = spectra[:, ny // 2:]
+        upsampled = np.fft.irfft2(padded, s=(2 * ny, 2 * nx))
+        upsampled *= self.reconfactor
+        combined = upsampled.sum(axis=0)
+        spectrum = np.fft.rfft2(combined)
+        spectrum *= self.postfilter
+        return np.fft.irfft2(spectrum, s=(2 * ny, 2 * nx)).astype(np.float32, copy=False)
+
+    @property
+    def nbytes(self) -> int:
+        return self.prefilter.nbytes + self.reconfactor.nbytes + self.postfilter.nbytes
+
+
+class SIMFilterCache:
+    """
+    Filter sets per wavelength and image shape.
+
+    ``get_or_create`` calibrates at most once per key, also when several
+    workers ask for the same key at the same time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filters: Dict[Hashable, SIMFilterSet] = {}
+        self._keyLocks: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(wavelength: float, shape: Tuple[int, ...]) -> Tuple[float, Tuple[int, int]]:
+        return float(wavelength), tuple(int(n) for n in shape[-2:])
+
+    def get(self, key: Hashable) -> Optional[SIMFilterSet]:
+        with self._lock:
+            return self._filters.get(key)
+
+    def get_or_create(self, key: Hashable, create: Callable[[], SIMFilterSet]) -> SIMFilterSet:
+        """Return the filters of key, calling create (e.g. a calibration) if there are none."""
+        with self._lock:
+            filters = self._filters.get(key)
+            if filters is not None:
+                self.hits += 1
+                return filters
+            keyLock = self._keyLocks.setdefault(key, threading.Lock())
+        with keyLock:
+            with self._lock:
+                filters = self._filters.get(key)
+                if filters is not None:
+                    self.hits += 1
+                    return filters
+            filters = create()
+            with self._lock:
+                self._filters[key] = filters
+                self.misses += 1
+            return filters
+
+    def invalidate(self, wavelength: Optional[float] = None):
+        """Forget the filters of one wavelength or of all wavelengths, e.g. after a parameter change."""
+        with self._lock:
+            for key in list(self._filters):
+                if wavelength is None or key[0] == float(wavelength):
+                    del self._filters[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._filters)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cached_filter_sets": [{"wavelength": key[0], "shape": list(key[1])}
+                                       for key in self._filters],
+                "cache_bytes": sum(filters.nbytes for filters in self._filters.values()),
+                "hits": self.hits,
+                "calibrations": self.misses,
+            }
@@ -0,0 +1,164 @@
+"""
+Bounded-queue worker pool for SIM reconstructions.
+
+Stacks are queued and processed by a fixed set of worker threads. The queue is
+bounded and ``submit`` blocks while it is full, so no stack is ever dropped:
+when reconstructions fall behind, the acquisition is slowed down instead of
+losing data, and memory use stays bounded.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+_STOP = object()
+
+
+class SIMReconstructionPipeline:
+    """
+    Processes queued items with ``process(item)`` on a pool of worker threads.
+
+    Items are started in submission order; with more than one worker they may
+    finish out of order.
+    """
+
+    def __init__(self, process: Callable[[Any], Any], workers: int = 2, max_queue: int = 8,
+                 name: str = "SIMReconstruction", on_error: Optional[Callable[[Any, Exception], None]] = None):
+        """
+        Args:
+            process: Called with each item on a worker thread
+            workers: Number of worker threads
+            max_queue: Maximum number of items waiting for a worker
+            name: Prefix of the worker thread names
+            on_error: Called with the item and the exception if process raises
+        """
+        self.process = process
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.name = name
+        self.on_error = on_error
+        self.queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._busy = 0
+        self._completionTimes = deque(maxlen=64)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.process_time = 0.0
+        self.blocked_time = 0.0
+        self.start()
+
+    def start(self):
+        """Start the worker threads (done by the constructor)."""
+        if self._threads:
+            return
+        self._threads = [threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> bool:
+        """
+        Queue an item, blocking while the queue is full.
+
+        Args:
+            item: Passed to process
+            timeout: Maximum time to wait for a free slot (None: wait forever)
+
+        Returns:
+            False if the pipeline is stopped or the timeout expired
+        """
+        if not self._threads:
+            return False
+        tStart = time.perf_counter()
+        try:
+            self.queue.put(item, timeout=timeout)
+        except queue.Full:
+            return False
+        finally:
+            blocked = time.perf_counter() - tStart
+        with self._lock:
+            self.submitted += 1
+            self.blocked_time += blocked
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            with self._lock:
+                self._busy += 1
+            tStart = time.perf_counter()
+            failed = False
+            try:
+                self.process(item)
+            except Exception as e:
+                failed = True
+                if self.on_error is not None:
+                    self.on_error(item, e)
+            tEnd = time.perf_counter()
+            with self._lock:
+                self._busy -= 1
+                self.process_time += tEnd - tStart
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                    self._completionTimes.append(tEnd)
+                self._done.notify_all()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all submitted items are processed. Returns False on timeout."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._lock:
+            while self.completed + self.failed < self.submitted:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._done.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Process the queued items, then stop the workers."""
+        if not self._threads:
+            return
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Throughput, queue depth and backpressure of the pipeline."""
+        with self._lock:
+            times = list(self._completionTimes)
+            processed = self.completed + self.failed
+            stats = {
+                "workers": self.workers,
+                "busy_workers": self._busy,
+                "queue_depth": self.queue.qsize(),
+                "max_queue": self.max_queue,
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "mean_process_time_s": self.process_time / processed if processed else 0.0,
+                "blocked_time_s": self.blocked_time,
+            }
+        # Throughput over the recent completions
+        if len(times) > 1 and times[-1] > times[0]:
+            stats["stacks_per_s"] = (len(times) - 1) / (times[-1] - times[0])
+        else:
+            stats["stacks_per_s"] = 0.0
+        return stats
@@ -3,16 +3,25 @@ Focus metrics module for ImSwitch focus lock functionality.
 
 Extracted from FocusLockController for better modularity and testability.
 Provides various focus measurement algorithms including astigmatism-based metrics.
+
+All metrics share one engine: frames are converted into a reused float32 stack
+(N x H x W) that is preprocessed in place, and ``compute_batch`` scores a whole
+stack in one pass (per-frame OpenCV work is spread over a thread pool).
 """
 
+import os
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional, Dict, Any, Tuple
+from typing import Callable, Optional, Dict, Any, Tuple
 import logging
 
+import cv2
 import numpy as np
 from scipy.optimize import curve_fit
-from scipy.ndimage import gaussian_filter, center_of_mass
+from scipy.ndimage import center_of_mass
 from skimage.feature import peak_local_max
 
 logger = logging.getLogger(__name__)
@@ -27,6 +36,66 @@ class FocusConfig:
     enable_gaussian_blur: bool = True
     min_signal_threshold: float = 10.0  # Minimum signal for valid measurement
     max_focus_value: float = 1e6  # Maximum valid focus value
+    num_threads: int = 0  # Threads for batched computation, 0 = one per CPU core (max 8)
+    astigmatism_fit: str = "log_gauss"  # "log_gauss", "moments" or "curve_fit"
+    fit_max_iter: int = 200  # Evaluations of the warm-started fallback fit
+
+
+# Weights of cv2.COLOR_RGB2GRAY, used for RGB(A) frames
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _frame_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by all focus metrics (OpenCV releases the GIL)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                           thread_name_prefix="focusmetric")
+        return _executor
+
+
+def for_each_frame(func: Callable[[int], None], n_frames: int, num_threads: int = 0) -> None:
+    """
+    Call func(i) for every frame index, spread over the shared thread pool.
+
+    Args:
+        func: Function of the frame index, writes its result itself
+        n_frames: Number of frames
+        num_threads: Maximum number of threads, 0 = all pool threads
+    """
+    workers = min(8, os.cpu_count() or 1) if num_threads <= 0 else num_threads
+    if n_frames <= 1 or workers <= 1:
+        for i in range(n_frames):
+            func(i)
+        return
+    # One task per thread, each working through a contiguous range of frames
+    bounds = np.linspace(0, n_frames, min(workers, n_frames) + 1).astype(int)
+    tasks = [
+        _frame_executor().submit(lambda lo, hi: [func(i) for i in range(lo, hi)], lo, hi)
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ]
+    for task in tasks:
+        task.result()
+
+
+def gaussian_blur_(stack: np.ndarray, sigma: float, num_threads: int = 0) -> np.ndarray:
+    """
+    Gaussian blur of every frame of a float32 (N, H, W) stack, in place.
+
+    Matches scipy.ndimage.gaussian_filter (reflect border, 4 sigma kernel).
+    """
+    if sigma <= 0:
+        return stack
+
+    def blur(i):
+        cv2.GaussianBlur(stack[i], (0, 0), sigma, dst=stack[i], borderType=cv2.BORDER_REFLECT)
+
+    for_each_frame(blur, len(stack), num_threads)
+    return stack
 
 
 class FocusMetricBase:
@@ -34,48 +103,96 @@ class FocusMetricBase:
     
     def __init__(self, config: Optional[FocusConfig] = None):
         self.config = config or FocusConfig()
+        self._local = threading.local()  # working stack per calling thread
+        self._compute_times = deque(maxlen=500)
         logger.debug(f"Focus metric initialized with config: {self.config}")
 
-    def preprocess_frame(self, frame: np.ndarray) -> np.ndarray:
+    def _record_compute_time(self, t_start: float) -> float:
+        """Store the time since t_start (perf_counter) and return it in ms."""
+        compute_ms = 1e3 * (time.perf_counter() - t_start)
+        self._compute_times.append(compute_ms)
+        return compute_ms
+
+    def get_timing_stats(self) -> Dict[str, float]:
+        """Per-frame compute time of the recent compute() calls in ms."""
+        if not self._compute_times:
+            return {"count": 0}
+        times = np.fromiter(self._compute_times, dtype=np.float64)
+        return {
+            "count": len(times),
+            "mean_ms": float(times.mean()),
+            "p50_ms": float(np.percentile(times, 50)),
+            "p95_ms": float(np.percentile(times, 95)),
+            "max_ms": float(times.max()),
+        }
+
+    def as_float_stack(self, frames: np.ndarray) -> np.ndarray:
         """
-        Preprocess frame for focus computation.
-        
+        Copy frames into the reused float32 working stack.
+
+        The stack is reused per thread, so concurrent callers don't overwrite
+        each other's data. RGB(A) frames are converted with the luma weights of
+        cv2.COLOR_RGB2GRAY, other channel counts are averaged.
+
         Args:
-            frame: Input image frame
-            
+            frames: Single frame (H, W), stack (N, H, W) or color stack (N, H, W, C)
+
         Returns:
-            Preprocessed frame
+            Float32 stack (N, H, W), valid until the next call from this thread
         """
-        # Convert to grayscale if needed
-        if frame.ndim == 3:
-            im = np.mean(frame, axis=-1).astype(np.uint16)
+        frames = np.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+        shape = frames.shape[:3]
+        stack = getattr(self._local, "stack", None)
+        if stack is None or stack.shape != shape:
+            stack = self._local.stack = np.empty(shape, dtype=np.float32)
+        if frames.ndim == 4 and frames.shape[-1] in (3, 4):
+            np.einsum("nhwc,c->nhw", frames[..., :3], _LUMA_WEIGHTS, out=stack,
+                      dtype=np.float32, casting="unsafe")
+        elif frames.ndim == 4:
+            np.mean(frames, axis=-1, dtype=np.float32, out=stack)
         else:
-            im = frame.astype(np.uint16)
+            np.copyto(stack, frames, casting="unsafe")
+        return stack
 
-        im = im.astype(float)
+    def preprocess_stack(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Preprocess a stack of frames for focus computation (float32, in place).
 
-        # Crop around brightest region if crop_radius > 0
-        if 0 and self.config.crop_radius > 0:
-            im_gauss = gaussian_filter(im, sigma=111)
-            max_coord = np.unravel_index(np.argmax(im_gauss), im_gauss.shape)
-            h, w = im.shape
-            y_min = max(0, max_coord[0] - self.config.crop_radius)
-            y_max = min(h, max_coord[0] + self.config.crop_radius)
-            x_min = max(0, max_coord[1] - self.config.crop_radius)
-            x_max = min(w, max_coord[1] + self.config.crop_radius)
-            im = im[y_min:y_max, x_min:x_max]
+        Args:
+            frames: Single frame (H, W) or stack (N, H, W)
+
+        Returns:
+            Preprocessed float32 stack (N, H, W), valid until the next call
+        """
+        stack = self.as_float_stack(frames)
 
         # Apply Gaussian blur if enabled
         if self.config.enable_gaussian_blur:
-            im = gaussian_filter(im, sigma=self.config.gaussian_sigma)
+            gaussian_blur_(stack, self.config.gaussian_sigma, self.config.num_threads)
 
         # Background subtraction and thresholding
         # TODO: normalize intensity to compensate laser fluctuations? 
-        im = im / np.max((np.max(im), 0.1)) * 255
-        im = im - np.mean(im) / 2.0
-        im[im < self.config.background_threshold] = 0
+        peak = np.maximum(stack.max(axis=(1, 2)), 0.1)
+        stack *= (255.0 / peak)[:, None, None]
+        stack -= (stack.mean(axis=(1, 2), dtype=np.float64) / 2.0).astype(np.float32)[:, None, None]
+        np.copyto(stack, 0, where=stack < self.config.background_threshold)
+        return stack
+
+    def preprocess_frame(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Preprocess frame for focus computation.
         
-        return im
+        Args:
+            frame: Input image frame (grayscale or color)
+            
+        Returns:
+            Preprocessed float32 frame, valid until the next call
+        """
+        if frame.ndim == 3:
+            frame = frame[np.newaxis]
+        return self.preprocess_stack(frame)[0]
 
     def compute(self, frame: np.ndarray) -> Dict[str, Any]:
         """
@@ -89,9 +206,23 @@ class FocusMetricBase:
         """
         raise NotImplementedError("Subclasses must implement compute method")
 
+    def compute_batch(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Compute the focus value of every frame of a stack.
+
+        Args:
+            frames: Stack of frames (N, H, W)
+
+        Returns:
+            Focus values (N,)
+        """
+        return np.array([self.compute(frame)["focus"] for frame in frames], dtype=np.float64)
+
     def update_config(self, **kwargs) -> None:
         """Update configuration parameters."""
         for key, value in kwargs.items():
+            if key == "astigmatism_fit" and value not in AstigmatismFocusMetric.FIT_METHODS:
+                raise ValueError(f"Unknown astigmatism fit: {value}. Available: {AstigmatismFocusMetric.FIT_METHODS}")
             if hasattr(self.config, key):
                 setattr(self.config, key, value)
                 logger.debug(f"Updated config: {key} = {value}")
@@ -105,8 +236,98 @@ class AstigmatismFocusMetric(FocusMetricBase):
     
     Computes focus by fitting Gaussian profiles to X and Y projections
     and calculating the ratio of their widths.
+
+    The widths are estimated in closed form ("log_gauss": weighted parabola
+    fit to the log of the projection, "moments": second moment); only if that
+    fails an iterative fit runs, warm-started from the previous frame.
     """
 
+    FIT_METHODS = ("log_gauss", "moments", "curve_fit")
+
+    def __init__(self, config: Optional[FocusConfig] = None):
+        super().__init__(config)
+        self._last_params = {}  # axis -> (i0, x0, sigma, amp) of the previous frame
+
+    @staticmethod
+    def estimate_sigma_moments(proj: np.ndarray) -> Tuple[float, float, float, float]:
+        """
+        Gaussian parameters of a projection from its first and second moments.
+
+        Returns:
+            Tuple (i0, x0, sigma, amp); sigma is NaN if the projection is flat
+        """
+        i0 = float(np.min(proj))
+        signal = proj - i0
+        total = float(np.sum(signal))
+        if total <= 0:
+            return i0, np.nan, np.nan, 0.0
+        x = np.arange(len(proj))
+        x0 = float(np.dot(x, signal) / total)
+        sigma = float(np.sqrt(np.dot((x - x0) ** 2, signal) / total))
+        return i0, x0, sigma, float(np.max(signal))
+
+    @staticmethod
+    def estimate_sigma_log_gauss(proj: np.ndarray, min_fraction: float = 0.2) -> Tuple[float, float, float, float]:
+        """
+        Gaussian parameters of a projection from a signal-weighted parabola fit
+        to its logarithm (points above min_fraction of the peak).
+
+        Returns:
+            Tuple (i0, x0, sigma, amp); sigma is NaN if no peak was found
+        """
+        i0 = float(np.min(proj))
+        signal = proj - i0
+        peak = float(np.max(signal))
+        x = np.flatnonzero(signal > min_fraction * peak)
+        if peak <= 0 or len(x) < 3:
+            return i0, np.nan, np.nan, 0.0
+        y = signal[x]
+        center = x.mean()
+        a, b, c = np.polyfit(x - center, np.log(y), 2, w=y)
+        if a >= 0:
+            return i0, np.nan, np.nan, 0.0
+        x0 = center - b / (2 * a)
+        return i0, float(x0), float(np.sqrt(-1 / (2 * a))), float(np.exp(c - b ** 2 / (4 * a)))
+
+    def _fit_warm(self, axis: str, proj: np.ndarray, p0: Tuple[float, float, float, float]) -> float:
+        """Iterative Gaussian fit starting from the previous frame's parameters (or p0)."""
+        x = np.arange(len(proj))
+        p0 = self._last_params.get(axis, p0)
+        popt, _ = curve_fit(self.gaussian_1d, x, proj, p0=p0, maxfev=self.config.fit_max_iter)
+        self._last_params[axis] = tuple(float(p) for p in popt)
+        return abs(float(popt[2]))
+
+    def estimate_sigma(self, axis: str, proj: np.ndarray) -> Tuple[float, str]:
+        """
+        Width of a projection with the configured estimator and fallbacks.
+
+        Returns:
+            Tuple (sigma, method actually used)
+        """
+        method = self.config.astigmatism_fit
+        if method == "moments":
+            params = self.estimate_sigma_moments(proj)
+        else:
+            params = self.estimate_sigma_log_gauss(proj)
+        sigma = params[2]
+        if method != "curve_fit" and np.isfinite(sigma) and 0 < sigma < len(proj):
+            self._last_params[axis] = params
+            return sigma, method
+        # Closed form not usable (or not requested): warm-started iterative fit
+        p0 = (float(np.mean(proj)), len(proj) / 2, float(np.std(proj)), float(np.max(proj) - np.mean(proj)))
+        try:
+            return self._fit_warm(axis, proj, p0), "curve_fit"
+        except Exception as e:
+            self._last_params.pop(axis, None)
+            logger.warning(f"Gaussian fitting failed, using std: {e}")
+            return float(np.std(proj)), "std"
+
+    def estimate_sigmas(self, projX: np.ndarray, projY: np.ndarray) -> Tuple[float, float, str]:
+        """Widths of both projections, see estimate_sigma."""
+        sigma_x, method_x = self.estimate_sigma("x", projX)
+        sigma_y, method_y = self.estimate_sigma("y", projY)
+        return sigma_x, sigma_y, method_x if method_x == method_y else f"{method_x}/{method_y}"
+
     @staticmethod
     def gaussian_1d(xdata: np.ndarray, i0: float, x0: float, sigma: float, amp: float) -> np.ndarray:
         """1D Gaussian function for curve fitting."""
@@ -203,19 +424,21 @@ class AstigmatismFocusMetric(FocusMetricBase):
             Dictionary with focus metric results
         """
         timestamp = time.time()
+        t_start = time.perf_counter()
         
         try:
             # Preprocess frame
-            im = self.preprocess_frame(np.array(frame))
+            im = self.preprocess_frame(frame)
             
             # Check for minimum signal
             if np.max(im) < self.config.min_signal_threshold:
                 logger.warning("Signal below threshold")
-                return {"t": timestamp, "focus": self.config.max_focus_value, "error": "low_signal"}
+                return {"t": timestamp, "focus": self.config.max_focus_value, "error": "low_signal",
+                        "compute_ms": self._record_compute_time(t_start)}
             
-            # Compute projections and fit Gaussians
+            # Compute projections and estimate the Gaussian widths
             projX, projY = self.compute_projections(im)
-            sigma_x, sigma_y = self.fit_projections(projX, projY)
+            sigma_x, sigma_y, fit_method = self.estimate_sigmas(projX, projY)
             
             # Calculate focus value as ratio
             if sigma_y == 0 or sigma_y < 1e-6:
@@ -234,12 +457,27 @@ class AstigmatismFocusMetric(FocusMetricBase):
                 "sigma_x": sigma_x,
                 "sigma_y": sigma_y,
                 "signal_max": float(np.max(im)),
-                "signal_mean": float(np.mean(im))
+                "signal_mean": float(np.mean(im)),
+                "fit_method": fit_method,
+                "compute_ms": self._record_compute_time(t_start),
             }
             
         except Exception as e:
             logger.error(f"Focus computation failed: {e}")
-            return {"t": timestamp, "focus": self.config.max_focus_value, "error": str(e)}
+            return {"t": timestamp, "focus": self.config.max_focus_value, "error": str(e),
+                    "compute_ms": self._record_compute_time(t_start)}
+
+    def compute_batch(self, frames: np.ndarray) -> np.ndarray:
+        """Astigmatism focus values of a stack; preprocessing and projections are vectorized."""
+        stack = self.preprocess_stack(frames)
+        projX, projY = stack.mean(axis=1), stack.mean(axis=2)
+        valid = stack.max(axis=(1, 2)) >= self.config.min_signal_threshold
+        focus = np.full(len(stack), self.config.max_focus_value, dtype=np.float64)
+        for i in np.flatnonzero(valid):
+            sigma_x, sigma_y, _ = self.estimate_sigmas(projX[i], projY[i])
+            if sigma_y >= 1e-6:
+                focus[i] = min(sigma_x / sigma_y, self.config.max_focus_value)
+        return focus
 
 
 class CenterOfMassFocusMetric(FocusMetricBase):
@@ -341,8 +579,10 @@ class CenterOfMassFocusMetric(FocusMetricBase):
         timestamp = time.time()
         
         try:
-            # Preprocess frame (use Gaussian filtering)
-            im = gaussian_filter(frame.astype(float), 7)
+            # Preprocess frame (use Gaussian filtering), color frames are converted to gray
+            if frame.ndim == 3:
+                frame = frame[np.newaxis]
+            im = gaussian_blur_(self.as_float_stack(frame), 7)[0]
             
             # Find peak centers
             center_coords = self.find_peak_centers(im, two_foci)
@@ -364,6 +604,67 @@ class CenterOfMassFocusMetric(FocusMetricBase):
             logger.error(f"Center of mass focus computation failed: {e}")
             return {"t": timestamp, "focus": self.config.max_focus_value, "error": str(e)}
 
+    def compute_batch(self, frames: np.ndarray) -> np.ndarray:
+        """Center of mass focus values of a stack (single focus per frame)."""
+        stack = gaussian_blur_(self.as_float_stack(frames), 7, self.config.num_threads)
+        flat_max = stack.reshape(len(stack), -1).argmax(axis=1)
+        peaks = np.stack(np.unravel_index(flat_max, stack.shape[1:]), axis=1)
+        return np.array([self.compute_center_of_mass(im, peak) for im, peak in zip(stack, peaks)],
+                        dtype=np.float64)
+
+
+class _SharpnessFocusMetric(FocusMetricBase):
+    """Base of the image sharpness metrics used by the autofocus (larger is sharper)."""
+
+    def _score(self, frame: np.ndarray) -> float:
+        raise NotImplementedError("Subclasses must implement _score method")
+
+    def compute(self, frame: np.ndarray) -> Dict[str, Any]:
+        """Compute the sharpness of a single (grayscale or color) frame."""
+        timestamp = time.time()
+        if frame.ndim == 3:
+            frame = frame[np.newaxis]
+        return {"t": timestamp, "focus": float(self.compute_batch(frame)[0])}
+
+    def compute_batch(self, frames: np.ndarray) -> np.ndarray:
+        stack = self.as_float_stack(frames)
+        focus = np.empty(len(stack), dtype=np.float64)
+
+        def score(i):
+            focus[i] = self._score(stack[i])
+
+        for_each_frame(score, len(stack), self.config.num_threads)
+        return focus
+
+
+class LaplacianFocusMetric(_SharpnessFocusMetric):
+    """Mean squared Laplacian (LAPE) of the frame."""
+
+    def _score(self, frame: np.ndarray) -> float:
+        lap = cv2.Laplacian(frame, cv2.CV_32F)
+        return float(np.mean(np.square(lap, out=lap), dtype=np.float64))
+
+
+class VarianceFocusMetric(_SharpnessFocusMetric):
+    """Standard deviation of the gray levels (GLVA) of the frame."""
+
+    def _score(self, frame: np.ndarray) -> float:
+        _, std = cv2.meanStdDev(frame)
+        return float(std[0, 0])
+
+
+def _benchmark_stack(shape: Tuple[int, int, int], seed: int = 0) -> np.ndarray:
+    """Synthetic uint16 stack of astigmatic spots on a noisy background."""
+    n, h, w = shape
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:h, :w].astype(np.float32)
+    stack = np.empty(shape, dtype=np.uint16)
+    for i, ratio in enumerate(np.linspace(0.5, 2.0, n)):
+        sigma_x, sigma_y = 0.05 * w * ratio, 0.05 * h / ratio
+        spot = 3000 * np.exp(-((x - w / 2) ** 2 / (2 * sigma_x ** 2) + (y - h / 2) ** 2 / (2 * sigma_y ** 2)))
+        stack[i] = np.clip(spot + rng.normal(100, 10, (h, w)), 0, 65535)
+    return stack
+
 
 class FocusMetricFactory:
     """Factory for creating focus metric instances."""
@@ -373,6 +674,8 @@ class FocusMetricFactory:
         "center_of_mass": CenterOfMassFocusMetric,
         "gaussian": AstigmatismFocusMetric,  # Alias
         "gradient": CenterOfMassFocusMetric,  # Alias for now
+        "laplacian": LaplacianFocusMetric,
+        "variance": VarianceFocusMetric,
     }
 
     @classmethod
@@ -398,6 +701,48 @@ class FocusMetricFactory:
         """Get list of available focus metrics."""
         return list(cls._metrics.keys())
 
+    @classmethod
+    def benchmark(cls, metric_types: Optional[list] = None, shape: Tuple[int, int, int] = (16, 256, 256),
+                  repeats: int = 3, config: Optional[FocusConfig] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Microbenchmark of the focus metrics on a synthetic stack.
+
+        Args:
+            metric_types: Metrics to time, defaults to all (without aliases)
+            shape: Shape (N, H, W) of the test stack
+            repeats: Number of runs, the fastest is reported
+            config: Focus configuration
+
+        Returns:
+            Per metric the time per frame in ms, frame by frame with compute()
+            and batched with compute_batch(), and the speedup of the batch
+        """
+        if metric_types is None:
+            metric_types, seen = [], set()
+            for name, metric_class in cls._metrics.items():
+                if metric_class not in seen:  # skip aliases
+                    seen.add(metric_class)
+                    metric_types.append(name)
+        stack = _benchmark_stack(shape)
+        results = {}
+        for metric_type in metric_types:
+            metric = cls.create(metric_type, config)
+            single, batch = np.inf, np.inf
+            for _ in range(max(1, repeats)):
+                t0 = time.perf_counter()
+                for frame in stack:
+                    metric.compute(frame)
+                single = min(single, time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                metric.compute_batch(stack)
+                batch = min(batch, time.perf_counter() - t0)
+            results[metric_type] = {
+                "frame_ms": 1e3 * single / len(stack),
+                "batch_ms": 1e3 * batch / len(stack),
+                "speedup": single / batch if batch > 0 else float("inf"),
+            }
+        return results
+
 
 # Convenience function for backward compatibility
 def create_focus_metric(metric_type: str, **config_kwargs) -> FocusMetricBase:
@@ -412,4 +757,10 @@ def create_focus_metric(metric_type: str, **config_kwargs) -> FocusMetricBase:
         Focus metric instance
     """
     config = FocusConfig(**config_kwargs) if config_kwargs else None
-    return FocusMetricFactory.create(metric_type, config)
\ No newline at end of file
+    return FocusMetricFactory.create(metric_type, config)
+
+
+if __name__ == "__main__":
+    for name, timing in FocusMetricFactory.benchmark().items():
+        print(f"{name:>15}: {timing['frame_ms']:8.2f} ms/frame single, "
+              f"{timing['batch_ms']:8.2f} ms/frame batched ({timing['speedup']:.1f}x)")
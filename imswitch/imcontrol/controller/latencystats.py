@@ -0,0 +1,144 @@
+"""
+Latency histograms for control loops and request handling.
+
+Latencies are counted in fixed, logarithmically spaced bins, so recording is
+O(1) with constant memory no matter how long a loop runs. Percentiles are
+estimated from the bins (accurate to the bin width, about 12% by default).
+"""
+
+import threading
+from typing import Dict, Any, Iterable, Optional
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """Histogram of latencies in milliseconds with log-spaced bins."""
+
+    def __init__(self, min_ms: float = 0.01, max_ms: float = 1e4, bins_per_decade: int = 20):
+        """
+        Args:
+            min_ms: Upper edge of the underflow bin
+            max_ms: Lower edge of the overflow bin
+            bins_per_decade: Resolution of the histogram
+        """
+        n_bins = int(round(np.log10(max_ms / min_ms) * bins_per_decade))
+        self.edges_ms = np.logspace(np.log10(min_ms), np.log10(max_ms), n_bins + 1)
+        self._log_min = np.log10(min_ms)
+        self._bins_per_decade = n_bins / np.log10(max_ms / min_ms)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all recorded latencies."""
+        with self._lock:
+            # counts[0]: below min_ms, counts[-1]: above max_ms
+            self.counts = np.zeros(len(self.edges_ms) + 1, dtype=np.int64)
+            self.count = 0
+            self.total_ms = 0.0
+            self.min_ms = float("inf")
+            self.max_ms = 0.0
+            self.last_ms = None
+
+    def record(self, latency_ms: float) -> None:
+        """Add one latency in milliseconds."""
+        latency_ms = float(latency_ms)
+        if latency_ms < self.edges_ms[0]:
+            index = 0
+        elif latency_ms >= self.edges_ms[-1]:
+            index = len(self.counts) - 1
+        else:
+            index = 1 + min(int((np.log10(latency_ms) - self._log_min) * self._bins_per_decade),
+                            len(self.edges_ms) - 2)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += latency_ms
+            self.min_ms = min(self.min_ms, latency_ms)
+            self.max_ms = max(self.max_ms, latency_ms)
+            self.last_ms = latency_ms
+
+    def _snapshot(self):
+        with self._lock:
+            return (self.counts.copy(), self.count, self.total_ms, self.min_ms,
+                    self.max_ms, self.last_ms)
+
+    def _percentile(self, counts, count, min_ms, max_ms, q):
+        index = int(np.searchsorted(np.cumsum(counts), q / 100 * count))
+        if index == 0:
+            return min_ms
+        if index >= len(counts) - 1:
+            return max_ms
+        # Geometric center of the bin, limited to the observed range
+        center = float(np.sqrt(self.edges_ms[index - 1] * self.edges_ms[index]))
+        return min(max(center, min_ms), max_ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Estimated q-th percentile (0-100) in ms, None if empty."""
+        counts, count, _, min_ms, max_ms, _ = self._snapshot()
+        if count == 0:
+            return None
+        return self._percentile(counts, count, min_ms, max_ms, q)
+
+    def to_dict(self, include_bins: bool = False) -> Dict[str, Any]:
+        """Summary statistics, optionally with the non-empty bins."""
+        # One consistent snapshot, latencies are recorded from other threads
+        counts, count, total_ms, min_ms, max_ms, last_ms = self._snapshot()
+        if count == 0:
+            return {"count": 0}
+        result = {
+            "count": count,
+            "last_ms": last_ms,
+            "mean_ms": total_ms / count,
+            "min_ms": min_ms,
+            "p50_ms": self._percentile(counts, count, min_ms, max_ms, 50),
+            "p95_ms": self._percentile(counts, count, min_ms, max_ms, 95),
+            "p99_ms": self._percentile(counts, count, min_ms, max_ms, 99),
+            "max_ms": max_ms,
+        }
+        if include_bins:
+            lower = np.concatenate(([0.0], self.edges_ms))
+            nonzero = np.flatnonzero(counts)
+            # the overflow bin is open ended, None keeps the output valid JSON
+            result["bins"] = [
+                {"from_ms": float(lower[i]),
+                 "to_ms": float(self.edges_ms[i]) if i < len(self.edges_ms) else None,
+                 "count": int(counts[i])}
+                for i in nonzero
+            ]
+        return result
+
+
+class LatencyTracker:
+    """A named set of latency histograms, e.g. one per stage of a control loop."""
+
+    def __init__(self, names: Iterable[str] = (), **histogram_kwargs):
+        self._histogram_kwargs = histogram_kwargs
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        for name in names:
+            self._get(name)
+
+    def _get(self, name: str) -> LatencyHistogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram(**self._histogram_kwargs))
+        return histogram
+
+    def record(self, name: str, latency_ms: float) -> None:
+        """Add a latency in milliseconds to the histogram of the given name."""
+        self._get(name).record(latency_ms)
+
+    def record_since(self, name: str, t_start: float, t_end: float) -> None:
+        """Add the latency between two time.time()/perf_counter() values."""
+        self._get(name).record(1e3 * (t_end - t_start))
+
+    def reset(self) -> None:
+        """Forget all recorded latencies."""
+        for histogram in list(self._histograms.values()):
+            histogram.reset()
+
+    def to_dict(self, include_bins: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Summary statistics of all histograms."""
+        return {name: histogram.to_dict(include_bins) for name, histogram in list(self._histograms.items())}
@@ -1,6 +1,6 @@
 import threading
 from imswitch.imcommon.framework import Worker
-from imswitch.imcommon.model import dirtools, initLogger
+from imswitch.imcommon.model import dirtools, initLogger, startupProfiler
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query
 from pydantic import BaseModel
@@ -26,7 +26,7 @@ import uvicorn
 from functools import wraps
 import os
 import socket
-from typing import List, Dict
+from typing import Any, List, Dict
 from imswitch import IS_HEADLESS, __ssl__, __httpport__
 from imswitch.imcontrol.model import configfiletools
 from fastapi.responses import RedirectResponse
@@ -39,6 +39,9 @@ from fastapi.openapi.docs import (
     get_swagger_ui_oauth2_redirect_html,
 )
 from fastapi.staticfiles import StaticFiles
+from imswitch.config import get_config
+from .apiexecutor import APIExecutor, validateParams
+from pydantic import ValidationError
 
 try:
     pass
@@ -90,6 +93,11 @@ BASE_DIR = dirtools.UserFileDirs.Data
 if not os.path.exists(BASE_DIR):
     os.makedirs(BASE_DIR)
 
+# Pydantic Model for running an API endpoint as background job
+class APIJobRequest(BaseModel):
+    endpoint: str
+    params: Dict[str, Any] = {}
+
 # Pydantic Model for folder creation
 class CreateFolderRequest(BaseModel):
     name: str
@@ -332,6 +340,16 @@ class ImSwitchServer(Worker):
 
         self.__logger =  initLogger(self)
 
+        # Synchronous endpoints run in a bounded thread pool, not on the event loop
+        config = get_config()
+        self._executor = APIExecutor(
+            maxWorkers=config.api_max_workers,
+            maxConcurrentPerController=config.api_max_concurrent_per_controller,
+            controllerLimits=config.api_controller_limits,
+            jobHistory=config.api_job_history,
+        )
+        self._apiEndpoints = {}
+
 
     def moveToThread(self, thread) -> None:
         return super().moveToThread(thread)
@@ -352,6 +370,7 @@ class ImSwitchServer(Worker):
 
     def stop(self):
         self.__logger.debug("Stopping ImSwitchServer")
+        self._executor.shutdown()
         try:
             self.server_thread.stop()
             #self.server_thread.join()
@@ -403,11 +422,20 @@ class ImSwitchServer(Worker):
         hostname = socket.gethostname()
         return {"hostname": hostname}
 
+    @app.get("/ImSwitchServer/getStartupProfile")
+    def get_startup_profile():
+        """
+        Returns the import and construct time (ms) of managers, controllers
+        and plugins during startup, slowest first, and the single events.
+        """
+        return startupProfiler.to_dict()
+
     def createAPI(self):
         api_dict = self._api._asdict()
         functions = api_dict.keys()
+        executor = self._executor
 
-        def includeAPI(str, func):
+        def includeAPI(str, func, module, name):
             if hasattr(func, '_APIAsyncExecution') and func._APIAsyncExecution:
                 if hasattr(func, '_APIRequestType') and func._APIRequestType == "POST":
                     @app.post(str)
@@ -421,17 +449,25 @@ class ImSwitchServer(Worker):
                         import importlib #importlib.reload(my_module)
                         return await func(*args, **kwargs) # sometimes we need to return a future
             else:
+                # Blocking calls run in the executor's thread pool so that they
+                # don't stall the event loop (other requests, socket streams)
                 if hasattr(func, '_APIRequestType') and func._APIRequestType == "POST":
                     @app.post(str)
                     @wraps(func)
-                    def wrapper(*args, **kwargs):
-                        return func(*args, **kwargs)
+                    async def wrapper(*args, **kwargs):
+                        return await executor.run(module, name, func, *args, **kwargs)
                 else:
                     @app.get(str) # TODO: Perhaps we want POST instead?
                     @wraps(func)
                     #@register
                     async def wrapper(*args, **kwargs):
-                        return func(*args, **kwargs)
+                        return await executor.run(module, name, func, *args, **kwargs)
+                self._apiEndpoints[str] = (module, name, func)
+                # Controllers with thread-safe endpoints may allow parallel calls
+                owner = getattr(getattr(func, '_apiFunc', func), '__self__', None)
+                concurrency = getattr(owner, 'apiConcurrency', None)
+                if concurrency is not None:
+                    executor.setControllerDefault(module, concurrency)
             return wrapper
 
         def includeUIAPI(str, func):
@@ -457,7 +493,9 @@ class ImSwitchServer(Worker):
                 module = func.module
             else:
                 module = func.__module__.split('.')[-1]
-            self.func = includeAPI("/"+module+"/"+f, func)
+            self.func = includeAPI("/"+module+"/"+f, func, module, f)
+
+        self.includeExecutorAPI()
 
         # add UIExport decorated functions to the fastAPI under /externUI
         if self._uiapi is None: return # we are on QT mode
@@ -490,6 +528,66 @@ class ImSwitchServer(Worker):
                     name=meta["name"],
                 )
 
+    def includeExecutorAPI(self):
+        """ Endpoints to run API calls as jobs and to monitor the executor. """
+        executor = self._executor
+
+        @app.get("/ImSwitchServer/getAPIStats")
+        async def getAPIStats(includeBins: bool = False):
+            """ Queue depth, running calls and latencies (ms) per controller. """
+            return executor.getStats(includeBins)
+
+        @app.get("/ImSwitchServer/resetAPIStats")
+        async def resetAPIStats():
+            executor.resetStats()
+
+        @app.get("/ImSwitchServer/setControllerConcurrency")
+        async def setControllerConcurrency(controller: str, limit: int):
+            """ Maximum number of simultaneous calls to a controller (0: unlimited). """
+            executor.setLimit(controller, limit)
+            return {"controller": controller, "limit": executor.getLimit(controller)}
+
+        @app.post("/ImSwitchServer/submitJob")
+        async def submitJob(request: APIJobRequest):
+            """ Starts a synchronous endpoint (e.g. "/PositionerController/movePositioner")
+            in the background and returns a job handle to poll. """
+            endpoint = "/" + request.endpoint.strip("/")
+            if endpoint not in self._apiEndpoints:
+                raise HTTPException(status_code=404, detail=f"Unknown endpoint {endpoint}")
+            module, name, func = self._apiEndpoints[endpoint]
+            try:
+                params = validateParams(func, request.params)
+            except ValidationError as e:
+                raise RequestValidationError(e.errors(include_url=False))
+            return executor.submitJob(module, name, func, **params)
+
+        @app.get("/ImSwitchServer/getJob")
+        async def getJob(jobId: str):
+            job = executor.getJob(jobId)
+            if job is None:
+                raise HTTPException(status_code=404, detail=f"Unknown job {jobId}")
+            return job
+
+        @app.get("/ImSwitchServer/getJobResult")
+        async def getJobResult(jobId: str):
+            job = executor.getJob(jobId)
+            if job is None:
+                raise HTTPException(status_code=404, detail=f"Unknown job {jobId}")
+            if job["status"] == "failed":
+                raise HTTPException(status_code=500, detail=job["error"])
+            if job["status"] != "done":
+                raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+            return executor.getJobResult(jobId)
+
+        @app.get("/ImSwitchServer/cancelJob")
+        async def cancelJob(jobId: str):
+            """ Cancels a job that is still waiting for a free slot. """
+            return {"cancelled": executor.cancelJob(jobId)}
+
+        @app.get("/ImSwitchServer/listJobs")
+        async def listJobs():
+            return executor.listJobs()
+
     # The reason why it's still called UC2ConfigController is because we don't want to change the API
     @app.get("/UC2ConfigController/returnAvailableSetups")
     def returnAvailableSetups():
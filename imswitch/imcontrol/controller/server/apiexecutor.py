@@ -0,0 +1,343 @@
+"""
+Execution of synchronous API endpoints off the uvicorn event loop.
+
+Synchronous APIExport methods (stage moves, snaps, calibrations, ...) run in a
+bounded thread pool so that a slow call never blocks the event loop that
+serves all other HTTP requests and the Socket.IO frame stream. Calls to one
+controller run one at a time unless the controller allows more (most
+controllers aren't thread-safe), so a burst of calls to one controller can't
+starve the others; excess calls wait on the event loop without holding a
+thread. Long calls can be submitted as jobs and polled for their result.
+"""
+
+import asyncio
+import functools
+import inspect
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from pydantic import ConfigDict, create_model
+
+from imswitch.imcontrol.controller.latencystats import LatencyTracker
+
+
+class _ControllerSlots:
+    """ Counting semaphore that can be awaited from any event loop and
+    released from any thread (asyncio.Semaphore is bound to one loop). """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    handedOver = False
+                except ValueError:
+                    handedOver = True
+            if handedOver and waiter[1].done() and not waiter[1].cancelled():
+                self.release()  # got the slot, but the request was cancelled
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                if not loop.is_closed():
+                    # The slot passes directly to the next waiter
+                    loop.call_soon_threadsafe(self._wake, future)
+                    return
+            self.active -= 1
+
+    def _wake(self, future: asyncio.Future) -> None:
+        if future.done():  # cancelled in the meantime
+            self.release()
+        else:
+            future.set_result(None)
+
+
+@functools.lru_cache(maxsize=None)
+def _paramsModel(func: Callable):
+    """ Pydantic model of the keyword arguments of an endpoint. """
+    try:
+        signature = inspect.signature(func, eval_str=True)
+    except (NameError, TypeError):
+        signature = inspect.signature(func)
+    fields, extra = {}, "forbid"
+    for name, parameter in signature.parameters.items():
+        if parameter.kind == parameter.VAR_KEYWORD:
+            extra = "allow"
+        elif parameter.kind != parameter.VAR_POSITIONAL:
+            annotation = Any if parameter.annotation is parameter.empty else parameter.annotation
+            default = ... if parameter.default is parameter.empty else parameter.default
+            fields[name] = (annotation, default)
+    config = ConfigDict(extra=extra, arbitrary_types_allowed=True)
+    return create_model(f"{getattr(func, '__name__', 'endpoint')}Params", __config__=config, **fields)
+
+
+def validateParams(func: Callable, params: Dict[str, Any]) -> Dict[str, Any]:
+    """ Validates and converts keyword arguments for an endpoint the way
+    FastAPI does for a request (e.g. dicts to pydantic models). Parameters
+    that were not passed keep the endpoint's defaults.
+
+    Raises:
+        pydantic.ValidationError: if the parameters don't match the signature
+    """
+    validated = _paramsModel(func).model_validate(params)
+    result = {name: getattr(validated, name) for name in validated.model_fields_set}
+    result.update(validated.model_extra or {})
+    return result
+
+
+class APIExecutor:
+    """ Runs synchronous API calls in a thread pool with per-controller
+    concurrency limits, job handles and latency statistics. """
+
+    def __init__(self, maxWorkers: int = 16, maxConcurrentPerController: int = 1,
+                 controllerLimits: Optional[Dict[str, int]] = None, jobHistory: int = 200):
+        """
+        Args:
+            maxWorkers: Threads of the pool shared by all controllers
+            maxConcurrentPerController: Default number of calls per controller
+              that may run at the same time (0: only limited by the pool)
+            controllerLimits: Per-controller overrides, e.g. {"LaserController": 4}
+            jobHistory: Number of finished jobs whose results are kept
+        """
+        self.maxWorkers = max(1, int(maxWorkers))
+        self._pool = ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix="imswitch-api")
+        self._defaultLimit = int(maxConcurrentPerController)
+        self._limits = dict(controllerLimits or {})
+        self._jobHistory = max(1, int(jobHistory))
+        self._slots: Dict[str, _ControllerSlots] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._countersLock = threading.Lock()
+        self._latency = LatencyTracker()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._jobsLock = threading.Lock()
+        self._jobsEventLoop = None
+
+    def getLimit(self, controller: str) -> int:
+        return self._limits.get(controller, self._defaultLimit)
+
+    def setLimit(self, controller: str, limit: int) -> None:
+        """ Changes the concurrency limit of a controller (applies to new calls). """
+        self._limits[controller] = int(limit)
+        self._slots.pop(controller, None)
+
+    def setControllerDefault(self, controller: str, limit: int) -> None:
+        """ Limit a controller asks for (its apiConcurrency), used unless the
+        limit was configured explicitly. """
+        if controller not in self._limits:
+            self.setLimit(controller, limit)
+
+    def _controllerSlots(self, controller: str) -> Optional[_ControllerSlots]:
+        limit = self.getLimit(controller)
+        if limit <= 0:
+            return None
+        slots = self._slots.get(controller)
+        if slots is None:
+            slots = self._slots.setdefault(controller, _ControllerSlots(limit))
+        return slots
+
+    def _count(self, controller: str, key: str, delta: int = 1) -> None:
+        with self._countersLock:
+            counters = self._counters.setdefault(
+                controller, {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+            )
+            counters[key] += delta
+
+    def _execute(self, controller: str, name: str, call: Callable, tQueued: float,
+                 job: Optional[Dict[str, Any]]):
+        """ Runs in a pool thread. """
+        tStart = time.perf_counter()
+        self._count(controller, "queued", -1)
+        self._count(controller, "running", 1)
+        self._latency.record_since(f"{controller}/queue_wait", tQueued, tStart)
+        if job is not None:
+            job["status"] = "running"
+            job["started"] = time.time()
+        try:
+            result = call()
+        except BaseException:
+            self._count(controller, "failed", 1)
+            raise
+        else:
+            self._count(controller, "completed", 1)
+            return result
+        finally:
+            self._count(controller, "running", -1)
+            self._latency.record_since(f"{controller}/{name}", tStart, time.perf_counter())
+
+    async def run(self, controller: str, name: str, func: Callable, *args,
+                  _job: Optional[Dict[str, Any]] = None, **kwargs) -> Any:
+        """ Calls func(*args, **kwargs) in the pool once the controller has a
+        free slot and returns its result. Must be awaited on the event loop. """
+        tQueued = time.perf_counter()
+        self._count(controller, "queued", 1)
+        started = False
+        slots = self._controllerSlots(controller)
+        try:
+            if slots is not None:
+                await slots.acquire()
+            try:
+                future = self._pool.submit(self._execute, controller, name,
+                                           functools.partial(func, *args, **kwargs), tQueued, _job)
+            except BaseException:
+                if slots is not None:
+                    slots.release()
+                raise
+            started = True
+            # Keep the slot until the call has really finished, even if
+            # the request is cancelled (e.g. the client disconnected)
+            future.add_done_callback(functools.partial(self._callDone, controller, slots))
+            return await asyncio.wrap_future(future)
+        finally:
+            if not started:
+                # Cancelled while waiting for a slot
+                self._count(controller, "queued", -1)
+
+    def _callDone(self, controller: str, slots: Optional[_ControllerSlots], future) -> None:
+        if future.cancelled():
+            # Cancelled before _execute ran, so it is still counted as queued
+            self._count(controller, "queued", -1)
+        if slots is not None:
+            slots.release()
+
+    # Jobs
+
+    def _jobLoop(self) -> asyncio.AbstractEventLoop:
+        """ Event loop of the thread that schedules jobs, independent of the
+        lifetime of the request that submitted them. """
+        with self._jobsLock:
+            if self._jobsEventLoop is None:
+                self._jobsEventLoop = asyncio.new_event_loop()
+                threading.Thread(target=self._jobsEventLoop.run_forever,
+                                 name="imswitch-api-jobs", daemon=True).start()
+            return self._jobsEventLoop
+
+    def submitJob(self, controller: str, name: str, func: Callable, **kwargs) -> Dict[str, Any]:
+        """ Starts a call in the background and returns its job description
+        (use getJob/getJobResult with its "jobId"). """
+        job = {
+            "jobId": uuid.uuid4().hex,
+            "endpoint": f"/{controller}/{name}",
+            "status": "queued",
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "error": None,
+        }
+        record = dict(job, result=None)
+
+        def done(task):
+            record["finished"] = time.time()
+            if task.cancelled():
+                record["status"] = "cancelled"
+            elif task.exception() is not None:
+                record["status"] = "failed"
+                record["error"] = repr(task.exception())
+            else:
+                record["status"] = "done"
+                record["result"] = task.result()
+            self._pruneJobs()
+
+        with self._jobsLock:
+            self._jobs[job["jobId"]] = record
+        task = asyncio.run_coroutine_threadsafe(
+            self.run(controller, name, func, _job=record, **kwargs), self._jobLoop()
+        )
+        record["_task"] = task
+        task.add_done_callback(done)
+        return job
+
+    def _pruneJobs(self) -> None:
+        with self._jobsLock:
+            finished = [jobId for jobId, job in self._jobs.items() if job["finished"] is not None]
+            for jobId in finished[:max(0, len(finished) - self._jobHistory)]:
+                del self._jobs[jobId]
+
+    def getJob(self, jobId: str) -> Optional[Dict[str, Any]]:
+        """ Status of a job without its result, None if unknown. """
+        job = self._jobs.get(jobId)
+        if job is None:
+            return None
+        return {key: value for key, value in job.items() if key not in ("result", "_task")}
+
+    def getJobResult(self, jobId: str) -> Any:
+        """ Result of a finished job. Raises KeyError if the job is unknown. """
+        return self._jobs[jobId]["result"]
+
+    def cancelJob(self, jobId: str) -> bool:
+        """ Cancels a job that has not started yet. """
+        job = self._jobs.get(jobId)
+        if job is None or job["status"] != "queued":
+            return False
+        return job["_task"].cancel()
+
+    def listJobs(self) -> list:
+        return [self.getJob(jobId) for jobId in list(self._jobs)]
+
+    # Statistics
+
+    def getStats(self, includeBins: bool = False) -> Dict[str, Any]:
+        """ Queue depth and load per controller and call latencies in ms
+        ("<controller>/queue_wait" and "<controller>/<method>"). """
+        with self._countersLock:
+            controllers = {
+                controller: dict(counters, limit=self.getLimit(controller))
+                for controller, counters in self._counters.items()
+            }
+        return {
+            "maxWorkers": self.maxWorkers,
+            "defaultControllerLimit": self._defaultLimit,
+            "queueDepth": sum(c["queued"] for c in controllers.values()),
+            "running": sum(c["running"] for c in controllers.values()),
+            "controllers": controllers,
+            "latency": self._latency.to_dict(includeBins),
+            "jobs": {
+                status: sum(1 for job in list(self._jobs.values()) if job["status"] == status)
+                for status in ("queued", "running", "done", "failed", "cancelled")
+            },
+        }
+
+    def resetStats(self) -> None:
+        self._latency.reset()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
+        if self._jobsEventLoop is not None:
+            self._jobsEventLoop.call_soon_threadsafe(self._jobsEventLoop.stop)
+
+
+# Copyright (C) 2020-2024 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -1,9 +1,12 @@
 from .Options import Options
 from .SetupInfo import DeviceInfo, DetectorInfo, LaserInfo, PositionerInfo, ScanInfo, SetupInfo
 from .errors import *
-from .managers import *
+from . import managers
 from .signaldesigners import SignalDesignerFactory
-import sys
 
-#sys.modules['visa'] = 'pyvisa'
 
+def __getattr__(name):
+    # Managers are imported on first use, see managers/__init__.py
+    if name in managers.__all__:
+        return getattr(managers, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -75,6 +75,7 @@ class CameraHIK:
         self.NBuffer = 5
         self.frame_buffer = collections.deque(maxlen=self.NBuffer)
         self.frameid_buffer = collections.deque(maxlen=self.NBuffer)
+        self.onFrame = None  # optional callback(frame, fid, ts), e.g. DetectorManager.pushFrame
         self.flatfieldImage = None
         self.camera = None
         self.DEBUG = False
@@ -304,6 +305,8 @@ class CameraHIK:
         self.frameid_buffer.append(fid)
         self.frameNumber = fid
         self.timestamp   = ts
+        if self.onFrame is not None:
+            self.onFrame(frame, fid, ts)
         if self.DEBUG:
             print("frame received:", fid, "timestamp:", ts, "mean:", np.mean(frame), "from camera name: ", self.mParameters.get("model_name", "Unknown"))
 
@@ -1,5 +1,6 @@
 from time import sleep
 import threading
+import time
 import numpy as np
 from imswitch.imcommon.framework import Mutex, Signal, SignalInterface, Thread, Timer, Worker
 from .MultiManager import MultiManager
@@ -16,8 +17,10 @@ class DetectorsManager(MultiManager, SignalInterface):
     sigNewFrame = Signal()
 
     detectorParams = {}
+
+    LIVEVIEW_MODES = ('timer', 'push')
     
-    def __init__(self, detectorInfos, updatePeriod, **lowLevelManagers):
+    def __init__(self, detectorInfos, updatePeriod, liveViewMode='timer', **lowLevelManagers):
         MultiManager.__init__(self, detectorInfos, 'detectors', **lowLevelManagers)
         SignalInterface.__init__(self)
 
@@ -29,7 +32,8 @@ class DetectorsManager(MultiManager, SignalInterface):
 
         self.detectorParams["compressionlevel"]=80
 
-        for detectorName, detectorInfo in detectorInfos.items():
+        # Detectors that failed to initialize are not in _subManagers
+        for detectorName in list(self._subManagers):
             if not self._subManagers[detectorName].forAcquisition:
                 continue
             # Connect signals
@@ -56,7 +60,7 @@ class DetectorsManager(MultiManager, SignalInterface):
                 self._currentDetectorName = detectorName
 
         # A timer will collect the new frame and update it through the communication channel
-        self._lvWorker = LVWorker(self, updatePeriod)
+        self._lvWorker = LVWorker(self, updatePeriod, liveViewMode)
         self._thread = Thread()
         self._lvWorker.moveToThread(self._thread)
         self._thread.started.connect(self._lvWorker.run)
@@ -190,32 +194,149 @@ class DetectorsManager(MultiManager, SignalInterface):
         self._thread.wait()
         self._thread.start()
 
+    def getLiveViewMode(self):
+        """ Returns the live view mode ('timer' or 'push'). """
+        return self._lvWorker.mode
+
+    def setLiveViewMode(self, mode, updatePeriod=None):
+        """ Sets how the live view is fed. In 'timer' mode the latest frame
+        of every detector is polled each update period. In 'push' mode,
+        detectors that deliver frames into their ring buffer update the
+        preview from their new-frame callback, coalesced to at most one
+        update per update period; other detectors keep being polled. """
+        if mode not in self.LIVEVIEW_MODES:
+            raise ValueError(f'Invalid live view mode "{mode}", expected one of'
+                             f' {self.LIVEVIEW_MODES}')
+        self._lvWorker.setMode(mode)
+        if updatePeriod is not None:
+            self._lvWorker.setUpdatePeriod(updatePeriod)
+        self._restartLiveView()
+
+    def getPreviewStats(self):
+        """ Returns the live view mode, update period and the preview latency
+        statistics of all acquisition detectors. """
+        return {
+            'mode': self._lvWorker.mode,
+            'updatePeriod': self._lvWorker.updatePeriod,
+            'detectors': self.execOnAll(lambda c: c.getPreviewStats(),
+                                        condition=lambda c: c.forAcquisition),
+        }
+
+    def _restartLiveView(self):
+        if not self._thread.isRunning():
+            return
+        self._thread.quit()
+        self._thread.wait()
+        self._thread.start()
+
+
 class LVWorker(Worker):
-    def __init__(self, detectorsManager, updatePeriod):
+    def __init__(self, detectorsManager, updatePeriod, mode='timer'):
         super().__init__()
         self._detectorsManager = detectorsManager
         self._updatePeriod = updatePeriod
+        self._mode = mode
         self._vtimer = None
 
+        # Push mode state
+        self._listeners = {}
+        self._pending = set()
+        self._pendingCondition = threading.Condition()
+        self._pushThread = None
+        self._pushRunning = False
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def updatePeriod(self):
+        return self._updatePeriod
+
     def run(self):
         print("start lvworker")
         self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(False),
                                          condition=lambda c: c.forAcquisition)
+        if self._mode == 'push':
+            self._startPush()
         self._vtimer = Timer()
-        self._vtimer.timeout.connect(
-            lambda: self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(True),
-                                                     condition=lambda c: c.forAcquisition)
-        )
+        self._vtimer.timeout.connect(self._pollDetectors)
         self._vtimer.start(self._updatePeriod)
 
     def stop(self):
         print("stop lvworker")
         if self._vtimer is not None:
             self._vtimer.stop()
+        self._stopPush()
 
     def setUpdatePeriod(self, updatePeriod):
         self._updatePeriod = updatePeriod
 
+    def setMode(self, mode):
+        self._mode = mode
+
+    def _isPushed(self, detector):
+        # A detector is served by the push loop once frames arrive in its ring buffer
+        return detector.name in self._listeners and detector.frameBuffer.allocated
+
+    def _pollDetectors(self):
+        self._detectorsManager.execOnAll(
+            lambda c: c.updateLatestFrame(True),
+            condition=lambda c: c.forAcquisition and not self._isPushed(c)
+        )
+
+    def _startPush(self):
+        self._pushRunning = True
+        for detectorName in self._detectorsManager.getAllDeviceNames(lambda c: c.forAcquisition):
+            def listener(frameId, timestamp, detectorName=detectorName):
+                with self._pendingCondition:
+                    self._pending.add(detectorName)
+                    self._pendingCondition.notify()
+            self._listeners[detectorName] = listener
+            self._detectorsManager[detectorName].addFrameListener(listener)
+        self._pushThread = threading.Thread(target=self._pushLoop, name='LVWorkerPush',
+                                            daemon=True)
+        self._pushThread.start()
+
+    def _stopPush(self):
+        for detectorName, listener in self._listeners.items():
+            self._detectorsManager[detectorName].removeFrameListener(listener)
+        self._listeners = {}
+        with self._pendingCondition:
+            self._pushRunning = False
+            self._pending.clear()
+            self._pendingCondition.notify_all()
+        if self._pushThread is not None and self._pushThread is not threading.current_thread():
+            self._pushThread.join(timeout=1)
+        self._pushThread = None
+
+    def _pushLoop(self):
+        lastUpdate = {}
+        while True:
+            with self._pendingCondition:
+                while self._pushRunning and not self._pending:
+                    self._pendingCondition.wait()
+                if not self._pushRunning:
+                    return
+
+                # Coalesce: frames arriving until the next update slot only
+                # mark the detector as pending once
+                now = time.monotonic()
+                period = self._updatePeriod / 1000
+                due = {name: lastUpdate.get(name, 0) + period for name in self._pending}
+                ready = [name for name, t in due.items() if t <= now]
+                if not ready:
+                    self._pendingCondition.wait(min(due.values()) - now)
+                    continue
+                self._pending.difference_update(ready)
+
+            for detectorName in ready:
+                lastUpdate[detectorName] = time.monotonic()
+                self._detectorsManager.execOn(
+                    detectorName, lambda c: c.updateLatestFrame(True, fromFrameBuffer=True)
+                )
+
+
 class NoDetectorsError(RuntimeError):
     """ Error raised when a function related to the current detector is called
     if the DetectorsManager doesn't manage any detectors (i.e. the manager is
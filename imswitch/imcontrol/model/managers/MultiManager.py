@@ -1,44 +1,97 @@
 import importlib
 from abc import ABC, abstractmethod
-from imswitch.imcommon.model import initLogger
+
+from imswitch.config import get_config
+from imswitch.imcommon.model import initLogger, startupProfiler, ParallelInit
 
 from imswitch.imcommon.model import pythontools
 
-import pkg_resources
 
 class MultiManager(ABC):
     """ Abstract class for a manager used to control a group of sub-managers.
-    Intended to be extended for each type of manager. """
+    Intended to be extended for each type of manager.
+
+    In headless mode the sub-managers are constructed concurrently (see
+    ParallelInit). Devices that use the same RS232 device or the same manager
+    class are constructed one after another. The managerProperties of a
+    device may set "initTimeout" (seconds, overrides the global
+    device_init_timeout) and "optional" (a failure is only a warning). """
 
     @abstractmethod
     def __init__(self, managedDeviceInfos, subManagersPackage, **lowLevelManagers):
         self.__logger = initLogger(self, instanceName='MultiManager')
         self._subManagers = {}
+        self._failedDevices = {}
         currentPackage = '.'.join(__name__.split('.')[:-1])
-        if managedDeviceInfos:
-            for managedDeviceName, managedDeviceInfo in managedDeviceInfos.items():
-                # Create sub-manager
-                #self.__logger.debug(f'{currentPackage}.{subManagersPackage}, {managedDeviceInfo.managerName}')
-                #self.__logger.debug(managedDeviceInfo)
-                try:
-                    package = importlib.import_module(
-                        pythontools.joinModulePath(f'{currentPackage}.{subManagersPackage}',
-                                                managedDeviceInfo.managerName)
-                    )
-                    manager = getattr(package, managedDeviceInfo.managerName)
+        if not managedDeviceInfos:
+            return
+
+        config = get_config()
+        init = ParallelInit(f'{type(self).__name__}',
+                            parallel=config.parallel_init and config.is_headless)
+
+        def createSubManager(managedDeviceName, managedDeviceInfo):
+            # Create sub-manager
+            #self.__logger.debug(f'{currentPackage}.{subManagersPackage}, {managedDeviceInfo.managerName}')
+            #self.__logger.debug(managedDeviceInfo)
+            with startupProfiler.measure('import', managedDeviceInfo.managerName):
+                package = importlib.import_module(
+                    pythontools.joinModulePath(f'{currentPackage}.{subManagersPackage}',
+                                            managedDeviceInfo.managerName)
+                )
+            manager = getattr(package, managedDeviceInfo.managerName)
+            return manager(managedDeviceInfo, managedDeviceName, **lowLevelManagers)
+
+        def finalizeLate(subManager):
+            # Constructed after its timeout, release the hardware again
+            if hasattr(subManager, 'finalize') and callable(subManager.finalize):
+                subManager.finalize()
+
+        for managedDeviceName, managedDeviceInfo in managedDeviceInfos.items():
+            properties = managedDeviceInfo.managerProperties or {}
+            resources = [f'manager:{managedDeviceInfo.managerName}']
+            if subManagersPackage == 'rs232s':
+                resources.append(f'rs232:{managedDeviceName}')
+            elif properties.get('rs232device'):
+                resources.append(f'rs232:{properties["rs232device"]}')
+            init.add(
+                f'{managedDeviceInfo.managerName} ({managedDeviceName})',
+                lambda name=managedDeviceName, info=managedDeviceInfo: createSubManager(name, info),
+                timeout=properties.get('initTimeout', config.device_init_timeout),
+                optional=True,  # failures are handled below
+                resources=resources,
+                onLate=finalizeLate,
+            )
+        init.run()
+
+        # Keep the order of the setup file, e.g. the first detector is the default one
+        for (managedDeviceName, managedDeviceInfo), task in zip(managedDeviceInfos.items(),
+                                                                init.tasks.values()):
+            if task.status == 'done':
+                self._subManagers[managedDeviceName] = task.value
+                continue
+
+            optional = bool((managedDeviceInfo.managerProperties or {}).get('optional', False))
+            message = f'Could not initialize {task.name}: {task.error}'
+            if optional:
+                self.__logger.warning(f'{message} (optional, continuing without it)')
+            else:
+                self.__logger.error(message)
+            self._failedDevices[managedDeviceName] = {
+                'status': task.status, 'error': task.error, 'optional': optional
+            }
+            if task.status == 'timeout':
+                continue
+
+            # try to import from the implugins
+            try:
+                for entry_point in pythontools.iterEntryPoints(f'imswitch.implugins.{subManagersPackage}'):
+                    manager = entry_point.load()
                     self._subManagers[managedDeviceName] = manager(
                         managedDeviceInfo, managedDeviceName, **lowLevelManagers)
-
-                except Exception as e:
-                    # try to import from the implugins
-                    self.__logger.error(e)
-                    try:
-                        for entry_point in pkg_resources.iter_entry_points(f'imswitch.implugins.{subManagersPackage}'):
-                            manager = entry_point.load()
-                            self._subManagers[managedDeviceName] = manager(
-                                managedDeviceInfo, managedDeviceName, **lowLevelManagers)
-                    except Exception as e:
-                        self.__logger.error(e)
+                    self._failedDevices.pop(managedDeviceName, None)
+            except Exception as e:
+                self.__logger.error(e)
 
     def hasDevices(self):
         """ Returns whether this manager manages any devices. """
@@ -69,6 +122,11 @@ class MultiManager(ABC):
                 for managedDeviceName, subManager in self._subManagers.items()
                 if condition(subManager)}
 
+    def getFailedDevices(self):
+        """ Returns the devices that could not be initialized with their
+        status ("failed" or "timeout") and error. """
+        return dict(self._failedDevices)
+
     def finalize(self):
         """ Close/cleanup sub-managers. """
         for subManager in self._subManagers.values():
@@ -1,5 +1,7 @@
+import collections
 import enum
 import os
+import threading
 import time
 from io import BytesIO
 from typing import Dict, Optional, Type, List
@@ -177,6 +179,255 @@ class MP4Storer(Storer):
         pass
 
 
+class FrameWriter(abc.ABC):
+    """ Writes batches of frames of one detector to a recording file. """
+
+    @abc.abstractmethod
+    def write(self, frames: np.ndarray):
+        """ Appends a batch of frames (first axis is the frame index). """
+        raise NotImplementedError
+
+    def close(self):
+        """ Finalizes the recording. """
+        pass
+
+
+def _frameChunks(frameShape, itemsize, maxChunkBytes=4 * 1024 ** 2):
+    """ Returns a chunk shape holding (a tile of) a single frame. The frame is
+    halved along its larger spatial axis until a chunk fits into
+    maxChunkBytes, so that every batch write touches whole chunks only. """
+    height, width = frameShape[0], frameShape[1]
+    rest = tuple(frameShape[2:])
+    restSize = int(np.prod(rest)) if rest else 1
+    while height * width * restSize * itemsize > maxChunkBytes and max(height, width) > 64:
+        if height >= width:
+            height = (height + 1) // 2
+        else:
+            width = (width + 1) // 2
+    return (1, height, width) + rest
+
+
+class _DatasetFrameWriter(FrameWriter):
+    """ Writes frames into a preallocated, chunked (n, y, x) dataset that is
+    created with the dtype and shape of the first batch. If the number of
+    frames is not known in advance, the dataset grows geometrically. The
+    dataset is trimmed to the number of written frames on close. """
+
+    growthFrames = 64
+
+    def __init__(self, group, datasetName, frameShape, attrs=None, numFrames=None):
+        self.group = group
+        self.datasetName = datasetName
+        self.frameShape = tuple(frameShape)
+        self.attrs = attrs or {}
+        self.numFrames = numFrames
+        self.dataset = None
+        self.framesWritten = 0
+
+    def _create(self, frameShape, dtype, numFrames):
+        raise NotImplementedError
+
+    def _resize(self, numFrames):
+        raise NotImplementedError
+
+    def _createDataset(self, frameShape, dtype):
+        numFrames = self.numFrames or self.growthFrames
+        self.dataset = self._create(frameShape, dtype, numFrames)
+        for key, value in self.attrs.items():
+            try:
+                self.dataset.attrs[key] = value
+            except Exception:
+                logger.debug(f'Could not put key:value pair {key}:{value} in metadata.')
+        self.dataset.attrs['writing'] = True
+
+    def write(self, frames):
+        if self.dataset is None:
+            self._createDataset(frames.shape[1:], frames.dtype)
+        start = self.framesWritten
+        stop = start + len(frames)
+        if stop > self.dataset.shape[0]:
+            self._resize(max(stop, 2 * self.dataset.shape[0]))
+        self.dataset[start:stop] = frames
+        self.framesWritten = stop
+
+    def close(self):
+        if self.dataset is None:
+            # No frames captured, keep an empty dataset
+            self._createDataset(self.frameShape, np.uint16)
+        if self.dataset.shape[0] != self.framesWritten:
+            self._resize(self.framesWritten)
+        self.dataset.attrs['writing'] = False
+
+
+class HDF5FrameWriter(_DatasetFrameWriter):
+    """ Writes frames into a chunked HDF5 dataset. """
+
+    def _create(self, frameShape, dtype, numFrames):
+        frameShape = tuple(frameShape)
+        return self.group.create_dataset(
+            self.datasetName, (numFrames, *frameShape), maxshape=(None, *frameShape),
+            dtype=dtype, chunks=_frameChunks(frameShape, np.dtype(dtype).itemsize)
+        )
+
+    def _resize(self, numFrames):
+        self.dataset.resize(numFrames, axis=0)
+
+
+class ZarrFrameWriter(_DatasetFrameWriter):
+    """ Writes frames into a chunked Zarr array. """
+
+    def _create(self, frameShape, dtype, numFrames):
+        frameShape = tuple(frameShape)
+        create = getattr(self.group, 'create_array', None) or self.group.create_dataset
+        return create(self.datasetName, shape=(numFrames, *frameShape), dtype=dtype,
+                      chunks=_frameChunks(frameShape, np.dtype(dtype).itemsize))
+
+    def _resize(self, numFrames):
+        self.dataset.resize((numFrames, *self.dataset.shape[1:]))
+
+
+class TiffFrameWriter(FrameWriter):
+    """ Appends frames to a BigTIFF file that stays open for the whole
+    recording. """
+
+    def __init__(self, filePath):
+        self.filePath = filePath
+        self._writer = tiff.TiffWriter(filePath, bigtiff=True)
+
+    def write(self, frames):
+        for frame in frames:
+            self._writer.write(frame, contiguous=True)
+
+    def close(self):
+        self._writer.close()
+
+
+class MP4FrameWriter(FrameWriter):
+    """ Writes frames as 8 bit BGR to an MP4 video. """
+
+    def __init__(self, filePath, frameSize, fps=20.0):
+        self.filePath = filePath
+        self._writer = cv2.VideoWriter(filePath, cv2.VideoWriter_fourcc(*'mp4v'), fps, frameSize)
+
+    def write(self, frames):
+        for frame in frames:
+            # https://stackoverflow.com/questions/30509573/writing-an-mp4-video-using-python-opencv
+            self._writer.write(cv2.cvtColor(cv2.convertScaleAbs(frame), cv2.COLOR_GRAY2BGR))
+
+    def close(self):
+        self._writer.release()
+
+
+class BackgroundFrameWriter:
+    """ Runs a FrameWriter on its own thread, fed by a queue that is bounded
+    in bytes. When the queue is full, submit() blocks until the writer caught
+    up (backpressure, the frames pile up in the camera buffer instead) or,
+    with dropWhenFull, discards the batch and counts the frames as dropped. """
+
+    def __init__(self, writer: FrameWriter, name='', maxQueueBytes=512 * 1024 ** 2,
+                 dropWhenFull=False):
+        self.writer = writer
+        self.name = name
+        self.maxQueueBytes = maxQueueBytes
+        self.dropWhenFull = dropWhenFull
+        self.error = None
+
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._closing = False
+        self._queuedBytes = 0
+        self._maxQueuedBytes = 0
+        self._framesWritten = 0
+        self._bytesWritten = 0
+        self._framesDropped = 0
+        self._writeTime = 0.0
+        self._blockedTime = 0.0
+        self._startTime = time.time()
+        self._endTime = None
+
+        self._thread = threading.Thread(target=self._run, name=f'FrameWriter-{name}',
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, frames: np.ndarray) -> bool:
+        """ Queues a batch of frames. Returns False if the batch was dropped. """
+        nbytes = frames.nbytes
+        with self._condition:
+            if self.error is not None:
+                self._framesDropped += len(frames)
+                return False
+            if self._queuedBytes > 0 and self._queuedBytes + nbytes > self.maxQueueBytes:
+                if self.dropWhenFull:
+                    self._framesDropped += len(frames)
+                    return False
+                blockedSince = time.perf_counter()
+                while (self._queuedBytes > 0 and self._queuedBytes + nbytes > self.maxQueueBytes
+                       and self.error is None):
+                    self._condition.wait()
+                self._blockedTime += time.perf_counter() - blockedSince
+            self._queue.append(frames)
+            self._queuedBytes += nbytes
+            self._maxQueuedBytes = max(self._maxQueuedBytes, self._queuedBytes)
+            self._condition.notify_all()
+        return True
+
+    def close(self):
+        """ Writes all queued frames, then closes the writer. """
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.writer.close()
+        self._endTime = time.time()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closing:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                frames = self._queue[0]
+
+            writeStart = time.perf_counter()
+            try:
+                if self.error is None:
+                    self.writer.write(frames)
+            except Exception as e:
+                logger.error(f'Writing frames of {self.name} failed: {e}')
+                self.error = e
+            writeTime = time.perf_counter() - writeStart
+
+            with self._condition:
+                self._queue.popleft()
+                self._queuedBytes -= frames.nbytes
+                if self.error is None:
+                    self._framesWritten += len(frames)
+                    self._bytesWritten += frames.nbytes
+                    self._writeTime += writeTime
+                else:
+                    self._framesDropped += len(frames)
+                self._condition.notify_all()
+
+    def getStats(self) -> dict:
+        """ Returns the sustained and disk write throughput (MB/s), queue fill
+        level and the number of dropped frames. """
+        with self._condition:
+            elapsed = (self._endTime or time.time()) - self._startTime
+            return {
+                'framesWritten': self._framesWritten,
+                'framesDropped': self._framesDropped,
+                'queuedFrames': sum(len(frames) for frames in self._queue),
+                'queuedMB': self._queuedBytes / 1024 ** 2,
+                'maxQueuedMB': self._maxQueuedBytes / 1024 ** 2,
+                'sustainedMBps': self._bytesWritten / 1024 ** 2 / elapsed if elapsed > 0 else 0.0,
+                'writeMBps': (self._bytesWritten / 1024 ** 2 / self._writeTime
+                              if self._writeTime > 0 else 0.0),
+                'blockedSeconds': self._blockedTime,
+                'error': None if self.error is None else str(self.error),
+            }
+
+
 class SaveMode(enum.Enum):
     Disk = 1
     RAM = 2
@@ -293,6 +544,21 @@ class RecordingManager(SignalInterface):
         if wait:
             self._thread.wait()
 
+    def getRecordingStats(self):
+        """ Returns per detector the sustained write throughput (MB/s), the
+        writer queue fill level and the number of dropped frames of the
+        current (or last) recording. """
+        return self.__recordingWorker.getStats()
+
+    def setWriterOptions(self, maxQueueMB=None, dropWhenFull=None):
+        """ Sets the writer queue size per detector and whether frames are
+        dropped (instead of blocking the recording loop) when it is full.
+        Applies to the next recording. """
+        if maxQueueMB is not None:
+            self.__recordingWorker.maxQueueBytes = int(maxQueueMB * 1024 ** 2)
+        if dropWhenFull is not None:
+            self.__recordingWorker.dropWhenFull = dropWhenFull
+
     def snap(self, detectorNames=None, savename="", saveMode=SaveMode.Disk, saveFormat=SaveFormat.TIFF, attrs=None):
         """ Saves an image with the specified detectors to a file
         with the specified name prefix, save mode, file format and attributes
@@ -402,330 +668,18 @@ class RecordingManager(SignalInterface):
 
 
 class RecordingWorker(Worker):
-    def __init__(self, recordingManager):
-        super().__init__()
-        self.__logger = initLogger(self)
-        self.__recordingManager = recordingManager
-        self.__logger = initLogger(self)
-
-    def run(self):
-        acqHandle = self.__recordingManager.detectorsManager.startAcquisition()
-        try:
-            self._record()
-
-        finally:
-            self.__recordingManager.detectorsManager.stopAcquisition(acqHandle)
-
-    def _record(self):
-        if self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
-            files, fileDests, filePaths = self._getFiles()
-
-        shapes = {detectorName: self.__recordingManager.detectorsManager[detectorName].shape
-                  for detectorName in self.detectorNames}
-
-        currentFrame = {}
-        datasets = {}
-        filenames = {}
-
-        for detectorName in self.detectorNames:
-            currentFrame[detectorName] = 0
-
-            datasetName = detectorName
-            if self.recMode == RecMode.ScanLapse and self.singleLapseFile:
-                # Add scan number to dataset name
-                scanNum = 0
-                datasetNameWithScan = f'{datasetName}_scan{scanNum}'
-                while datasetNameWithScan in files[detectorName]:
-                    scanNum += 1
-                    datasetNameWithScan = f'{datasetName}_scan{scanNum}'
-                datasetName = datasetNameWithScan
-
-            # Initial number of frames must not be 0; otherwise, too much disk space may get
-            # allocated. We remove this default frame later on if no frames are captured.
-            shape = shapes[detectorName]
-            if len(shape) > 2:
-                shape = shape[-2:]
-
-            if self.saveFormat == SaveFormat.HDF5:
-                # Initial number of frames must not be 0; otherwise, too much disk space may get
-                # allocated. We remove this default frame later on if no frames are captured.
-                datasets[detectorName] = files[detectorName].create_dataset(
-                    datasetName, (1, *reversed(shape)),
-                    maxshape=(None, *reversed(shape)),
-                    dtype='i2'
-                )
-
-                for key, value in self.attrs[detectorName].items():
-                    datasets[detectorName].attrs[key] = value
-
-                datasets[detectorName].attrs['detector_name'] = detectorName
-
-                # For ImageJ compatibility
-                datasets[detectorName].attrs['element_size_um'] \
-                    = self.__recordingManager.detectorsManager[detectorName].pixelSizeUm
-                datasets[detectorName].attrs['writing'] = True
-
-            elif self.saveFormat == SaveFormat.TIFF:
-                fileExtension = str(self.saveFormat.name).lower()
-                filenames[detectorName] = self.__recordingManager.getSaveFilePath(
-                    f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-
-            elif self.saveFormat == SaveFormat.ZARR:
-                if not IS_OME_ZARR:
-                    logger.error("OME Zarr is not installed. Please install ome-zarr.")
-                    return
-                datasets[detectorName] = files[detectorName].create_dataset(datasetName, shape=(1, *reversed(shape)),
-                                                                            dtype='i2', chunks=(1, 512, 512)
-                                                                            )
-                datasets[detectorName].attrs['detector_name'] = detectorName
-                # For ImageJ compatibility
-                datasets[detectorName].attrs['element_size_um'] \
-                    = self.__recordingManager.detectorsManager[detectorName].pixelSizeUm
-                datasets[detectorName].attrs['writing'] = True
-                info: List[dict] = [{"path": datasetName, "transformation": None}]
-                write_multiscales_metadata(files[detectorName], info, format_from_version("0.2"), shape, **self.attrs[detectorName])
-
-        self.__recordingManager.sigRecordingStarted.emit()
-        try:
-            if len(self.detectorNames) < 1:
-                raise ValueError('No detectors to record specified')
-
-            if self.recMode in [RecMode.SpecFrames, RecMode.ScanOnce, RecMode.ScanLapse]:
-                recFrames = self.recFrames
-                if recFrames is None:
-                    raise ValueError('recFrames must be specified in SpecFrames, ScanOnce or'
-                                     ' ScanLapse mode')
-
-                while (self.__recordingManager.record and
-                       any([currentFrame[detectorName] < recFrames
-                            for detectorName in self.detectorNames])):
-                    for detectorName in self.detectorNames:
-                        if currentFrame[detectorName] >= recFrames:
-                            continue  # Reached requested number of frames with this detector, skip
-
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-
-                        if n > 0:
-                            it = currentFrame[detectorName]
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-                            elif self.saveFormat == SaveFormat.HDF5:
-                                dataset = datasets[detectorName]
-                                if (it + n) <= recFrames:
-                                    dataset.resize(n + it, axis=0)
-                                    dataset[it:it + n, :, :] = newFrames
-                                    currentFrame[detectorName] += n
-                                else:
-                                    dataset.resize(recFrames, axis=0)
-                                    dataset[it:recFrames, :, :] = newFrames[0:recFrames - it]
-                                    currentFrame[detectorName] = recFrames
-                            elif self.saveFormat == SaveFormat.ZARR:
-                                dataset = datasets[detectorName]
-                                if it == 0:
-                                    dataset[0, :, :] = newFrames[0, :, :]
-                                    if n > 0:
-                                        dataset.append(newFrames[1:n, :, :])
-                                else:
-                                    dataset.append(newFrames)
-                                currentFrame[detectorName] += n
-
-                            # Things get a bit weird if we have multiple detectors when we report
-                            # the current frame number, since the detectors may not be synchronized.
-                            # For now, we will report the lowest number.
-                            self.__recordingManager.sigRecordingFrameNumUpdated.emit(
-                                min(list(currentFrame.values()))
-                            )
-                    time.sleep(0.0001)  # Prevents freezing for some reason
-
-                self.__recordingManager.sigRecordingFrameNumUpdated.emit(0)
-            elif self.recMode == RecMode.SpecTime:
-                recTime = self.recTime
-                if recTime is None:
-                    raise ValueError('recTime must be specified in SpecTime mode')
-
-                start = time.time()
-                currentRecTime = 0
-                shouldStop = False
-                while True:
-                    for detectorName in self.detectorNames:
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-                        if n > 0:
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-                            elif self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                dataset.resize(n + it, axis=0)
-                                dataset[it:it + n, :, :] = newFrames
-                            currentFrame[detectorName] += n
-                            self.__recordingManager.sigRecordingTimeUpdated.emit(
-                                np.around(currentRecTime, decimals=2)
-                            )
-                            currentRecTime = time.time() - start
-
-                    if shouldStop:
-                        break  # Enter loop one final time, then stop
-
-                    if not self.__recordingManager.record or currentRecTime >= recTime:
-                        shouldStop = True
-
-                    time.sleep(0.0001)  # Prevents freezing for some reason
+    # Upper bound of frame data waiting for the writer thread per detector
+    maxQueueBytes = 512 * 1024 ** 2
+    # Drop frames instead of blocking when a writer can't keep up
+    dropWhenFull = False
 
-                self.__recordingManager.sigRecordingTimeUpdated.emit(0)
-            elif self.recMode == RecMode.UntilStop:
-                shouldStop = False
-                while True:
-                    for detectorName in self.detectorNames:
-                        newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-                        if n > 0:
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-
-                            elif self.saveFormat == SaveFormat.HDF5:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                dataset.resize(n + it, axis=0)
-                                dataset[it:it + n, :, :] = newFrames
-
-                            elif self.saveFormat == SaveFormat.ZARR:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                if it == 0:
-                                    dataset[0, :, :] = newFrames[0, :, :]
-                                    if n > 0:
-                                        dataset.append(newFrames[1:n, :, :])
-                                else:
-                                    dataset.append(newFrames)
-
-                            currentFrame[detectorName] += n
-
-                    if shouldStop:
-                        break
-
-                    if not self.__recordingManager.record:
-                        shouldStop = True  # Enter loop one final time, then stop
-
-                    time.sleep(0.0001)  # Prevents freezing for some reason
-            else:
-                raise ValueError('Unsupported recording mode specified')
-        finally:
-
-            if self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
-                for detectorName, file in files.items():
-                    # Remove default frame if no frames have been captured
-                    if currentFrame[detectorName] < 1:
-                        if self.saveFormat == SaveFormat.HDF5:
-                            datasets[detectorName].resize(0, axis=0)
-
-                    # Handle memory recordings
-                    if self.saveMode == SaveMode.RAM or self.saveMode == SaveMode.DiskAndRAM:
-                        filePath = filePaths[detectorName]
-                        name = os.path.basename(filePath)
-                        if self.saveMode == SaveMode.RAM:
-                            file.close()
-                            self.__recordingManager.sigMemoryRecordingAvailable.emit(
-                                name, fileDests[detectorName], filePath, False
-                            )
-                        else:
-                            file.flush()
-                            self.__recordingManager.sigMemoryRecordingAvailable.emit(
-                                name, file, filePath, True
-                            )
-                    else:
-                        datasets[detectorName].attrs['writing'] = False
-                        if self.saveFormat == SaveFormat.HDF5:
-                            file.close()
-                        else:
-                            self.store.close()
-            emitSignal = True
-            if self.recMode in [RecMode.SpecFrames, RecMode.ScanOnce, RecMode.ScanLapse]:
-                emitSignal = False
-            self.__recordingManager.endRecording(emitSignal=emitSignal, wait=False)
-
-    def _getFiles(self):
-        singleMultiDetectorFile = self.singleMultiDetectorFile
-        singleLapseFile = self.recMode == RecMode.ScanLapse and self.singleLapseFile
-
-        files = {}
-        fileDests = {}
-        filePaths = {}
-        extension = 'hdf5' if self.saveFormat == SaveFormat.HDF5 else 'zarr'
-
-        for detectorName in self.detectorNames:
-            if singleMultiDetectorFile:
-                baseFilePath = f'{self.savename}.{extension}'
-            else:
-                baseFilePath = f'{self.savename}_{detectorName}.{extension}'
-
-            filePaths[detectorName] = self.__recordingManager.getSaveFilePath(
-                baseFilePath,
-                allowOverwriteDisk=singleLapseFile and self.saveMode != SaveMode.RAM,
-                allowOverwriteMem=singleLapseFile and self.saveMode == SaveMode.RAM
-            )
-
-        for detectorName in self.detectorNames:
-            if self.saveMode == SaveMode.RAM:
-                memRecordings = self.__recordingManager._memRecordings
-                if (filePaths[detectorName] not in memRecordings or
-                        memRecordings[filePaths[detectorName]].closed):
-                    memRecordings[filePaths[detectorName]] = BytesIO()
-                fileDests[detectorName] = memRecordings[filePaths[detectorName]]
-            else:
-                fileDests[detectorName] = filePaths[detectorName]
-
-            if singleMultiDetectorFile and len(files) > 0:
-                files[detectorName] = list(files.values())[0]
-            else:
-                if self.saveFormat == SaveFormat.HDF5:
-                    files[detectorName] = h5py.File(fileDests[detectorName],
-                                                    'a' if singleLapseFile else 'w-')
-                elif self.saveFormat == SaveFormat.ZARR:
-                    self.store = _create_zarr_store(fileDests[detectorName])
-                    files[detectorName] = zarr.group(store=self.store, overwrite=True)
-
-        return files, fileDests, filePaths
-
-    def _getNewFrames(self, detectorName):
-        newFrames, frameIndices = self.__recordingManager.detectorsManager[detectorName].getChunk()
-        newFrames = np.array(newFrames)
-        return newFrames
-
-class RecordingWorkerNoQt(Worker):
     def __init__(self, recordingManager):
         super().__init__()
         self.__logger = initLogger(self)
         self.__recordingManager = recordingManager
-        self.__logger = initLogger(self)
+        self.writers = {}
 
     def run(self):
-        self.__logger.info('Recording worker NoQT started')
         acqHandle = self.__recordingManager.detectorsManager.startAcquisition()
         try:
             self._record()
@@ -733,20 +687,63 @@ class RecordingWorkerNoQt(Worker):
         finally:
             self.__recordingManager.detectorsManager.stopAcquisition(acqHandle)
 
-    def moveToThread(self, thread) -> None:
-        return super().moveToThread(thread)
+    def getStats(self):
+        """ Returns the writer statistics of the current (or last) recording
+        per detector, including frames lost in the detector ring buffer. """
+        stats = {}
+        for detectorName, writer in self.writers.items():
+            stats[detectorName] = writer.getStats()
+            try:
+                consumers = self.__recordingManager.detectorsManager[
+                    detectorName].getFrameBufferInfo()['consumers']
+                stats[detectorName]['bufferOverruns'] = consumers['chunk']['overruns']
+            except KeyError:
+                pass
+        return stats
+
+    def _createFrameWriter(self, detectorName, datasetName, file, numFrames):
+        detectorManager = self.__recordingManager.detectorsManager[detectorName]
+        shape = detectorManager.shape
+        if len(shape) > 2:
+            shape = shape[-2:]
+        fileExtension = str(self.saveFormat.name).lower()
+
+        if self.saveFormat in (SaveFormat.HDF5, SaveFormat.ZARR):
+            attrs = dict(self.attrs[detectorName])
+            attrs['detector_name'] = detectorName
+            # For ImageJ compatibility
+            attrs['element_size_um'] = detectorManager.pixelSizeUm
+            if self.saveFormat == SaveFormat.HDF5:
+                return HDF5FrameWriter(file, datasetName, tuple(reversed(shape)), attrs, numFrames)
+            info: List[dict] = [{"path": datasetName, "transformation": None}]
+            write_multiscales_metadata(file, info, format_from_version("0.2"), shape,
+                                       **self.attrs[detectorName])
+            return ZarrFrameWriter(file, datasetName, tuple(reversed(shape)), attrs, numFrames)
+        elif self.saveFormat == SaveFormat.TIFF:
+            return TiffFrameWriter(self.__recordingManager.getSaveFilePath(
+                f'{self.savename}_{detectorName}.{fileExtension}', False, False))
+        elif self.saveFormat == SaveFormat.MP4:
+            filePath = self.__recordingManager.getSaveFilePath(
+                f'{self.savename}_{detectorName}.{fileExtension}')
+            self.__logger.debug("Saving Video to file: " + filePath)
+            return MP4FrameWriter(filePath, tuple(shape))
+        return None
 
     def _record(self):
-        self.__logger.info('Recording started in mode: ' + str(self.recMode))
+        files = {}
         if self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
+            if self.saveFormat == SaveFormat.ZARR and not IS_OME_ZARR:
+                logger.error("OME Zarr is not installed. Please install ome-zarr.")
+                self.__recordingManager.endRecording(wait=False)
+                return
             files, fileDests, filePaths = self._getFiles()
 
-        shapes = {detectorName: self.__recordingManager.detectorsManager[detectorName].shape
-                  for detectorName in self.detectorNames}
+        numFrames = None
+        if self.recMode in [RecMode.SpecFrames, RecMode.ScanOnce, RecMode.ScanLapse]:
+            numFrames = self.recFrames
 
         currentFrame = {}
-        datasets = {}
-        filenames = {}
+        self.writers = {}
 
         for detectorName in self.detectorNames:
             currentFrame[detectorName] = 0
@@ -761,85 +758,14 @@ class RecordingWorkerNoQt(Worker):
                     datasetNameWithScan = f'{datasetName}_scan{scanNum}'
                 datasetName = datasetNameWithScan
 
-            # Initial number of frames must not be 0; otherwise, too much disk space may get
-            # allocated. We remove this default frame later on if no frames are captured.
-            shape = shapes[detectorName]
-            if len(shape) > 2:
-                shape = shape[-2:]
-
-            if self.saveFormat == SaveFormat.HDF5:
-                # Initial number of frames must not be 0; otherwise, too much disk space may get
-                # allocated. We remove this default frame later on if no frames are captured.
-                datasets[detectorName] = files[detectorName].create_dataset(
-                    datasetName, (1, *reversed(shape)),
-                    maxshape=(None, *reversed(shape)),
-                    dtype='i2'
+            # Preallocated for numFrames (if known); written on a separate thread
+            writer = self._createFrameWriter(detectorName, datasetName, files.get(detectorName),
+                                             numFrames)
+            if writer is not None:
+                self.writers[detectorName] = BackgroundFrameWriter(
+                    writer, detectorName, self.maxQueueBytes, self.dropWhenFull
                 )
 
-                for key, value in self.attrs[detectorName].items():
-                    self.__logger.debug(key)
-                    self.__logger.debug(value)
-                    try:
-                        datasets[detectorName].attrs[key] = value
-                    except:
-                        pass
-
-                datasets[detectorName].attrs['detector_name'] = detectorName
-
-                # For ImageJ compatibility
-                datasets[detectorName].attrs['element_size_um'] \
-                    = self.__recordingManager.detectorsManager[detectorName].pixelSizeUm
-                datasets[detectorName].attrs['writing'] = True
-
-                for key, value in self.attrs[detectorName].items():
-                    try:
-                        datasets[detectorName].attrs[key] = value
-                    except:
-                        pass
-
-            elif self.saveFormat == SaveFormat.MP4:
-                # Need to initiliaze videowriter for each detector
-                self.__logger.debug("Initialize MP4 recorder")
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                fileExtension = str(self.saveFormat.name).lower()
-                filePath = self.__recordingManager.getSaveFilePath(f'{self.savename}_{detectorName}.{fileExtension}')
-                self.__logger.debug("Saving Video to file: " + filePath)
-                filenames[detectorName] = filePath
-                datasets[detectorName] = cv2.VideoWriter(filePath, fourcc, 20.0, shapes[detectorName])
-                #datasets[detectorName] = cv2.VideoWriter(filePath, cv2.VideoWriter_fourcc(*'MJPG'), 10, shapes[detectorName])
-
-
-            elif self.saveFormat == SaveFormat.TIFF:
-                fileExtension = str(self.saveFormat.name).lower()
-                filenames[detectorName] = self.__recordingManager.getSaveFilePath(
-                    f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-
-            elif self.saveFormat == SaveFormat.PNG:
-                fileExtension = str(self.saveFormat.name).lower()
-                filenames[detectorName] = self.__recordingManager.getSaveFilePath(
-                    f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-
-            elif self.saveFormat == SaveFormat.JPG:
-                fileExtension = str(self.saveFormat.name).lower()
-                filenames[detectorName] = self.__recordingManager.getSaveFilePath(
-                    f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-
-            elif self.saveFormat == SaveFormat.ZARR:
-                if not IS_OME_ZARR:
-                    logger.error("OME Zarr is not installed. Please install ome-zarr.")
-                    return
-                datasets[detectorName] = files[detectorName].create_dataset(datasetName, shape=(1, *reversed(shape)),
-                                                                            dtype='i2', chunks=(1, 512, 512)
-                                                                            )
-                datasets[detectorName].attrs['detector_name'] = detectorName
-                # For ImageJ compatibility
-                datasets[detectorName].attrs['element_size_um'] \
-                    = self.__recordingManager.detectorsManager[detectorName].pixelSizeUm
-                datasets[detectorName].attrs['writing'] = True
-                info: List[dict] = [{"path": datasetName, "transformation": None}]
-                write_multiscales_metadata(files[detectorName], info, format_from_version("0.2"), shape, **self.attrs[detectorName])
-
-
         self.__recordingManager.sigRecordingStarted.emit()
         try:
             if len(self.detectorNames) < 1:
@@ -859,48 +785,10 @@ class RecordingWorkerNoQt(Worker):
                             continue  # Reached requested number of frames with this detector, skip
 
                         newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-
-                        if n > 0:
-                            it = currentFrame[detectorName]
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-                            elif self.saveFormat == SaveFormat.HDF5:
-                                dataset = datasets[detectorName]
-                                if (it + n) <= recFrames:
-                                    dataset.resize(n + it, axis=0)
-                                    dataset[it:it + n, :, :] = newFrames
-                                    currentFrame[detectorName] += n
-                                else:
-                                    dataset.resize(recFrames, axis=0)
-                                    dataset[it:recFrames, :, :] = newFrames[0:recFrames - it]
-                                    currentFrame[detectorName] = recFrames
-                            elif self.saveFormat == SaveFormat.ZARR:
-                                dataset = datasets[detectorName]
-                                if it == 0:
-                                    dataset[0, :, :] = newFrames[0, :, :]
-                                    if n > 0:
-                                        dataset.append(newFrames[1:n, :, :])
-                                else:
-                                    dataset.append(newFrames)
-                                currentFrame[detectorName] += n
-                            elif self.saveFormat == SaveFormat.MP4:
-                                for iframe in range(n):
-                                    frame = newFrames[iframe,:,:]
-                                    #https://stackoverflow.com/questions/30509573/writing-an-mp4-video-using-python-opencv
-                                    frame = cv2.cvtColor(cv2.convertScaleAbs(frame), cv2.COLOR_GRAY2BGR)
-                                    self.__logger.debug(type(frame))
-
-                                    datasets[detectorName].write(frame)
-
+                        newFrames = newFrames[:recFrames - currentFrame[detectorName]]
+                        if len(newFrames) > 0:
+                            self._writeFrames(detectorName, newFrames)
+                            currentFrame[detectorName] += len(newFrames)
 
                             # Things get a bit weird if we have multiple detectors when we report
                             # the current frame number, since the detectors may not be synchronized.
@@ -922,33 +810,9 @@ class RecordingWorkerNoQt(Worker):
                 while True:
                     for detectorName in self.detectorNames:
                         newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-                        if n > 0:
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-                            elif self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                dataset.resize(n + it, axis=0)
-                                dataset[it:it + n, :, :] = newFrames
-                            elif self.saveFormat == SaveFormat.MP4:
-                                for iframe in range(n):
-                                    frame = newFrames[iframe,:,:]
-                                    #https://stackoverflow.com/questions/30509573/writing-an-mp4-video-using-python-opencv
-                                    frame = cv2.cvtColor(cv2.convertScaleAbs(frame), cv2.COLOR_GRAY2BGR)
-                                    self.__logger.debug(type(frame))
-
-                                    datasets[detectorName].write(frame)
-
-                            currentFrame[detectorName] += n
+                        if len(newFrames) > 0:
+                            self._writeFrames(detectorName, newFrames)
+                            currentFrame[detectorName] += len(newFrames)
                             self.__recordingManager.sigRecordingTimeUpdated.emit(
                                 np.around(currentRecTime, decimals=2)
                             )
@@ -968,44 +832,9 @@ class RecordingWorkerNoQt(Worker):
                 while True:
                     for detectorName in self.detectorNames:
                         newFrames = self._getNewFrames(detectorName)
-                        n = len(newFrames)
-                        if n > 0:
-                            if self.saveFormat == SaveFormat.TIFF:
-                                try:
-                                    filePath = filenames[detectorName]
-                                    tiff.imwrite(filePath, newFrames, append=True)
-                                except ValueError:
-                                    self.__logger.error("TIFF File exceeded 4GB.")
-                                    if self.saveFormat == SaveFormat.TIFF:
-                                        filePath = self.__recordingManager.getSaveFilePath(
-                                            f'{self.savename}_{detectorName}.{fileExtension}', False, False)
-                                        continue
-
-                            elif self.saveFormat == SaveFormat.HDF5:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                dataset.resize(n + it, axis=0)
-                                dataset[it:it + n, :, :] = newFrames
-
-                            elif self.saveFormat == SaveFormat.ZARR:
-                                it = currentFrame[detectorName]
-                                dataset = datasets[detectorName]
-                                if it == 0:
-                                    dataset[0, :, :] = newFrames[0, :, :]
-                                    if n > 0:
-                                        dataset.append(newFrames[1:n, :, :])
-                                else:
-                                    dataset.append(newFrames)
-                            elif self.saveFormat == SaveFormat.MP4:
-                                for iframe in range(n):
-                                    frame = newFrames[iframe,:,:]
-                                    #https://stackoverflow.com/questions/30509573/writing-an-mp4-video-using-python-opencv
-                                    frame = cv2.cvtColor(cv2.convertScaleAbs(frame), cv2.COLOR_GRAY2BGR)
-
-                                    datasets[detectorName].write(frame)
-
-
-                            currentFrame[detectorName] += n
+                        if len(newFrames) > 0:
+                            self._writeFrames(detectorName, newFrames)
+                            currentFrame[detectorName] += len(newFrames)
 
                     if shouldStop:
                         break
@@ -1017,14 +846,17 @@ class RecordingWorkerNoQt(Worker):
             else:
                 raise ValueError('Unsupported recording mode specified')
         finally:
+            # Drain the writer queues before the files are closed
+            for writer in self.writers.values():
+                writer.close()
+            for detectorName, stats in self.getStats().items():
+                self.__logger.info(
+                    f'Recorded {stats["framesWritten"]} frames of {detectorName} at'
+                    f' {stats["sustainedMBps"]:.1f} MB/s, {stats["framesDropped"]} dropped'
+                )
 
             if self.saveFormat == SaveFormat.HDF5 or self.saveFormat == SaveFormat.ZARR:
                 for detectorName, file in files.items():
-                    # Remove default frame if no frames have been captured
-                    if currentFrame[detectorName] < 1:
-                        if self.saveFormat == SaveFormat.HDF5:
-                            datasets[detectorName].resize(0, axis=0)
-
                     # Handle memory recordings
                     if self.saveMode == SaveMode.RAM or self.saveMode == SaveMode.DiskAndRAM:
                         filePath = filePaths[detectorName]
@@ -1040,19 +872,20 @@ class RecordingWorkerNoQt(Worker):
                                 name, file, filePath, True
                             )
                     else:
-                        datasets[detectorName].attrs['writing'] = False
                         if self.saveFormat == SaveFormat.HDF5:
                             file.close()
-                        elif self.saveFormat == SaveFormat.MP4:
-                            for detectorName, file in files.items():
-                                datasets[detectorName].release()
-                        else:
+                        elif hasattr(self.store, 'close'):
                             self.store.close()
             emitSignal = True
             if self.recMode in [RecMode.SpecFrames, RecMode.ScanOnce, RecMode.ScanLapse]:
                 emitSignal = False
             self.__recordingManager.endRecording(emitSignal=emitSignal, wait=False)
 
+    def _writeFrames(self, detectorName, frames):
+        writer = self.writers.get(detectorName)
+        if writer is not None:
+            writer.submit(frames)
+
     def _getFiles(self):
         singleMultiDetectorFile = self.singleMultiDetectorFile
         singleLapseFile = self.recMode == RecMode.ScanLapse and self.singleLapseFile
@@ -1097,9 +930,17 @@ class RecordingWorkerNoQt(Worker):
         return files, fileDests, filePaths
 
     def _getNewFrames(self, detectorName):
-        newFrames = self.__recordingManager.detectorsManager[detectorName].getChunk()
-        newFrames = np.array(newFrames)
-        return newFrames
+        chunk = self.__recordingManager.detectorsManager[detectorName].getChunk()
+        if isinstance(chunk, tuple):
+            chunk = chunk[0]  # (frames, frameIndices)
+        if chunk is None:
+            return np.empty((0, 0, 0))
+        return np.array(chunk)
+
+class RecordingWorkerNoQt(RecordingWorker):
+    def run(self):
+        logger.info('Recording worker NoQT started')
+        super().run()
 
 
 class RecMode(enum.Enum):
@@ -1,48 +1,108 @@
+"""
+Managers are imported lazily: ``from imswitch.imcontrol.model import
+LasersManager`` only imports the module of that manager (and its hardware
+dependencies) on first use, so a setup only pays for the managers it needs.
+The time spent importing each manager is recorded in the startup profiler.
+"""
+
+import importlib
+import sys
+import types
 import warnings
-# TODO: Import managers dynamically - similar to the controllers - to save time 
-from .AutofocusManager import AutofocusManager
-from .FOVLockManager import FOVLockManager
-from .DetectorsManager import DetectorsManager, NoDetectorsError
-from .LasersManager import LasersManager
-from .LEDsManager import LEDsManager
-from .LEDMatrixsManager import LEDMatrixsManager
-from .MultiManager import MultiManager
-from .NidaqManager import NidaqManager
-from .PositionersManager import PositionersManager
-from .RS232sManager import RS232sManager
-from .RecordingManager import RecordingManager, RecMode, SaveMode, SaveFormat
-from .SLMManager import SLMManager
-from .ScanManagerPointScan import ScanManagerPointScan
-from .ScanManagerBase import ScanManagerBase
-from .ScanManagerMoNaLISA import ScanManagerMoNaLISA
-from .StandManager import StandManager
-from .RotatorsManager import RotatorsManager
-from .UC2ConfigManager import UC2ConfigManager
-from .SIMManager import SIMManager
-from .DPCManager import DPCManager
-from .MCTManager import MCTManager
-from .TimelapseManager import TimelapseManager
-from .ExperimentManager import ExperimentManager
-from .ROIScanManager import ROIScanManager
-from .LightsheetManager import LightsheetManager
-from .WebRTCManager import WebRTCManager
-from .HyphaManager import HyphaManager
-from .HistoScanManager import HistoScanManager
-from .StresstestManager import StresstestManager
-from .ObjectiveManager import ObjectiveManager
-from .WorkflowManager import WorkflowManager
-from .FlowStopManager import FlowStopManager
-from .LepmonManager import LepmonManager
-from .FlatfieldManager import FlatfieldManager
-from .PixelCalibrationManager import PixelCalibrationManager
-# from .ISMManager import ISMManager
-from .OSSIMManager import OSSIMManager
-
-# Optional: Arkitekt integration. Import guarded so missing optional deps don't break app startup.
-try:
-	from .ArkitektManager import ArkitektManager
-except Exception as _arkitekt_err:  # pragma: no cover - optional dependency
-	warnings.warn(
-		f"ArkitektManager unavailable: {type(_arkitekt_err).__name__}: {_arkitekt_err}. "
-		"Arkitekt features will be disabled unless dependencies are installed.")
-	ArkitektManager = None  # type: ignore
\ No newline at end of file
+
+from imswitch.imcommon.model import startupProfiler
+
+# Exported name -> submodule that defines it
+_lazyNames = {
+    'AutofocusManager': 'AutofocusManager',
+    'FOVLockManager': 'FOVLockManager',
+    'DetectorsManager': 'DetectorsManager',
+    'NoDetectorsError': 'DetectorsManager',
+    'LasersManager': 'LasersManager',
+    'LEDsManager': 'LEDsManager',
+    'LEDMatrixsManager': 'LEDMatrixsManager',
+    'MultiManager': 'MultiManager',
+    'NidaqManager': 'NidaqManager',
+    'PositionersManager': 'PositionersManager',
+    'RS232sManager': 'RS232sManager',
+    'RecordingManager': 'RecordingManager',
+    'RecMode': 'RecordingManager',
+    'SaveMode': 'RecordingManager',
+    'SaveFormat': 'RecordingManager',
+    'SLMManager': 'SLMManager',
+    'ScanManagerPointScan': 'ScanManagerPointScan',
+    'ScanManagerBase': 'ScanManagerBase',
+    'ScanManagerMoNaLISA': 'ScanManagerMoNaLISA',
+    'StandManager': 'StandManager',
+    'RotatorsManager': 'RotatorsManager',
+    'UC2ConfigManager': 'UC2ConfigManager',
+    'SIMManager': 'SIMManager',
+    'DPCManager': 'DPCManager',
+    'MCTManager': 'MCTManager',
+    'TimelapseManager': 'TimelapseManager',
+    'ExperimentManager': 'ExperimentManager',
+    'ROIScanManager': 'ROIScanManager',
+    'LightsheetManager': 'LightsheetManager',
+    'WebRTCManager': 'WebRTCManager',
+    'HyphaManager': 'HyphaManager',
+    'HistoScanManager': 'HistoScanManager',
+    'StresstestManager': 'StresstestManager',
+    'ObjectiveManager': 'ObjectiveManager',
+    'WorkflowManager': 'WorkflowManager',
+    'FlowStopManager': 'FlowStopManager',
+    'LepmonManager': 'LepmonManager',
+    'FlatfieldManager': 'FlatfieldManager',
+    'PixelCalibrationManager': 'PixelCalibrationManager',
+    # 'ISMManager': 'ISMManager',
+    'OSSIMManager': 'OSSIMManager',
+    'ArkitektManager': 'ArkitektManager',
+}
+
+# Optional integrations whose missing dependencies must not break app startup
+_optionalNames = {'ArkitektManager'}
+
+__all__ = list(_lazyNames)
+
+
+def _load(name):
+    moduleName = _lazyNames[name]
+    try:
+        with startupProfiler.measure('import', moduleName):
+            module = importlib.import_module(f'{__name__}.{moduleName}')
+        value = getattr(module, name)
+    except Exception as e:
+        if name not in _optionalNames:
+            raise
+        warnings.warn(
+            f"{name} unavailable: {type(e).__name__}: {e}. "
+            "Its features will be disabled unless dependencies are installed.")
+        value = None
+    # Cache as a regular attribute; the import system's own binding of the
+    # submodule is suppressed by _ManagersModule below.
+    types.ModuleType.__setattr__(sys.modules[__name__], name, value)
+    return value
+
+
+def __getattr__(name):
+    if name in _lazyNames:
+        return _load(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazyNames))
+
+
+class _ManagersModule(types.ModuleType):
+    """ Most submodules have the same name as the class they define. Importing
+    such a submodule (e.g. managers.DetectorsManager from RecordingManager)
+    would bind the module object to the package attribute and hide the class,
+    so that binding is skipped and the class is resolved lazily instead. """
+
+    def __setattr__(self, name, value):
+        if isinstance(value, types.ModuleType) and _lazyNames.get(name) == name:
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _ManagersModule
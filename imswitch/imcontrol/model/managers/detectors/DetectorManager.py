@@ -1,3 +1,6 @@
+import collections
+import threading
+import time
 import traceback
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
@@ -7,6 +10,7 @@ import numpy as np
 
 from imswitch.imcommon.framework import Signal, SignalInterface
 from imswitch.imcommon.model import initLogger
+from .framebuffer import FrameCursor, FrameRingBuffer
 
 
 @dataclass
@@ -116,6 +120,28 @@ class DetectorManager(SignalInterface):
         self.__supportedBinnings = supportedBinnings
         self.__image = np.array([])
 
+        # Common frame ring buffer, filled by cameras that call pushFrame()
+        managerProperties = getattr(detectorInfo, 'managerProperties', None) or {}
+        self.__frameBuffer = FrameRingBuffer(
+            capacity=managerProperties.get('frameBufferSize', 16),
+            shared=managerProperties.get('frameBufferShared', False),
+            maxBytes=int(managerProperties.get('frameBufferMaxMB', 256) * 1024 ** 2)
+        )
+        self.__frameConsumers: Dict[str, FrameCursor] = {}
+        self.__frameConsumersLock = threading.Lock()
+        self.__frameListeners = []
+
+        # Waiters of getFrameAfter(), woken by pushFrame(). The readout time is
+        # an upper bound of readout and transfer, from exposure end to arrival.
+        self.__frameCondition = threading.Condition()
+        self.__frameWaiters = 0
+        self.__readoutTime = float(managerProperties.get('readoutTimeMs', 20)) / 1000
+
+        # Preview contrast stretch lookup table and latency bookkeeping
+        self.__previewLUT = None
+        self.__previewLUTKey = None
+        self.__previewLatencies = collections.deque(maxlen=200)
+
         self.__forAcquisition = detectorInfo.forAcquisition
         self.__forFocusLock = detectorInfo.forFocusLock
         #if not detectorInfo.forAcquisition and not detectorInfo.forFocusLock:
@@ -130,30 +156,219 @@ class DetectorManager(SignalInterface):
         self.setRGB(isRGB)
         self.setBinning(supportedBinnings[0])
 
-    def updateLatestFrame(self, init):
+    def updateLatestFrame(self, init, fromFrameBuffer=False):
         """ :meta private: """
+        hostTime = None
         try:
-            self.__image = self.getLatestFrame()
+            latest = self.__frameBuffer.latest() if fromFrameBuffer else None
+            if latest is not None:
+                self.__image, _, _, hostTime = latest
+            else:
+                self.__image = self.getLatestFrame()
         except Exception:
             self.__logger.error(traceback.format_exc())
         else:
             if self.__image is not None:
-                '''
-                eventually manipulate the image before sending it
-                we have 255 levels of gray, so we can use the min and max values to scale the image
-
-                TODO: not ideal as we scale noise, but we need to do this for the preview
-                '''
-                def stretch_pixels(image_12bit, lower_clip, upper_clip):
-                    # Clamping to the range [lower_clip, upper_clip]
-                    clamped = np.clip(image_12bit, lower_clip, upper_clip)
-                    # Mapping the clamped values to [0, 255]
-                    scaled = (clamped - lower_clip) * 255.0 / (upper_clip - lower_clip)
-                    # Converting to 8-bit
-                    return np.clip(scaled, 0, 255).astype(np.uint8)
+                # TODO: not ideal as we scale noise, but we need to do this for the preview
                 if self._maxValueFramePreview != -1 and self._minValueFramePreview != -1:
-                    self.__image = stretch_pixels(self.__image, self._minValueFramePreview, self._maxValueFramePreview)
+                    self.__image = self.stretchPixels(self.__image, self._minValueFramePreview,
+                                                      self._maxValueFramePreview)
                 self.sigImageUpdated.emit(self.__image, init, self.scale) # TODO - inject compressionrate?
+                if hostTime is not None:
+                    self.__previewLatencies.append(time.time() - hostTime)
+
+    def stretchPixels(self, image, lowerClip, upperClip):
+        """ Maps [lowerClip, upperClip] linearly to the 8 bit range. Integer
+        images up to 16 bit use a lookup table that is cached until the clip
+        values change, other dtypes fall back to float math. """
+        if image.dtype in (np.uint8, np.uint16):
+            key = (image.dtype, lowerClip, upperClip)
+            if key != self.__previewLUTKey:
+                levels = np.arange(np.iinfo(image.dtype).max + 1, dtype=np.float32)
+                scaled = (levels - lowerClip) * 255.0 / max(upperClip - lowerClip, 1e-9)
+                self.__previewLUT = np.clip(scaled, 0, 255).astype(np.uint8)
+                self.__previewLUTKey = key
+            return self.__previewLUT[image]
+        # Clamping to the range [lower_clip, upper_clip] and mapping to [0, 255]
+        clamped = np.clip(image, lowerClip, upperClip)
+        scaled = (clamped - lowerClip) * 255.0 / max(upperClip - lowerClip, 1e-9)
+        return np.clip(scaled, 0, 255).astype(np.uint8)
+
+    def getPreviewStats(self) -> Dict[str, Any]:
+        """ Returns the measured latency from frame arrival to preview emit
+        (only available for previews fed from the frame ring buffer). """
+        latencies = np.array(self.__previewLatencies) * 1000
+        if len(latencies) == 0:
+            return {'count': 0}
+        return {
+            'count': int(len(latencies)),
+            'meanLatencyMs': float(np.mean(latencies)),
+            'p50LatencyMs': float(np.percentile(latencies, 50)),
+            'p95LatencyMs': float(np.percentile(latencies, 95)),
+            'maxLatencyMs': float(np.max(latencies)),
+        }
+
+    def addFrameListener(self, callback) -> None:
+        """ Registers ``callback(frameId, timestamp)``, called from the
+        camera thread after every frame that was pushed into the ring
+        buffer. Callbacks must return quickly. """
+        if callback not in self.__frameListeners:
+            self.__frameListeners = self.__frameListeners + [callback]
+
+    def removeFrameListener(self, callback) -> None:
+        """ Unregisters a callback added with addFrameListener. """
+        self.__frameListeners = [c for c in self.__frameListeners if c != callback]
+
+    def pushFrame(self, frame: np.ndarray, frameId: int = -1, timestamp: int = 0) -> None:
+        """ Copies a newly acquired frame into the detector's ring buffer.
+        Meant to be called from the camera's frame callback (single producer).
+
+        Args:
+            frame: The frame as delivered by the camera.
+            frameId: Camera frame number.
+            timestamp: Hardware timestamp of the frame (camera ticks).
+        """
+        self.__frameBuffer.push(frame, frameId, timestamp)
+        for listener in self.__frameListeners:
+            listener(frameId, timestamp)
+        if self.__frameWaiters:
+            with self.__frameCondition:
+                self.__frameCondition.notify_all()
+
+    @property
+    def exposureTime(self) -> float:
+        """ Exposure time in seconds, from the ``exposure`` parameter (ms);
+        0 if the detector has none. """
+        parameter = self.__parameters.get('exposure')
+        try:
+            return max(0.0, float(parameter.value) / 1000)
+        except (AttributeError, TypeError, ValueError):
+            return 0.0
+
+    @property
+    def readoutTime(self) -> float:
+        """ Upper bound of the time from the end of an exposure until the
+        frame arrives on the host in seconds (``readoutTimeMs`` manager
+        property, 20 ms by default). """
+        return self.__readoutTime
+
+    def getFrameAfter(self, t: Optional[float] = None, timeout: Optional[float] = None,
+                      returnInfo: bool = False):
+        """ Returns the first frame whose exposure started at or after the
+        host time ``t`` (``time.time()``, default: now), e.g. the end of a
+        stage move plus its settling time.
+
+        Frames pushed by the camera callback are matched by their arrival
+        time minus exposure and readout time, waiting on a condition that
+        pushFrame() notifies. Polled detectors wait until ``t`` plus exposure
+        and readout time and return the next frame with a new frame number.
+
+        Args:
+            t: Earliest exposure start.
+            timeout: Maximum time to wait after the frame is due, default
+              one second plus two frame times.
+            returnInfo: Also return a dict with ``frameId``, ``hostTime`` and
+              ``exposureStart`` (estimated from exposure and readout time).
+
+        Raises:
+            TimeoutError: No such frame arrived in time.
+        """
+        t = time.time() if t is None else float(t)
+        latency = self.exposureTime + self.__readoutTime
+        due = t + latency
+        if timeout is None:
+            timeout = 1.0 + 2 * latency
+        deadline = max(time.time(), due) + timeout
+
+        buffer = self.__frameBuffer
+        if buffer.allocated:
+            with self.__frameCondition:
+                self.__frameWaiters += 1
+            try:
+                start, generation = 0, buffer.generation  # frames before start arrived too early
+                while True:
+                    if buffer.generation != generation:
+                        start, generation = 0, buffer.generation  # reallocated
+                    head = buffer.head
+                    seq = buffer.firstAfter(start, due)
+                    if seq is None:
+                        start = head
+                    else:
+                        start = seq
+                        frames, frameIds, timestamps, hostTimes, first = buffer.read(seq, seq + 1)
+                        if first == seq and len(frameIds) == 1:
+                            info = {'frameId': int(frameIds[0]), 'timestamp': int(timestamps[0]),
+                                    'hostTime': float(hostTimes[0]),
+                                    'exposureStart': float(hostTimes[0]) - latency}
+                            return (frames[0], info) if returnInfo else frames[0]
+                        continue  # overwritten while reading, the next one is newer
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    with self.__frameCondition:
+                        if buffer.head == head:
+                            self.__frameCondition.wait(min(remaining, 0.1))
+            finally:
+                with self.__frameCondition:
+                    self.__frameWaiters -= 1
+            raise TimeoutError(f'No frame of {self.__name} exposed after t={t:.3f} '
+                               f'within {timeout:.2f} s')
+
+        # Polled detectors: a frame number that changes after the frame is due
+        time.sleep(max(0.0, due - time.time()))
+        try:
+            _, lastFrameId = self.getLatestFrame(returnFrameNumber=True)
+        except TypeError:
+            lastFrameId = None
+        if lastFrameId is None:
+            # no frame numbers, wait for another frame time instead
+            time.sleep(latency)
+            frame = self.getLatestFrame()
+            info = {'frameId': -1, 'hostTime': time.time(), 'exposureStart': time.time() - latency}
+            return (frame, info) if returnInfo else frame
+        pollInterval = min(0.01, max(0.001, latency / 4))
+        while time.time() < deadline:
+            time.sleep(pollInterval)
+            frame, frameId = self.getLatestFrame(returnFrameNumber=True)
+            if frame is not None and frameId != lastFrameId:
+                hostTime = time.time()
+                info = {'frameId': frameId, 'hostTime': hostTime, 'exposureStart': hostTime - latency}
+                return (frame, info) if returnInfo else frame
+        raise TimeoutError(f'No frame of {self.__name} exposed after t={t:.3f} '
+                           f'within {timeout:.2f} s')
+
+    def registerFrameConsumer(self, consumerName: str, fromLatest: bool = True) -> FrameCursor:
+        """ Returns the ring buffer cursor of a consumer (e.g. "recorder",
+        "liveview", "focuslock"), creating it if necessary. Each consumer
+        sees every frame independently of the others. """
+        with self.__frameConsumersLock:
+            cursor = self.__frameConsumers.get(consumerName)
+            if cursor is None:
+                cursor = self.__frameBuffer.createCursor(fromLatest)
+                self.__frameConsumers[consumerName] = cursor
+            return cursor
+
+    def unregisterFrameConsumer(self, consumerName: str) -> None:
+        """ Removes the ring buffer cursor of a consumer. """
+        with self.__frameConsumersLock:
+            self.__frameConsumers.pop(consumerName, None)
+
+    def getNewFrames(self, consumerName: str, maxFrames: Optional[int] = None, copy: bool = True):
+        """ Returns the frames the consumer has not read yet as a tuple
+        ``(frames, frameIds, timestamps, hostTimes)``. """
+        return self.registerFrameConsumer(consumerName).read(maxFrames, copy)
+
+    def getFrameBufferInfo(self) -> Dict[str, Any]:
+        """ Returns the ring buffer description (including the shared memory
+        name, if shared) and the state of all consumers. """
+        info = self.__frameBuffer.info()
+        with self.__frameConsumersLock:
+            info['consumers'] = {
+                name: {'position': c.position, 'available': c.available(),
+                       'framesRead': c.framesRead, 'overruns': c.overruns}
+                for name, c in self.__frameConsumers.items()
+            }
+        return info
 
     def setMinValueFramePreview(self, value):
         """ Sets the minimum value for the frame preview to display via a jpeg image """
@@ -266,6 +481,12 @@ class DetectorManager(SignalInterface):
         """ Latest LiveView image. """
         return self.__image
 
+    @property
+    def frameBuffer(self) -> FrameRingBuffer:
+        """ Ring buffer holding the latest frames, frame IDs and timestamps.
+        Only filled by detectors whose camera calls ``pushFrame``. """
+        return self.__frameBuffer
+
     @property
     def parameters(self) -> Dict[str, DetectorParameter]:
         """ Dictionary of available parameters. """
@@ -343,7 +564,7 @@ class DetectorManager(SignalInterface):
 
     def finalize(self) -> None:
         """ Close/cleanup detector. """
-        pass
+        self.__frameBuffer.close()
 
     def recordFlatfieldImage(self, image: np.ndarray) -> np.ndarray:
         """ Performs flatfield correction on the specified image. """
@@ -100,6 +100,11 @@ class HikCamManager(DetectorManager):
         super().__init__(detectorInfo, name, fullShape=fullShape, supportedBinnings=[1],
                          model=model, parameters=parameters, actions=actions, croppable=True)
 
+        # Copy every frame from the SDK callback into the common ring buffer
+        if hasattr(self._camera, 'onFrame'):
+            self.registerFrameConsumer('chunk', fromLatest=False)
+            self._camera.onFrame = self.pushFrame
+
 
     def setFlatfieldImage(self, flatfieldImage, isFlatfielding):
         self._camera.setFlatfieldImage(flatfieldImage, isFlatfielding)
@@ -140,12 +145,17 @@ class HikCamManager(DetectorManager):
         self.parameters['trigger_source'].value = source
 
     def getChunk(self):
+        if self.frameBuffer.allocated:
+            # Read through our own cursor so other ring buffer consumers keep their frames
+            frames, frameIds, _, _ = self.getNewFrames('chunk')
+            return frames, frameIds
         try:
             return self._camera.getLastChunk()
         except:
             return None
 
     def flushBuffers(self):
+        self.registerFrameConsumer('chunk').skipToLatest()
         self._camera.flushBuffer()
 
     def startAcquisition(self):
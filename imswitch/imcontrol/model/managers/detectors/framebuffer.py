@@ -0,0 +1,342 @@
+"""
+Preallocated frame ring buffer shared by the detector managers.
+
+A single producer (the camera callback) copies every frame into a fixed
+slot of a preallocated stack; any number of consumers (recorder, live view,
+focus lock, ...) read through their own cursor, so reading frames never
+removes them for the other consumers. Frame IDs, hardware timestamps and
+host arrival times are stored next to the pixels.
+
+Synchronisation is lock-free: the producer fills slot ``head % capacity``
+and only then publishes it by incrementing ``head``. Readers never touch the
+slot that is written next and re-check ``head`` after copying, so frames that
+were overwritten while being copied are dropped and counted as overruns.
+
+The storage can optionally live in ``multiprocessing.shared_memory`` so that
+other processes can attach to it with ``FrameRingBuffer.attach(info)``. A
+released segment stays mapped as long as ``copy=False`` views into it exist.
+"""
+
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Header slots (int64) at the start of the storage block
+_HEAD = 0
+_GENERATION = 1
+_STALE = 2
+_HEADER_LEN = 8
+_ALIGN = 64
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class FrameRingBuffer:
+    """ Preallocated single-producer/multi-consumer ring buffer of frames.
+
+    The storage is allocated lazily on the first frame (or by ``configure``)
+    and reallocated when the frame shape or dtype changes, e.g. after a ROI
+    change. Each reallocation increments ``generation`` and resets all
+    cursors.
+    """
+
+    def __init__(self, capacity: int, frameShape: Optional[Tuple[int, ...]] = None,
+                 dtype=np.uint16, shared: bool = False, maxBytes: Optional[int] = None):
+        """
+        Args:
+            capacity: Number of frames kept in the ring.
+            frameShape: Shape of a single frame; None allocates on first push.
+            dtype: Pixel dtype.
+            shared: Place the storage in ``multiprocessing.shared_memory``.
+            maxBytes: Upper bound for the pixel storage; the capacity is
+              reduced to fit (at least 2 frames are always kept).
+        """
+        self._requestedCapacity = max(2, int(capacity))
+        self._maxBytes = maxBytes
+        self._shared = shared
+        self._shm = None
+        self._ownsShm = True
+        self._retiredShm = []  # released segments still referenced by views
+        self._allocLock = threading.Lock()
+        self._generation = 0
+        self.capacity = 0
+        self.frameShape = None
+        self.dtype = np.dtype(dtype)
+        self._header = np.zeros(_HEADER_LEN, dtype=np.int64)
+        self._frames = None
+        self._frameIds = None
+        self._timestamps = None
+        self._hostTimes = None
+        if frameShape is not None:
+            self.configure(frameShape, dtype)
+
+    # Allocation
+
+    def configure(self, frameShape: Tuple[int, ...], dtype) -> None:
+        """ (Re)allocates the storage for frames of the given shape/dtype. """
+        with self._allocLock:
+            frameShape = tuple(int(s) for s in frameShape)
+            dtype = np.dtype(dtype)
+            if self._frames is not None and frameShape == self.frameShape and dtype == self.dtype:
+                return
+
+            frameBytes = int(np.prod(frameShape)) * dtype.itemsize
+            capacity = self._requestedCapacity
+            if self._maxBytes is not None and frameBytes > 0:
+                capacity = max(2, min(capacity, self._maxBytes // frameBytes))
+
+            self._release()
+            self._generation += 1
+            self.capacity = capacity
+            self.frameShape = frameShape
+            self.dtype = dtype
+
+            metaBytes = _align(_HEADER_LEN * 8) + 3 * _align(capacity * 8)
+            totalBytes = metaBytes + capacity * frameBytes
+            if self._shared:
+                self._shm = shared_memory.SharedMemory(create=True, size=max(1, totalBytes))
+                self._ownsShm = True
+                buf = self._shm.buf
+            else:
+                buf = bytearray(totalBytes)
+            self._mapStorage(buf)
+            self._header[_HEAD] = 0
+            self._header[_GENERATION] = self._generation
+            self._header[_STALE] = 0
+
+    def _mapStorage(self, buf) -> None:
+        capacity = self.capacity
+        offset = 0
+        self._header = np.frombuffer(buf, dtype=np.int64, count=_HEADER_LEN, offset=offset)
+        offset += _align(_HEADER_LEN * 8)
+        self._frameIds = np.frombuffer(buf, dtype=np.int64, count=capacity, offset=offset)
+        offset += _align(capacity * 8)
+        self._timestamps = np.frombuffer(buf, dtype=np.int64, count=capacity, offset=offset)
+        offset += _align(capacity * 8)
+        self._hostTimes = np.frombuffer(buf, dtype=np.float64, count=capacity, offset=offset)
+        offset += _align(capacity * 8)
+        self._frames = np.frombuffer(
+            buf, dtype=self.dtype, count=capacity * int(np.prod(self.frameShape)), offset=offset
+        ).reshape((capacity,) + self.frameShape)
+
+    def _release(self) -> None:
+        if self._shm is not None:
+            if self._ownsShm:
+                self._header[_STALE] = 1  # tell attached processes to re-attach
+            self._header = np.zeros(_HEADER_LEN, dtype=np.int64)
+            self._frames = self._frameIds = self._timestamps = self._hostTimes = None
+            if self._ownsShm:
+                self._shm.unlink()  # the mapping itself lives on while views exist
+            self._retiredShm.append(self._shm)
+            self._shm = None
+        self._closeRetired()
+
+    def _closeRetired(self) -> None:
+        """ Unmaps released segments no copy=False view refers to anymore. """
+        alive = []
+        for shm in self._retiredShm:
+            try:
+                shm.close()
+            except BufferError:
+                alive.append(shm)
+        self._retiredShm = alive
+
+    def close(self) -> None:
+        """ Releases the storage (and unlinks the shared memory block). """
+        with self._allocLock:
+            self._release()
+            self._frames = None
+
+    @classmethod
+    def attach(cls, info: dict) -> 'FrameRingBuffer':
+        """ Attaches to the shared-memory buffer described by ``info()`` of
+        another process. The returned buffer must only be read from. """
+        buffer = cls(info['capacity'], dtype=info['dtype'], shared=True)
+        buffer._shm = shared_memory.SharedMemory(name=info['name'])
+        buffer._ownsShm = False
+        buffer.capacity = info['capacity']
+        buffer.frameShape = tuple(info['frameShape'])
+        buffer.dtype = np.dtype(info['dtype'])
+        buffer._mapStorage(buffer._shm.buf)
+        buffer._generation = int(buffer._header[_GENERATION])
+        return buffer
+
+    def info(self) -> dict:
+        """ Description of the buffer, sufficient for ``attach``. """
+        return {
+            'name': self._shm.name if self._shm is not None else None,
+            'shared': self._shared,
+            'capacity': self.capacity,
+            'frameShape': list(self.frameShape) if self.frameShape is not None else None,
+            'dtype': self.dtype.str,
+            'generation': self._generation,
+            'head': self.head,
+        }
+
+    # State
+
+    @property
+    def allocated(self) -> bool:
+        return self._frames is not None
+
+    @property
+    def head(self) -> int:
+        """ Total number of frames written since the last (re)allocation. """
+        return int(self._header[_HEAD])
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def isStale(self) -> bool:
+        """ True if the producer reallocated the storage (attached readers
+        must attach again). """
+        return bool(self._header[_STALE])
+
+    # Producer side
+
+    def push(self, frame: np.ndarray, frameId: int = -1, timestamp: int = 0,
+             hostTime: Optional[float] = None) -> int:
+        """ Copies a frame into the next slot and publishes it.
+
+        Returns:
+            The sequence number of the frame.
+        """
+        if self._frames is None or frame.shape != self.frameShape or frame.dtype != self.dtype:
+            self.configure(frame.shape, frame.dtype)
+        seq = int(self._header[_HEAD])
+        slot = seq % self.capacity
+        np.copyto(self._frames[slot], frame)
+        self._frameIds[slot] = frameId
+        self._timestamps[slot] = timestamp
+        self._hostTimes[slot] = time.time() if hostTime is None else hostTime
+        self._header[_HEAD] = seq + 1  # publish
+        return seq
+
+    # Consumer side
+
+    def oldestReadable(self, head: Optional[int] = None) -> int:
+        """ Oldest sequence number that is safe to read (the slot that is
+        written next is excluded). """
+        head = self.head if head is None else head
+        return max(0, head - self.capacity + 1)
+
+    def read(self, start: int, stop: int, copy: bool = True):
+        """ Reads frames with sequence numbers in ``[start, stop)``.
+
+        With ``copy=False`` and no wrap-around the frames are views into the
+        ring; they are only valid until the producer has written another
+        ``capacity - 1`` frames. After a reallocation or ``close()`` they keep
+        showing the old frames, the memory is released once they are dropped.
+
+        Returns:
+            Tuple ``(frames, frameIds, timestamps, hostTimes, start)`` where
+            ``start`` is the first sequence number actually returned (frames
+            that were overwritten while reading are dropped).
+        """
+        start = max(start, self.oldestReadable())
+        if self._frames is None or stop <= start:
+            return self._empty() + (stop,)
+        first, last = start % self.capacity, (stop - 1) % self.capacity
+        if first <= last:
+            index = slice(first, last + 1)
+            frames = self._frames[index]
+            if copy:
+                frames = frames.copy()
+        else:
+            index = np.r_[first:self.capacity, 0:last + 1]
+            frames = self._frames[index]
+        frameIds = self._frameIds[index].copy()
+        timestamps = self._timestamps[index].copy()
+        hostTimes = self._hostTimes[index].copy()
+
+        # Drop frames the producer overwrote while we were copying
+        valid = self.oldestReadable()
+        if valid > start and copy:
+            drop = min(valid - start, len(frameIds))
+            frames, frameIds = frames[drop:], frameIds[drop:]
+            timestamps, hostTimes = timestamps[drop:], hostTimes[drop:]
+            start += drop
+        return frames, frameIds, timestamps, hostTimes, start
+
+    def latest(self, copy: bool = True):
+        """ Returns ``(frame, frameId, timestamp, hostTime)`` of the newest
+        frame or None if the buffer is empty. """
+        head = self.head
+        if head == 0 or self._frames is None:
+            return None
+        frames, frameIds, timestamps, hostTimes, _ = self.read(head - 1, head, copy=copy)
+        if len(frameIds) == 0:
+            return None
+        return frames[0], int(frameIds[0]), int(timestamps[0]), float(hostTimes[0])
+
+    def firstAfter(self, start: int, hostTime: float) -> Optional[int]:
+        """ Sequence number of the first readable frame from ``start`` on
+        that arrived at or after ``hostTime``, or None if there is none yet. """
+        head = self.head
+        if self._frames is None:
+            return None
+        for seq in range(max(start, self.oldestReadable(head)), head):
+            if self._hostTimes[seq % self.capacity] >= hostTime:
+                return seq
+        return None
+
+    def createCursor(self, fromLatest: bool = True) -> 'FrameCursor':
+        """ Creates an independent read cursor. With ``fromLatest`` only
+        frames written after this call are returned. """
+        return FrameCursor(self, fromLatest)
+
+    def _empty(self):
+        shape = (0,) + (self.frameShape if self.frameShape is not None else (0, 0))
+        return (np.empty(shape, dtype=self.dtype), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+
+class FrameCursor:
+    """ Read position of one consumer of a FrameRingBuffer. """
+
+    def __init__(self, buffer: FrameRingBuffer, fromLatest: bool = True):
+        self._buffer = buffer
+        self._generation = buffer.generation
+        self.position = buffer.head if fromLatest else buffer.oldestReadable()
+        self.overruns = 0
+        self.framesRead = 0
+
+    def _checkGeneration(self) -> None:
+        if self._generation != self._buffer.generation:
+            self._generation = self._buffer.generation
+            self.position = 0
+
+    def available(self) -> int:
+        """ Number of unread frames. """
+        self._checkGeneration()
+        return max(0, self._buffer.head - max(self.position, self._buffer.oldestReadable()))
+
+    def read(self, maxFrames: Optional[int] = None, copy: bool = True):
+        """ Returns the frames written since the last read as
+        ``(frames, frameIds, timestamps, hostTimes)``. Frames that were
+        overwritten before they could be read are counted in ``overruns``. """
+        self._checkGeneration()
+        head = self._buffer.head
+        stop = head if maxFrames is None else min(head, self.position + max(0, int(maxFrames)))
+        oldest = self._buffer.oldestReadable(head)
+        if self.position < oldest:
+            self.overruns += oldest - self.position
+            self.position = oldest
+            stop = head if maxFrames is None else min(head, self.position + max(0, int(maxFrames)))
+        frames, frameIds, timestamps, hostTimes, start = self._buffer.read(self.position, stop, copy)
+        self.overruns += start - self.position if start > self.position else 0
+        self.position = max(stop, self.position)
+        self.framesRead += len(frameIds)
+        return frames, frameIds, timestamps, hostTimes
+
+    def skipToLatest(self) -> None:
+        """ Marks all frames written so far as read. """
+        self._checkGeneration()
+        self.position = self._buffer.head
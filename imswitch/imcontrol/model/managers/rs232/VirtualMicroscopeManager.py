@@ -1,6 +1,5 @@
 import os
 import cv2
-import math
 import time
 from imswitch import IS_HEADLESS, __file__
 import threading
@@ -8,6 +7,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from skimage.draw import line
+from scipy import fft as scipy_fft
+from scipy import special
 from scipy.signal import convolve2d
 from imswitch.imcommon.model import initLogger
 
@@ -18,18 +19,6 @@ try:
 except:
     IS_NIP = False
 
-# Makes sure code still executes without numba, albeit extremely slow
-try:
-    from numba import njit, prange
-except ModuleNotFoundError:
-    prange = range
-
-    def njit(*args, **kwargs):
-        def wrapper(func):
-            return func
-
-        return wrapper
-
 """
 End-to-end astigmatism autofocus simulation:
 - Simulated microscope with Z-scan, rotated astigmatism, and XY drift
@@ -112,6 +101,121 @@ class AstigmaticMicroscopeSimulator:
 
 
 
+class SMLMEmitterField:
+    """Fixed emitters on a binary structure with stateful blinking.
+
+    Emitter coordinates are extracted from the structure once and binned into
+    a grid of square cells, so that a frame only visits the cells overlapping
+    the viewport. Every emitter is a two-state (on/off) Markov chain; emitters
+    that were out of view are advanced in closed form when they come back into
+    view, so only visible emitters cost time. Each active emitter is rendered
+    into its 4 sigma footprint only.
+    """
+
+    def __init__(
+        self,
+        structure,
+        cell_size=64,
+        on_fraction=0.05,    # steady-state fraction of emitters that are on
+        mean_on_frames=2.0,  # mean number of frames an emitter stays on
+        sigma=0.21 * 6 / 1.2,
+        sigma_std=0.21 * 0.5 / 1.2,
+        seed=None,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.height, self.width = structure.shape
+        self.cell_size = int(cell_size)
+        self.n_cells_y = -(-self.height // self.cell_size)
+        self.n_cells_x = -(-self.width // self.cell_size)
+
+        ys, xs = np.nonzero(structure)
+        cell = (ys // self.cell_size) * self.n_cells_x + xs // self.cell_size
+        order = np.argsort(cell, kind="stable")
+        # Emitters sorted by cell, cell_start is the CSR index into them
+        self.y = ys[order].astype(np.float32) + self.rng.random(len(ys), dtype=np.float32)
+        self.x = xs[order].astype(np.float32) + self.rng.random(len(xs), dtype=np.float32)
+        self.sigma = np.clip(self.rng.normal(sigma, sigma_std, len(ys)), 0.3, None).astype(np.float32)
+        self.cell_start = np.searchsorted(cell[order], np.arange(self.n_cells_y * self.n_cells_x + 1))
+
+        self.set_kinetics(on_fraction, mean_on_frames)
+        self.state = self.rng.random(len(ys)) < self.on_fraction
+        self.last_frame = np.zeros(len(ys), dtype=np.int64)
+        self.frame = 0
+
+    def set_kinetics(self, on_fraction, mean_on_frames):
+        """Set the blinking kinetics from the duty cycle and the mean on time."""
+        self.on_fraction = float(on_fraction)
+        self.p_off = 1.0 / max(float(mean_on_frames), 1.0)
+        self.p_on = self.on_fraction * self.p_off / max(1.0 - self.on_fraction, 1e-9)
+
+    def _candidates(self, y0, x0, h, w, margin):
+        """Indices of the emitters in cells overlapping the (wrapped) viewport."""
+        cs = self.cell_size
+        rows = np.unique(((y0 - margin + np.arange(h + 2 * margin)) % self.height) // cs)
+        cols = np.unique(((x0 - margin + np.arange(w + 2 * margin)) % self.width) // cs)
+        cells = (rows[:, None] * self.n_cells_x + cols[None, :]).ravel()
+        starts, stops = self.cell_start[cells], self.cell_start[cells + 1]
+        counts = stops - starts
+        if counts.sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return offsets + np.arange(counts.sum())
+
+    def _advance(self, idx):
+        """Advance the blinking state of the given emitters to the current frame."""
+        steps = self.frame - self.last_frame[idx]
+        decay = (1.0 - self.p_on - self.p_off) ** steps
+        p_now_on = self.on_fraction + (self.state[idx] - self.on_fraction) * decay
+        self.state[idx] = self.rng.random(len(idx)) < p_now_on
+        self.last_frame[idx] = self.frame
+
+    def render(self, y0, x0, h, w, photons, photons_std):
+        """
+        Render the next frame of the viewport whose top-left corner is the
+        source pixel (y0, x0).
+
+        Returns:
+            Expected photon image (float32, h x w) before noise
+        """
+        self.frame += 1
+        margin = int(np.ceil(4 * float(self.sigma.max()))) + 1
+        idx = self._candidates(y0, x0, h, w, margin)
+        image = np.zeros(h * w, dtype=np.float32)
+        if len(idx) == 0:
+            return image.reshape(h, w)
+
+        vy = (self.y[idx] - y0 + margin) % self.height - margin
+        vx = (self.x[idx] - x0 + margin) % self.width - margin
+        visible = (vy > -margin) & (vy < h + margin) & (vx > -margin) & (vx < w + margin)
+        idx, vy, vx = idx[visible], vy[visible], vx[visible]
+        self._advance(idx)
+        on = self.state[idx]
+        idx, vy, vx = idx[on], vy[on], vx[on]
+        if len(idx) == 0:
+            return image.reshape(h, w)
+
+        sigma = self.sigma[idx]
+        photon = self.rng.normal(photons, photons_std, len(idx)).astype(np.float32)
+
+        # Pixel grid of the 4 sigma footprint around every emitter
+        k = 2 * margin
+        px = np.floor(vx).astype(np.int64)[:, None] - margin + np.arange(k)
+        py = np.floor(vy).astype(np.int64)[:, None] - margin + np.arange(k)
+        s = (sigma * np.float32(np.sqrt(2)))[:, None]
+        dx = px - vx[:, None]
+        dy = py - vy[:, None]
+        erf_x = special.erf((dx + 1) / s) - special.erf(dx / s)
+        erf_y = special.erf((dy + 1) / s) - special.erf(dy / s)
+        patch = 0.25 * photon[:, None, None] * erf_y[:, :, None] * erf_x[:, None, :]
+        # Don't bother if the emitter is further than 4 sigma from the pixel centre
+        inside = ((dy + 0.5)[:, :, None] ** 2 + (dx + 0.5)[:, None, :] ** 2
+                  < 16 * (sigma ** 2)[:, None, None])
+        inside &= ((py >= 0) & (py < h))[:, :, None] & ((px >= 0) & (px < w))[:, None, :]
+        flat = (py[:, :, None] * w + px[:, None, :])[inside]
+        image += np.bincount(flat, weights=patch[inside], minlength=h * w).astype(np.float32)
+        return image.reshape(h, w)
+
+
 class VirtualMicroscopeManager:
     """A low-level wrapper for TCP-IP communication (ESP32 REST API)
        with added objective control that toggles the objective lens.
@@ -137,7 +241,14 @@ class VirtualMicroscopeManager:
                 "If you want to use the plant, use 'imagePath': 'simplant', 'astigmatism' in your setup.json"
             )
 
-        self._virtualMicroscope = VirtualMicroscopy(self._imagePath)
+        # High-throughput mode: float32 viewport slicing, cached defocus OTFs and
+        # frame pacing to a target frame rate instead of a fixed sleep
+        highThroughput = bool(self._settings.get("highThroughput", False))
+        targetFps = self._settings.get("targetFps", None)
+
+        self._virtualMicroscope = VirtualMicroscopy(
+            self._imagePath, highThroughput=highThroughput, targetFps=targetFps
+        )
         self._positioner = self._virtualMicroscope.positioner
         self._camera = self._virtualMicroscope.camera
         self._illuminator = self._virtualMicroscope.illuminator
@@ -179,6 +290,8 @@ class Positioner:
         self.position = {"X": 0, "Y": 0, "Z": 0, "A": 0}
         self.mDimensions = (self._parent.camera.SensorHeight, self._parent.camera.SensorWidth)
         self.lock = threading.Lock()
+        self._psfCache = {}  # dz -> psf
+        self._psfCacheSize = 32
         if IS_NIP:
             self.psf = self.compute_psf(dz=0)
         else:
@@ -215,18 +328,25 @@ class Positioner:
         dz = np.float32(dz)
         print("Defocus:" + str(dz))
         if IS_NIP and dz != 0:
-            obj = nip.image(np.zeros(self.mDimensions))
-            obj.pixelsize = (100.0, 100.0)
-            paraAbber = nip.PSF_PARAMS()
-            paraAbber.aberration_types = [paraAbber.aberration_zernikes.spheric]
-            paraAbber.aberration_strength = [np.float32(dz) / 10]
-            psf = nip.psf(obj, paraAbber)
-            self.psf = psf.copy()
-            del psf
-            del obj
+            # The PSF only depends on dz, keep the last few ones around
+            psf = self._psfCache.get(float(dz))
+            if psf is None:
+                psf = self._computeDefocusPSF(dz)
+                if len(self._psfCache) >= self._psfCacheSize:
+                    self._psfCache.pop(next(iter(self._psfCache)))
+                self._psfCache[float(dz)] = psf
+            self.psf = psf
         else:
             self.psf = None
 
+    def _computeDefocusPSF(self, dz):
+        obj = nip.image(np.zeros(self.mDimensions))
+        obj.pixelsize = (100.0, 100.0)
+        paraAbber = nip.PSF_PARAMS()
+        paraAbber.aberration_types = [paraAbber.aberration_zernikes.spheric]
+        paraAbber.aberration_strength = [np.float32(dz) / 10]
+        return np.asarray(nip.psf(obj, paraAbber), dtype=np.float32)
+
     def get_psf(self):
         return self.psf
 
@@ -247,8 +367,8 @@ class Illuminator:
 
 
 class VirtualMicroscopy:
-    def __init__(self, filePath="path_to_image.jpeg"):
-        self.camera = Camera(self, filePath)
+    def __init__(self, filePath="path_to_image.jpeg", highThroughput=False, targetFps=None):
+        self.camera = Camera(self, filePath, highThroughput=highThroughput, targetFps=targetFps)
         self.positioner = Positioner(self)
         self.illuminator = Illuminator(self)
         self.objective = Objective(self)
@@ -257,35 +377,6 @@ class VirtualMicroscopy:
         pass
 
 
-@njit(parallel=True)
-def FromLoc2Image_MultiThreaded(
-    xc_array: np.ndarray, yc_array: np.ndarray, photon_array: np.ndarray,
-    sigma_array: np.ndarray, image_height: int, image_width: int, pixel_size: float
-):
-    Image = np.zeros((image_height, image_width))
-    for ij in prange(image_height * image_width):
-        j = int(ij / image_width)
-        i = ij - j * image_width
-        for xc, yc, photon, sigma in zip(xc_array, yc_array, photon_array, sigma_array):
-            if (photon > 0) and (sigma > 0):
-                S = sigma * math.sqrt(2)
-                x = i * pixel_size - xc
-                y = j * pixel_size - yc
-                if (x + pixel_size / 2) ** 2 + (y + pixel_size / 2) ** 2 < 16 * sigma**2:
-                    ErfX = math.erf((x + pixel_size) / S) - math.erf(x / S)
-                    ErfY = math.erf((y + pixel_size) / S) - math.erf(y / S)
-                    Image[j][i] += 0.25 * photon * ErfX * ErfY
-    return Image
-
-
-def binary2locs(img: np.ndarray, density: float):
-    all_locs = np.nonzero(img == 1)
-    n_points = int(len(all_locs[0]) * density)
-    selected_idx = np.random.choice(len(all_locs[0]), n_points, replace=False)
-    filtered_locs = all_locs[0][selected_idx], all_locs[1][selected_idx]
-    return filtered_locs
-
-
 def createBranchingTree(width=5000, height=5000, lineWidth=3):
     np.random.seed(0)
     image = np.ones((height, width), dtype=np.uint8) * 255
@@ -346,9 +437,15 @@ class Objective:
 
 
 class Camera:
-    def __init__(self, parent, filePath="path_to_image.jpeg"):
+    def __init__(self, parent, filePath="path_to_image.jpeg", highThroughput=False, targetFps=None):
         self._parent = parent
         self.filePath = filePath
+        self.highThroughput = highThroughput
+        # Frame rate the camera is paced to in high-throughput mode (None/<=0: unlimited)
+        self.targetFps = targetFps
+        self._nextFrameTime = 0.0
+        self._otfCache = {}  # (z, shape) -> rfft2 of the defocus PSF
+        self._otfCacheSize = 32
 
         if self.filePath == "simplant":
             self.image = createBranchingTree(width=5000, height=5000)
@@ -372,6 +469,10 @@ class Camera:
             self.image = (
                 1 - ((tmp - tmp_min) / (tmp_max - tmp_min)) > 0
             )  # generating binary image
+            # Emitters are extracted and indexed once, blinking is tracked per emitter
+            self.emitters = SMLMEmitterField(self.image)
+            if targetFps is None and not highThroughput:
+                self.targetFps = 10  # previous fixed frame time of 0.1 s
         else:
             self.image = np.mean(cv2.imread(filePath), axis=2)
             self.image /= np.max(self.image)
@@ -385,8 +486,10 @@ class Camera:
         self.frameNumber = 0
         # precompute noise so that we will save energy and trees
         self.noiseStack = np.abs(
-            np.random.randn(self.SensorHeight, self.SensorWidth, 100) * 2
-        )
+            np.random.randn(100, self.SensorHeight, self.SensorWidth) * 2
+        ).astype(np.float32)
+        if self.highThroughput and self.filePath not in ("smlm", "astigmatism"):
+            self.image = self.image.astype(np.float32)
 
     def produce_frame(
         self, x_offset=0, y_offset=0, z_offset=0, light_intensity=1.0, defocusPSF=None
@@ -396,6 +499,8 @@ class Camera:
             return self.produce_smlm_frame(x_offset, y_offset, light_intensity).astype(np.uint16)
         elif self.filePath == "astigmatism":
             return self.produce_astigmatism_frame(z_offset).astype(np.uint16)
+        elif self.highThroughput:
+            return self.produce_frame_fast(x_offset, y_offset, z_offset, light_intensity, defocusPSF)
         else:
             with self.lock:
                 # add moise
@@ -411,7 +516,7 @@ class Camera:
                     print("Defocus:" + str(defocusPSF.shape))
                     image = np.array(np.real(nip.convolve(image, defocusPSF)))
                 image = np.float32(image) * np.float32(light_intensity)
-                image += self.noiseStack[:, :, np.random.randint(0, 100)]
+                image += self.noiseStack[np.random.randint(0, 100)]
                 
 
                 # Adjust illumination
@@ -419,6 +524,56 @@ class Camera:
                 time.sleep(0.1)
                 return np.array(image).astype(np.uint16)
 
+    def produce_frame_fast(
+        self, x_offset=0, y_offset=0, z_offset=0, light_intensity=1.0, defocusPSF=None
+    ):
+        """Generate a frame in high-throughput mode: the viewport is sliced from
+        the source with wrap-around indexing, defocus is applied with an OTF
+        cached per Z, everything stays float32 and the frame rate is paced to
+        targetFps instead of sleeping for a fixed time."""
+        image = self._extract_viewport(self.image, x_offset, y_offset)
+        if defocusPSF is not None and defocusPSF.shape == image.shape:
+            otf = self._get_otf(z_offset, defocusPSF)
+            image = scipy_fft.irfft2(scipy_fft.rfft2(image, workers=-1) * otf,
+                                     s=image.shape, workers=-1)
+        image *= np.float32(light_intensity)
+        image += self.noiseStack[np.random.randint(0, len(self.noiseStack))]
+        np.clip(image, 0, 65535, out=image)
+        self._pace()
+        return image.astype(np.uint16)
+
+    def _extract_viewport(self, image, x_offset, y_offset):
+        """Equivalent of rolling the source by the offsets and cropping the
+        sensor-sized center, without touching the rest of the source."""
+        height, width = image.shape[:2]
+        y0 = (height // 2 - self.SensorHeight // 2 - int(y_offset)) % height
+        x0 = (width // 2 - self.SensorWidth // 2 - int(x_offset)) % width
+        if y0 + self.SensorHeight <= height and x0 + self.SensorWidth <= width:
+            return image[y0:y0 + self.SensorHeight, x0:x0 + self.SensorWidth].copy()
+        rows = (y0 + np.arange(self.SensorHeight)) % height
+        cols = (x0 + np.arange(self.SensorWidth)) % width
+        return image[np.ix_(rows, cols)]
+
+    def _get_otf(self, z_offset, psf):
+        key = (float(z_offset), psf.shape)
+        otf = self._otfCache.get(key)
+        if otf is None:
+            otf = scipy_fft.rfft2(np.fft.ifftshift(np.asarray(psf, dtype=np.float32)))
+            otf = otf.astype(np.complex64)
+            if len(self._otfCache) >= self._otfCacheSize:
+                self._otfCache.pop(next(iter(self._otfCache)))
+            self._otfCache[key] = otf
+        return otf
+
+    def _pace(self):
+        """Sleep until the next frame is due according to targetFps."""
+        if not self.targetFps or self.targetFps <= 0:
+            return
+        now = time.perf_counter()
+        if self._nextFrameTime > now:
+            time.sleep(self._nextFrameTime - now)
+        self._nextFrameTime = max(self._nextFrameTime, now) + 1.0 / self.targetFps
+
     def produce_astigmatism_frame(self, z_offset=0):
         #!/usr/bin/env python3
         return self.astimulator.render_frame(z=z_offset)
@@ -426,49 +581,27 @@ class Camera:
     def produce_smlm_frame(self, x_offset=0, y_offset=0, light_intensity=5000):
         """Generate a SMLM frame based on the current settings."""
         with self.lock:
-            # add moise
-            image = self.image.copy()
-            # Adjust image based on offsets
-            image = np.roll(
-                np.roll(image, int(x_offset), axis=1), int(y_offset), axis=0
-            )
-            image = np.array(nip.extract(image, (self.SensorHeight, self.SensorWidth)))
-
-            yc_array, xc_array = binary2locs(image, density=0.05)
-            photon_array = np.random.normal(
-                light_intensity * 5, light_intensity * 0.05, size=len(xc_array)
+            height, width = self.image.shape
+            # Same viewport as rolling the structure by the offsets and cropping the center
+            y0 = (height // 2 - self.SensorHeight // 2 - int(y_offset)) % height
+            x0 = (width // 2 - self.SensorWidth // 2 - int(x_offset)) % width
+            out = self.emitters.render(
+                y0, x0, self.SensorHeight, self.SensorWidth,
+                photons=light_intensity * 5, photons_std=light_intensity * 0.05
             )
 
-            wavelenght = 6  # change to get it from microscope settings
-            wavelenght_std = 0.5  # change to get it from microscope settings
-            NA = 1.2  # change to get it from microscope settings
-            sigma = 0.21 * wavelenght / NA  # change to get it from microscope settings
-            sigma_std = (
-                0.21 * wavelenght_std / NA
-            )  # change to get it from microscope settings
-            sigma_array = np.random.normal(sigma, sigma_std, size=len(xc_array))
-
             ADC_per_photon_conversion = 1.0  # change to get it from microscope settings
             readout_noise = 50  # change to get it from microscope settings
             ADC_offset = 100  # change to get it from microscope settings
 
-            out = FromLoc2Image_MultiThreaded(
-                xc_array,
-                yc_array,
-                photon_array,
-                sigma_array,
-                self.SensorHeight,
-                self.SensorWidth,
-                self.PixelSize,
-            )
             out = (
-                ADC_per_photon_conversion * np.random.poisson(out)
+                ADC_per_photon_conversion * np.random.poisson(np.clip(out, 0, None)).astype(np.float32)
                 + readout_noise
-                * np.random.normal(size=(self.SensorHeight, self.SensorWidth))
+                * np.random.standard_normal(size=out.shape).astype(np.float32)
                 + ADC_offset
             )
-            time.sleep(0.1)
-            return np.array(out)
+            self._pace()
+            return np.clip(out, 0, None)
 
     def getLast(self, returnFrameNumber=False):
         position = self._parent.positioner.get_position()
@@ -501,100 +634,8 @@ class Camera:
         return np.expand_dims(mFrame, axis=0), [self.frameNumber] # we only provide one chunk, so we return a list with one element
     
     def setPropertyValue(self, propertyName, propertyValue):
-        pass
-
-
-@njit(parallel=True)
-def FromLoc2Image_MultiThreaded(
-    xc_array: np.ndarray, yc_array: np.ndarray, photon_array: np.ndarray, sigma_array: np.ndarray, image_height: int, image_width: int, pixel_size: float
-):
-    """
-    Generate an image from localized emitters using multi-threading.
-
-    Parameters
-    ----------
-    xc_array : array_like
-        Array of x-coordinates of the emitters.
-    yc_array : array_like
-        Array of y-coordinates of the emitters.
-    photon_array : array_like
-        Array of photon counts for each emitter.
-    sigma_array : array_like
-        Array of standard deviations (sigmas) for each emitter.
-    image_height : int
-        Height of the output image in pixels.
-    image_width : int
-        Width of the output image in pixels.
-    pixel_size : float
-        Size of each pixel in the image.
-
-    Returns
-    -------
-    Image : ndarray
-        2D array representing the generated image.
-
-    Notes
-    -----
-    The function utilizes multi-threading for parallel processing using Numba's
-    `njit` decorator with `parallel=True`. Emitters with non-positive photon
-    counts or non-positive sigma values are ignored. Only emitters within a
-    distance of 4 sigma from the center of the pixel are considered to save
-    computation time.
-
-    The calculation involves error functions (`erf`) to determine the contribution
-    of each emitter to the pixel intensity.
-
-    Originally from: https://colab.research.google.com/github/HenriquesLab/ZeroCostDL4Mic/blob/master/Colab_notebooks/Deep-STORM_2D_ZeroCostDL4Mic.ipynb
-    """
-    Image = np.zeros((image_height, image_width))
-    for ij in prange(image_height * image_width):
-        j = int(ij / image_width)
-        i = ij - j * image_width
-        for xc, yc, photon, sigma in zip(xc_array, yc_array, photon_array, sigma_array):
-            # Don't bother if the emitter has photons <= 0 or if Sigma <= 0
-            if (photon > 0) and (sigma > 0):
-                S = sigma * math.sqrt(2)
-                x = i * pixel_size - xc
-                y = j * pixel_size - yc
-                # Don't bother if the emitter is further than 4 sigma from the centre of the pixel
-                if (x + pixel_size / 2) ** 2 + (
-                    y + pixel_size / 2
-                ) ** 2 < 16 * sigma**2:
-                    ErfX = math.erf((x + pixel_size) / S) - math.erf(x / S)
-                    ErfY = math.erf((y + pixel_size) / S) - math.erf(y / S)
-                    Image[j][i] += 0.25 * photon * ErfX * ErfY
-    return Image
-
-
-def binary2locs(img: np.ndarray, density: float):
-    """
-    Selects a subset of locations from a binary image based on a specified density.
-
-    Parameters
-    ----------
-    img : np.ndarray
-        2D binary image array where 1s indicate points of interest.
-    density : float
-        Proportion of points to randomly select from the points of interest.
-        Should be a value between 0 and 1.
-
-    Returns
-    -------
-    filtered_locs : tuple of np.ndarray
-        Tuple containing two arrays. The first array contains the row indices
-        and the second array contains the column indices of the selected points.
-
-    Notes
-    -----
-    The function identifies all locations in the binary image where the value is 1.
-    It then randomly selects a subset of these locations based on the specified
-    density and returns their coordinates.
-    """
-    all_locs = np.nonzero(img == 1)
-    n_points = int(len(all_locs[0]) * density)
-    selected_idx = np.random.choice(len(all_locs[0]), n_points, replace=False)
-    filtered_locs = all_locs[0][selected_idx], all_locs[1][selected_idx]
-    return filtered_locs
+        if propertyName == "frame_rate":
+            self.targetFps = propertyValue
 
 
 def createBranchingTree(width=5000, height=5000, lineWidth=3):
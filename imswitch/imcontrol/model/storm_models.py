@@ -99,6 +99,21 @@ class STORMProcessingParameters(BaseModel):
     
     super_resolution_pixel_size_nm: float = Field(default=10.0, gt=0,
                                                  description="Super-resolution pixel size in nanometers")
+
+    # Batched localization
+    batch_size: int = Field(default=0, ge=0, le=1000,
+                          description="Frames per localization batch (0 to localize frame by frame)")
+
+    localization_workers: Optional[int] = Field(default=None, ge=0,
+                                              description="Worker processes for batched localization "
+                                                          "(None: one per spare CPU core, 0: no extra processes)")
+
+    drift_correction: bool = Field(default=False,
+                                   description="Correct the drift online by redundant cross-correlation "
+                                               "of localization sub-window renderings")
+
+    drift_window_frames: int = Field(default=500, ge=10,
+                                     description="Frames per drift estimation window")
     
     # Bandpass filter parameters
     bandpass_filter: BandpassFilterParameters = Field(default_factory=BandpassFilterParameters,
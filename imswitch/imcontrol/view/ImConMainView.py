@@ -2,9 +2,8 @@ from dataclasses import dataclass
 from imswitch import IS_HEADLESS
 # FIXME: We should probably create another file that does not import these files
 from imswitch.imcommon.framework import Signal
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import initLogger, pythontools
 from . import widgets
-import pkg_resources
 import importlib
 import importlib.util
 
@@ -225,7 +224,7 @@ class ImConMainView(QMainWindow):
             except Exception as e:
                 # try to get it from the plugins
                 foundPluginController = False
-                for entry_point in pkg_resources.iter_entry_points(f'imswitch.implugins'):
+                for entry_point in pythontools.iterEntryPoints('imswitch.implugins'):
                     if entry_point.name == f'{widgetKey}_widget':
                         packageWidget = entry_point.load()
                         self.widgets[widgetKey] = self.factory.createWidget(packageWidget)
@@ -281,7 +280,7 @@ class ImConMainViewNoQt(object):
         # Preload all available plugins for widgets
         availablePlugins = {
             entry_point.name: entry_point
-            for entry_point in pkg_resources.iter_entry_points(f'imswitch.implugins')
+            for entry_point in pythontools.iterEntryPoints('imswitch.implugins')
         }
 
         for widgetKey, dockInfo in dockInfoDict.items():